@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应请求超时
+按目标主机记录企业微信接口的响应延迟，使用EWMA（参考RFC 6298的RTO算法）
+与滑动窗口p99估计连接/读取超时，并受单个事件的发送截止时间约束。
+健康调用约100ms时，停滞的连接不必等满固定的10秒。
+Action 每次运行只发送少量请求，估计值通过状态文件在多次运行之间累积
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+# 样本不足时使用的默认超时（与原固定超时一致）
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 10.0
+
+# 自适应超时的上下限
+MIN_CONNECT_TIMEOUT = 1.0
+MIN_READ_TIMEOUT = 1.0
+MAX_CONNECT_TIMEOUT = 10.0
+MAX_READ_TIMEOUT = 10.0
+
+# 至少积累多少个样本后才启用自适应超时
+MIN_SAMPLES = 5
+
+# EWMA平滑系数（RFC 6298 推荐值）
+ALPHA = 0.125
+BETA = 0.25
+
+# p99滑动窗口大小
+WINDOW_SIZE = 200
+
+# 状态文件中超过该时长未更新的主机被丢弃（网络环境可能已变化）
+STATE_MAX_AGE = 24 * 3600
+_STATE_VERSION = 1
+
+
+class LatencyTracker:
+    """
+    单个目标主机的延迟估计
+    """
+
+    def __init__(self, window_size=WINDOW_SIZE, min_samples=MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window_size)
+        self.srtt = None
+        self.rttvar = None
+        self.count = 0
+        self.updated_at = None
+
+    def record(self, latency):
+        """
+        记录一次成功响应的延迟（秒）
+        """
+        with self._lock:
+            self._samples.append(latency)
+            self._update_ewma(latency)
+
+    def record_timeout(self, timeout):
+        """
+        记录一次超时：以超时时间作为（被截断的）样本只更新EWMA，使估计值向上修正；
+        不计入分位数窗口，避免被截断的长尾样本长期抬高p99
+        """
+        with self._lock:
+            self._update_ewma(timeout)
+
+    def _update_ewma(self, latency):
+        self.count += 1
+        self.updated_at = time.time()
+        if self.srtt is None:
+            self.srtt = latency
+            self.rttvar = latency / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - latency)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * latency
+
+    def to_dict(self):
+        """
+        导出可JSON序列化的估计状态
+        """
+        with self._lock:
+            return {
+                'srtt': self.srtt,
+                'rttvar': self.rttvar,
+                'count': self.count,
+                'samples': list(self._samples),
+                'updated_at': self.updated_at,
+            }
+
+    @classmethod
+    def from_dict(cls, data, **options):
+        """
+        从 to_dict 导出的状态恢复
+        :param data: 状态字典
+        :param options: 构造参数
+        """
+        tracker = cls(**options)
+        tracker._samples.extend(float(sample) for sample in data['samples'])
+        tracker.srtt = None if data['srtt'] is None else float(data['srtt'])
+        tracker.rttvar = None if data['rttvar'] is None else float(data['rttvar'])
+        tracker.count = int(data['count']) if tracker.srtt is not None else 0
+        tracker.updated_at = data['updated_at']
+        return tracker
+
+    def percentile(self, q):
+        """
+        滑动窗口内延迟的分位数
+        :param q: 0~1之间的分位
+        """
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def timeouts(self, deadline=None, clock=time.time):
+        """
+        计算下一次请求的 (连接超时, 读取超时)
+        :param deadline: 事件发送截止时间（时间戳），超时不会超过剩余时间
+        :return: (connect, read)，截止时间已过时返回 (0, 0)
+        """
+        if self.count < self.min_samples:
+            connect, read = DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+        else:
+            rto = self.srtt + 4 * self.rttvar
+            p99 = self.percentile(0.99) or rto
+            read = min(MAX_READ_TIMEOUT, max(MIN_READ_TIMEOUT, rto, p99 * 2))
+            # 建连只占一次往返，但至少保留一次SYN重传的时间
+            connect = min(MAX_CONNECT_TIMEOUT, max(MIN_CONNECT_TIMEOUT, rto))
+        if deadline is not None:
+            remaining = deadline - clock()
+            if remaining <= 0:
+                return 0.0, 0.0
+            connect = min(connect, remaining)
+            read = min(read, remaining)
+        return connect, read
+
+
+_trackers = {}
+_registry_lock = threading.Lock()
+
+
+def get_tracker(url):
+    """
+    获取目标主机的延迟估计（同一主机的多个机器人共享）
+    """
+    host = urlparse(url).netloc
+    tracker = _trackers.get(host)
+    if tracker is None:
+        with _registry_lock:
+            tracker = _trackers.setdefault(host, LatencyTracker())
+    return tracker
+
+
+def reset_trackers():
+    """
+    清空所有延迟估计
+    """
+    with _registry_lock:
+        _trackers.clear()
+
+
+def _read_state(path):
+    with open(path, encoding='utf-8') as f:
+        state = json.load(f)
+    if not isinstance(state, dict) or state.get('version') != _STATE_VERSION:
+        return {}
+    return state.get('hosts') or {}
+
+
+def load_trackers(path, max_age=STATE_MAX_AGE, clock=time.time):
+    """
+    从状态文件恢复各主机的延迟估计，文件不存在或损坏时从空状态开始
+    :param path: 状态文件路径
+    :param max_age: 超过该秒数未更新的主机不恢复
+    :return: 恢复的主机数量
+    """
+    try:
+        hosts = _read_state(path)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError) as e:
+        print(f'::warning::[{os.getenv("CURRENT_SESSION_ID", "main")}] 超时估计状态文件无效，重新开始估计: {e}')
+        return 0
+    now = clock()
+    loaded = 0
+    with _registry_lock:
+        for host, data in hosts.items():
+            try:
+                tracker = LatencyTracker.from_dict(data)
+            except (TypeError, ValueError, KeyError):
+                continue
+            if tracker.updated_at is None or now - tracker.updated_at > max_age:
+                continue
+            _trackers[host] = tracker
+            loaded += 1
+    return loaded
+
+
+def save_trackers(path):
+    """
+    保存各主机的延迟估计（先写临时文件再原子替换），文件中其他主机的估计保留
+    并发作业同时保存时后写入的覆盖先写入的，只会丢失少量样本，不影响正确性
+    :param path: 状态文件路径
+    :return: 保存的主机数量
+    """
+    try:
+        hosts = _read_state(path)
+    except (OSError, ValueError):
+        hosts = {}
+    with _registry_lock:
+        trackers = dict(_trackers)
+    for host, tracker in trackers.items():
+        if tracker.updated_at is not None:
+            hosts[host] = tracker.to_dict()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': _STATE_VERSION, 'hosts': hosts}, f)
+    os.replace(temp_path, path)
+    return len(hosts)
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+事件归档
+将GitHub事件数据与每个目标的发送结果（含实际发送的消息）写入压缩JSONL分段，便于事后查询与定向重放：
+- 分段按时间轮转（缺省每天一个），文件名为分段起始时间
+- 记录按块压缩，每块是独立的 gzip member（或 zstd frame），可以从块的偏移直接解压
+- index.jsonl 为稀疏索引：每块一行，记录时间范围、仓库、事件类型、目标机器人与块的偏移和长度
+
+“上周二给X群发了什么”只需读取索引，定位到相关的块并解压这些块，无需扫描全部归档。
+
+用法:
+    python archive.py search --dir archive --since 2024-05-14 --until 2024-05-15 --target <机器人标识>
+    python archive.py replay --dir archive --repo owner/repo --event release --webhook URL
+"""
+
+import argparse
+import contextlib
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+
+from delivery_store import target_id
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+INDEX_FILE = 'index.jsonl'
+DEFAULT_ROTATE_SECONDS = 24 * 3600
+# 每块最多的记录数，以及缓冲记录最长保留时间（秒），超过后写出
+DEFAULT_BLOCK_RECORDS = 256
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+_EXTENSIONS = {COMPRESSION_GZIP: '.jsonl.gz', COMPRESSION_ZSTD: '.jsonl.zst'}
+
+KIND_EVENT = 'event'
+KIND_DELIVERY = 'delivery'
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _compress(data, compression):
+    if compression == COMPRESSION_ZSTD:
+        return _zstd().ZstdCompressor().compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _decompress(data, compression):
+    if compression == COMPRESSION_ZSTD:
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError('读取 zstd 归档分段需要安装 zstandard')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def robot_label(webhook_url):
+    """
+    归档与查询中使用的机器人标识（Key的哈希，与中继指标中的标识一致）
+    """
+    return target_id(webhook_url)[:12]
+
+
+def parse_time(value):
+    """
+    解析命令行中的时间：时间戳、ISO日期或日期时间（无时区时按本地时间）
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+class IndexEntry:
+    """
+    稀疏索引项：一个压缩块的位置与摘要
+    """
+
+    __slots__ = ('segment', 'offset', 'length', 'count', 'ts_min', 'ts_max', 'repos', 'events', 'targets')
+
+    def __init__(self, segment, offset, length, count, ts_min, ts_max, repos=(), events=(), targets=()):
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        self.count = count
+        self.ts_min = ts_min
+        self.ts_max = ts_max
+        self.repos = list(repos)
+        self.events = list(events)
+        self.targets = list(targets)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+    def matches(self, start=None, end=None, repo=None, event_name=None, target=None):
+        if start is not None and self.ts_max < start:
+            return False
+        if end is not None and self.ts_min >= end:
+            return False
+        if repo is not None and repo not in self.repos:
+            return False
+        if event_name is not None and event_name not in self.events:
+            return False
+        if target is not None and target not in self.targets:
+            return False
+        return True
+
+
+class EventArchive:
+    """
+    按时间轮转的压缩事件归档
+    """
+
+    def __init__(self, directory, rotate_seconds=DEFAULT_ROTATE_SECONDS, compression=COMPRESSION_GZIP,
+                 block_records=DEFAULT_BLOCK_RECORDS, flush_interval=DEFAULT_FLUSH_INTERVAL, clock=time.time):
+        """
+        :param directory: 归档目录
+        :param rotate_seconds: 分段时长（秒）
+        :param compression: gzip 或 zstd（需要安装 zstandard，未安装时使用gzip）
+        :param block_records: 每块最多的记录数，越小查询解压的数据越少，压缩率越低
+        :param flush_interval: 缓冲记录最长保留时间（秒）
+        :param clock: 时间函数，用于测试
+        """
+        if compression not in _EXTENSIONS:
+            raise ValueError(f'不支持的压缩方式: {compression}')
+        if compression == COMPRESSION_ZSTD and _zstd() is None:
+            print(f'::warning::[{os.getenv("CURRENT_SESSION_ID", "main")}] 未安装 zstandard，归档使用gzip压缩')
+            compression = COMPRESSION_GZIP
+        self.directory = directory
+        self.rotate_seconds = rotate_seconds
+        self.compression = compression
+        self.block_records = block_records
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._buffer_segment = None
+        self._buffer_since = None
+        self._closed = threading.Event()
+        self._flusher = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        """
+        启动后台定时写出：常驻服务（中继）空闲时缓冲记录也最多保留约 flush_interval 秒
+        """
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_periodically, name='archive-flush', daemon=True)
+            self._flusher.start()
+        return self
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval / 2):
+            try:
+                self.flush_expired()
+            except OSError as e:
+                print(f'::warning::[{os.getenv("CURRENT_SESSION_ID", "main")}] 归档写出失败: {e}')
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _segment_name(self, ts):
+        start = int(ts // self.rotate_seconds * self.rotate_seconds)
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(start))
+        return f'segment-{stamp}{_EXTENSIONS[self.compression]}'
+
+    def append(self, record):
+        """
+        追加一条记录（必须包含 ts）；跨分段或缓冲已满、过期时写出当前块
+        """
+        segment = self._segment_name(record['ts'])
+        with self._lock:
+            if self._buffer and segment != self._buffer_segment:
+                self._flush_locked()
+            if not self._buffer:
+                self._buffer_segment = segment
+                self._buffer_since = self._clock()
+            self._buffer.append(record)
+            if len(self._buffer) >= self.block_records or \
+                    self._clock() - self._buffer_since >= self.flush_interval:
+                self._flush_locked()
+
+    def append_event(self, event_name, payload, delivery_id=None, ts=None):
+        """
+        归档GitHub事件数据
+        """
+        self.append({
+            'kind': KIND_EVENT,
+            'ts': self._clock() if ts is None else ts,
+            'delivery_id': delivery_id,
+            'event_name': event_name,
+            'repo': (payload.get('repository') or {}).get('full_name'),
+            'payload': payload,
+        })
+
+    def append_delivery(self, event_name, repo, webhook_url, message, result, delivery_id=None, ts=None):
+        """
+        归档一次发送结果与实际发送的消息
+        :param result: DeliveryResult
+        """
+        self.append({
+            'kind': KIND_DELIVERY,
+            'ts': self._clock() if ts is None else ts,
+            'delivery_id': delivery_id,
+            'event_name': event_name,
+            'repo': repo,
+            'target': robot_label(webhook_url),
+            'success': result.success,
+            'skipped': result.skipped,
+            'status_code': result.status_code,
+            'errcode': result.errcode,
+            'error': result.error,
+            'message': message,
+        })
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def flush_expired(self):
+        """
+        缓冲记录超过 flush_interval 时写出
+        """
+        with self._lock:
+            if self._buffer and self._clock() - self._buffer_since >= self.flush_interval:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        records, self._buffer = self._buffer, []
+        lines = ''.join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n' for record in records)
+        block = _compress(lines.encode('utf-8'), self.compression)
+        path = os.path.join(self.directory, self._buffer_segment)
+        with open(path, 'ab') as f:
+            # 多个进程写同一归档目录时（自托管Runner），以文件锁保证块的偏移正确
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(block)
+            f.flush()
+        timestamps = [record['ts'] for record in records]
+        entry = IndexEntry(
+            self._buffer_segment, offset, len(block), len(records), min(timestamps), max(timestamps),
+            repos=sorted({record['repo'] for record in records if record.get('repo')}),
+            events=sorted({record['event_name'] for record in records if record.get('event_name')}),
+            targets=sorted({record['target'] for record in records if record.get('target')}),
+        )
+        with open(os.path.join(self.directory, INDEX_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry.to_dict(), ensure_ascii=False) + '\n')
+
+    def index(self):
+        """
+        :return: IndexEntry 列表（写入顺序）
+        """
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return []
+        entries = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                with contextlib.suppress(ValueError, KeyError, TypeError):
+                    entries.append(IndexEntry.from_dict(json.loads(line)))
+        return entries
+
+    def _read_block(self, entry):
+        compression = COMPRESSION_ZSTD if entry.segment.endswith(_EXTENSIONS[COMPRESSION_ZSTD]) else COMPRESSION_GZIP
+        with open(os.path.join(self.directory, entry.segment), 'rb') as f:
+            f.seek(entry.offset)
+            data = f.read(entry.length)
+        for line in _decompress(data, compression).decode('utf-8').splitlines():
+            yield json.loads(line)
+
+    def search(self, start=None, end=None, repo=None, event_name=None, target=None, kind=None, delivery_id=None):
+        """
+        按条件查询归档记录，只解压索引命中的块
+        :param start: 起始时间戳（含）
+        :param end: 结束时间戳（不含）
+        :param repo: 仓库全名
+        :param event_name: 事件类型
+        :param target: 机器人标识（robot_label）或Webhook URL
+        :param kind: event 或 delivery
+        :param delivery_id: 投递ID
+        """
+        self.flush()
+        if target is not None and '://' in target:
+            target = robot_label(target)
+        # 按目标查询时，事件记录所在的块没有目标信息，只筛选发送记录
+        if target is not None:
+            kind = KIND_DELIVERY
+        for entry in self.index():
+            if not entry.matches(start, end, repo, event_name, target):
+                continue
+            for record in self._read_block(entry):
+                if start is not None and record['ts'] < start:
+                    continue
+                if end is not None and record['ts'] >= end:
+                    continue
+                if (repo is not None and record.get('repo') != repo) or \
+                        (event_name is not None and record.get('event_name') != event_name) or \
+                        (target is not None and record.get('target') != target) or \
+                        (kind is not None and record.get('kind') != kind) or \
+                        (delivery_id is not None and record.get('delivery_id') != delivery_id):
+                    continue
+                yield record
+
+
+def replay(records, notifier):
+    """
+    重放归档中的事件记录
+    :param records: search() 返回的记录，只处理事件记录
+    :param notifier: notifier.Notifier
+    :return: NotificationResult 列表
+    """
+    results = []
+    for record in records:
+        if record.get('kind') != KIND_EVENT:
+            continue
+        results.append(notifier.send(record['event_name'], record['payload'], delivery_id=record.get('delivery_id')))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='查询或重放归档的GitHub事件与发送记录')
+    parser.add_argument('command', choices=('search', 'replay'))
+    parser.add_argument('--dir', required=True, help='归档目录')
+    parser.add_argument('--since', help='起始时间（时间戳或ISO日期时间）')
+    parser.add_argument('--until', help='结束时间（不含）')
+    parser.add_argument('--repo', help='仓库全名 owner/repo')
+    parser.add_argument('--event', help='事件类型')
+    parser.add_argument('--target', help='机器人标识或Webhook URL（只查询发送记录）')
+    parser.add_argument('--kind', choices=(KIND_EVENT, KIND_DELIVERY))
+    parser.add_argument('--delivery-id', help='投递ID')
+    parser.add_argument('--webhook', help='重放目标Webhook URL，多个用逗号分隔')
+    parser.add_argument('--msgtype', default='markdown')
+    args = parser.parse_args()
+
+    archive = EventArchive(args.dir)
+    matched = archive.search(parse_time(args.since), parse_time(args.until), args.repo, args.event, args.target,
+                             args.kind, args.delivery_id)
+    if args.command == 'search':
+        for item in matched:
+            print(json.dumps(item, ensure_ascii=False))
+    else:
+        if not args.webhook:
+            parser.error('replay 需要 --webhook')
+        from notifier import Notifier
+
+        with Notifier(args.webhook, msgtype=args.msgtype) as replay_notifier:
+            replayed = replay(matched, replay_notifier)
+        print(f'重放事件: {len(replayed)} 个，成功: {sum(result.success for result in replayed)} 个')
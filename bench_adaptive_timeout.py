@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准脚本：在注入长尾延迟的接口替身上对比固定10秒超时与自适应超时
+每种模式发送相同数量的消息，统计总耗时、延迟分位数与成功率
+用法: python bench_adaptive_timeout.py [消息数] [长尾概率] [长尾延迟秒数]
+"""
+
+import contextlib
+import io
+import sys
+import time
+
+import adaptive_timeout
+import circuit_breaker
+import main
+from mock_wechat_server import MockWeChatServer
+
+MESSAGE = {'msgtype': 'markdown', 'markdown': {'content': '自适应超时基准测试'}}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(url, count, adaptive, max_attempts):
+    """
+    顺序发送 count 条消息，返回 (各条耗时, 成功数)
+    """
+    adaptive_timeout.reset_trackers()
+    circuit_breaker.reset_breakers()
+    circuit_breaker.configure_breakers(failure_threshold=count + 1)
+    if not adaptive:
+        # 关闭自适应：样本门槛设为无穷大，始终使用默认的10秒超时
+        adaptive_timeout.get_tracker(url).min_samples = float('inf')
+    latencies = []
+    successes = 0
+    for _ in range(count):
+        start = time.monotonic()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ok = main.send_wechat_message(url, MESSAGE, deadline=time.time() + 10, max_attempts=max_attempts)
+        latencies.append(time.monotonic() - start)
+        successes += ok
+    return latencies, successes
+
+
+def main_bench(count=200, tail_probability=0.03, tail_latency=15.0):
+    print(f'消息数: {count}, 基础延迟: 0.1s, 长尾概率: {tail_probability}, 长尾延迟: {tail_latency}s')
+    print(f"{'模式':<12} {'总耗时':>8} {'p50':>8} {'p99':>8} {'最大':>8} {'成功':>6}")
+    for name, adaptive, attempts in (('固定10s', False, 1), ('自适应+重试', True, 2)):
+        with MockWeChatServer(latency=0.1, tail_probability=tail_probability,
+                              tail_latency=tail_latency, seed=42) as server:
+            latencies, successes = run(server.url, count, adaptive, attempts)
+        print(f'{name:<12} {sum(latencies):>7.2f}s {percentile(latencies, 0.5):>7.3f}s '
+              f'{percentile(latencies, 0.99):>7.3f}s {max(latencies):>7.3f}s {successes:>4}/{count}')
+
+
+if __name__ == "__main__":
+    args = [float(arg) for arg in sys.argv[1:]]
+    main_bench(int(args[0]) if args else 200, *args[1:])
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+负载测试：按目标速率开环回放合成事件语料，统计吞吐量与延迟分位数
+开环：请求按预定时间发出，不等待前一个请求完成；延迟从预定发出时间开始计算，
+目标处理不过来时排队时间也计入延迟（避免闭环压测的协调遗漏问题）
+
+目标:
+- relay: POST 到中继服务（未指定 --url 时在进程内启动中继），延迟为接收并返回202的时间
+- action: 以子进程运行 main.py（与Action运行方式一致），延迟为整个进程的运行时间
+- library: 进程内调用 notifier.Notifier.send（批处理/嵌入服务），延迟包括读取事件文件
+
+用法:
+    python bench_load.py corpus --out corpus --count 1000 --seed 1
+    python bench_load.py run --corpus corpus --target relay --rate 50 --duration 30 --mock-latency 0.05
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from synthetic_events import MAX_EVENT_BYTES, CorpusGenerator, read_corpus, write_corpus
+
+TARGETS = ('relay', 'action', 'library')
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LoadReport:
+    """
+    一次负载测试的结果
+    """
+
+    def __init__(self, latencies, errors, elapsed, offered_rate):
+        self.latencies = latencies
+        self.errors = errors
+        self.elapsed = elapsed
+        self.offered_rate = offered_rate
+
+    @property
+    def completed(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.completed / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'offered_rate': self.offered_rate,
+            'completed': self.completed,
+            'errors': self.errors,
+            'elapsed': round(self.elapsed, 3),
+            'throughput': round(self.throughput, 2),
+            'p50': round(percentile(self.latencies, 0.5), 4),
+            'p90': round(percentile(self.latencies, 0.9), 4),
+            'p99': round(percentile(self.latencies, 0.99), 4),
+            'max': round(max(self.latencies, default=0.0), 4),
+        }
+
+    def format(self):
+        data = self.to_dict()
+        return (f"目标速率 {data['offered_rate']:.1f}/s, 完成 {data['completed']}, 失败 {data['errors']}, "
+                f"吞吐量 {data['throughput']:.1f}/s, 耗时 {data['elapsed']:.2f}s\n"
+                f"延迟 p50 {data['p50'] * 1000:.1f}ms, p90 {data['p90'] * 1000:.1f}ms, "
+                f"p99 {data['p99'] * 1000:.1f}ms, 最大 {data['max'] * 1000:.1f}ms")
+
+
+def run_open_loop(send, items, rate, arrival='poisson', concurrency=64, seed=0):
+    """
+    开环发送
+    :param send: 发送函数 send(item)，返回是否成功
+    :param items: 待发送项
+    :param rate: 目标速率（每秒）
+    :param arrival: poisson（指数间隔）或 constant（固定间隔）
+    :param concurrency: 最大并发数，超过时请求在本地排队（计入延迟）
+    :param seed: 到达间隔随机种子
+    :return: LoadReport
+    """
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(item, scheduled):
+        nonlocal errors
+        try:
+            ok = send(item)
+        except Exception:
+            ok = False
+        latency = time.perf_counter() - scheduled
+        with lock:
+            if ok:
+                latencies.append(latency)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    scheduled = start
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for item in items:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(timed, item, scheduled)
+            scheduled += rng.expovariate(rate) if arrival == 'poisson' else 1.0 / rate
+    return LoadReport(latencies, errors, time.perf_counter() - start, rate)
+
+
+def relay_sender(url):
+    """
+    POST 语料事件到中继
+    """
+    session = requests.Session()
+
+    def send(entry):
+        with open(entry['path'], 'rb') as f:
+            body = f.read()
+        response = session.post(url, data=body, timeout=30, headers={
+            'Content-Type': 'application/json', 'X-GitHub-Event': entry['event_name'],
+            'X-GitHub-Delivery': entry['delivery_id']})
+        return response.status_code < 300
+    return send
+
+
+def action_sender(webhook_url, extra_env=None):
+    """
+    以子进程运行 main.py
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+    def send(entry):
+        env = dict(os.environ, **(extra_env or {}))
+        env.update({
+            'INPUT_WECHAT_WEBHOOK_URL': webhook_url,
+            'INPUT_EVENT_TYPES': ','.join(sorted({'push', 'pull_request', 'issues', 'release', 'workflow_run',
+                                                  'check_run'})),
+            'INPUT_DELIVERY_ID': entry['delivery_id'],
+            'GITHUB_EVENT_PATH': entry['path'],
+            'GITHUB_EVENT_NAME': entry['event_name'],
+        })
+        result = subprocess.run([sys.executable, script], env=env, capture_output=True, timeout=120)
+        return result.returncode == 0
+    return send
+
+
+def library_sender(notifier):
+    """
+    进程内调用 Notifier.send
+    """
+    def send(entry):
+        with open(entry['path'], 'rb') as f:
+            payload = json.load(f)
+        return notifier.send(entry['event_name'], payload, delivery_id=entry['delivery_id']).success
+    return send
+
+
+def main_bench(args):
+    import circuit_breaker
+    from mock_wechat_server import MockWeChatServer
+    from notifier import Notifier
+    from relay import Relay
+
+    entries = read_corpus(args.corpus)
+    count = args.count or int(args.rate * args.duration)
+    items = [entries[index % len(entries)] for index in range(count)]
+    print(f'语料 {len(entries)} 个事件，发送 {count} 次，目标 {args.target}')
+
+    with contextlib.ExitStack() as stack:
+        # 进程内目标（中继、通知库）的调试日志量很大，压测期间丢弃
+        stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        webhook_url = args.webhook
+        if not webhook_url:
+            server = stack.enter_context(MockWeChatServer(latency=args.mock_latency))
+            webhook_url = server.url
+        # 压测关注本地处理能力，熔断器不应因为排队超时而打开
+        circuit_breaker.configure_breakers(failure_threshold=count + 1)
+        if args.target == 'relay':
+            url = args.url
+            if not url:
+                relay = stack.enter_context(Relay(webhook_url, rate_per_minute=args.relay_rate,
+                                                  max_queue=max(count, 1)))
+                url = relay.url + '/webhook'
+            send = relay_sender(url)
+        elif args.target == 'action':
+            send = action_sender(webhook_url)
+        else:
+            send = library_sender(stack.enter_context(Notifier(webhook_url)))
+        report = run_open_loop(send, items, args.rate, args.arrival, args.concurrency, args.seed)
+    print(report.format())
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report.to_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='合成事件语料与开环负载测试')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    corpus_parser = commands.add_parser('corpus', help='生成合成事件语料')
+    corpus_parser.add_argument('--out', required=True, help='输出目录')
+    corpus_parser.add_argument('--count', type=int, default=1000)
+    corpus_parser.add_argument('--seed', type=int, default=0)
+    corpus_parser.add_argument('--max-bytes', type=int, default=MAX_EVENT_BYTES, help='单个事件的大小上限')
+
+    run_parser = commands.add_parser('run', help='按目标速率回放语料')
+    run_parser.add_argument('--corpus', required=True, help='语料目录')
+    run_parser.add_argument('--target', choices=TARGETS, default='relay')
+    run_parser.add_argument('--rate', type=float, default=20.0, help='目标速率（每秒）')
+    run_parser.add_argument('--duration', type=float, default=30.0, help='持续时间（秒）')
+    run_parser.add_argument('--count', type=int, help='发送次数，优先于 --duration')
+    run_parser.add_argument('--arrival', choices=('poisson', 'constant'), default='poisson')
+    run_parser.add_argument('--concurrency', type=int, default=64)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--url', help='中继地址，未指定时在进程内启动中继')
+    run_parser.add_argument('--relay-rate', type=int, default=10 ** 6,
+                            help='进程内中继每个机器人每分钟的发送上限（压测时通常不限速）')
+    run_parser.add_argument('--webhook', help='企业微信Webhook URL，未指定时启动本地接口替身')
+    run_parser.add_argument('--mock-latency', type=float, default=0.05, help='接口替身的延迟（秒）')
+    run_parser.add_argument('--json', help='将结果写入JSON文件')
+    cli_args = parser.parse_args()
+
+    if cli_args.command == 'corpus':
+        written = write_corpus(cli_args.out, CorpusGenerator(cli_args.seed, max_bytes=cli_args.max_bytes)
+                               .events(cli_args.count))
+        print(f'已生成 {written} 个事件: {cli_args.out}')
+    else:
+        main_bench(cli_args)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准脚本：对比开启与关闭连接预热时Action的端到端耗时
+以子进程运行 main.py（与Action运行方式一致），交替使用 prewarm=true/false 发送不同大小的合成事件；
+接口替身默认以HTTPS（openssl 生成的自签名证书）提供服务，并在每个新连接上注入 --connect-latency 延迟，
+模拟到 qyapi.weixin.qq.com 的DNS解析、TCP与TLS握手往返
+用法: python bench_prewarm.py [--runs 10] [--connect-latency 0.15] [--latency 0.05] [--no-tls] [--webhook URL]
+"""
+
+import argparse
+import contextlib
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_load import percentile
+from mock_wechat_server import MockWeChatServer, self_signed_context
+from synthetic_events import SIZE_CLASSES, CorpusGenerator, read_corpus, write_corpus
+
+
+def corpus_by_size(directory, seed):
+    """
+    每个大小档位生成一个 push 事件
+    """
+    events = []
+    for name, _, low, high in SIZE_CLASSES:
+        generator = CorpusGenerator(seed, size_classes=((name, 1.0, low, min(high, 4 * low)),))
+        events.append(generator.event('push'))
+    write_corpus(directory, events)
+    return read_corpus(directory)
+
+
+def measure(webhook_url, entry, env):
+    """
+    以子进程运行一次 main.py
+    :return: (进程总耗时, main 函数耗时)，后者不含解释器启动与模块导入，波动更小
+    """
+    env = dict(os.environ, **env)
+    env.update({
+        'INPUT_WECHAT_WEBHOOK_URL': webhook_url,
+        'INPUT_EVENT_TYPES': entry['event_name'],
+        'INPUT_DELIVERY_ID': f'{entry["delivery_id"]}-{time.monotonic_ns()}',
+        'GITHUB_EVENT_PATH': entry['path'],
+        'GITHUB_EVENT_NAME': entry['event_name'],
+    })
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, script], env=env, capture_output=True, text=True, timeout=120)
+    elapsed = time.perf_counter() - start
+    match = re.search(r'总执行时长: ([\d.]+)s', result.stdout)
+    if result.returncode != 0 or match is None:
+        raise RuntimeError(f'发送失败: {entry["file"]}')
+    return elapsed, float(match.group(1))
+
+
+def main_bench(args):
+    directory = tempfile.mkdtemp()
+    entries = corpus_by_size(directory, args.seed)
+    tls = None if args.no_tls or args.webhook else self_signed_context(directory)
+    env = {}
+    if tls is not None:
+        # aiohttp 默认上下文读取 SSL_CERT_FILE，预热使用的上下文与 requests 一致读取 REQUESTS_CA_BUNDLE
+        env = {'SSL_CERT_FILE': tls[1], 'REQUESTS_CA_BUNDLE': tls[1]}
+    with contextlib.ExitStack() as stack:
+        webhook_url = args.webhook
+        if not webhook_url:
+            server = stack.enter_context(MockWeChatServer(latency=args.latency, connect_latency=args.connect_latency,
+                                                          ssl_context=tls[0] if tls else None))
+            webhook_url = server.url
+        target = '真实Webhook' if args.webhook else f'接口替身（{"HTTPS" if tls else "HTTP"}）'
+        print(f'目标: {target}, 建立连接延迟: {args.connect_latency}s, 接口延迟: {args.latency}s, 每组 {args.runs} 次')
+        print(f"{'大小':<8} {'事件字节':>10} {'指标':<8} {'关闭 p50':>10} {'开启 p50':>10} {'节省 p50':>10} {'节省均值':>10}")
+        for entry in entries:
+            timings = {'false': [], 'true': []}
+            for _ in range(args.runs):
+                # 交替运行，抵消机器负载波动
+                for prewarm in ('false', 'true'):
+                    timings[prewarm].append(measure(webhook_url, entry, dict(env, INPUT_PREWARM=prewarm)))
+            for index, metric in enumerate(('进程', 'main')):
+                cold = [timing[index] for timing in timings['false']]
+                warm = [timing[index] for timing in timings['true']]
+                print(f"{entry['size_class']:<8} {entry['bytes']:>10} {metric:<8} "
+                      f"{percentile(cold, 0.5) * 1000:>8.1f}ms {percentile(warm, 0.5) * 1000:>8.1f}ms "
+                      f"{(percentile(cold, 0.5) - percentile(warm, 0.5)) * 1000:>8.1f}ms "
+                      f"{(statistics.mean(cold) - statistics.mean(warm)) * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='连接预热端到端基准')
+    parser.add_argument('--runs', type=int, default=10, help='每种配置的运行次数')
+    parser.add_argument('--connect-latency', type=float, default=0.15,
+                        help='接口替身每个新连接的延迟（秒），模拟DNS+TCP+TLS握手')
+    parser.add_argument('--latency', type=float, default=0.05, help='接口替身的响应延迟（秒）')
+    parser.add_argument('--no-tls', action='store_true', help='接口替身使用HTTP')
+    parser.add_argument('--webhook', help='使用真实的企业微信Webhook URL代替接口替身')
+    parser.add_argument('--seed', type=int, default=0)
+    main_bench(parser.parse_args())
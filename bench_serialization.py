@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准脚本：使用tracemalloc对比每条消息发送前的内存分配
+- 旧路径：json.dumps(ensure_ascii=True) 生成日志摘要 + requests 的 json=message 再次序列化
+- 新路径：消息体只编码一次，以memoryview交给requests，日志只解码前100字节切片
+不发起网络请求，只统计请求体准备阶段（requests.Request.prepare）的分配
+"""
+
+import json
+import sys
+import tracemalloc
+
+import requests
+
+import main
+from render_cache import body_preview, encode_message
+
+WEBHOOK_URL = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=bench"
+
+
+def build_message(size):
+    """
+    构造指定内容长度的Markdown消息
+    """
+    return {
+        'msgtype': 'markdown',
+        'markdown': {
+            'content': '## 📢 GitHub 代码推送通知\n' + ('**提交信息**: 修复了一个问题 fix\n' * (size // 30 + 1))[:size]
+        }
+    }
+
+
+def legacy_path(message):
+    preview = json.dumps(message, ensure_ascii=True)[:100]
+    request = requests.Request('POST', WEBHOOK_URL, json=message).prepare()
+    return preview, request
+
+
+def preencoded_path(message, body=None):
+    if body is None:
+        body = encode_message(message)
+    payload = memoryview(body)
+    preview = body_preview(payload)
+    request = requests.Request('POST', WEBHOOK_URL, data=payload, headers=main.JSON_HEADERS).prepare()
+    return preview, request
+
+
+def measure(func, message, iterations, **kwargs):
+    """
+    统计 iterations 次调用的平均峰值内存（相对调用前）和平均新增分配块数
+    """
+    func(message, **kwargs)
+    tracemalloc.start()
+    peak_total = 0
+    blocks_total = 0
+    for _ in range(iterations):
+        before = tracemalloc.take_snapshot()
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = func(message, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        peak_total += peak - baseline
+        blocks_total += sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+        del result
+    tracemalloc.stop()
+    return peak_total / iterations, blocks_total / iterations
+
+
+def main_bench(iterations=50):
+    print('每条消息的峰值内存（字节）/ 新增分配块数')
+    print(f"{'内容长度':>10} {'旧路径':>16} {'新路径':>16} {'预编码复用':>16}")
+    for size in (200, 2000, 20000):
+        message = build_message(size)
+        body = encode_message(message)
+        legacy = measure(legacy_path, message, iterations)
+        fresh = measure(preencoded_path, message, iterations)
+        reused = measure(preencoded_path, message, iterations, body=body)
+        print(f'{size:>10} {legacy[0]:>9.0f} / {legacy[1]:<4.0f} {fresh[0]:>9.0f} / {fresh[1]:<4.0f} '
+              f'{reused[0]:>9.0f} / {reused[1]:<4.0f}')
+
+
+if __name__ == "__main__":
+    main_bench(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CI失败日志摘录
+从 workflow_run 的日志压缩包或 check_run 对应作业的纯文本日志中提取失败步骤附近的若干行。
+日志可能有几百MB，提取过程内存与耗时均有上限：
+纯文本日志使用内存映射从文件末尾向前查找错误标记；
+压缩包按步骤倒序（最后执行的步骤最可能失败）逐个成员分块解压，只保留有界的行窗口
+"""
+
+import collections
+import mmap
+import os
+import re
+import tempfile
+import time
+import zipfile
+
+import requests
+
+# 按优先级排列的错误标记
+ERROR_MARKERS = (b'##[error]', b'Traceback (most recent call last)', b'FAILED', b'Error:', b'error:', b'ERROR')
+
+# 需要附带日志摘录的结论
+FAILURE_CONCLUSIONS = ('failure', 'timed_out', 'startup_failure')
+
+DEFAULT_CONTEXT_LINES = 15
+DEFAULT_MAX_SCAN_BYTES = 8 * 1024 * 1024
+DEFAULT_TIME_BUDGET = 3.0
+# 下载日志的大小上限
+DEFAULT_MAX_DOWNLOAD_BYTES = 64 * 1024 * 1024
+# 摘录的UTF-8字节上限，渲染时还会按消息剩余空间进一步截断
+EXCERPT_MAX_BYTES = 2048
+
+_CHUNK_SIZE = 64 * 1024
+# 错误标记之后保留的行数
+_LINES_AFTER = 2
+_TIMESTAMP_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?Z ')
+_ANSI_RE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+# 压缩包成员名: <作业>/<序号>_<步骤>.txt 或 <序号>_<作业>.txt
+_MEMBER_RE = re.compile(r'^(?:(?P<job>.+)/)?(?P<index>\d+)_(?P<name>.+)\.txt$')
+
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+
+
+class LogExcerpt:
+    """
+    日志摘录
+    """
+
+    __slots__ = ('source', 'lines', 'truncated')
+
+    def __init__(self, source, lines, truncated=False):
+        # 步骤名称（如 build / Run tests），纯文本日志为文件名
+        self.source = source
+        self.lines = lines
+        # 因扫描上限或时间预算未完整扫描
+        self.truncated = truncated
+
+    @property
+    def text(self):
+        """
+        清理时间戳和ANSI颜色码后的摘录，超长时保留末尾
+        """
+        text = '\n'.join(clean_line(line) for line in self.lines).strip('\n')
+        return truncate_head(text, EXCERPT_MAX_BYTES)
+
+    def __repr__(self):
+        return f'LogExcerpt(source={self.source!r}, lines={len(self.lines)}, truncated={self.truncated})'
+
+
+def truncate_head(text, max_bytes):
+    """
+    按UTF-8字节数截断文本开头，保留末尾
+    :param text: 文本
+    :param max_bytes: 字节上限
+    :return: 不超过上限的文本，截断时以…开头，空间不足时返回空字符串
+    """
+    data = text.encode('utf-8')
+    if len(data) <= max_bytes:
+        return text
+    keep = max_bytes - len('…'.encode('utf-8'))
+    if keep <= 0:
+        return ''
+    # 截断点可能落在多字节字符中间，丢弃残缺的首字符
+    return '…' + data[-keep:].decode('utf-8', errors='ignore')
+
+
+def clean_line(line):
+    """
+    去除行首的GitHub时间戳和ANSI颜色码
+    """
+    return _ANSI_RE.sub('', _TIMESTAMP_RE.sub('', line.rstrip('\r')))
+
+
+def _has_marker(line):
+    return any(marker in line for marker in ERROR_MARKERS)
+
+
+def _excerpt_from_text(path, context_lines, max_scan_bytes, deadline, clock):
+    """
+    内存映射纯文本日志，从末尾向前按块查找最后一个错误标记
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return None
+    source = os.path.basename(path)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        floor = max(0, size - max_scan_bytes)
+        overlap = max(len(marker) for marker in ERROR_MARKERS)
+        end = size
+        position = -1
+        truncated = floor > 0
+        while end > floor:
+            if clock() > deadline:
+                truncated = True
+                break
+            start = max(floor, end - _CHUNK_SIZE)
+            # 与后一块重叠，避免标记跨越块边界
+            window_end = min(size, end + overlap)
+            position = max(mm.rfind(marker, start, window_end) for marker in ERROR_MARKERS)
+            if position >= 0:
+                break
+            end = start
+
+        if position < 0:
+            # 未找到错误标记时退化为日志末尾
+            position = size - 1
+        # 标记所在行之后再保留若干行
+        line_end = position
+        for _ in range(_LINES_AFTER + 1):
+            next_newline = mm.find(b'\n', line_end, size)
+            if next_newline < 0:
+                line_end = size
+                break
+            line_end = next_newline + 1
+        # 向前取 context_lines 行
+        line_start = line_end
+        for _ in range(context_lines + 1):
+            if line_start <= floor:
+                line_start = floor
+                break
+            previous_newline = mm.rfind(b'\n', floor, line_start - 1)
+            if previous_newline < 0:
+                line_start = floor
+                break
+            line_start = previous_newline + 1
+        data = mm[line_start:line_end]
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    return LogExcerpt(source, lines[-context_lines:], truncated)
+
+
+def _member_order(names, failing_names):
+    """
+    成员扫描顺序：优先失败作业，其次步骤文件，同一作业内按步骤序号倒序
+    """
+    failing_names = set(failing_names or ())
+    candidates = []
+    for name in names:
+        match = _MEMBER_RE.match(name)
+        if not match:
+            continue
+        job = match.group('job')
+        owner = job or match.group('name')
+        candidates.append((owner not in failing_names, job is None, owner, -int(match.group('index')), name))
+    candidates.sort()
+    return [(candidate[-1], candidate[2], _MEMBER_RE.match(candidate[-1]).group('name'))
+            for candidate in candidates]
+
+
+def _scan_member(archive, name, context_lines, deadline, clock):
+    """
+    分块解压一个成员，只保留最近 context_lines 行和最后一个错误标记附近的行
+    :return: (是否找到标记, 摘录行, 是否因时间预算中断)
+    """
+    recent = collections.deque(maxlen=context_lines)
+    excerpt = None
+    after = 0
+    pending = b''
+    with archive.open(name) as member:
+        while True:
+            if clock() > deadline:
+                return excerpt is not None, list(excerpt or recent), True
+            chunk = member.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for raw_line in lines:
+                line = raw_line.decode('utf-8', errors='replace')
+                recent.append(line)
+                if _has_marker(raw_line):
+                    excerpt = list(recent)
+                    after = _LINES_AFTER
+                elif after:
+                    excerpt.append(line)
+                    after -= 1
+    if pending:
+        line = pending.decode('utf-8', errors='replace')
+        recent.append(line)
+        if _has_marker(pending):
+            excerpt = list(recent)
+        elif after:
+            excerpt.append(line)
+    if excerpt is not None:
+        return True, excerpt[-(context_lines + _LINES_AFTER):], False
+    return False, list(recent), False
+
+
+def _excerpt_from_archive(path, failing_names, context_lines, deadline, clock):
+    with zipfile.ZipFile(path) as archive:
+        order = _member_order(archive.namelist(), failing_names)
+        fallback = None
+        for name, job, step in order:
+            found, lines, interrupted = _scan_member(archive, name, context_lines, deadline, clock)
+            source = f'{job} / {step}' if job != step else job
+            if found:
+                return LogExcerpt(source, lines, interrupted)
+            if fallback is None and lines:
+                fallback = LogExcerpt(source, lines, interrupted)
+            if interrupted:
+                break
+    return fallback
+
+
+def extract_log_excerpt(path, failing_names=None, context_lines=DEFAULT_CONTEXT_LINES,
+                        max_scan_bytes=DEFAULT_MAX_SCAN_BYTES, time_budget=DEFAULT_TIME_BUDGET, clock=time.monotonic):
+    """
+    从日志文件提取失败附近的摘录
+    :param path: workflow_run 日志压缩包（zip）或作业纯文本日志
+    :param failing_names: 优先扫描的作业名称（如 check_run 名称），可选
+    :param context_lines: 摘录行数
+    :param max_scan_bytes: 纯文本日志从末尾向前扫描的字节上限
+    :param time_budget: 扫描时间预算（秒），超出时返回已有结果
+    :return: LogExcerpt，日志为空或无法读取时返回None
+    """
+    deadline = clock() + time_budget
+    try:
+        if zipfile.is_zipfile(path):
+            return _excerpt_from_archive(path, failing_names, context_lines, deadline, clock)
+        return _excerpt_from_text(path, context_lines, max_scan_bytes, deadline, clock)
+    except (OSError, zipfile.BadZipFile, ValueError) as e:
+        print(f'::warning::[{os.getenv("CURRENT_SESSION_ID", "main")}] 读取CI日志失败: {e}')
+        return None
+
+
+def download_logs(url, token, max_bytes=DEFAULT_MAX_DOWNLOAD_BYTES, timeout=30):
+    """
+    流式下载日志到临时文件，超过大小上限时放弃
+    :param url: 日志地址（workflow_run.logs_url 或作业日志接口）
+    :param token: GitHub Token
+    :return: 临时文件路径，调用方负责删除；失败时返回None
+    """
+    headers = {'Authorization': f'Bearer {token}', 'Accept': 'application/vnd.github+json'}
+    fd, path = tempfile.mkstemp(prefix='ci-log-')
+    try:
+        with os.fdopen(fd, 'wb') as f, requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            written = 0
+            for chunk in response.iter_content(_CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise ValueError(f'日志超过 {max_bytes} 字节上限')
+                f.write(chunk)
+        return path
+    except (requests.exceptions.RequestException, ValueError, OSError) as e:
+        print(f'::warning::[{os.getenv("CURRENT_SESSION_ID", "main")}] 下载CI日志失败: {e}')
+        os.unlink(path)
+        return None
+
+
+def is_failure(event_name, event_data):
+    """
+    判断 workflow_run / check_run 事件是否为已完成的失败运行
+    """
+    run = event_data.get(event_name) or {}
+    return event_data.get('action') == 'completed' and run.get('conclusion') in FAILURE_CONCLUSIONS
+
+
+def log_url(event_name, event_data):
+    """
+    推导日志下载地址：workflow_run 为整次运行的压缩包，check_run 为对应作业的纯文本日志
+    """
+    if event_name == 'workflow_run':
+        return (event_data.get('workflow_run') or {}).get('logs_url')
+    if event_name == 'check_run':
+        check_run = event_data.get('check_run') or {}
+        repo = (event_data.get('repository') or {}).get('full_name')
+        # GitHub Actions 创建的检查运行ID即作业ID
+        if repo and check_run.get('id') and (check_run.get('app') or {}).get('slug') == 'github-actions':
+            return f'{GITHUB_API_URL}/repos/{repo}/actions/jobs/{check_run["id"]}/logs'
+    return None
+
+
+def failure_excerpt(event_name, event_data, log_path=None, token=None, **options):
+    """
+    为失败的CI事件获取日志摘录：优先使用本地日志文件，其次使用Token下载
+    :param event_name: workflow_run 或 check_run
+    :param event_data: GitHub事件数据
+    :param log_path: 本地日志压缩包或文本文件，可选
+    :param token: GitHub Token，可选
+    :param options: 传给 extract_log_excerpt 的其他参数
+    :return: LogExcerpt 或 None
+    """
+    if not is_failure(event_name, event_data):
+        return None
+    failing_names = None
+    if event_name == 'check_run':
+        failing_names = [(event_data.get('check_run') or {}).get('name')]
+    if log_path:
+        return extract_log_excerpt(log_path, failing_names, **options)
+    url = log_url(event_name, event_data)
+    if not (token and url):
+        return None
+    path = download_logs(url, token)
+    if not path:
+        return None
+    try:
+        return extract_log_excerpt(path, failing_names, **options)
+    finally:
+        os.unlink(path)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+企业微信Webhook熔断器
+为每个目标机器人维护独立的 closed / open / half_open 状态，
+当机器人Key失效或持续失败时快速失败，避免每个事件都耗尽请求超时时间
+只有传输错误、HTTP 5xx、服务繁忙和Key失效计为失败，消息内容错误和限频不会触发熔断
+"""
+
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+# 熔断器状态
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# 默认配置
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RECOVERY_TIMEOUT = 60.0
+DEFAULT_HALF_OPEN_MAX_CALLS = 1
+
+# 表示机器人Key本身不可用的企业微信错误码，出现后立即熔断
+# 93000: invalid webhook url，93004: 机器人被停用，93008: 不在群中
+FATAL_ERRCODES = {93000, 93004, 93008}
+# 表示企业微信服务暂时不可用的错误码，与HTTP 5xx一样计为失败
+# -1: 系统繁忙
+UNAVAILABLE_ERRCODES = {-1}
+
+
+class CircuitBreaker:
+    """
+    单个Webhook目标的熔断器
+    - closed: 正常放行，连续失败达到阈值后进入 open
+    - open: 直接拒绝，经过 recovery_timeout 秒后进入 half_open
+    - half_open: 放行少量探测请求，成功则恢复 closed，失败则重新 open
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 recovery_timeout=DEFAULT_RECOVERY_TIMEOUT,
+                 half_open_max_calls=DEFAULT_HALF_OPEN_MAX_CALLS,
+                 clock=time.monotonic):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.recovery_timeout = float(recovery_timeout)
+        self.half_open_max_calls = max(1, int(half_open_max_calls))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.last_error = None
+
+    @property
+    def state(self):
+        """
+        当前状态（open 状态超过恢复时间后视为 half_open）
+        """
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        if self._state == STATE_OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._state = STATE_HALF_OPEN
+            self._half_open_calls = 0
+
+    def allow_request(self):
+        """
+        判断是否允许发送请求
+        :return: True表示放行，False表示熔断中应快速失败
+        """
+        with self._lock:
+            self._refresh_state()
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            return False
+
+    def retry_after(self):
+        """
+        距离下一次允许探测的剩余秒数
+        """
+        with self._lock:
+            if self._state != STATE_OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (self._clock() - self._opened_at))
+
+    def record_success(self):
+        """
+        记录一次成功，重置失败计数并关闭熔断器
+        """
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+            self.last_error = None
+
+    def record_response(self, error=None, errcode=None, status_code=None):
+        """
+        记录一次收到响应但发送失败的结果
+        服务不可用或机器人Key失效计为失败；消息内容错误、单个机器人限频（45009）等说明机器人可达，
+        按成功处理，避免几条格式错误的消息熔断正常的机器人
+        :param error: 失败原因描述
+        :param errcode: 企业微信返回的错误码
+        :param status_code: HTTP状态码
+        """
+        if is_endpoint_failure(errcode, status_code):
+            self.record_failure(error, errcode)
+        else:
+            self.record_success()
+
+    def record_failure(self, error=None, errcode=None):
+        """
+        记录一次失败
+        :param error: 失败原因描述
+        :param errcode: 企业微信返回的错误码，致命错误码会立即熔断
+        """
+        with self._lock:
+            self.last_error = error
+            self._failures += 1
+            if (self._state == STATE_HALF_OPEN
+                    or errcode in FATAL_ERRCODES
+                    or self._failures >= self.failure_threshold):
+                self._state = STATE_OPEN
+                self._opened_at = self._clock()
+                self._half_open_calls = 0
+
+
+def is_endpoint_failure(errcode=None, status_code=None):
+    """
+    判断企业微信的响应是否说明机器人或服务不可用（计入熔断失败）
+    :param errcode: 企业微信返回的错误码
+    :param status_code: HTTP状态码
+    :return: HTTP 5xx、服务繁忙或机器人Key失效时返回True
+    """
+    if status_code is not None and status_code >= 500:
+        return True
+    return errcode in FATAL_ERRCODES or errcode in UNAVAILABLE_ERRCODES
+
+
+def webhook_key(webhook_url):
+    """
+    提取用于区分机器人的标识（优先使用URL中的key参数，避免其他参数影响）
+    """
+    parsed = urlparse(webhook_url)
+    key = parse_qs(parsed.query).get('key')
+    if key:
+        return f'{parsed.netloc}:{key[0]}'
+    return webhook_url
+
+
+_breakers = {}
+_registry_lock = threading.Lock()
+_breaker_config = {
+    'failure_threshold': DEFAULT_FAILURE_THRESHOLD,
+    'recovery_timeout': DEFAULT_RECOVERY_TIMEOUT,
+    'half_open_max_calls': DEFAULT_HALF_OPEN_MAX_CALLS,
+}
+
+
+def configure_breakers(failure_threshold=None, recovery_timeout=None, half_open_max_calls=None):
+    """
+    设置新建熔断器的默认配置（已创建的熔断器同步更新）
+    """
+    with _registry_lock:
+        if failure_threshold is not None:
+            _breaker_config['failure_threshold'] = max(1, int(failure_threshold))
+        if recovery_timeout is not None:
+            _breaker_config['recovery_timeout'] = float(recovery_timeout)
+        if half_open_max_calls is not None:
+            _breaker_config['half_open_max_calls'] = max(1, int(half_open_max_calls))
+        for breaker in _breakers.values():
+            breaker.failure_threshold = _breaker_config['failure_threshold']
+            breaker.recovery_timeout = _breaker_config['recovery_timeout']
+            breaker.half_open_max_calls = _breaker_config['half_open_max_calls']
+
+
+def get_breaker(webhook_url):
+    """
+    获取目标Webhook对应的熔断器，不存在时按当前配置创建
+    """
+    key = webhook_key(webhook_url)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(**_breaker_config)
+                _breakers[key] = breaker
+    return breaker
+
+
+def reset_breakers():
+    """
+    清空所有熔断器状态
+    """
+    with _registry_lock:
+        _breakers.clear()
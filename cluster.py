@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+中继集群：成员列表与一致性哈希
+单个中继节点既是单点故障又是吞吐上限；但企业微信的配额按机器人计算，简单的负载均衡会让多个节点
+各自认为拥有同一个机器人每分钟20条的配额。集群模式下:
+- 所有节点配置相同的成员列表（节点的基础URL），各自定期探测其他节点的 /healthz
+- 机器人（以Key的哈希标识）按一致性哈希分配给存活节点，每个机器人的队列和限速器只在一个节点上
+- 任一节点接收的事件转发给各机器人的所属节点；节点故障或排空时从哈希环中移除，只有它的机器人迁移到其他节点
+存活视图由各节点自己的探测决定，不经过共识：视图不一致的节点收到转发时再转发一次给自己视图中的所属节点；
+某个节点把仍在运行的所属节点标记为下线时（网络分区），两者会在探测恢复前各自为同一机器人限速发送
+"""
+
+import bisect
+import hashlib
+import threading
+
+import requests
+
+DEFAULT_VIRTUAL_NODES = 64
+DEFAULT_PROBE_INTERVAL = 2.0
+DEFAULT_PROBE_TIMEOUT = 1.0
+
+
+def normalize_node(url):
+    return url.strip().rstrip('/')
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.sha256(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    带虚拟节点的一致性哈希环
+    """
+
+    def __init__(self, nodes, virtual_nodes=DEFAULT_VIRTUAL_NODES):
+        """
+        :param nodes: 节点标识列表
+        :param virtual_nodes: 每个节点在环上的点数，越多分布越均匀
+        """
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f'{node}#{index}'), node) for node in self.nodes for index in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key):
+        """
+        :return: 顺时针方向第一个节点，环为空时返回None
+        """
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class Membership:
+    """
+    静态成员列表加健康探测
+    所有节点初始视为存活；转发失败或探测失败（包括正在排空返回503）时标记为下线，探测成功后恢复。
+    本节点始终在自己的视图中存活，排空时由其他节点把它移出哈希环
+    """
+
+    def __init__(self, self_url, nodes, virtual_nodes=DEFAULT_VIRTUAL_NODES, probe_interval=DEFAULT_PROBE_INTERVAL,
+                 probe_timeout=DEFAULT_PROBE_TIMEOUT, session=None):
+        """
+        :param self_url: 本节点的基础URL（其他节点访问本节点使用的地址）
+        :param nodes: 所有节点的基础URL列表，或逗号/换行分隔的字符串；可以不包含本节点
+        :param virtual_nodes: 每个节点的虚拟节点数
+        :param probe_interval: 探测间隔（秒）
+        :param probe_timeout: 探测超时（秒）
+        :param session: requests.Session，可选
+        """
+        if isinstance(nodes, str):
+            nodes = nodes.replace('\n', ',').split(',')
+        self.self_url = normalize_node(self_url)
+        self.nodes = sorted({normalize_node(node) for node in nodes if node.strip()} | {self.self_url})
+        self.virtual_nodes = virtual_nodes
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._session = session or requests.Session()
+        self._alive = {node: True for node in self.nodes}
+        self._lock = threading.Lock()
+        self._ring = HashRing(self.nodes, virtual_nodes)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def peers(self):
+        return [node for node in self.nodes if node != self.self_url]
+
+    def live_nodes(self):
+        with self._lock:
+            return [node for node in self.nodes if self._alive[node]]
+
+    def owner(self, key):
+        """
+        :return: 当前视图中 key 的所属节点
+        """
+        with self._lock:
+            return self._ring.owner(key)
+
+    def is_local(self, key):
+        return self.owner(key) == self.self_url
+
+    def _set_alive(self, node, alive):
+        with self._lock:
+            if node == self.self_url or self._alive.get(node) is None or self._alive[node] == alive:
+                return False
+            self._alive[node] = alive
+            self._ring = HashRing([node for node in self.nodes if self._alive[node]], self.virtual_nodes)
+        print(f'::{"info" if alive else "warning"}::[cluster] 节点{"恢复" if alive else "下线"}: {node}')
+        return True
+
+    def mark_down(self, node):
+        """
+        :return: 视图是否发生变化
+        """
+        return self._set_alive(node, False)
+
+    def mark_up(self, node):
+        return self._set_alive(node, True)
+
+    def probe(self):
+        """
+        探测一次所有其他节点
+        """
+        for node in self.peers:
+            try:
+                alive = self._session.get(node + '/healthz', timeout=self.probe_timeout).status_code == 200
+            except requests.RequestException:
+                alive = False
+            self._set_alive(node, alive)
+
+    def _run(self):
+        while not self._stop.wait(self.probe_interval):
+            self.probe()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.probe_timeout + 1)
+        self._session.close()
+
+    def status(self):
+        """
+        :return: 成员视图，供 /cluster 接口输出
+        """
+        with self._lock:
+            return {'self': self.self_url, 'nodes': {node: self._alive[node] for node in self.nodes}}
+
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+投递回执与幂等存储
+以 (投递ID, 目标机器人) 为主键记录发送结果，重跑工作流或超时后重试时
+已成功发送的通知不会重复推送。基于SQLite（WAL模式），多进程/多线程并发安全
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+from circuit_breaker import webhook_key
+
+# 回执状态
+STATUS_PENDING = 'pending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+# 默认配置
+DEFAULT_LEASE_SECONDS = 60.0
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    delivery_id TEXT NOT NULL,
+    target TEXT NOT NULL,
+    status TEXT NOT NULL,
+    detail TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (delivery_id, target)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_receipts_updated_at ON receipts (updated_at);
+"""
+
+
+def target_id(webhook_url):
+    """
+    目标机器人标识，只保存哈希，不在回执中落盘机器人Key
+    """
+    return hashlib.sha256(webhook_key(webhook_url).encode('utf-8')).hexdigest()[:32]
+
+
+class IdempotencyStore:
+    """
+    幂等存储
+    发送前调用 claim() 占用 (投递ID, 目标)，发送后调用 record() 写入结果。
+    已成功的键会缓存在内存集合中，重复查询无需访问数据库
+    """
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, clock=time.time):
+        self.path = path
+        self.lease_seconds = float(lease_seconds)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sent = set()
+        # isolation_level=None 以便手动控制 BEGIN IMMEDIATE 事务
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, delivery_id, webhook_url):
+        """
+        查询回执
+        :return: 回执字典，不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status, detail, attempts, created_at, updated_at FROM receipts '
+                'WHERE delivery_id = ? AND target = ?',
+                (delivery_id, target_id(webhook_url))
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'delivery_id': delivery_id,
+            'status': row[0],
+            'detail': row[1],
+            'attempts': row[2],
+            'created_at': row[3],
+            'updated_at': row[4],
+        }
+
+    def is_delivered(self, delivery_id, webhook_url):
+        """
+        判断该投递是否已成功发送到目标
+        """
+        key = (delivery_id, target_id(webhook_url))
+        if key in self._sent:
+            return True
+        receipt = self.get(delivery_id, webhook_url)
+        if receipt and receipt['status'] == STATUS_SENT:
+            self._sent.add(key)
+            return True
+        return False
+
+    def claim(self, delivery_id, webhook_url):
+        """
+        占用一次发送机会
+        已发送成功、或其他worker正在发送（租约未过期）时返回False；
+        首次发送、上次失败、或上次发送中断（租约过期）时返回True
+        """
+        target = target_id(webhook_url)
+        if (delivery_id, target) in self._sent:
+            return False
+        now = self._clock()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT status, updated_at FROM receipts WHERE delivery_id = ? AND target = ?',
+                    (delivery_id, target)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        'INSERT INTO receipts (delivery_id, target, status, attempts, created_at, updated_at) '
+                        'VALUES (?, ?, ?, 1, ?, ?)',
+                        (delivery_id, target, STATUS_PENDING, now, now)
+                    )
+                    claimed = True
+                elif row[0] == STATUS_SENT:
+                    self._sent.add((delivery_id, target))
+                    claimed = False
+                elif row[0] == STATUS_PENDING and now - row[1] < self.lease_seconds:
+                    claimed = False
+                else:
+                    self._conn.execute(
+                        'UPDATE receipts SET status = ?, attempts = attempts + 1, updated_at = ? '
+                        'WHERE delivery_id = ? AND target = ?',
+                        (STATUS_PENDING, now, delivery_id, target)
+                    )
+                    claimed = True
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return claimed
+
+    def record(self, delivery_id, webhook_url, success, detail=None):
+        """
+        写入发送结果
+        :param success: 是否发送成功
+        :param detail: 结果描述（错误原因、错误码等）
+        """
+        target = target_id(webhook_url)
+        now = self._clock()
+        status = STATUS_SENT if success else STATUS_FAILED
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO receipts (delivery_id, target, status, detail, attempts, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, 1, ?, ?) '
+                'ON CONFLICT (delivery_id, target) DO UPDATE SET '
+                'status = excluded.status, detail = excluded.detail, updated_at = excluded.updated_at',
+                (delivery_id, target, status, detail, now, now)
+            )
+        if success:
+            self._sent.add((delivery_id, target))
+
+    def expire(self, ttl_seconds=DEFAULT_TTL_SECONDS, vacuum=False):
+        """
+        删除超过保留期的回执
+        :param ttl_seconds: 保留秒数
+        :param vacuum: 是否同时压缩数据库文件
+        :return: 删除的条数
+        """
+        cutoff = self._clock() - ttl_seconds
+        with self._lock:
+            deleted = self._conn.execute('DELETE FROM receipts WHERE updated_at < ?', (cutoff,)).rowcount
+            if vacuum:
+                self._conn.execute('VACUUM')
+        self._sent.clear()
+        return deleted
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每日/每周动态摘要
+事件发生时只写入本地SQLite存储，由定时任务按周期汇总，
+为每个仓库生成一张推送、PR创建/合并、Issue和Release的统计卡片
+用法: python digest.py --db digest.db --period daily --webhook <URL>
+"""
+
+import argparse
+import sqlite3
+import time
+
+from event_record import NotificationEvent
+
+# 汇总周期（秒）
+PERIODS = {
+    'daily': 24 * 3600,
+    'weekly': 7 * 24 * 3600,
+}
+
+# 事件分类，写入时预先计算，汇总时可直接走覆盖索引
+KIND_PUSH = 'push'
+KIND_PR_OPENED = 'pr_opened'
+KIND_PR_MERGED = 'pr_merged'
+KIND_PR_CLOSED = 'pr_closed'
+KIND_ISSUE_OPENED = 'issue_opened'
+KIND_ISSUE_CLOSED = 'issue_closed'
+KIND_RELEASE = 'release'
+KIND_OTHER = 'other'
+
+# 每个仓库卡片中列出的最近条目数
+MAX_HIGHLIGHTS = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    repo TEXT NOT NULL,
+    repo_url TEXT,
+    kind TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    action TEXT,
+    actor TEXT,
+    title TEXT,
+    url TEXT,
+    number INTEGER,
+    commit_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts_repo_kind ON events (ts, repo, kind, commit_count);
+CREATE INDEX IF NOT EXISTS idx_events_repo_ts ON events (repo, ts);
+CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events (event_type, ts);
+"""
+
+_KIND_LABELS = (
+    (KIND_PUSH, '代码推送'),
+    (KIND_PR_OPENED, '新建PR'),
+    (KIND_PR_MERGED, '合并PR'),
+    (KIND_PR_CLOSED, '关闭PR'),
+    (KIND_ISSUE_OPENED, '新建Issue'),
+    (KIND_ISSUE_CLOSED, '关闭Issue'),
+    (KIND_RELEASE, '发布版本'),
+)
+
+
+def event_kind(event):
+    """
+    根据事件类型和操作确定摘要分类
+    :param event: NotificationEvent
+    """
+    if event.event_name == 'push':
+        return KIND_PUSH
+    if event.event_name == 'pull_request':
+        if event.action == 'opened':
+            return KIND_PR_OPENED
+        if event.action == 'closed':
+            return KIND_PR_MERGED if event.merged else KIND_PR_CLOSED
+    elif event.event_name == 'issues':
+        if event.action == 'opened':
+            return KIND_ISSUE_OPENED
+        if event.action == 'closed':
+            return KIND_ISSUE_CLOSED
+    elif event.event_name == 'release' and event.action in ('published', 'released'):
+        return KIND_RELEASE
+    return KIND_OTHER
+
+
+class DigestStore:
+    """
+    摘要事件存储
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def record(self, event):
+        """
+        写入一个事件
+        :param event: NotificationEvent
+        """
+        self.record_many([event])
+
+    def record_many(self, events):
+        """
+        批量写入事件（单个事务）
+        :param events: NotificationEvent 可迭代对象
+        """
+        rows = []
+        for event in events:
+            title = event.title or event.tag_name
+            if event.event_name == 'push':
+                title = event.commit_message
+            rows.append((
+                event.received_at or time.time(),
+                event.repo_full_name or '',
+                event.repo_html_url,
+                event_kind(event),
+                event.event_name,
+                event.action,
+                event.author if event.event_name == 'push' else event.sender,
+                title,
+                event.html_url or event.compare_url,
+                event.number,
+                event.commit_count or 0,
+            ))
+        with self._conn:
+            self._conn.executemany(
+                'INSERT INTO events (ts, repo, repo_url, kind, event_type, action, actor, title, url, number, '
+                'commit_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        return len(rows)
+
+    def summarize(self, since, until):
+        """
+        汇总时间段内各仓库各分类的事件数
+        :return: {仓库: {'counts': {分类: 数量}, 'commits': 提交总数}}
+        """
+        summary = {}
+        rows = self._conn.execute(
+            'SELECT repo, kind, COUNT(*), SUM(commit_count) FROM events '
+            'WHERE ts >= ? AND ts < ? GROUP BY repo, kind',
+            (since, until)
+        )
+        for repo, kind, count, commits in rows:
+            entry = summary.setdefault(repo, {'counts': {}, 'commits': 0})
+            entry['counts'][kind] = count
+            if kind == KIND_PUSH:
+                entry['commits'] = commits or 0
+        return summary
+
+    def highlights(self, repo, since, until, limit=MAX_HIGHLIGHTS):
+        """
+        仓库在时间段内最近的PR合并、Issue和Release条目
+        """
+        return self._conn.execute(
+            'SELECT kind, title, url, number, actor FROM events '
+            'WHERE repo = ? AND ts >= ? AND ts < ? AND kind IN (?, ?, ?, ?) '
+            'ORDER BY ts DESC LIMIT ?',
+            (repo, since, until, KIND_PR_MERGED, KIND_PR_OPENED, KIND_ISSUE_OPENED, KIND_RELEASE, limit)
+        ).fetchall()
+
+    def repo_url(self, repo):
+        row = self._conn.execute(
+            'SELECT repo_url FROM events WHERE repo = ? ORDER BY ts DESC LIMIT 1', (repo,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def purge(self, before):
+        """
+        删除指定时间之前的事件
+        :return: 删除的条数
+        """
+        with self._conn:
+            return self._conn.execute('DELETE FROM events WHERE ts < ?', (before,)).rowcount
+
+
+def digest_window(period='daily', now=None):
+    """
+    计算摘要周期的时间窗口
+    :param period: 'daily' 或 'weekly'
+    :param now: 周期结束时间戳，缺省为当前时间
+    :return: (开始时间戳, 结束时间戳)
+    """
+    until = time.time() if now is None else now
+    return until - PERIODS[period], until
+
+
+def generate_digest_messages(store, period='daily', now=None):
+    """
+    生成各仓库的摘要卡片
+    :param store: DigestStore
+    :param period: 'daily' 或 'weekly'
+    :param now: 周期结束时间戳，缺省为当前时间
+    :return: 企业微信通知消息列表（每个仓库一条）
+    """
+    since, until = digest_window(period, now)
+    title = '今日' if period == 'daily' else '本周'
+    start_text = time.strftime('%Y-%m-%d %H:%M', time.localtime(since))
+    end_text = time.strftime('%Y-%m-%d %H:%M', time.localtime(until))
+
+    messages = []
+    for repo, entry in sorted(store.summarize(since, until).items()):
+        counts = entry['counts']
+        repo_url = store.repo_url(repo)
+        repo_text = f'[{repo}]({repo_url})' if repo_url else repo
+        lines = [
+            f'## 📊 GitHub {title}动态摘要',
+            '',
+            f'**仓库**: {repo_text}',
+            f'**时间**: {start_text} ~ {end_text}',
+        ]
+        for kind, label in _KIND_LABELS:
+            if counts.get(kind):
+                suffix = f'（{entry["commits"]} 个提交）' if kind == KIND_PUSH else ''
+                lines.append(f'**{label}**: {counts[kind]} 次{suffix}')
+
+        highlights = store.highlights(repo, since, until)
+        if highlights:
+            lines.extend(['', '**最近动态**:'])
+            for kind, item_title, url, number, actor in highlights:
+                label = dict(_KIND_LABELS).get(kind, kind)
+                number_text = f' #{number}' if number else ''
+                lines.append(f'- {label}{number_text}: [{item_title}]({url}) - {actor}')
+
+        messages.append({
+            'msgtype': 'markdown',
+            'markdown': {
+                'content': '\n'.join(lines)
+            }
+        })
+    return messages
+
+
+def record_payload(store, event_name, payload, delivery_id=None):
+    """
+    从GitHub事件数据提取字段并写入摘要存储
+    """
+    store.record(NotificationEvent.from_payload(event_name, payload, delivery_id=delivery_id))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='发送GitHub动态摘要到企业微信')
+    parser.add_argument('--db', required=True, help='摘要存储SQLite文件路径')
+    parser.add_argument('--period', choices=sorted(PERIODS), default='daily')
+    parser.add_argument('--webhook', required=True, help='企业微信机器人Webhook URL，多个用逗号分隔')
+    parser.add_argument('--profile', metavar='DIR', help='输出剖析结果到指定目录')
+    args = parser.parse_args()
+
+    import main
+    import profiling
+
+    if args.profile:
+        profiling.configure(args.profile)
+    since, until = digest_window(args.period)
+    with profiling.profile('digest'), DigestStore(args.db) as digest_store:
+        with profiling.stage('summarize'):
+            digest_messages = generate_digest_messages(digest_store, args.period, now=until)
+        succeeded = 0
+        with profiling.stage('deliver'):
+            for digest_message in digest_messages:
+                for target_url in main.parse_webhook_urls(args.webhook):
+                    succeeded += main.send_wechat_message(target_url, digest_message)
+        # 早于本次摘要窗口的事件不会再出现在后续摘要中
+        purged = digest_store.purge(since)
+    print(f'摘要卡片: {len(digest_messages)} 张，成功发送: {succeeded} 次，清理过期事件: {purged} 条')
+    for profile_path in profiling.shutdown():
+        print(f'剖析结果已写入: {profile_path}')
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+事件过滤表达式
+在渲染和发送之前按事件名称和事件字段过滤，例如:
+
+    event == "pull_request" && pull_request.base.ref == "main" && action in ["opened", "closed"]
+
+语法:
+- 字段路径: action、pull_request.base.ref、commits[0].message；event 表示事件名称；不存在的字段为 null
+- 字面量: "字符串"、'字符串'、数字、true、false、null、[列表]
+- 比较: == != < <= > >= in、not in、=~（正则匹配）；单独的字段按真值判断
+- 逻辑: && || ! 与括号
+
+表达式只编译一次，得到嵌套的闭包。编译时推导出表达式允许的事件名称集合，
+名称不满足时无需打开事件文件；安装了 ijson 时字段只从事件文件中流式读取所需的部分，
+被过滤的大事件（如包含数千次提交的push）几乎没有开销
+"""
+
+import json
+import operator
+import re
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+EVENT_NAME = 'event'
+
+_TOKEN_RE = re.compile(r'''
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op>==|!=|<=|>=|=~|&&|\|\||[<>!()\[\],.])
+      | (?P<name>[A-Za-z_][A-Za-z0-9_\-]*)
+    )''', re.VERBOSE)
+
+_COMPARISONS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+_KEYWORDS = {'true': True, 'false': False, 'null': None}
+_MISSING = object()
+
+
+class FilterSyntaxError(ValueError):
+    """
+    过滤表达式语法错误
+    """
+
+    def __init__(self, message, expression, position):
+        super().__init__(f'{message}（位置 {position}）: {expression}')
+        self.position = position
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN_RE.match(expression, position)
+        if not match or match.end() == position:
+            raise FilterSyntaxError('无法识别的字符', expression, position)
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'number':
+            value = float(value) if '.' in value else int(value)
+        elif kind == 'string':
+            value = json.loads(value) if value[0] == '"' else value[1:-1].replace("\\'", "'")
+        tokens.append((kind, value, match.start(kind)))
+        position = match.end()
+    tokens.append(('end', None, len(expression)))
+    return tokens
+
+
+def _get_path(payload, path):
+    value = payload
+    for key in path:
+        if isinstance(key, int):
+            if not isinstance(value, list) or not -len(value) <= key < len(value):
+                return None
+            value = value[key]
+        else:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key, _MISSING)
+            if value is _MISSING:
+                return None
+    return value
+
+
+def _safe_compare(compare):
+    def apply(left, right):
+        try:
+            return compare(left, right)
+        except TypeError:
+            # null 或类型不同的有序比较为假
+            return False
+    return apply
+
+
+class _Parser:
+    """
+    递归下降解析，直接生成闭包 fn(event_name, payload)，同时记录字段路径和事件名称约束
+    每个节点返回 (闭包, 允许的事件名称集合或None)
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.index = 0
+        self.paths = set()
+
+    def peek(self, offset=0):
+        return self.tokens[self.index + offset]
+
+    def take(self, value=None):
+        token = self.tokens[self.index]
+        if value is not None and token[1] != value:
+            raise FilterSyntaxError(f'期望 {value!r}', self.expression, token[2])
+        self.index += 1
+        return token
+
+    def at(self, kind, value=None):
+        token = self.tokens[self.index]
+        return token[0] == kind and (value is None or token[1] == value)
+
+    def parse(self):
+        node = self.parse_or()
+        if not self.at('end'):
+            raise FilterSyntaxError('表达式在此处多余', self.expression, self.peek()[2])
+        return node
+
+    def parse_or(self):
+        fn, names = self.parse_and()
+        while self.at('op', '||'):
+            self.take()
+            right, right_names = self.parse_and()
+            fn = (lambda a, b: lambda event_name, payload: a(event_name, payload) or b(event_name, payload))(fn, right)
+            names = None if names is None or right_names is None else names | right_names
+        return fn, names
+
+    def parse_and(self):
+        fn, names = self.parse_not()
+        while self.at('op', '&&'):
+            self.take()
+            right, right_names = self.parse_not()
+            fn = (lambda a, b: lambda event_name, payload: a(event_name, payload) and b(event_name, payload))(fn, right)
+            if names is None:
+                names = right_names
+            elif right_names is not None:
+                names = names & right_names
+        return fn, names
+
+    def parse_not(self):
+        if self.at('op', '!'):
+            self.take()
+            inner, _ = self.parse_not()
+            return (lambda event_name, payload: not inner(event_name, payload)), None
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left, left_const, left_is_event, left_names = self.parse_operand()
+        token = self.peek()
+        if token[0] == 'op' and token[1] in _COMPARISONS:
+            self.take()
+            right, right_const, right_is_event, _ = self.parse_operand()
+            compare = _safe_compare(_COMPARISONS[token[1]])
+            names = None
+            if token[1] == '==' and left_is_event and right_const is not _MISSING:
+                names = frozenset([right_const])
+            elif token[1] == '==' and right_is_event and left_const is not _MISSING:
+                names = frozenset([left_const])
+            return (lambda event_name, payload: compare(left(event_name, payload), right(event_name, payload))), names
+        if token[0] == 'op' and token[1] == '=~':
+            self.take()
+            _, pattern, _, _ = self.parse_operand()
+            if not isinstance(pattern, str):
+                raise FilterSyntaxError('=~ 右侧必须是字符串字面量', self.expression, token[2])
+            regex = re.compile(pattern)
+            return (lambda event_name, payload: isinstance(left(event_name, payload), str)
+                    and regex.search(left(event_name, payload)) is not None), None
+        negate = False
+        if token[0] == 'name' and token[1] == 'not' and self.peek(1)[:2] == ('name', 'in'):
+            self.take()
+            negate = True
+            token = self.peek()
+        if token[0] == 'name' and token[1] == 'in':
+            self.take()
+            right, right_const, _, _ = self.parse_operand()
+            if right_const is not _MISSING:
+                # 字面量列表预先转换为集合（元素均可哈希时）
+                try:
+                    members = frozenset(right_const)
+                except TypeError:
+                    members = right_const
+                contains = lambda event_name, payload: _contains(members, left(event_name, payload))
+            else:
+                contains = lambda event_name, payload: _contains(right(event_name, payload), left(event_name, payload))
+            if negate:
+                return (lambda event_name, payload: not contains(event_name, payload)), None
+            names = frozenset(right_const) if left_is_event and isinstance(right_const, list) else None
+            return contains, names
+        if negate:
+            raise FilterSyntaxError('not 后需要 in', self.expression, token[2])
+        # 单独的括号表达式保留其中推断出的事件名称
+        return (lambda event_name, payload: bool(left(event_name, payload))), left_names
+
+    def parse_operand(self):
+        """
+        :return: (闭包, 常量值或_MISSING, 是否为事件名称, 括号表达式允许的事件名称或None)
+        """
+        kind, value, position = self.take()
+        if kind in ('number', 'string'):
+            return (lambda event_name, payload: value), value, False, None
+        if kind == 'op' and value == '(':
+            fn, names = self.parse_or()
+            self.take(')')
+            return fn, _MISSING, False, names
+        if kind == 'op' and value == '[':
+            items = []
+            while not self.at('op', ']'):
+                _, item, _, _ = self.parse_operand()
+                if item is _MISSING:
+                    raise FilterSyntaxError('列表只能包含字面量', self.expression, self.peek()[2])
+                items.append(item)
+                if not self.at('op', ']'):
+                    self.take(',')
+            self.take(']')
+            return (lambda event_name, payload: items), items, False, None
+        if kind == 'name' and value in _KEYWORDS:
+            constant = _KEYWORDS[value]
+            return (lambda event_name, payload: constant), constant, False, None
+        if kind == 'name':
+            if value == EVENT_NAME and not self.at('op', '.') and not self.at('op', '['):
+                return (lambda event_name, payload: event_name), _MISSING, True, None
+            path = [value]
+            while self.at('op', '.') or self.at('op', '['):
+                if self.take()[1] == '.':
+                    path.append(self.take_name())
+                else:
+                    index = self.take()
+                    if index[0] != 'number' or not isinstance(index[1], int):
+                        raise FilterSyntaxError('下标必须是整数', self.expression, index[2])
+                    path.append(index[1])
+                    self.take(']')
+            path = tuple(path)
+            self.paths.add(path)
+            return (lambda event_name, payload: _get_path(payload, path)), _MISSING, False, None
+        raise FilterSyntaxError('期望字段、字面量或括号', self.expression, position)
+
+    def take_name(self):
+        kind, value, position = self.take()
+        if kind != 'name':
+            raise FilterSyntaxError('期望字段名', self.expression, position)
+        return value
+
+
+def _contains(container, item):
+    try:
+        return item in container
+    except TypeError:
+        return False
+
+
+class EventFilter:
+    """
+    编译后的过滤表达式
+    """
+
+    def __init__(self, expression):
+        """
+        :param expression: 过滤表达式
+        :raises FilterSyntaxError: 语法错误
+        """
+        self.expression = expression
+        parser = _Parser(expression)
+        self._fn, names = parser.parse()
+        # 表达式允许的事件名称，None 表示不限制
+        self.event_names = names
+        # 表达式引用的事件字段路径
+        self.paths = frozenset(parser.paths)
+
+    def __repr__(self):
+        return f'EventFilter({self.expression!r})'
+
+    def accepts_event(self, event_name):
+        """
+        名称级判断，无需事件数据；返回False时表达式对该事件一定为假
+        """
+        return self.event_names is None or event_name in self.event_names
+
+    def __call__(self, event_name, payload):
+        """
+        :return: 事件是否通过过滤
+        """
+        return self.accepts_event(event_name) and bool(self._fn(event_name, payload))
+
+    def can_stream(self):
+        """
+        是否可以只流式读取所需字段（需要 ijson，且路径不含下标）
+        """
+        return ijson is not None and all(isinstance(key, str) for path in self.paths for key in path)
+
+    def matches_file(self, event_name, fp):
+        """
+        对事件文件求值：可以流式读取时只解析到所需字段全部出现为止，否则完整解析
+        :param fp: 以二进制模式打开的事件文件
+        """
+        if not self.accepts_event(event_name):
+            return False
+        if not self.paths:
+            return bool(self._fn(event_name, {}))
+        if not self.can_stream():
+            return self(event_name, json.load(fp))
+        return bool(self._fn(event_name, stream_fields(fp, self.paths)))
+
+
+def stream_fields(fp, paths):
+    """
+    使用 ijson 流式读取JSON中指定路径的值，全部找到后立即停止
+    :param fp: 以二进制模式打开的文件
+    :param paths: 字段路径元组的集合（只包含字符串键）
+    :return: 只包含这些路径的嵌套字典，缺失的路径不出现
+    """
+    wanted = {'.'.join(path): path for path in paths}
+    found = {}
+    building = None
+    depth = 0
+    for prefix, event, value in ijson.parse(fp, use_float=True):
+        if building is not None:
+            building[1].event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+            if depth == 0:
+                found[building[0]] = building[1].value
+                building = None
+                if len(found) == len(wanted):
+                    break
+            continue
+        if prefix not in wanted or prefix in found or event in ('map_key', 'end_map', 'end_array'):
+            continue
+        if event in ('start_map', 'start_array'):
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            building, depth = (prefix, builder), 1
+            continue
+        found[prefix] = value
+        if len(found) == len(wanted):
+            break
+
+    payload = {}
+    for prefix, value in found.items():
+        target = payload
+        path = wanted[prefix]
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+            if not isinstance(target, dict):
+                break
+        else:
+            target[path[-1]] = value
+    return payload
+
+
+def compile_filter(expression):
+    """
+    编译过滤表达式，空表达式返回None
+    :raises FilterSyntaxError: 语法错误
+    """
+    if not expression or not expression.strip():
+        return None
+    return EventFilter(expression.strip())
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑事件记录
+GitHub事件数据通常有几十到几百KB，而通知只用到其中十几个字段。
+事件入队时一次性提取为 NotificationEvent，队列中只保存该记录，
+落盘时使用紧凑的二进制格式（存在位图 + 变长整数 + UTF-8字符串）
+"""
+
+import hashlib
+import struct
+import time
+
+# 二进制格式标识与版本
+RECORD_MAGIC = b'NE'
+RECORD_VERSION = 5
+
+# 字段类型
+_STR = 's'
+_INT = 'i'
+_BOOL = 'b'
+_FLOAT = 'f'
+
+# 字段顺序即二进制布局，只能在末尾追加并递增 RECORD_VERSION
+FIELD_SPECS = (
+    ('event_name', _STR),
+    ('action', _STR),
+    ('delivery_id', _STR),
+    ('received_at', _FLOAT),
+    ('repo_full_name', _STR),
+    ('repo_html_url', _STR),
+    ('sender', _STR),
+    ('title', _STR),
+    ('html_url', _STR),
+    ('number', _INT),
+    ('state', _STR),
+    ('author', _STR),
+    ('ref', _STR),
+    ('base_ref', _STR),
+    ('merged', _BOOL),
+    ('prerelease', _BOOL),
+    ('tag_name', _STR),
+    ('compare_url', _STR),
+    ('commit_count', _INT),
+    ('commit_message', _STR),
+    ('commit_author', _STR),
+    ('commit_id', _STR),
+    # 版本2: workflow_run / check_run
+    ('conclusion', _STR),
+    ('summary', _STR),
+    ('failed_step', _STR),
+    ('log_excerpt', _STR),
+    # 版本3: 需要提醒的企业微信成员ID，逗号分隔
+    ('mentions', _STR),
+    # 版本4: 推送的文件变更统计
+    ('files_changed', _INT),
+    ('additions', _INT),
+    ('deletions', _INT),
+    # 版本5: GitHub API 补全的评审人（登录名:状态，逗号分隔）、CI状态与Release附件
+    ('reviewers', _STR),
+    ('ci_state', _STR),
+    ('asset_count', _INT),
+    ('asset_size', _INT),
+)
+FIELD_NAMES = tuple(name for name, _ in FIELD_SPECS)
+
+# 只标识投递、不影响通知内容的字段，计算内容指纹时忽略
+DELIVERY_FIELDS = ('delivery_id', 'received_at')
+
+_FLOAT_STRUCT = struct.Struct('<d')
+_LENGTH_STRUCT = struct.Struct('<I')
+
+
+class NotificationEvent:
+    """
+    通知所需字段的紧凑表示，使用 __slots__ 避免每个实例携带 __dict__
+    """
+
+    __slots__ = FIELD_NAMES
+
+    def __init__(self, **fields):
+        for name in FIELD_NAMES:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f'未知字段: {", ".join(sorted(fields))}')
+
+    def __eq__(self, other):
+        if not isinstance(other, NotificationEvent):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELD_NAMES)
+
+    def __repr__(self):
+        return f'NotificationEvent(event_name={self.event_name!r}, repo={self.repo_full_name!r}, ' \
+               f'delivery_id={self.delivery_id!r})'
+
+    @classmethod
+    def from_payload(cls, event_name, payload, delivery_id=None, received_at=None):
+        """
+        从GitHub事件数据中提取通知所需字段（入队时调用一次）
+        :param event_name: GitHub事件名称
+        :param payload: GitHub事件数据
+        :param delivery_id: GitHub投递ID
+        :param received_at: 接收时间戳，缺省为当前时间
+        :return: NotificationEvent
+        """
+        repo = payload.get('repository') or {}
+        sender = payload.get('sender') or {}
+        fields = {
+            'event_name': event_name,
+            'action': payload.get('action'),
+            'delivery_id': delivery_id,
+            'received_at': time.time() if received_at is None else received_at,
+            'repo_full_name': repo.get('full_name'),
+            'repo_html_url': repo.get('html_url'),
+            'sender': sender.get('login'),
+            'mentions': ','.join(payload.get('wecom_mentions') or []) or None,
+        }
+
+        if event_name == 'push':
+            commits = payload.get('commits') or []
+            first_commit = commits[0] if commits else {}
+            message_lines = (first_commit.get('message') or '').splitlines()
+            # commits 最多包含20条，提交数优先使用补全统计，其次为 size
+            push_stats = payload.get('push_stats') or {}
+            commit_count = push_stats.get('commits')
+            if commit_count is None:
+                commit_count = payload.get('size', len(commits))
+            fields.update({
+                'author': (payload.get('pusher') or {}).get('name'),
+                'ref': payload.get('ref'),
+                'compare_url': payload.get('compare'),
+                'commit_count': commit_count,
+                'files_changed': push_stats.get('files'),
+                'additions': push_stats.get('additions'),
+                'deletions': push_stats.get('deletions'),
+                'commit_message': message_lines[0] if message_lines else '',
+                'commit_author': (first_commit.get('committer') or {}).get('name'),
+                'commit_id': first_commit.get('id'),
+            })
+        elif event_name in ('pull_request', 'issues'):
+            item = payload.get(event_name if event_name == 'pull_request' else 'issue') or {}
+            details = payload.get('github_details') or {}
+            fields.update({
+                'title': item.get('title'),
+                'html_url': item.get('html_url'),
+                'number': item.get('number'),
+                'state': item.get('state'),
+                'author': (item.get('user') or {}).get('login'),
+            })
+            if event_name == 'pull_request':
+                fields.update({
+                    'ref': (item.get('head') or {}).get('ref'),
+                    'base_ref': (item.get('base') or {}).get('ref'),
+                    'merged': bool(item.get('merged')),
+                    'files_changed': details.get('files'),
+                    'additions': details.get('additions'),
+                    'deletions': details.get('deletions'),
+                    'reviewers': ','.join(f"{reviewer['login']}:{reviewer['state']}"
+                                          for reviewer in details.get('reviewers') or []) or None,
+                    'ci_state': details.get('ci_state'),
+                })
+        elif event_name == 'release':
+            release = payload.get('release') or {}
+            details = payload.get('github_details') or {}
+            fields.update({
+                'title': release.get('name'),
+                'html_url': release.get('html_url'),
+                'tag_name': release.get('tag_name'),
+                'prerelease': bool(release.get('prerelease')),
+                'asset_count': details.get('assets'),
+                'asset_size': details.get('asset_size'),
+            })
+        elif event_name in ('workflow_run', 'check_run'):
+            run = payload.get(event_name) or {}
+            excerpt = payload.get('log_excerpt') or {}
+            fields.update({
+                'title': run.get('name'),
+                'html_url': run.get('html_url'),
+                'state': run.get('status'),
+                'conclusion': run.get('conclusion'),
+                'commit_id': run.get('head_sha'),
+                'failed_step': excerpt.get('source'),
+                'log_excerpt': excerpt.get('text'),
+            })
+            if event_name == 'workflow_run':
+                message_lines = ((run.get('head_commit') or {}).get('message') or '').splitlines()
+                fields.update({
+                    'number': run.get('run_number'),
+                    'ref': run.get('head_branch'),
+                    'author': (run.get('actor') or {}).get('login'),
+                    'commit_message': message_lines[0] if message_lines else '',
+                })
+            else:
+                fields.update({
+                    'ref': (run.get('check_suite') or {}).get('head_branch'),
+                    'summary': (run.get('output') or {}).get('title'),
+                })
+        return cls(**fields)
+
+    def to_payload(self):
+        """
+        还原为 generate_*_message 可直接使用的最小事件数据
+        :return: 与GitHub事件数据结构一致的字典
+        """
+        payload = {
+            'repository': {'full_name': self.repo_full_name, 'html_url': self.repo_html_url},
+            'sender': {'login': self.sender},
+        }
+        if self.action is not None:
+            payload['action'] = self.action
+        if self.mentions:
+            payload['wecom_mentions'] = self.mentions.split(',')
+
+        if self.event_name == 'push':
+            commits = []
+            if self.commit_count:
+                # 只保存第一条提交，提交数通过 size 表示
+                commits.append({
+                    'message': self.commit_message,
+                    'committer': {'name': self.commit_author},
+                    'id': self.commit_id,
+                })
+            payload.update({
+                'pusher': {'name': self.author},
+                'ref': self.ref,
+                'compare': self.compare_url,
+                'commits': commits,
+                'size': self.commit_count or 0,
+            })
+            if self.files_changed is not None:
+                payload['push_stats'] = {
+                    'commits': self.commit_count,
+                    'files': self.files_changed,
+                    'additions': self.additions,
+                    'deletions': self.deletions,
+                }
+        elif self.event_name in ('pull_request', 'issues'):
+            item = {
+                'title': self.title,
+                'html_url': self.html_url,
+                'number': self.number,
+                'state': self.state,
+                'user': {'login': self.author},
+            }
+            if self.event_name == 'pull_request':
+                item.update({
+                    'head': {'ref': self.ref},
+                    'base': {'ref': self.base_ref},
+                    'merged': bool(self.merged),
+                })
+                payload['pull_request'] = item
+                if any(value is not None for value in (self.files_changed, self.reviewers, self.ci_state)):
+                    payload['github_details'] = {
+                        'files': self.files_changed,
+                        'additions': self.additions,
+                        'deletions': self.deletions,
+                        'reviewers': [dict(zip(('login', 'state'), reviewer.rsplit(':', 1)))
+                                      for reviewer in (self.reviewers or '').split(',') if reviewer],
+                        'ci_state': self.ci_state,
+                    }
+            else:
+                payload['issue'] = item
+        elif self.event_name == 'release':
+            payload['release'] = {
+                'name': self.title,
+                'html_url': self.html_url,
+                'tag_name': self.tag_name,
+                'prerelease': bool(self.prerelease),
+            }
+            if self.asset_count is not None:
+                payload['github_details'] = {'assets': self.asset_count, 'asset_size': self.asset_size}
+        elif self.event_name in ('workflow_run', 'check_run'):
+            run = {
+                'name': self.title,
+                'html_url': self.html_url,
+                'status': self.state,
+                'conclusion': self.conclusion,
+                'head_sha': self.commit_id,
+            }
+            if self.event_name == 'workflow_run':
+                run.update({
+                    'run_number': self.number,
+                    'head_branch': self.ref,
+                    'actor': {'login': self.author},
+                    'head_commit': {'message': self.commit_message},
+                })
+            else:
+                run.update({
+                    'check_suite': {'head_branch': self.ref},
+                    'output': {'title': self.summary},
+                })
+            payload[self.event_name] = run
+            if self.log_excerpt:
+                payload['log_excerpt'] = {'source': self.failed_step, 'text': self.log_excerpt}
+        return payload
+
+
+def _write_varint(buffer, value):
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            buffer.append(byte | 0x80)
+        else:
+            buffer.append(byte)
+            return
+
+
+def _read_varint(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, offset
+        shift += 7
+
+
+def pack_event(event, exclude=()):
+    """
+    将事件序列化为紧凑二进制
+    布局: magic(2) + version(1) + 存在位图(varint) + 按字段顺序排列的非空字段值
+    :param event: NotificationEvent
+    :param exclude: 视为空值、不写入的字段名
+    """
+    buffer = bytearray(RECORD_MAGIC)
+    buffer.append(RECORD_VERSION)
+    presence = 0
+    values = bytearray()
+    for index, (name, kind) in enumerate(FIELD_SPECS):
+        value = None if name in exclude else getattr(event, name)
+        if value is None:
+            continue
+        presence |= 1 << index
+        if kind == _STR:
+            encoded = str(value).encode('utf-8')
+            _write_varint(values, len(encoded))
+            values += encoded
+        elif kind == _INT:
+            # zigzag编码以支持负数
+            value = int(value)
+            _write_varint(values, (value << 1) ^ (value >> 63))
+        elif kind == _BOOL:
+            values.append(1 if value else 0)
+        else:
+            values += _FLOAT_STRUCT.pack(value)
+    _write_varint(buffer, presence)
+    buffer += values
+    return bytes(buffer)
+
+
+def fingerprint(event):
+    """
+    计算事件内容指纹：忽略投递ID与接收时间的紧凑记录的SHA-256摘要，
+    渲染所用的全部字段（含补全结果与提醒成员）都参与计算
+    :param event: NotificationEvent
+    :return: 十六进制摘要
+    """
+    return hashlib.sha256(pack_event(event, exclude=DELIVERY_FIELDS)).hexdigest()
+
+
+def unpack_event(data):
+    """
+    从紧凑二进制还原事件
+    :param data: pack_event 的输出（bytes 或 memoryview）
+    :return: NotificationEvent
+    """
+    data = memoryview(data)
+    if bytes(data[:2]) != RECORD_MAGIC:
+        raise ValueError('无效的事件记录')
+    if data[2] > RECORD_VERSION:
+        raise ValueError(f'不支持的事件记录版本: {data[2]}')
+    presence, offset = _read_varint(data, 3)
+    fields = {}
+    for index, (name, kind) in enumerate(FIELD_SPECS):
+        if not presence & (1 << index):
+            continue
+        if kind == _STR:
+            length, offset = _read_varint(data, offset)
+            fields[name] = str(data[offset:offset + length], 'utf-8')
+            offset += length
+        elif kind == _INT:
+            value, offset = _read_varint(data, offset)
+            fields[name] = (value >> 1) ^ -(value & 1)
+        elif kind == _BOOL:
+            fields[name] = bool(data[offset])
+            offset += 1
+        else:
+            fields[name] = _FLOAT_STRUCT.unpack_from(data, offset)[0]
+            offset += _FLOAT_STRUCT.size
+    return NotificationEvent(**fields)
+
+
+def write_events(fp, events):
+    """
+    以长度前缀帧格式将事件追加写入二进制文件
+    :param fp: 以二进制模式打开的文件对象
+    :param events: NotificationEvent 可迭代对象
+    :return: 写入的事件数量
+    """
+    count = 0
+    for event in events:
+        record = pack_event(event)
+        fp.write(_LENGTH_STRUCT.pack(len(record)))
+        fp.write(record)
+        count += 1
+    return count
+
+
+def read_events(fp):
+    """
+    逐条读取 write_events 写入的事件，末尾不完整的记录（写入中断）会被忽略
+    :param fp: 以二进制模式打开的文件对象
+    """
+    while True:
+        header = fp.read(_LENGTH_STRUCT.size)
+        if len(header) < _LENGTH_STRUCT.size:
+            return
+        length = _LENGTH_STRUCT.unpack(header)[0]
+        record = fp.read(length)
+        if len(record) < length:
+            return
+        yield unpack_event(record)
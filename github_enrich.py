@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GitHub API 补全
+为 Pull Request 通知补充变更文件数、评审人和CI状态，为 Release 通知补充附件数量和大小。
+每个事件都调用API会很快耗尽速率限制，因此：
+- 事件数据中已有的字段（changed_files、requested_reviewers、assets 等）直接使用，不发起请求
+- REST 请求按URL缓存到磁盘，再次请求时带 If-None-Match，未变化时GitHub返回304，不计入速率限制
+- Pull Request 的评审、评审请求和CI状态通过一次 GraphQL 查询获取。GraphQL 不支持条件请求，
+  结果按 (仓库, 编号, 头提交, 更新时间) 缓存，CI尚未结束时不缓存；GraphQL 不可用时改用REST条件请求
+- 每个事件有时间预算，超出预算时放弃补全，发送未补全的通知
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+import requests
+
+DEFAULT_CACHE_SIZE = 2000
+# 缓存条目保留时间（304重新验证后刷新）
+DEFAULT_CACHE_TTL = 7 * 24 * 3600
+# 每个事件的补全时间预算（秒）
+DEFAULT_BUDGET = 3.0
+
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+
+# 补全结果在事件数据中的键
+DETAILS_KEY = 'github_details'
+
+# CI状态
+CI_SUCCESS = 'success'
+CI_FAILURE = 'failure'
+CI_PENDING = 'pending'
+
+# 评审状态
+REVIEW_APPROVED = 'approved'
+REVIEW_CHANGES_REQUESTED = 'changes_requested'
+REVIEW_COMMENTED = 'commented'
+REVIEW_REQUESTED = 'requested'
+
+CI_STATE_LABELS = {
+    CI_SUCCESS: '<font color="info">通过</font>',
+    CI_FAILURE: '<font color="warning">失败</font>',
+    CI_PENDING: '<font color="comment">进行中</font>',
+}
+CI_STATE_TEXT = {CI_SUCCESS: '通过', CI_FAILURE: '失败', CI_PENDING: '进行中'}
+REVIEW_STATE_TEXT = {
+    REVIEW_APPROVED: '已批准',
+    REVIEW_CHANGES_REQUESTED: '要求修改',
+    REVIEW_COMMENTED: '已评论',
+    REVIEW_REQUESTED: '待评审',
+}
+
+# GraphQL statusCheckRollup.state 与 CI状态的对应
+_ROLLUP_STATES = {
+    'SUCCESS': CI_SUCCESS,
+    'FAILURE': CI_FAILURE,
+    'ERROR': CI_FAILURE,
+    'PENDING': CI_PENDING,
+    'EXPECTED': CI_PENDING,
+}
+_FAILED_CONCLUSIONS = ('failure', 'timed_out', 'cancelled', 'action_required', 'startup_failure')
+
+PULL_REQUEST_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      changedFiles
+      additions
+      deletions
+      reviews(last: 50) { nodes { author { login } state } }
+      reviewRequests(first: 20) { nodes { requestedReviewer { ... on User { login } ... on Team { slug } } } }
+      commits(last: 1) { nodes { commit { oid statusCheckRollup { state } } } }
+    }
+  }
+}
+"""
+
+
+class GitHubApiError(RuntimeError):
+    """
+    GitHub API 请求失败或响应无效
+    """
+
+
+class ConditionalCache:
+    """
+    按URL缓存GitHub API响应及其 ETag / Last-Modified，可选保存到JSON文件供后续运行复用
+    """
+
+    def __init__(self, path=None, maxsize=DEFAULT_CACHE_SIZE, ttl_seconds=DEFAULT_CACHE_TTL, clock=time.time):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, url):
+        """
+        :return: 缓存条目 {'data', 'etag', 'last_modified', 'cached_at'}，不存在或已过期时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry and self._clock() - entry['cached_at'] < self.ttl_seconds:
+            return entry
+        return None
+
+    def put(self, url, data, etag=None, last_modified=None):
+        with self._lock:
+            self._entries[url] = {'data': data, 'etag': etag, 'last_modified': last_modified,
+                                  'cached_at': self._clock()}
+            if len(self._entries) > self.maxsize:
+                # 淘汰最早缓存（或最早重新验证）的条目
+                oldest = sorted(self._entries, key=lambda key: self._entries[key]['cached_at'])
+                for key in oldest[:len(self._entries) - self.maxsize]:
+                    del self._entries[key]
+            self._dirty = True
+
+    def save(self):
+        """
+        将缓存写入文件（先写临时文件再重命名），没有变化时不写
+        """
+        if not self.path or not self._dirty:
+            return
+        now = self._clock()
+        with self._lock:
+            self._entries = {key: entry for key, entry in self._entries.items()
+                             if now - entry['cached_at'] < self.ttl_seconds}
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f'{self.path}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(temp_path, self.path)
+            self._dirty = False
+
+
+class GitHubApi:
+    """
+    基于 PyGitHub Requester 的条件请求与 GraphQL 查询
+    """
+
+    def __init__(self, requester, cache=None, api_url=None):
+        """
+        :param requester: PyGitHub 的 Requester（Github(...).requester）
+        :param cache: ConditionalCache，可选
+        :param api_url: REST API 基础URL，用作缓存键的前缀
+        """
+        from github import GithubException
+
+        self.requester = requester
+        self.cache = cache if cache is not None else ConditionalCache()
+        self.api_url = (api_url or GITHUB_API_URL).rstrip('/')
+        # AttributeError / TypeError: PyGitHub 接口与预期不一致时同样放弃补全，不影响通知发送
+        self.errors = (GitHubApiError, GithubException, requests.exceptions.RequestException, ValueError,
+                       AttributeError, TypeError)
+        # 发出的请求数，以及其中未变化（304，不计入速率限制）的次数
+        self.requests = 0
+        self.not_modified = 0
+
+    @property
+    def rate_limit_remaining(self):
+        """
+        :return: 最近一次响应中的剩余请求数，未知时为-1
+        """
+        return self.requester.rate_limiting[0]
+
+    def get(self, path):
+        """
+        条件GET：缓存中有 ETag / Last-Modified 时带上 If-None-Match / If-Modified-Since，304时返回缓存的数据
+        :param path: API路径，如 /repos/owner/name/pulls/1/reviews
+        :return: 响应JSON
+        :raises GitHubApiError: 响应状态码不是2xx或304
+        """
+        url = self.api_url + path
+        entry = self.cache.get(url)
+        headers = {'Accept': 'application/vnd.github+json'}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        elif entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        status, response_headers, body = self.requester.requestJson('GET', path, headers=headers)
+        self.requests += 1
+        if status == 304 and entry:
+            self.not_modified += 1
+            self.cache.put(url, entry['data'], response_headers.get('etag') or entry.get('etag'),
+                           entry.get('last_modified'))
+            return entry['data']
+        if not 200 <= status < 300:
+            raise GitHubApiError(f'GET {path} 返回 HTTP {status}')
+        data = json.loads(body) if body else None
+        self.cache.put(url, data, response_headers.get('etag'), response_headers.get('last-modified'))
+        return data
+
+    def graphql(self, query, variables):
+        """
+        :return: GraphQL 响应中的 data
+        """
+        self.requests += 1
+        _, response = self.requester.graphql_query(query, variables)
+        return response['data']
+
+
+def github_api(token, cache=None, api_url=None, timeout=DEFAULT_BUDGET):
+    """
+    创建基于 PyGitHub 的API客户端，未安装 PyGitHub 时返回None
+    :param token: GitHub Token，可选（未提供时不使用GraphQL，REST请求受未认证速率限制）
+    :param cache: ConditionalCache，可选
+    :param api_url: REST API 基础URL，缺省为 GITHUB_API_URL
+    :param timeout: 单次请求超时（秒）
+    """
+    session_id = os.getenv('CURRENT_SESSION_ID', 'main')
+    try:
+        from github import Auth, Github
+    except ImportError:
+        print(f'::warning::[{session_id}] 未安装 PyGitHub，跳过GitHub API补全')
+        return None
+    try:
+        # 时间预算由调用方控制：关闭 PyGitHub 的重试和请求间隔（PyGitHub 的超时只接受整数秒）
+        client = Github(auth=Auth.Token(token) if token else None, base_url=(api_url or GITHUB_API_URL).rstrip('/'),
+                        timeout=max(1, math.ceil(timeout)), retry=None, seconds_between_requests=None,
+                        seconds_between_writes=None)
+        return GitHubApi(client.requester, cache, api_url)
+    except (AttributeError, TypeError) as e:
+        # 需要 PyGitHub 2.5+（Github.requester、Requester.graphql_query）
+        print(f'::warning::[{session_id}] PyGitHub 版本不受支持，跳过GitHub API补全: {e}')
+        return None
+
+
+def merge_reviewers(reviews, requested):
+    """
+    合并评审记录与评审请求
+    :param reviews: [(登录名, GitHub评审状态)]，按时间顺序
+    :param requested: 仍在等待评审的登录名列表
+    :return: [{'login', 'state'}]，按首次出现的顺序
+    """
+    states = {}
+    for login, state in reviews:
+        state = (state or '').lower()
+        if not login or state not in (REVIEW_APPROVED, REVIEW_CHANGES_REQUESTED, REVIEW_COMMENTED):
+            continue
+        # 批准或要求修改之后的评论不改变评审结论
+        if state == REVIEW_COMMENTED and states.get(login) not in (None, REVIEW_COMMENTED):
+            continue
+        states[login] = state
+    for login in requested:
+        if login:
+            # 重新请求评审的成员以待评审为准
+            states[login] = REVIEW_REQUESTED
+    return [{'login': login, 'state': state} for login, state in states.items()]
+
+
+def rest_ci_state(check_runs, combined_status):
+    """
+    根据 check-runs 和 commit status 计算CI状态
+    :return: success、failure、pending，没有任何检查时返回None
+    """
+    runs = check_runs.get('check_runs') or []
+    statuses = combined_status.get('statuses') or []
+    if any(run.get('conclusion') in _FAILED_CONCLUSIONS for run in runs) or \
+            any(status.get('state') in ('failure', 'error') for status in statuses):
+        return CI_FAILURE
+    if any(run.get('status') != 'completed' for run in runs) or \
+            any(status.get('state') == 'pending' for status in statuses):
+        return CI_PENDING
+    return CI_SUCCESS if runs or statuses else None
+
+
+def _pull_request_graphql(api, repo, pr):
+    """
+    一次GraphQL查询获取评审、评审请求、变更统计和头提交的CI状态
+    """
+    head_sha = (pr.get('head') or {}).get('sha')
+    key = f"{api.requester.graphql_url}#{repo}/pull/{pr['number']}@{head_sha}:{pr.get('updated_at')}"
+    entry = api.cache.get(key) if head_sha and pr.get('updated_at') else None
+    if entry:
+        return entry['data']
+
+    owner, name = repo.split('/', 1)
+    data = api.graphql(PULL_REQUEST_QUERY, {'owner': owner, 'name': name, 'number': pr['number']})
+    node = (data.get('repository') or {}).get('pullRequest')
+    if node is None:
+        raise GitHubApiError(f"找不到 Pull Request {repo}#{pr['number']}")
+    reviews = [((review.get('author') or {}).get('login'), review.get('state'))
+               for review in (node.get('reviews') or {}).get('nodes') or []]
+    requested = [(request.get('requestedReviewer') or {}).get('login') or
+                 (request.get('requestedReviewer') or {}).get('slug')
+                 for request in (node.get('reviewRequests') or {}).get('nodes') or []]
+    commits = (node.get('commits') or {}).get('nodes') or []
+    rollup = (commits[0]['commit'].get('statusCheckRollup') or {}) if commits else {}
+    details = {
+        'files': node.get('changedFiles'),
+        'additions': node.get('additions'),
+        'deletions': node.get('deletions'),
+        'reviewers': merge_reviewers(reviews, requested),
+        'ci_state': _ROLLUP_STATES.get(rollup.get('state')),
+    }
+    # CI结束后结果只会随新的提交或PR更新（updated_at）变化
+    if head_sha and pr.get('updated_at') and details['ci_state'] != CI_PENDING:
+        api.cache.put(key, details)
+    return details
+
+
+def _pull_request_rest(api, repo, pr):
+    """
+    GraphQL 不可用时使用REST条件请求：评审、check-runs 和 commit status 各一次
+    """
+    number = pr['number']
+    details = {}
+    if pr.get('changed_files') is None:
+        data = api.get(f'/repos/{repo}/pulls/{number}')
+        pr = dict(pr, **{name: data.get(name) for name in
+                         ('changed_files', 'additions', 'deletions', 'requested_reviewers', 'requested_teams')})
+    details.update({'files': pr.get('changed_files'), 'additions': pr.get('additions'),
+                    'deletions': pr.get('deletions')})
+    reviews = [((review.get('user') or {}).get('login'), review.get('state'))
+               for review in api.get(f'/repos/{repo}/pulls/{number}/reviews?per_page=100') or []]
+    requested = [user.get('login') for user in pr.get('requested_reviewers') or []] + \
+                [team.get('slug') for team in pr.get('requested_teams') or []]
+    details['reviewers'] = merge_reviewers(reviews, requested)
+    head_sha = (pr.get('head') or {}).get('sha')
+    details['ci_state'] = None
+    if head_sha:
+        details['ci_state'] = rest_ci_state(api.get(f'/repos/{repo}/commits/{head_sha}/check-runs?per_page=100'),
+                                            api.get(f'/repos/{repo}/commits/{head_sha}/status'))
+    return details
+
+
+def pull_request_details(api, event_data, use_graphql=True):
+    """
+    补全 Pull Request 的变更文件数、评审人和CI状态
+    :param api: GitHubApi
+    :param event_data: pull_request 事件数据
+    :param use_graphql: 是否优先使用GraphQL批量查询（需要Token）
+    :return: {'files', 'additions', 'deletions', 'reviewers', 'ci_state'}
+    """
+    repo = (event_data.get('repository') or {}).get('full_name')
+    pr = event_data.get('pull_request') or {}
+    if not repo or pr.get('number') is None:
+        return None
+    if use_graphql:
+        try:
+            details = _pull_request_graphql(api, repo, pr)
+        except api.errors as e:
+            print(f'::debug::[{os.getenv("CURRENT_SESSION_ID", "main")}] GraphQL查询失败，改用REST条件请求: {e}')
+        else:
+            # 事件数据中的变更统计与事件同时产生，优先使用
+            for name, field in (('files', 'changed_files'), ('additions', 'additions'), ('deletions', 'deletions')):
+                if pr.get(field) is not None:
+                    details = dict(details, **{name: pr[field]})
+            return details
+    return _pull_request_rest(api, repo, pr)
+
+
+def release_details(api, event_data, use_graphql=True):
+    """
+    补全 Release 的附件数量和总大小，事件数据中已有附件列表时不发起请求
+    :return: {'assets', 'asset_size'}
+    """
+    repo = (event_data.get('repository') or {}).get('full_name')
+    release = event_data.get('release') or {}
+    assets = release.get('assets')
+    if not assets and event_data.get('action') != 'deleted' and repo and release.get('id') is not None:
+        # 附件通常在 published 之后才上传完成
+        assets = api.get(f"/repos/{repo}/releases/{release['id']}/assets?per_page=100") or []
+    if assets is None:
+        return None
+    return {'assets': len(assets), 'asset_size': sum(asset.get('size') or 0 for asset in assets)}
+
+
+# 事件类型与补全函数的映射
+LOOKUPS = {
+    'pull_request': pull_request_details,
+    'release': release_details,
+}
+
+
+def enrich_event(event_name, event_data, api, budget=DEFAULT_BUDGET, use_graphql=True):
+    """
+    在时间预算内补全事件
+    :param event_name: GitHub事件名称
+    :param event_data: GitHub事件数据（不会被修改）
+    :param api: GitHubApi，为None时不补全
+    :param budget: 时间预算（秒）
+    :param use_graphql: 是否优先使用GraphQL批量查询
+    :return: 补全结果字典；事件类型不支持、请求失败或超出预算时返回None，使用未补全的通知
+    """
+    lookup = LOOKUPS.get(event_name)
+    if lookup is None or api is None:
+        return None
+    session_id = os.getenv('CURRENT_SESSION_ID', 'main')
+    result = {}
+
+    def run():
+        try:
+            result['details'] = lookup(api, event_data, use_graphql and api.requester.auth is not None)
+        except api.errors as e:
+            print(f'::warning::[{session_id}] GitHub API补全失败: {e}')
+        finally:
+            try:
+                api.cache.save()
+            except OSError as e:
+                print(f'::warning::[{session_id}] 保存GitHub API缓存失败: {e}')
+
+    # 在后台线程中查询，超出预算时不再等待（单次请求超时也不超过预算，线程随后结束）
+    worker = threading.Thread(target=run, name='github-enrich', daemon=True)
+    worker.start()
+    worker.join(budget)
+    if worker.is_alive():
+        print(f'::warning::[{session_id}] GitHub API补全超出时间预算 {budget} 秒，发送未补全的通知')
+        return None
+    print(f'::debug::[{session_id}] GitHub API补全: 请求 {api.requests} 次，其中未变化 {api.not_modified} 次，'
+          f'剩余速率限制 {api.rate_limit_remaining}')
+    return result.get('details')
+
+
+def format_size(size):
+    """
+    :return: 人类可读的大小，如 1.5 MB
+    """
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def format_reviewers(reviewers):
+    """
+    :param reviewers: [{'login', 'state'}]
+    :return: 如 alice(已批准)、bob(待评审)
+    """
+    return '、'.join(f"{item['login']}({REVIEW_STATE_TEXT.get(item['state'], item['state'])})"
+                    for item in reviewers)
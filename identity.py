@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GitHub 账号到企业微信成员的身份映射
+映射文件在启动时一次性加载为内存哈希索引（按GitHub登录名和邮箱），每个事件的查找都是O(1)；
+映射文件中没有的登录名可以通过 PyGitHub 查询其公开邮箱再按邮箱匹配，
+查询结果（包括未找到）进入 LRU + TTL 缓存，同一用户不会在每个事件中重复调用API。
+
+映射文件支持两种格式：
+- JSON: {"octocat": "zhangsan", "hubot": {"userid": "lisi", "email": "lisi@example.com"}}
+- CSV: 每行 github_login,wecom_userid[,email]，# 开头为注释
+"""
+
+import collections
+import csv
+import json
+import os
+import threading
+import time
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 6 * 3600
+
+# 企业微信markdown消息中 <@userid> 的数量上限，避免刷屏
+MAX_MENTIONS = 10
+
+
+class Identity:
+    """
+    企业微信成员
+    """
+
+    __slots__ = ('login', 'userid', 'email')
+
+    def __init__(self, login, userid, email=None):
+        self.login = login
+        self.userid = userid
+        self.email = email
+
+    def __eq__(self, other):
+        if not isinstance(other, Identity):
+            return NotImplemented
+        return (self.login, self.userid, self.email) == (other.login, other.userid, other.email)
+
+    def __repr__(self):
+        return f'Identity(login={self.login!r}, userid={self.userid!r})'
+
+
+class TTLCache:
+    """
+    带过期时间的LRU缓存（线程安全）
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl_seconds=DEFAULT_CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, self._MISSING)
+            if entry is self._MISSING:
+                return default
+            value, expires_at = entry
+            if self._clock() >= expires_at:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def __contains__(self, key):
+        return self.get(key, self._MISSING) is not self._MISSING
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _load_entries(path):
+    """
+    读取映射文件
+    :return: [(github_login, wecom_userid, email)]
+    """
+    entries = []
+    if path.lower().endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for login, value in data.items():
+            if isinstance(value, dict):
+                entries.append((login, value.get('userid'), value.get('email')))
+            else:
+                entries.append((login, value, None))
+    else:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.reader(f):
+                if not row or row[0].lstrip().startswith('#'):
+                    continue
+                row = [column.strip() for column in row]
+                entries.append((row[0], row[1] if len(row) > 1 else None, row[2] if len(row) > 2 else None))
+    return [(login, userid, email or None) for login, userid, email in entries if login and userid]
+
+
+def github_client(token):
+    """
+    创建 PyGitHub 客户端，未安装 PyGitHub 时返回None
+    """
+    try:
+        from github import Github
+    except ImportError:
+        print(f'::warning::[{os.getenv("CURRENT_SESSION_ID", "main")}] 未安装 PyGitHub，跳过身份在线查询')
+        return None
+    return Github(token)
+
+
+class IdentityMap:
+    """
+    GitHub登录名到企业微信成员的映射
+    """
+
+    def __init__(self, path=None, client=None, cache_size=DEFAULT_CACHE_SIZE, cache_ttl=DEFAULT_CACHE_TTL,
+                 clock=time.monotonic):
+        """
+        :param path: 映射文件路径（JSON或CSV），可选
+        :param client: PyGitHub 客户端（需提供 get_user(login).email），可选，用于映射文件之外的登录名
+        :param cache_size: 在线查询结果缓存条目上限
+        :param cache_ttl: 在线查询结果缓存有效期（秒）
+        """
+        self._by_login = {}
+        self._by_email = {}
+        self._client = client
+        self._cache = TTLCache(cache_size, cache_ttl, clock)
+        if path:
+            for login, userid, email in _load_entries(path):
+                self.add(login, userid, email)
+
+    def __len__(self):
+        return len(self._by_login)
+
+    def add(self, login, userid, email=None):
+        identity = Identity(login, userid, email)
+        self._by_login[login.lower()] = identity
+        if email:
+            self._by_email[email.lower()] = identity
+        return identity
+
+    def _lookup(self, login):
+        """
+        通过GitHub API查询公开邮箱并按邮箱匹配
+        """
+        try:
+            email = self._client.get_user(login).email
+        except Exception as e:
+            # PyGitHub 的网络和API异常类型众多，查询失败只影响提醒，不影响通知
+            print(f'::warning::[{os.getenv("CURRENT_SESSION_ID", "main")}] 查询GitHub用户 {login} 失败: {e}')
+            return None
+        identity = self._by_email.get(email.lower()) if email else None
+        return Identity(login, identity.userid, email) if identity else None
+
+    def resolve(self, login):
+        """
+        解析GitHub登录名
+        :return: Identity，未找到时返回None
+        """
+        if not login:
+            return None
+        key = login.lower()
+        identity = self._by_login.get(key)
+        if identity is not None or self._client is None:
+            return identity
+        cached = self._cache.get(key, TTLCache._MISSING)
+        if cached is not TTLCache._MISSING:
+            return cached
+        identity = self._lookup(login)
+        # 未找到的结果同样缓存，避免每个事件重复查询
+        self._cache.put(key, identity)
+        return identity
+
+    def userids(self, logins):
+        """
+        批量解析并去重，保持顺序
+        :return: 企业微信成员ID列表
+        """
+        userids = []
+        for login in logins:
+            identity = self.resolve(login)
+            if identity is not None and identity.userid not in userids:
+                userids.append(identity.userid)
+        return userids[:MAX_MENTIONS]
+
+
+def mention_logins(event_name, event_data):
+    """
+    需要提醒的GitHub登录名：PR的评审人和指派人、Issue的指派人、失败工作流的触发者
+    :param event_name: GitHub事件名称
+    :param event_data: GitHub事件数据
+    """
+    if event_name == 'pull_request':
+        pr = event_data.get('pull_request') or {}
+        users = (pr.get('requested_reviewers') or []) + (pr.get('assignees') or [])
+    elif event_name == 'issues':
+        users = (event_data.get('issue') or {}).get('assignees') or []
+    elif event_name == 'workflow_run':
+        users = [(event_data.get('workflow_run') or {}).get('actor') or {}]
+    else:
+        users = []
+    return [user.get('login') for user in users if user.get('login')]
+
+
+def resolve_mentions(event_name, event_data, identity_map):
+    """
+    解析事件需要提醒的企业微信成员
+    :return: 企业微信成员ID列表
+    """
+    return identity_map.userids(mention_logins(event_name, event_data))
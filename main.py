@@ -1,15 +1,64 @@
 import os
 import sys
 import json
+import asyncio
+import aiohttp
 import requests
 import time
+import urllib3
 import uuid
 import traceback
+import contextlib
+
+import ci_logs
+import profiling
+import tracing
+from adaptive_timeout import get_tracker, load_trackers, save_trackers
+from archive import EventArchive
+from circuit_breaker import configure_breakers, get_breaker
+from delivery_store import DEFAULT_TTL_SECONDS, IdempotencyStore, target_id
+from digest import DigestStore, digest_window, generate_digest_messages, record_payload
+from event_filter import compile_filter
+from event_record import NotificationEvent, fingerprint
+from github_enrich import (CI_STATE_LABELS, DEFAULT_BUDGET, DETAILS_KEY, LOOKUPS, ConditionalCache, enrich_event,
+                           format_reviewers, format_size, github_api)
+from identity import IdentityMap, github_client, resolve_mentions
+from message_types import EVENT_RENDERERS, MSGTYPE_MARKDOWN, MediaCache, build_attachment_message
+from prewarm import ConnectionPrewarmer
+from push_stats import PushStatsCache, enrich_push
+from relay_client import HandoffError, spool_event, submit_event
+from render_cache import RenderCache, body_preview, content_hash, encode_message, file_hash
+from shutdown import (DEFAULT_DRAIN_TIMEOUT, GracefulShutdown, ShutdownRequested, append_checkpoint,
+                      load_checkpoint, save_checkpoint)
+from throttle import FrequencyThrottle, suppressed_summary_message, throttle_key
+
+# 消息模板版本，修改任一 generate_*_message 的输出格式时需要递增，使渲染缓存失效
+TEMPLATE_VERSION = '4'
+
+# 企业微信markdown消息内容的UTF-8字节上限
+MARKDOWN_MAX_BYTES = 4096
+
+# 发送预编码请求体时使用的请求头
+JSON_HEADERS = {'Content-Type': 'application/json; charset=utf-8'}
+
+# 进程内渲染缓存，多目标发送和重放时复用同一份消息体
+render_cache = RenderCache()
+
+class MissingInputError(ValueError):
+    """
+    缺少必填输入参数
+    """
+
+class InvalidInputError(ValueError):
+    """
+    输入参数格式错误或超出取值范围
+    """
 
 def get_input(name, required=False, default=None):
     """
     获取GitHub Action输入参数
     从环境变量中读取，环境变量格式为 INPUT_参数名大写
+    缺少必填参数时抛出 MissingInputError（由 main 统一处理退出码）
     """
     start_time = time.time()
     session_id = str(uuid.uuid4())
@@ -26,84 +75,256 @@ def get_input(name, required=False, default=None):
         error_msg = f'Missing required input: {name}'
         print(f'::error::[{session_id}] {error_msg}')
         print(f'::debug::[{session_id}] 执行时间: {time.time() - start_time:.3f}s')
-        sys.exit(1)
+        raise MissingInputError(error_msg)
     
     print(f'::debug::[{session_id}] 返回值: {value}')
     print(f'::debug::[{session_id}] 执行时间: {time.time() - start_time:.3f}s')
     print(f'::debug::[{session_id}] 结束执行 get_input 函数')
     return value
 
-def send_wechat_message(webhook_url, message):
+def get_float_input(name, default, minimum=0.0, maximum=None):
+    """
+    获取数值类型的输入参数，未设置或为空时使用默认值
+    格式错误或超出范围时抛出 InvalidInputError
+    :param name: 参数名
+    :param default: 默认值
+    :param minimum: 最小值
+    :param maximum: 最大值，None表示不限制
+    :return: 参数值
+    """
+    value = get_input(name) or str(default)
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    # NaN 与任何数比较都为False，需要单独排除
+    if number is None or number != number or number < minimum or (maximum is not None and number > maximum):
+        bounds = f'{minimum} ~ {maximum}' if maximum is not None else f'>= {minimum}'
+        error_msg = f'Invalid input {name}: {value!r}（取值范围 {bounds}）'
+        print(f'::error::[{os.getenv("CURRENT_SESSION_ID", "main")}] {error_msg}')
+        raise InvalidInputError(error_msg)
+    return number
+
+def parse_webhook_urls(value):
+    """
+    解析Webhook URL列表，支持逗号或换行分隔多个机器人
+    :param value: 原始输入
+    :return: 去重后的URL列表
+    """
+    urls = []
+    for item in (value or '').replace('\n', ',').split(','):
+        item = item.strip()
+        if item and item not in urls:
+            urls.append(item)
+    return urls
+
+def is_connect_failure(error):
+    """
+    判断同步请求是否在建立连接阶段失败：此时请求尚未发出，重试不会导致企业微信重复收到消息
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = getattr(error.args[0], 'reason', None)
+        return isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+    return False
+
+def is_async_connect_failure(error):
+    """
+    判断异步请求是否在建立连接阶段失败（连接被拒绝、DNS失败或连接超时）
+    """
+    # aiohttp 3.10 起连接超时为 ConnectionTimeoutError，之前的版本无法与读取超时区分
+    connect_timeout = getattr(aiohttp, 'ConnectionTimeoutError', aiohttp.ClientConnectorError)
+    return isinstance(error, (aiohttp.ClientConnectorError, connect_timeout))
+
+class DeliveryResult:
+    """
+    单次发送结果
+    """
+
+    __slots__ = ('success', 'status_code', 'errcode', 'error', 'duration', 'skipped')
+
+    def __init__(self, success, status_code=None, errcode=None, error=None, duration=0.0, skipped=False):
+        self.success = success
+        self.status_code = status_code
+        self.errcode = errcode
+        self.error = error
+        self.duration = duration
+        self.skipped = skipped
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return f'DeliveryResult(success={self.success}, status_code={self.status_code}, ' \
+               f'errcode={self.errcode}, error={self.error!r}, skipped={self.skipped})'
+
+def send_wechat_message(webhook_url, message, body=None, deadline=None, max_attempts=1):
     """
     发送企业微信通知
     :param webhook_url: 企业微信机器人Webhook URL
     :param message: 通知消息内容
+    :param body: 预编码的UTF-8 JSON请求体，提供时直接发送，不再重新序列化message
+    :param deadline: 发送截止时间（时间戳），超时时间不会超过剩余时间
+    :param max_attempts: 建立连接失败时的最大尝试次数
     :return: 是否发送成功
     """
+    return send_wechat_message_result(webhook_url, message, body=body, deadline=deadline,
+                                      max_attempts=max_attempts).success
+
+def trace_result(span, result):
+    """
+    在追踪 span 上记录发送结果
+    :param span: tracing.Span
+    :param result: DeliveryResult
+    """
+    span.set_attributes({'wechat.success': result.success, 'http.response.status_code': result.status_code,
+                         'wechat.errcode': result.errcode})
+    if not result.success:
+        span.set_status(tracing.STATUS_ERROR, result.error)
+
+@tracing.traced('wechat.send')
+def send_wechat_message_result(webhook_url, message, body=None, deadline=None, max_attempts=1, session=None,
+                                retry_read_timeout=False):
+    """
+    发送企业微信通知，返回包含状态码、错误码和耗时的发送结果
+    :param webhook_url: 企业微信机器人Webhook URL
+    :param message: 通知消息内容
+    :param body: 预编码的UTF-8 JSON请求体，提供时直接发送，不再重新序列化message
+    :param deadline: 发送截止时间（时间戳），超时时间不会超过剩余时间
+    :param max_attempts: 建立连接失败时的最大尝试次数
+    :param session: requests.Session，提供时复用其连接池
+    :param retry_read_timeout: 读取超时是否重试。请求可能已被企业微信接收，重试会重复发送，
+                               只应在幂等存储已认领该投递时开启
+    :return: DeliveryResult
+    """
     start_time = time.time()
     session_id = str(uuid.uuid4())
     parent_session = os.getenv('CURRENT_SESSION_ID', 'main')
+    span = tracing.current_span()
+    span.set_attribute('wechat.robot', target_id(webhook_url)[:12])
     
     print(f'::debug::[{session_id}] 开始执行 send_wechat_message 函数')
     print(f'::debug::[{session_id}] 上一级调用会话ID: {parent_session}')
     print(f'::debug::[{session_id}] 参数: webhook_url={webhook_url[:50]}...(已截断), message_type={message.get("msgtype")}')
-    # 使用ensure_ascii=True避免Windows环境下的编码问题
-    print(f'::debug::[{session_id}] 消息内容摘要: {json.dumps(message, ensure_ascii=True)[:100]}...(已截断)')
+    # 请求体只编码一次，以memoryview交给传输层，日志只解码前100字节的切片
+    if body is None:
+        body = encode_message(message)
+    payload = memoryview(body)
+    print(f'::debug::[{session_id}] 消息内容摘要: {body_preview(payload)}...(已截断)')
     
     success = False
     error_msg = None
+    errcode = None
     status_code = None
     response_content = None
     
-    try:
-        # 发送请求
-        print(f'::debug::[{session_id}] 开始发送HTTP请求')
-        response = requests.post(webhook_url, json=message, timeout=10, verify=True)
-        
-        # 记录响应信息
-        status_code = response.status_code
-        response_content = response.text
-        
-        print(f'::debug::[{session_id}] HTTP响应状态码: {status_code}')
-        print(f'::debug::[{session_id}] HTTP响应头: {dict(response.headers)}')
-        print(f'::debug::[{session_id}] HTTP响应内容: {response_content}')
+    # 熔断器处于打开状态时直接快速失败，不再占用请求超时时间
+    breaker = get_breaker(webhook_url)
+    if not breaker.allow_request():
+        print(f'::warning::[{session_id}] 目标Webhook已熔断，跳过发送，{breaker.retry_after():.1f}s 后允许探测')
+        print(f'::debug::[{session_id}] 最近一次失败原因: {breaker.last_error}')
+        print(f'::info::[{session_id}] 发送结果: 失败, 错误原因: 熔断器打开')
+        print(f'::debug::[{session_id}] 结束执行 send_wechat_message 函数')
+        result = DeliveryResult(False, error='熔断器打开', duration=time.time() - start_time)
+        trace_result(span, result)
+        return result
+    
+    tracker = get_tracker(webhook_url)
+    attempt = 0
+    while True:
+        attempt += 1
+        retryable = False
         
-        # 检查响应状态
-        response.raise_for_status()
+        # 根据观测到的延迟计算超时，并受事件发送截止时间约束
+        connect_timeout, read_timeout = tracker.timeouts(deadline)
+        if read_timeout <= 0:
+            error_msg = error_msg or '超出发送截止时间'
+            print(f'::error::[{session_id}] 已超出发送截止时间，停止发送')
+            break
         
-        # 解析响应内容
+        # 每次尝试一个HTTP客户端 span，重试在链路中表现为同一发送 span 下的多个子 span
+        attempt_span = tracing.start_span('POST', kind=tracing.KIND_CLIENT, attributes={
+            'http.request.method': 'POST', 'wechat.attempt': attempt,
+            'wechat.connect_timeout': connect_timeout, 'wechat.read_timeout': read_timeout})
         try:
-            response_json = response.json()
-            print(f'::debug::[{session_id}] JSON响应: {json.dumps(response_json, ensure_ascii=False)}')
-            if response_json.get('errcode') == 0:
+            # 发送请求
+            print(f'::debug::[{session_id}] 开始发送HTTP请求（第{attempt}次），超时: 连接 {connect_timeout:.2f}s / 读取 {read_timeout:.2f}s')
+            request_start = time.monotonic()
+            http = session or requests
+            response = http.post(webhook_url, data=payload, headers=JSON_HEADERS,
+                                 timeout=(connect_timeout, read_timeout), verify=True)
+            tracker.record(time.monotonic() - request_start)
+            
+            # 记录响应信息
+            status_code = response.status_code
+            response_content = response.text
+            
+            print(f'::debug::[{session_id}] HTTP响应状态码: {status_code}')
+            print(f'::debug::[{session_id}] HTTP响应头: {dict(response.headers)}')
+            print(f'::debug::[{session_id}] HTTP响应内容: {response_content}')
+            
+            # 检查响应状态
+            response.raise_for_status()
+            
+            # 解析响应内容
+            try:
+                response_json = response.json()
+                print(f'::debug::[{session_id}] JSON响应: {json.dumps(response_json, ensure_ascii=False)}')
+                errcode = response_json.get('errcode')
+                if errcode == 0:
+                    success = True
+                    breaker.record_success()
+                    print(f'::info::[{session_id}] 企业微信通知发送成功')
+                else:
+                    success = False
+                    error_msg = f'企业微信API错误: {response_json.get("errmsg")}'
+                    breaker.record_response(error_msg, errcode, status_code)
+                    print(f'::error::[{session_id}] {error_msg}')
+            except json.JSONDecodeError:
                 success = True
-                print(f'::info::[{session_id}] 企业微信通知发送成功')
+                breaker.record_success()
+                print(f'::info::[{session_id}] 企业微信通知发送成功（非JSON响应）')
+                
+        except requests.exceptions.RequestException as e:
+            success = False
+            error_msg = f'请求异常: {str(e)}'
+            # 收到HTTP错误响应时按状态码判断，没有响应的传输错误计为失败
+            if getattr(e, 'response', None) is not None:
+                breaker.record_response(error_msg, status_code=e.response.status_code)
             else:
-                success = False
-                error_msg = f'企业微信API错误: {response_json.get("errmsg")}'
-                print(f'::error::[{session_id}] {error_msg}')
-        except json.JSONDecodeError:
-            success = True
-            print(f'::info::[{session_id}] 企业微信通知发送成功（非JSON响应）')
+                breaker.record_failure(error_msg)
+            if isinstance(e, requests.exceptions.Timeout):
+                tracker.record_timeout(read_timeout)
+            # 发送消息不是幂等操作：只重试请求尚未发出的连接失败，读取超时时服务端可能已经接收
+            retryable = is_connect_failure(e) or \
+                (retry_read_timeout and isinstance(e, requests.exceptions.ReadTimeout))
+            print(f'::error::[{session_id}] {error_msg}')
+            print(f'::debug::[{session_id}] 异常类型: {type(e).__name__}')
+            print(f'::debug::[{session_id}] 异常堆栈: {traceback.format_exc()}')
             
-    except requests.exceptions.RequestException as e:
-        success = False
-        error_msg = f'请求异常: {str(e)}'
-        print(f'::error::[{session_id}] {error_msg}')
-        print(f'::debug::[{session_id}] 异常类型: {type(e).__name__}')
-        print(f'::debug::[{session_id}] 异常堆栈: {traceback.format_exc()}')
+            if hasattr(e, 'response') and e.response is not None:
+                status_code = e.response.status_code
+                response_content = e.response.text
+                print(f'::debug::[{session_id}] 异常响应状态码: {status_code}')
+                print(f'::debug::[{session_id}] 异常响应内容: {response_content}')
+        except Exception as e:
+            success = False
+            error_msg = f'未知异常: {str(e)}'
+            breaker.record_failure(error_msg)
+            print(f'::error::[{session_id}] {error_msg}')
+            print(f'::debug::[{session_id}] 异常类型: {type(e).__name__}')
+            print(f'::debug::[{session_id}] 异常堆栈: {traceback.format_exc()}')
+        trace_result(attempt_span, DeliveryResult(success, status_code=status_code, errcode=errcode, error=error_msg))
+        attempt_span.end()
         
-        if hasattr(e, 'response') and e.response is not None:
-            status_code = e.response.status_code
-            response_content = e.response.text
-            print(f'::debug::[{session_id}] 异常响应状态码: {status_code}')
-            print(f'::debug::[{session_id}] 异常响应内容: {response_content}')
-    except Exception as e:
-        success = False
-        error_msg = f'未知异常: {str(e)}'
-        print(f'::error::[{session_id}] {error_msg}')
-        print(f'::debug::[{session_id}] 异常类型: {type(e).__name__}')
-        print(f'::debug::[{session_id}] 异常堆栈: {traceback.format_exc()}')
+        if success or not retryable or attempt >= max_attempts:
+            break
+        if not breaker.allow_request():
+            print(f'::warning::[{session_id}] 目标Webhook已熔断，停止重试')
+            break
+        print(f'::warning::[{session_id}] 第{attempt}次发送失败，准备重试')
+        span.add_event('retry', {'wechat.attempt': attempt, 'wechat.error': error_msg})
     
     # 记录执行时间
     duration = time.time() - start_time
@@ -118,7 +339,288 @@ def send_wechat_message(webhook_url, message):
     print(f'::info::[{session_id}] {result_msg}')
     
     print(f'::debug::[{session_id}] 结束执行 send_wechat_message 函数')
-    return success
+    result = DeliveryResult(success, status_code=status_code, errcode=errcode, error=error_msg, duration=duration)
+    span.set_attribute('wechat.attempts', attempt)
+    trace_result(span, result)
+    return result
+
+def deliver_notification(webhook_url, rendered, delivery_id=None, store=None, deadline=None, max_attempts=1,
+                         session=None):
+    """
+    投递已渲染的通知，配置了幂等存储时跳过已成功发送的 (投递ID, 目标)
+    :param webhook_url: 企业微信机器人Webhook URL
+    :param rendered: render_event 返回的 RenderedMessage
+    :param delivery_id: GitHub投递ID，用于幂等判断
+    :param store: IdempotencyStore，可选
+    :param deadline: 发送截止时间（时间戳）
+    :param max_attempts: 建立连接失败时的最大尝试次数（幂等存储认领投递后读取超时也会重试）
+    :param session: requests.Session，可选
+    :return: DeliveryResult
+    """
+    claimed = store is not None and bool(delivery_id)
+    if claimed:
+        if not store.claim(delivery_id, webhook_url):
+            print(f'::info::[{os.getenv("CURRENT_SESSION_ID", "main")}] 投递 {delivery_id} 已发送或正在发送到该目标，跳过重复通知')
+            return DeliveryResult(True, skipped=True)
+    
+    result = send_wechat_message_result(webhook_url, rendered.message, body=rendered.body, deadline=deadline,
+                                        max_attempts=max_attempts, session=session, retry_read_timeout=claimed)
+    
+    if claimed:
+        detail = None if result.success else f'errcode={result.errcode}, status={result.status_code}, error={result.error}'
+        store.record(delivery_id, webhook_url, result.success, detail)
+    return result
+
+def check_throttle(throttle, event):
+    """
+    频率节流：记录事件并判断是否静音，同一投递ID只计数一次（重跑工作流不会重复累计）
+    :param throttle: FrequencyThrottle
+    :param event: NotificationEvent
+    :return: (是否允许发送该事件, 已结束静音的 MutedKey 列表)
+    """
+    key = throttle_key(event)
+    allowed = throttle.hit(key, event.delivery_id)
+    if not allowed:
+        print(f'::info::[{os.getenv("CURRENT_SESSION_ID", "main")}] 相似事件 {key} 在 {throttle.window_seconds:.0f}s 内'
+              f'超过 {throttle.threshold} 次，已静音')
+    return allowed, throttle.pop_expired()
+
+def send_suppressed_summaries(expired, webhook_urls, session=None):
+    """
+    为已结束静音的键发送“已抑制 N 条相似事件”摘要
+    :param expired: MutedKey 列表
+    :param webhook_urls: 摘要发送目标
+    :param session: requests.Session，可选
+    """
+    for muted in expired:
+        print(f'::info::[{os.getenv("CURRENT_SESSION_ID", "main")}] 相似事件 {muted.key} 静音结束，'
+              f'共抑制 {muted.suppressed} 条，发送摘要')
+        summary = suppressed_summary_message(muted)
+        for webhook_url in webhook_urls:
+            send_wechat_message_result(webhook_url, summary, session=session)
+
+def apply_throttle(throttle, event, webhook_urls, session=None):
+    """
+    发送前的频率节流：记录事件并判断是否静音，同时为已结束静音的键发送“已抑制 N 条相似事件”摘要
+    :param throttle: FrequencyThrottle
+    :param event: NotificationEvent
+    :param webhook_urls: 摘要发送目标
+    :param session: requests.Session，可选
+    :return: True 表示允许发送该事件
+    """
+    allowed, expired = check_throttle(throttle, event)
+    send_suppressed_summaries(expired, webhook_urls, session=session)
+    return allowed
+
+def parse_wechat_response(status_code, text):
+    """
+    解析企业微信接口响应
+    :param status_code: HTTP状态码
+    :param text: 响应内容
+    :return: (是否成功, 错误码, 错误信息)
+    """
+    if status_code >= 400:
+        return False, None, f'请求异常: HTTP {status_code}'
+    try:
+        response_json = json.loads(text)
+    except json.JSONDecodeError:
+        # 非JSON响应视为成功，与同步发送保持一致
+        return True, None, None
+    errcode = response_json.get('errcode')
+    if errcode == 0:
+        return True, errcode, None
+    return False, errcode, f'企业微信API错误: {response_json.get("errmsg")}'
+
+@tracing.traced('wechat.send')
+async def send_wechat_message_async(session, webhook_url, message, body=None, deadline=None, max_attempts=1,
+                                    retry_read_timeout=False):
+    """
+    异步发送企业微信通知（熔断、自适应超时和重试策略与 send_wechat_message_result 一致）
+    :param session: aiohttp.ClientSession
+    :param webhook_url: 企业微信机器人Webhook URL
+    :param message: 通知消息内容
+    :param body: 预编码的UTF-8 JSON请求体
+    :param deadline: 发送截止时间（时间戳）
+    :param max_attempts: 建立连接失败时的最大尝试次数
+    :param retry_read_timeout: 读取超时是否重试，只应在幂等存储已认领该投递时开启
+    :return: DeliveryResult
+    """
+    start_time = time.time()
+    session_id = str(uuid.uuid4())
+    span = tracing.current_span()
+    span.set_attribute('wechat.robot', target_id(webhook_url)[:12])
+    if body is None:
+        body = encode_message(message)
+    payload = memoryview(body)
+    
+    breaker = get_breaker(webhook_url)
+    if not breaker.allow_request():
+        print(f'::warning::[{session_id}] 目标Webhook已熔断，跳过发送，{breaker.retry_after():.1f}s 后允许探测')
+        result = DeliveryResult(False, error='熔断器打开', duration=time.time() - start_time)
+        trace_result(span, result)
+        return result
+    
+    tracker = get_tracker(webhook_url)
+    success = False
+    error_msg = None
+    errcode = None
+    status_code = None
+    attempt = 0
+    while True:
+        attempt += 1
+        retryable = False
+        connect_timeout, read_timeout = tracker.timeouts(deadline)
+        if read_timeout <= 0:
+            error_msg = error_msg or '超出发送截止时间'
+            break
+        
+        timeout = aiohttp.ClientTimeout(total=connect_timeout + read_timeout, sock_connect=connect_timeout,
+                                        sock_read=read_timeout)
+        attempt_span = tracing.start_span('POST', kind=tracing.KIND_CLIENT, attributes={
+            'http.request.method': 'POST', 'wechat.attempt': attempt,
+            'wechat.connect_timeout': connect_timeout, 'wechat.read_timeout': read_timeout})
+        request_start = time.monotonic()
+        try:
+            async with session.post(webhook_url, data=payload, headers=JSON_HEADERS, timeout=timeout) as response:
+                status_code = response.status
+                response_content = await response.text()
+            tracker.record(time.monotonic() - request_start)
+            success, errcode, error_msg = parse_wechat_response(status_code, response_content)
+            if success:
+                breaker.record_success()
+            else:
+                breaker.record_response(error_msg, errcode, status_code)
+        except aiohttp.ClientError as e:
+            success = False
+            error_msg = f'请求异常: {str(e) or type(e).__name__}'
+            if isinstance(e, asyncio.TimeoutError):
+                tracker.record_timeout(read_timeout)
+            breaker.record_failure(error_msg)
+            # 与同步发送一致：只重试连接阶段的失败
+            retryable = is_async_connect_failure(e) or (retry_read_timeout and isinstance(e, asyncio.TimeoutError))
+        except asyncio.TimeoutError:
+            success = False
+            error_msg = f'请求异常: 超时（第{attempt}次）'
+            tracker.record_timeout(read_timeout)
+            breaker.record_failure(error_msg)
+            retryable = retry_read_timeout
+        trace_result(attempt_span, DeliveryResult(success, status_code=status_code, errcode=errcode, error=error_msg))
+        attempt_span.end()
+        
+        if success or not retryable or attempt >= max_attempts:
+            break
+        if not breaker.allow_request():
+            break
+        span.add_event('retry', {'wechat.attempt': attempt, 'wechat.error': error_msg})
+    
+    duration = time.time() - start_time
+    result_msg = f'发送结果: {"成功" if success else "失败"}'
+    if not success:
+        result_msg += f', 错误原因: {error_msg}'
+    if status_code:
+        result_msg += f', HTTP状态码: {status_code}'
+    print(f'::info::[{session_id}] {result_msg}, 执行时长: {duration:.3f}s')
+    result = DeliveryResult(success, status_code=status_code, errcode=errcode, error=error_msg, duration=duration)
+    span.set_attribute('wechat.attempts', attempt)
+    trace_result(span, result)
+    return result
+
+async def load_event(path):
+    """
+    异步读取事件文件（文件读取放到线程池，不阻塞事件循环）
+    :param path: 事件文件路径
+    :return: (原始字节, 解析后的事件数据)
+    """
+    def read():
+        with open(path, 'rb') as f:
+            return f.read()
+    raw_event = await asyncio.to_thread(read)
+    return raw_event, json.loads(raw_event)
+
+async def notify(event, webhook_url, session, msgtype=MSGTYPE_MARKDOWN, store=None, deadline=None,
+                 max_attempts=1, attachment=None, media_cache=None, rendered=None):
+    """
+    异步投递一个事件到一个目标
+    :param event: NotificationEvent
+    :param webhook_url: 企业微信机器人Webhook URL
+    :param session: aiohttp.ClientSession
+    :param msgtype: 消息类型
+    :param store: IdempotencyStore，可选
+    :param deadline: 发送截止时间（时间戳）
+    :param max_attempts: 建立连接失败时的最大尝试次数（幂等存储认领投递后读取超时也会重试）
+    :param attachment: 附件路径，可选
+    :param media_cache: MediaCache，可选
+    :param rendered: 调用方已渲染的 RenderedMessage，可选，缺省时按 msgtype 渲染
+    :return: DeliveryResult，事件类型不支持时返回None
+    """
+    if rendered is None:
+        rendered = render_event(event, msgtype)
+    if rendered is None:
+        return None
+    
+    delivery_id = event.delivery_id
+    claimed = store is not None and bool(delivery_id)
+    # 幂等存储是同步SQLite，等待数据库锁时不能阻塞其他目标的并发发送
+    if claimed and not await asyncio.to_thread(store.claim, delivery_id, webhook_url):
+        print(f'::info::[{os.getenv("CURRENT_SESSION_ID", "main")}] 投递 {delivery_id} 已发送或正在发送到该目标，跳过重复通知')
+        return DeliveryResult(True, skipped=True)
+    
+    result = await send_wechat_message_async(session, webhook_url, rendered.message, body=rendered.body,
+                                             deadline=deadline, max_attempts=max_attempts,
+                                             retry_read_timeout=claimed)
+    
+    if claimed:
+        detail = None if result.success else f'errcode={result.errcode}, status={result.status_code}, error={result.error}'
+        await asyncio.to_thread(store.record, delivery_id, webhook_url, result.success, detail)
+    
+    # 附件（图片/文件）作为单独的消息发送；上传素材仍使用同步客户端，放到线程池执行
+    if attachment and result.success and not result.skipped:
+        attachment_message = await asyncio.to_thread(build_attachment_message, webhook_url, attachment, media_cache)
+        if attachment_message:
+            await send_wechat_message_async(session, webhook_url, attachment_message, deadline=deadline,
+                                            max_attempts=max_attempts)
+    return result
+
+async def notify_all(event, webhook_urls, session=None, **options):
+    """
+    并发投递一个事件到多个目标
+    :param event: NotificationEvent
+    :param webhook_urls: 企业微信机器人Webhook URL列表
+    :param session: aiohttp.ClientSession，缺省时临时创建
+    :param options: 传给 notify 的其他参数
+    :return: 与 webhook_urls 顺序一致的 DeliveryResult 列表
+    """
+    if session is None:
+        async with aiohttp.ClientSession() as own_session:
+            return await notify_all(event, webhook_urls, own_session, **options)
+    return list(await asyncio.gather(*(notify(event, url, session, **options) for url in webhook_urls)))
+
+def _mentions_markdown(event_data):
+    """
+    生成提醒行（企业微信markdown消息通过 <@userid> 提醒成员），没有需要提醒的成员时返回空字符串
+    :param event_data: GitHub事件数据，wecom_mentions 为 identity 解析出的企业微信成员ID（可选）
+    """
+    userids = event_data.get('wecom_mentions') or []
+    if not userids:
+        return ''
+    return '**提醒**: ' + ' '.join(f'<@{userid}>' for userid in userids) + '\n'
+
+def _github_details_markdown(event_data):
+    """
+    生成GitHub API补全信息的Markdown片段（变更统计、评审人、CI状态、Release附件），没有补全信息时返回空字符串
+    :param event_data: GitHub事件数据，github_details 为 github_enrich 的补全结果（可选）
+    """
+    details = event_data.get(DETAILS_KEY) or {}
+    lines = []
+    if details.get('files') is not None:
+        lines.append(f"**变更**: {details['files']} 个文件（+{details['additions']} / -{details['deletions']}）")
+    if details.get('reviewers'):
+        lines.append(f"**评审**: {format_reviewers(details['reviewers'])}")
+    if details.get('ci_state'):
+        lines.append(f"**CI**: {CI_STATE_LABELS.get(details['ci_state'], details['ci_state'])}")
+    if details.get('assets'):
+        lines.append(f"**附件**: {details['assets']} 个，共 {format_size(details['asset_size'] or 0)}")
+    return ''.join(line + '\n' for line in lines)
 
 def generate_push_message(event_data):
     """
@@ -134,6 +636,15 @@ def generate_push_message(event_data):
     # 获取分支名称
     branch = event_data['ref'].split('/')[-1]
     
+    # commits 最多包含20条提交，提交数优先使用补全统计，其次为事件中的 size
+    push_stats = event_data.get('push_stats') or {}
+    commit_count = push_stats.get('commits')
+    if commit_count is None:
+        commit_count = event_data.get('size', len(commits))
+    changes = ''
+    if push_stats.get('files') is not None:
+        changes = f"**变更**: {push_stats['files']} 个文件（+{push_stats['additions']} / -{push_stats['deletions']}）\n"
+    
     return {
         'msgtype': 'markdown',
         'markdown': {
@@ -143,8 +654,8 @@ def generate_push_message(event_data):
 **操作**: 代码推送
 **分支**: {branch}
 **作者**: {pusher['name']}
-**提交数**: {len(commits)} 个
-**查看对比**: [点击查看]({compare_url})
+**提交数**: {commit_count} 个
+{changes}**查看对比**: [点击查看]({compare_url})
 
 **最新提交**:
 - **提交信息**: {commits[0]['message'].splitlines()[0]}
@@ -186,7 +697,7 @@ def generate_pull_request_message(event_data):
 **状态**: {pr['state']}
 **源分支**: {pr['head']['ref']} → 目标分支: {pr['base']['ref']}
 **作者**: {pr['user']['login']}
-            """
+{_github_details_markdown(event_data)}{_mentions_markdown(event_data)}            """
         }
     }
 
@@ -223,7 +734,7 @@ def generate_issues_message(event_data):
 **编号**: #{issue['number']}
 **状态**: {issue['state']}
 **作者**: {issue['user']['login']}
-            """
+{_mentions_markdown(event_data)}            """
         }
     }
 
@@ -259,10 +770,225 @@ def generate_release_message(event_data):
 **名称**: [{release['name'] or release['tag_name']}]({release['html_url']})
 **版本**: {release['tag_name']}
 **类型**: {'预发布' if release['prerelease'] else '正式发布'}
-            """
+{_github_details_markdown(event_data)}            """
         }
     }
 
+def _log_excerpt_markdown(event_data, max_bytes=MARKDOWN_MAX_BYTES):
+    """
+    生成失败日志摘录的Markdown片段（引用格式），没有摘录或放不下时返回空字符串
+    :param event_data: GitHub事件数据
+    :param max_bytes: 片段可占用的UTF-8字节数，超出时从开头丢弃日志行，保留最后的错误信息
+    :return: Markdown片段
+    """
+    excerpt = event_data.get('log_excerpt') or {}
+    if not excerpt.get('text'):
+        return ''
+    header = f"**失败步骤**: {excerpt.get('source') or '未知'}\n"
+    remaining = max_bytes - len(header.encode('utf-8'))
+    quoted = []
+    for line in reversed(excerpt['text'].splitlines()):
+        # 每行额外占用 "> " 前缀和换行符
+        size = len(line.encode('utf-8')) + 3
+        if size > remaining:
+            line = ci_logs.truncate_head(line, remaining - 3)
+            if line:
+                quoted.append(f'> {line}')
+            break
+        quoted.append(f'> {line}')
+        remaining -= size
+    if not quoted:
+        return ''
+    return header + '\n'.join(reversed(quoted)) + '\n'
+
+def _with_log_excerpt(head, event_data, tail=''):
+    """
+    在消息正文与结尾之间插入失败日志摘录，摘录只使用剩余的字节空间
+    :param head: 摘录之前的Markdown内容
+    :param event_data: GitHub事件数据
+    :param tail: 摘录之后的Markdown内容
+    :return: 不超过企业微信字节上限的Markdown内容（head和tail本身超限时除外）
+    """
+    budget = MARKDOWN_MAX_BYTES - len((head + tail).encode('utf-8'))
+    return head + _log_excerpt_markdown(event_data, budget) + tail
+
+def generate_workflow_run_message(event_data):
+    """
+    生成Workflow Run事件通知内容（只通知已完成的失败运行）
+    :param event_data: GitHub事件数据，log_excerpt 为 ci_logs 提取的失败日志摘录（可选）
+    :return: 企业微信通知消息，非失败运行返回None
+    """
+    if not ci_logs.is_failure('workflow_run', event_data):
+        return None
+    repo = event_data['repository']
+    run = event_data['workflow_run']
+    head_commit = run.get('head_commit') or {}
+    commit_lines = (head_commit.get('message') or '').splitlines()
+    
+    return {
+        'msgtype': 'markdown',
+        'markdown': {
+            'content': _with_log_excerpt(f"""## 🚨 GitHub Actions 运行失败
+
+**仓库**: [{repo['full_name']}]({repo['html_url']})
+**工作流**: [{run['name']} #{run['run_number']}]({run['html_url']})
+**结论**: <font color="warning">{run['conclusion']}</font>
+**分支**: {run['head_branch']}
+**提交**: {(run['head_sha'] or '')[:7]} {commit_lines[0] if commit_lines else ''}
+**触发者**: {(run.get('actor') or {}).get('login')}
+""", event_data, _mentions_markdown(event_data))
+        }
+    }
+
+def generate_check_run_message(event_data):
+    """
+    生成Check Run事件通知内容（只通知已完成的失败检查）
+    :param event_data: GitHub事件数据，log_excerpt 为 ci_logs 提取的失败日志摘录（可选）
+    :return: 企业微信通知消息，非失败检查返回None
+    """
+    if not ci_logs.is_failure('check_run', event_data):
+        return None
+    repo = event_data['repository']
+    check_run = event_data['check_run']
+    summary = (check_run.get('output') or {}).get('title')
+    
+    return {
+        'msgtype': 'markdown',
+        'markdown': {
+            'content': _with_log_excerpt(f"""## 🚨 GitHub 检查失败
+
+**仓库**: [{repo['full_name']}]({repo['html_url']})
+**检查**: [{check_run['name']}]({check_run['html_url']})
+**结论**: <font color="warning">{check_run['conclusion']}</font>
+**分支**: {(check_run.get('check_suite') or {}).get('head_branch')}
+**提交**: {(check_run['head_sha'] or '')[:7]}
+{f'**概要**: {summary}' if summary else ''}
+""", event_data)
+        }
+    }
+
+# 事件类型与消息生成函数的映射
+MESSAGE_GENERATORS = {
+    'push': generate_push_message,
+    'pull_request': generate_pull_request_message,
+    'issues': generate_issues_message,
+    'release': generate_release_message,
+    'workflow_run': generate_workflow_run_message,
+    'check_run': generate_check_run_message,
+}
+
+def render_event(event, msgtype=MSGTYPE_MARKDOWN):
+    """
+    渲染通知消息并预编码请求体，结果按 (事件类型, 内容指纹, 模板版本, 消息类型) 缓存
+    内容指纹覆盖渲染用到的全部字段，重新补全后的同一投递不会命中旧消息
+    :param event: NotificationEvent
+    :param msgtype: 消息类型：markdown、template_card 或 news
+    :return: RenderedMessage，事件类型不支持时返回None
+    """
+    generator = MESSAGE_GENERATORS.get(event.event_name)
+    if generator is None:
+        return None
+    if msgtype == MSGTYPE_MARKDOWN:
+        render = lambda: generator(event.to_payload())
+    elif msgtype in EVENT_RENDERERS:
+        renderer = EVENT_RENDERERS[msgtype]
+        render = lambda: renderer(event)
+    else:
+        raise ValueError(f'不支持的消息类型: {msgtype}')
+    key = (event.event_name, fingerprint(event), TEMPLATE_VERSION, msgtype)
+    return render_cache.get_or_render(key, render)
+
+def render_message(event_name, event_data, delivery_id=None, msgtype=MSGTYPE_MARKDOWN):
+    """
+    从GitHub事件数据渲染通知消息，先提取为 NotificationEvent，再由 render_event 渲染并缓存
+    :param event_name: GitHub事件名称
+    :param event_data: GitHub事件数据
+    :param delivery_id: GitHub投递ID（X-GitHub-Delivery），可选
+    :param msgtype: 消息类型：markdown、template_card 或 news
+    :return: RenderedMessage，事件类型不支持时返回None
+    """
+    if event_name not in MESSAGE_GENERATORS:
+        return None
+    return render_event(NotificationEvent.from_payload(event_name, event_data, delivery_id=delivery_id), msgtype)
+
+def resume_checkpoint(checkpoint_path, webhook_urls, msgtype=MSGTYPE_MARKDOWN, store=None, max_attempts=1,
+                      shutdown=None, session=None):
+    """
+    恢复发送检查点中的未发送事件（上次运行被 SIGTERM 或 SIGINT 中断时写入），发送后从检查点移除
+    :param checkpoint_path: 检查点文件路径
+    :param webhook_urls: Webhook URL列表
+    :param msgtype: 消息类型
+    :param store: IdempotencyStore，可选，避免中断前已发送的目标重复收到
+    :param max_attempts: 建立连接失败时的最大尝试次数
+    :param shutdown: GracefulShutdown，可选，再次收到退出信号时保留剩余事件
+    :param session: requests.Session，可选
+    :return: 恢复发送的事件数量
+    """
+    pending = load_checkpoint(checkpoint_path)
+    if not pending:
+        return 0
+    print(f'::info::[{os.getenv("CURRENT_SESSION_ID", "main")}] 检查点中有 {len(pending)} 个未发送事件，开始恢复发送')
+    sent = 0
+    try:
+        for event in pending:
+            if shutdown is not None:
+                shutdown.check()
+            rendered = render_event(event, msgtype)
+            if rendered is not None:
+                for target_url in webhook_urls:
+                    deliver_notification(target_url, rendered, delivery_id=event.delivery_id, store=store,
+                                         max_attempts=max_attempts, session=session)
+            sent += 1
+    finally:
+        save_checkpoint(checkpoint_path, pending[sent:])
+    return sent
+
+def derive_delivery_id(event_hash):
+    """
+    未提供投递ID时的默认值：运行ID + 事件内容哈希（重跑工作流时保持不变），不在Actions中运行时为内容哈希
+    :param event_hash: 事件文件的内容哈希
+    """
+    run_id = os.getenv('GITHUB_RUN_ID')
+    return f'{run_id}:{event_hash[:16]}' if run_id else event_hash
+
+def handoff_event(event, relay_url=None, spool_dir=None, secret=None, idempotent=False):
+    """
+    交接模式：把紧凑事件记录交给中继，由中继负责发送、重试和限速
+    :param event: NotificationEvent
+    :param relay_url: 中继的基础URL，优先使用
+    :param spool_dir: 与中继共享的缓冲目录，未配置 relay_url 或提交失败时使用
+    :param secret: 中继配置的Webhook密钥
+    :param idempotent: 是否配置了幂等存储；中继可能已接收事件（读取超时、部分机器人已入队）时，
+                       只有配置后才改为写入缓冲目录或直接发送
+    :return: 是否交接成功；中继可能已接收且未配置幂等存储时视为成功，不再重复发送
+    """
+    session_id = os.getenv('CURRENT_SESSION_ID', 'main')
+    with tracing.span('handoff', kind=tracing.KIND_PRODUCER) as span:
+        if relay_url:
+            try:
+                outcome = submit_event(relay_url, event, secret=secret)
+                span.set_attribute('relay.outcome', outcome)
+                print(f'::info::[{session_id}] 事件 {event.delivery_id} 已提交到中继，结果: {outcome}')
+                return True
+            except HandoffError as e:
+                span.record_exception(e)
+                print(f'::warning::[{session_id}] {e}')
+                if e.uncertain and not idempotent:
+                    span.set_attribute('relay.outcome', 'uncertain')
+                    print(f'::warning::[{session_id}] 中继可能已接收事件 {event.delivery_id}，'
+                          f'未配置 idempotency_db，为避免重复通知不再改为其他方式发送')
+                    return True
+        if spool_dir:
+            try:
+                path = spool_event(spool_dir, event)
+                span.set_attribute('relay.spool_file', os.path.basename(path))
+                print(f'::info::[{session_id}] 事件 {event.delivery_id} 已写入中继缓冲目录: {path}')
+                return True
+            except OSError as e:
+                span.record_exception(e)
+                print(f'::warning::[{session_id}] 写入中继缓冲目录失败: {e}')
+    return False
+
 def main():
     """
     主函数
@@ -289,11 +1015,65 @@ def main():
     print(f'::debug::[{session_id}]   操作人: {github_actor}')
     print(f'::debug::[{session_id}]   提交SHA: {github_sha}')
     
+    # 数值参数在创建任何需要清理的资源之前校验，格式错误时直接退出
+    try:
+        trace_sample_rate = get_float_input('trace_sample_rate', tracing.DEFAULT_SAMPLE_RATE, maximum=1.0)
+        drain_timeout = get_float_input('drain_timeout', DEFAULT_DRAIN_TIMEOUT)
+    except InvalidInputError:
+        print(f'::error::[{session_id}] 输入参数无效，请检查 trace_sample_rate 与 drain_timeout')
+        sys.exit(1)
+    
+    # 剖析开关：输出 cProfile、tracemalloc 与分阶段耗时文件，可作为工作流制品上传
+    profile_scope = contextlib.ExitStack()
+    if get_input('profile', default='false').lower() == 'true':
+        profiling.configure(get_input('profile_dir', default=profiling.DEFAULT_OUTPUT_DIR))
+        profile_scope.enter_context(profiling.profile('main'))
+    
+    # 分布式追踪：各阶段的 span 导出到 OTLP 接收端或本地文件，链路以投递ID标识
+    trace_scope = contextlib.ExitStack()
+    tracer = tracing.configure(
+        endpoint=get_input('trace_endpoint') or os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT'),
+        path=get_input('trace_file'),
+        sample_rate=trace_sample_rate,
+        export_interval=None
+    )
+    # 投递ID：优先使用输入，其次为 运行ID + 事件内容哈希。启用追踪时在开始根 span 之前确定，
+    # trace id 与采样决定都由投递ID派生，与中继侧（HTTP或缓冲目录交接）的 span 属于同一链路
+    delivery_id = get_input('delivery_id')
+    event_hash = None
+    if not delivery_id and tracer is not None:
+        with contextlib.suppress(OSError, TypeError):
+            event_hash = file_hash(os.getenv('GITHUB_EVENT_PATH'))
+            delivery_id = derive_delivery_id(event_hash)
+    root_span = trace_scope.enter_context(tracing.span(
+        'notification', delivery_id=delivery_id, kind=tracing.KIND_CONSUMER,
+        attributes={'github.event': github_event_name, 'github.repository': github_repository,
+                    'github.run_id': os.getenv('GITHUB_RUN_ID')}))
+    if tracer is not None:
+        print(f'::debug::[{session_id}] 追踪ID: {root_span.trace_id}，采样率: {tracer.sample_rate}')
+    
+    # 优雅退出：SIGTERM/SIGINT 只置位标志，在安全点（补全前、交接前、发送前）退出；进行中的发送最多再等待 drain_timeout，
+    # 未发送的事件写入检查点，下次运行时恢复
+    shutdown = GracefulShutdown(drain_timeout).install()
+    checkpoint_path = get_input('checkpoint_path')
+    # 自适应超时的延迟估计保存在状态文件中，在多次运行之间累积
+    timeout_state = get_input('timeout_state')
+    pending_event = None
+    prewarmer = None
+    
     try:
         # 1. 获取输入参数
         print(f'::debug::[{session_id}] 步骤1: 获取输入参数')
-        webhook_url = get_input('wechat_webhook_url', required=False)
+        webhook_url = get_input('wechat_webhook_url', required=False)  # 支持逗号或换行分隔多个机器人
         event_types = get_input('event_types', default='push,pull_request,issues,release').split(',')
+        # 运行模式: realtime 实时通知；digest 只记录到摘要存储；digest-send 汇总并发送摘要；relay 交给中继发送
+        mode = get_input('mode', default='realtime')
+        configure_breakers(
+            failure_threshold=get_input('circuit_failure_threshold', default='3'),
+            recovery_timeout=get_input('circuit_recovery_timeout', default='60')
+        )
+        if timeout_state:
+            print(f'::debug::[{session_id}] 恢复超时估计: {load_trackers(timeout_state)} 个主机')
         print(f'::debug::[{session_id}] 输入参数获取完成: webhook_url={webhook_url[:50] if webhook_url else "None"}..., event_types={event_types}')
         
         # 如果webhook_url为空，尝试从环境变量获取
@@ -302,12 +1082,48 @@ def main():
             webhook_url = os.getenv('WECHAT_WEBHOOK_URL') or os.getenv('WCOM_WEBHOOK_URL')
             print(f'::debug::[{session_id}] 从环境变量获取到webhook_url: {webhook_url[:50] if webhook_url else "None"}...')
         
-        # 最终检查webhook_url是否存在
-        if not webhook_url:
+        # 最终检查webhook_url是否存在（交接模式下只在中继不可用、需要直接发送时使用）
+        if not webhook_url and mode != 'relay':
             print(f'::error::[{session_id}] 未找到有效的webhook_url')
             print(f'::error::[{session_id}] 请通过GitHub Action输入或环境变量提供WECHAT_WEBHOOK_URL或WCOM_WEBHOOK_URL')
             sys.exit(1)
         
+        digest_db = get_input('digest_db')
+        if mode in ('digest', 'digest-send') and not digest_db:
+            print(f'::error::[{session_id}] {mode} 模式需要配置 digest_db')
+            sys.exit(1)
+        relay_url = get_input('relay_url')
+        relay_spool_dir = get_input('relay_spool_dir')
+        if mode == 'relay' and not (relay_url or relay_spool_dir):
+            print(f'::error::[{session_id}] relay 模式需要配置 relay_url 或 relay_spool_dir')
+            sys.exit(1)
+        
+        if mode == 'digest-send':
+            period = get_input('digest_period', default='daily')
+            print(f'::debug::[{session_id}] 摘要模式: 汇总 {period} 动态，存储: {digest_db}')
+            since, until = digest_window(period)
+            with DigestStore(digest_db) as store:
+                digest_messages = generate_digest_messages(store, period, now=until)
+                print(f'::info::[{session_id}] 生成摘要卡片 {len(digest_messages)} 张')
+                for digest_message in digest_messages:
+                    for target_url in parse_webhook_urls(webhook_url):
+                        send_result = send_wechat_message(target_url, digest_message)
+                        print(f'::debug::[{session_id}] send_wechat_message 返回结果: {send_result}')
+                # 早于本次摘要窗口的事件不会再出现在后续摘要中，清理后存储只保留最近一个周期
+                purged = store.purge(since)
+            print(f'::debug::[{session_id}] 清理摘要存储中 {purged} 条过期事件')
+            return
+        
+        if checkpoint_path and mode == 'realtime':
+            idempotency_db = get_input('idempotency_db')
+            with IdempotencyStore(idempotency_db) if idempotency_db else contextlib.nullcontext() as resume_store:
+                resumed = resume_checkpoint(checkpoint_path, parse_webhook_urls(webhook_url),
+                                            msgtype=get_input('message_type', default=MSGTYPE_MARKDOWN),
+                                            store=resume_store, max_attempts=int(get_input('max_attempts', default='1')),
+                                            shutdown=shutdown)
+            if resumed:
+                print(f'::info::[{session_id}] 已恢复发送检查点中的 {resumed} 个事件')
+        
         # 2. 获取GitHub事件信息
         print(f'::debug::[{session_id}] 步骤2: 获取GitHub事件信息')
         event_path = os.getenv('GITHUB_EVENT_PATH')
@@ -317,15 +1133,6 @@ def main():
         
         print(f'::debug::[{session_id}] 事件文件路径: {event_path}')
         
-        try:
-            with open(event_path, 'r') as f:
-                event_data = json.load(f)
-            print(f'::debug::[{session_id}] 事件数据加载成功，数据大小: {len(json.dumps(event_data))} 字节')
-        except json.JSONDecodeError as e:
-            print(f'::error::[{session_id}] 解析GitHub事件数据失败: {e}')
-            print(f'::debug::[{session_id}] 异常堆栈: {traceback.format_exc()}')
-            sys.exit(1)
-        
         if not github_event_name:
             print(f'::error::[{session_id}] GITHUB_EVENT_NAME 环境变量未找到')
             sys.exit(1)
@@ -333,46 +1140,224 @@ def main():
         print(f'::info::[{session_id}] 当前事件类型: {github_event_name}')
         print(f'::info::[{session_id}] 配置的通知事件类型: {event_types}')
         
-        # 3. 检查是否需要处理该事件类型
+        # 3. 检查是否需要处理该事件：只按名称过滤的事件无需打开事件文件
         print(f'::debug::[{session_id}] 步骤3: 检查事件类型是否需要处理')
         if github_event_name not in event_types:
             print(f'::info::[{session_id}] 事件类型 {github_event_name} 不在配置的通知列表中，跳过通知')
             return
+        if github_event_name not in MESSAGE_GENERATORS:
+            print(f'::warning::[{session_id}] 未处理的事件类型: {github_event_name}')
+            return
+        
+        event_filter = compile_filter(get_input('filter'))
+        if event_filter is not None:
+            print(f'::debug::[{session_id}] 过滤表达式: {event_filter.expression}')
+            if not event_filter.accepts_event(github_event_name):
+                print(f'::info::[{session_id}] 事件类型 {github_event_name} 不满足过滤表达式，跳过通知')
+                return
+        
+        # 连接预热：确定需要发送后立即在后台建立到Webhook主机的连接，与事件解析、补全和渲染并行
+        if mode == 'realtime' and get_input('prewarm', default='true').lower() == 'true':
+            prewarmer = ConnectionPrewarmer(parse_webhook_urls(webhook_url)).start()
+        
+        # 安装了 ijson 时只流式读取表达式引用的字段，被过滤的事件不做完整解析
+        streamed = False
+        if event_filter is not None and event_filter.paths and event_filter.can_stream():
+            with profiling.stage('filter'), tracing.span('filter'), open(event_path, 'rb') as f:
+                matched = event_filter.matches_file(github_event_name, f)
+            if not matched:
+                print(f'::info::[{session_id}] 事件不满足过滤表达式，跳过通知')
+                return
+            streamed = True
+        
+        try:
+            with profiling.stage('load_event'), tracing.span('parse') as parse_span:
+                with open(event_path, 'rb') as f:
+                    raw_event = f.read()
+                event_data = json.loads(raw_event)
+                parse_span.set_attribute('github.event.size', len(raw_event))
+            print(f'::debug::[{session_id}] 事件数据加载成功，数据大小: {len(raw_event)} 字节')
+        except json.JSONDecodeError as e:
+            print(f'::error::[{session_id}] 解析GitHub事件数据失败: {e}')
+            print(f'::debug::[{session_id}] 异常堆栈: {traceback.format_exc()}')
+            sys.exit(1)
+        
+        if event_filter is not None and not streamed:
+            with profiling.stage('filter'), tracing.span('filter'):
+                matched = event_filter(github_event_name, event_data)
+            if not matched:
+                print(f'::info::[{session_id}] 事件不满足过滤表达式，跳过通知')
+                return
         
         # 4. 根据事件类型生成通知内容
         print(f'::debug::[{session_id}] 步骤4: 生成通知内容')
-        message = None
         
-        if github_event_name == 'push':
-            print(f'::debug::[{session_id}] 处理 push 事件')
-            message = generate_push_message(event_data)
-        elif github_event_name == 'pull_request':
-            print(f'::debug::[{session_id}] 处理 pull_request 事件')
-            message = generate_pull_request_message(event_data)
-        elif github_event_name == 'issues':
-            print(f'::debug::[{session_id}] 处理 issues 事件')
-            message = generate_issues_message(event_data)
-        elif github_event_name == 'release':
-            print(f'::debug::[{session_id}] 处理 release 事件')
-            message = generate_release_message(event_data)
-        else:
-            print(f'::warning::[{session_id}] 未处理的事件类型: {github_event_name}')
+        if mode == 'digest':
+            print(f'::debug::[{session_id}] 摘要模式: 记录 {github_event_name} 事件到 {digest_db}，不发送实时通知')
+            with DigestStore(digest_db) as store:
+                record_payload(store, github_event_name, event_data)
             return
         
-        if message:
-            # 5. 发送通知
-            print(f'::debug::[{session_id}] 步骤5: 发送企业微信通知')
-            print(f'::debug::[{session_id}] 调用 send_wechat_message 函数')
-            send_result = send_wechat_message(webhook_url, message)
-            print(f'::debug::[{session_id}] send_wechat_message 返回结果: {send_result}')
+        print(f'::debug::[{session_id}] 处理 {github_event_name} 事件')
+        if event_hash is None:
+            event_hash = content_hash(raw=raw_event)
+        if not delivery_id:
+            delivery_id = derive_delivery_id(event_hash)
+        # 补全期间（日志下载、GitHub API、身份查询）收到退出信号时，先检查点保存未补全的事件，恢复时按原始内容发送
+        pending_event = NotificationEvent.from_payload(github_event_name, event_data, delivery_id=delivery_id)
+        shutdown.check()
+
+        # 事件补全：CI日志摘录、推送统计、PR/Release详情、@提醒成员
+        with profiling.stage('enrich'), tracing.span('enrich'):
+            # CI失败事件附带失败步骤的日志摘录（本地日志文件优先，其次使用Token下载）
+            if github_event_name in ('workflow_run', 'check_run'):
+                excerpt = ci_logs.failure_excerpt(github_event_name, event_data, log_path=get_input('ci_log_path'),
+                                                  token=get_input('github_token'))
+                if excerpt is not None:
+                    print(f'::debug::[{session_id}] 提取CI日志摘录: {excerpt}')
+                    event_data['log_excerpt'] = {'source': excerpt.source, 'text': excerpt.text}
+
+            # push事件的 commits 最多20条：根据 before/after 补全准确的提交数与文件变更统计
+            if github_event_name == 'push' and get_input('push_stats', default='false').lower() == 'true':
+                stats = enrich_push(
+                    event_data,
+                    cache=PushStatsCache(get_input('push_stats_cache') or None),
+                    git_dir=get_input('git_dir') or os.getenv('GITHUB_WORKSPACE'),
+                    token=get_input('github_token')
+                )
+                print(f'::debug::[{session_id}] 推送统计: {stats}')
+                event_data['push_stats'] = stats.to_dict()
+
+            # Pull Request / Release 补充变更文件数、评审人、CI状态和附件大小（条件请求缓存，超出时间预算时不补全）
+            if github_event_name in LOOKUPS and get_input('github_enrich', default='false').lower() == 'true':
+                shutdown.check()
+                budget = float(get_input('enrich_budget', default=str(DEFAULT_BUDGET)))
+                api = github_api(get_input('github_token'), ConditionalCache(get_input('github_cache') or None),
+                                 timeout=budget)
+                details = enrich_event(github_event_name, event_data, api, budget=budget)
+                if details is not None:
+                    print(f'::debug::[{session_id}] GitHub API补全结果: {details}')
+                    event_data[DETAILS_KEY] = details
+
+            # 将评审人、指派人等GitHub账号解析为企业微信成员，用于 <@userid> 提醒
+            identity_path = get_input('identity_map')
+            if identity_path:
+                shutdown.check()
+                client = None
+                if get_input('identity_lookup', default='false').lower() == 'true' and get_input('github_token'):
+                    client = github_client(get_input('github_token'))
+                mentions = resolve_mentions(github_event_name, event_data, IdentityMap(identity_path, client=client))
+                if mentions:
+                    print(f'::debug::[{session_id}] 提醒企业微信成员: {mentions}')
+                    event_data['wecom_mentions'] = mentions
+        
+        msgtype = get_input('message_type', default=MSGTYPE_MARKDOWN)
+        print(f'::debug::[{session_id}] 消息类型: {msgtype}')
+        
+        event = NotificationEvent.from_payload(github_event_name, event_data, delivery_id=delivery_id)
+        pending_event = event
+        root_span.set_attribute('github.delivery_id', delivery_id)
+        shutdown.check()
+        
+        # 交接模式：校验通过后只提交紧凑事件记录并返回，不等待企业微信的往返和重试
+        if mode == 'relay':
+            if handoff_event(event, relay_url, relay_spool_dir, get_input('relay_secret'),
+                             idempotent=bool(get_input('idempotency_db'))):
+                pending_event = None
+                return
+            if not webhook_url:
+                print(f'::error::[{session_id}] 中继不可用，且未配置 wechat_webhook_url，无法直接发送')
+                sys.exit(1)
+            print(f'::warning::[{session_id}] 中继不可用，改为直接发送')
+        # 预先渲染：校验消息类型，并使发送阶段直接命中渲染缓存
+        with profiling.stage('render'), tracing.span('render'):
+            rendered = render_event(event, msgtype)
+        
+        if rendered:
+            # 5. 发送通知（多个机器人并发发送，复用同一份已编码的消息体）
+            webhook_urls = parse_webhook_urls(webhook_url)
+            print(f'::debug::[{session_id}] 步骤5: 发送企业微信通知，目标数量: {len(webhook_urls)}')
+            
+            # 频率节流：同一对象的相似事件在窗口内过多时静音，状态保存在文件中供后续运行累计
+            # 持有文件锁读取、计数并保存，并发作业不会互相覆盖；摘要在释放锁之后发送
+            throttle_state = get_input('throttle_state')
+            if throttle_state:
+                with profiling.stage('throttle'), tracing.span('throttle'), FrequencyThrottle.locked(
+                        throttle_state,
+                        threshold=int(get_input('throttle_threshold', default='10')),
+                        window_seconds=float(get_input('throttle_window', default='600'))) as throttle:
+                    allowed, expired = check_throttle(throttle, event)
+                send_suppressed_summaries(expired, webhook_urls)
+                if not allowed:
+                    pending_event = None
+                    return
+            
+            shutdown.check()
+            store = None
+            idempotency_db = get_input('idempotency_db')
+            if idempotency_db:
+                print(f'::debug::[{session_id}] 启用幂等存储: {idempotency_db}, 投递ID: {delivery_id}')
+                store = IdempotencyStore(idempotency_db)
+                expired = store.expire(float(get_input('idempotency_ttl', default=str(DEFAULT_TTL_SECONDS))))
+                print(f'::debug::[{session_id}] 清理过期回执: {expired} 条')
+            
+            # 单个事件的发送截止时间（覆盖所有目标与重试），未配置时不限制
+            send_deadline = get_input('send_deadline')
+            deadline = start_time + float(send_deadline) if send_deadline else None
+            max_attempts = int(get_input('max_attempts', default='1'))
+            attachment = get_input('attachment')
+            media_cache = MediaCache(get_input('media_cache') or None) if attachment else None
+            
+            try:
+                print(f'::debug::[{session_id}] 调用 notify_all 函数')
+                send_options = dict(msgtype=msgtype, store=store, deadline=deadline, max_attempts=max_attempts,
+                                    attachment=attachment, media_cache=media_cache, rendered=rendered)
+                deliver = shutdown.bounded(notify_all)
+                with profiling.stage('deliver'), tracing.span('deliver'):
+                    if prewarmer is not None:
+                        send_results = prewarmer.run(deliver, event, webhook_urls, **send_options)
+                    else:
+                        send_results = asyncio.run(deliver(event, webhook_urls, **send_options))
+                pending_event = None
+                if prewarmer is not None:
+                    for origin, warmed in prewarmer.warmed.items():
+                        if isinstance(warmed, Exception):
+                            print(f'::debug::[{session_id}] 连接预热失败: {origin}: {warmed!r}')
+                        else:
+                            print(f'::debug::[{session_id}] 连接预热完成: {origin}，耗时 {warmed:.3f}s')
+                for target_url, send_result in zip(webhook_urls, send_results):
+                    print(f'::debug::[{session_id}] {target_url[:50]}...(已截断) 发送结果: {send_result}')
+                
+                # 归档事件数据与发送结果，便于事后查询和定向重放
+                archive_dir = get_input('archive_dir')
+                if archive_dir:
+                    with profiling.stage('archive'), tracing.span('archive'), EventArchive(
+                            archive_dir, compression=get_input('archive_compression', default='gzip')) as archive:
+                        archive.append_event(github_event_name, event_data, delivery_id=delivery_id)
+                        for target_url, send_result in zip(webhook_urls, send_results):
+                            archive.append_delivery(github_event_name, event.repo_full_name, target_url,
+                                                    rendered.message, send_result, delivery_id=delivery_id)
+                    print(f'::debug::[{session_id}] 事件与发送结果已归档到 {archive_dir}')
+            finally:
+                if store is not None:
+                    store.close()
         else:
             print(f'::warning::[{session_id}] 未生成通知消息')
             
-    except KeyboardInterrupt:
-        print(f'::warning::[{session_id}] 程序被用户中断')
+    except (ShutdownRequested, KeyboardInterrupt) as e:
+        # 信号处理函数安装之前（或非主线程运行时）收到 Ctrl-C 同样保存未发送的事件
+        print(f'::warning::[{session_id}] 程序收到退出信号: {str(e) or type(e).__name__}')
+        root_span.record_exception(e)
+        if pending_event is not None:
+            if checkpoint_path:
+                total = append_checkpoint(checkpoint_path, [pending_event])
+                print(f'::warning::[{session_id}] 未发送事件 {pending_event.delivery_id} 已写入检查点 {checkpoint_path}（共 {total} 个），下次运行时恢复')
+            else:
+                print(f'::warning::[{session_id}] 事件 {pending_event.delivery_id} 未发送，配置 checkpoint_path 可在下次运行时恢复')
         sys.exit(1)
     except Exception as e:
         print(f'::error::[{session_id}] 主函数执行异常')
+        root_span.record_exception(e)
         print(f'::error::[{session_id}] 异常类型: {type(e).__name__}')
         print(f'::error::[{session_id}] 异常信息: {str(e)}')
         print(f'::debug::[{session_id}] 异常堆栈: {traceback.format_exc()}')
@@ -386,6 +1371,19 @@ def main():
         print(f'::debug::[{session_id}] 结束时间: {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(end_time))}')
         print(f'::debug::[{session_id}] 总执行时长: {duration:.3f}s')
         print(f'::debug::[{session_id}] 会话ID: {session_id}')
+        if prewarmer is not None:
+            prewarmer.close()
+        if timeout_state:
+            try:
+                save_trackers(timeout_state)
+            except OSError as e:
+                print(f'::warning::[{session_id}] 保存超时估计失败: {e}')
+        shutdown.restore()
+        profile_scope.close()
+        trace_scope.close()
+        tracing.shutdown()
+        for profile_path in profiling.shutdown():
+            print(f'::info::[{session_id}] 剖析结果已写入: {profile_path}')
         print(f'::info::[{session_id}] 程序执行完成')
 
 if __name__ == '__main__':
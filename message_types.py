@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+企业微信消息类型
+在渲染阶段之上抽象消息类型：markdown 由 main.py 中的 generate_*_message 生成，
+template_card / news 基于 NotificationEvent 的公共字段渲染，
+文件和图片附件通过 upload_media 上传（按内容哈希缓存 media_id，3天有效期内不重复上传）
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
+
+import requests
+
+from circuit_breaker import webhook_key
+from github_enrich import CI_STATE_TEXT, format_reviewers, format_size
+
+MSGTYPE_MARKDOWN = 'markdown'
+MSGTYPE_TEMPLATE_CARD = 'template_card'
+MSGTYPE_NEWS = 'news'
+
+# 企业微信 media_id 有效期为3天，预留1小时余量
+MEDIA_TTL_SECONDS = 3 * 24 * 3600 - 3600
+
+# 图片消息的大小上限（base64编码前）
+MAX_IMAGE_BYTES = 2 * 1024 * 1024
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# 卡片横向内容的值长度上限
+_CARD_VALUE_LIMIT = 26
+
+_EVENT_TITLES = {
+    'push': 'GitHub 代码推送通知',
+    'pull_request': 'GitHub Pull Request 通知',
+    'issues': 'GitHub Issues 通知',
+    'release': 'GitHub Release 通知',
+    'workflow_run': 'GitHub Actions 运行失败',
+    'check_run': 'GitHub 检查失败',
+}
+
+
+def _truncate(value, limit=_CARD_VALUE_LIMIT):
+    value = '' if value is None else str(value)
+    return value if len(value) <= limit else value[:limit - 1] + '…'
+
+
+def _event_summary(event):
+    """
+    提取各消息类型共用的标题、描述、链接和键值字段
+    :param event: NotificationEvent
+    :return: (标题, 描述, 链接, [(字段名, 值)])
+    """
+    fields = [('仓库', event.repo_full_name)]
+    if event.event_name == 'push':
+        branch = (event.ref or '').split('/')[-1]
+        title = f'{event.author} 推送到 {branch}'
+        description = event.commit_message or ''
+        url = event.compare_url
+        fields += [('分支', branch), ('提交数', f'{event.commit_count or 0} 个'),
+                   ('提交者', event.commit_author), ('提交哈希', (event.commit_id or '')[:7])]
+    elif event.event_name in ('pull_request', 'issues'):
+        prefix = 'PR' if event.event_name == 'pull_request' else 'Issue'
+        title = f'{prefix} #{event.number} {event.title}'
+        description = f'{event.sender} {event.action} {prefix}'
+        url = event.html_url
+        fields += [('状态', event.state), ('作者', event.author)]
+        if event.event_name == 'pull_request':
+            fields.append(('分支', f'{event.ref} → {event.base_ref}'))
+            if event.reviewers:
+                reviewers = [dict(zip(('login', 'state'), item.rsplit(':', 1))) for item in event.reviewers.split(',')]
+                fields.append(('评审', format_reviewers(reviewers)))
+            if event.ci_state:
+                fields.append(('CI', CI_STATE_TEXT.get(event.ci_state, event.ci_state)))
+            if event.files_changed is not None:
+                fields.append(('变更', f'{event.files_changed} 个文件 +{event.additions}/-{event.deletions}'))
+    elif event.event_name == 'release':
+        title = f'Release {event.title or event.tag_name}'
+        description = f'{event.sender} {event.action} {event.tag_name}'
+        url = event.html_url
+        fields += [('版本', event.tag_name), ('类型', '预发布' if event.prerelease else '正式发布')]
+        if event.asset_count:
+            fields.append(('附件', f'{event.asset_count} 个，{format_size(event.asset_size or 0)}'))
+    elif event.event_name in ('workflow_run', 'check_run'):
+        title = f'{event.title} #{event.number}' if event.number else event.title
+        description = f'{event.failed_step} 失败' if event.failed_step else (event.summary or event.conclusion or '')
+        url = event.html_url
+        fields += [('结论', event.conclusion), ('分支', event.ref), ('提交', (event.commit_id or '')[:7]),
+                   ('失败步骤', event.failed_step), ('触发者', event.author)]
+    else:
+        title = f'{event.event_name} {event.action or ""}'.strip()
+        description = ''
+        url = event.repo_html_url
+    return title, description, url, fields
+
+
+def render_template_card(event):
+    """
+    渲染文本通知模版卡片，一次调用即可展示标题、多个字段和跳转链接
+    :param event: NotificationEvent
+    """
+    title, description, url, fields = _event_summary(event)
+    card = {
+        'card_type': 'text_notice',
+        'source': {'desc': _EVENT_TITLES.get(event.event_name, 'GitHub 通知')},
+        'main_title': {'title': _truncate(title, 36), 'desc': _truncate(description, 44)},
+        # 企业微信限制最多6个横向字段
+        'horizontal_content_list': [
+            {'keyname': name, 'value': _truncate(value)} for name, value in fields[:6] if value
+        ],
+        'card_action': {'type': 1, 'url': url or event.repo_html_url},
+    }
+    if url:
+        card['jump_list'] = [{'type': 1, 'url': url, 'title': '查看详情'}]
+    return {'msgtype': MSGTYPE_TEMPLATE_CARD, MSGTYPE_TEMPLATE_CARD: card}
+
+
+def render_news(event):
+    """
+    渲染图文消息
+    :param event: NotificationEvent
+    """
+    title, description, url, fields = _event_summary(event)
+    details = '，'.join(f'{name}: {value}' for name, value in fields if value)
+    return {
+        'msgtype': MSGTYPE_NEWS,
+        MSGTYPE_NEWS: {
+            'articles': [{
+                'title': title,
+                'description': f'{description}\n{details}'.strip(),
+                'url': url or event.repo_html_url,
+            }]
+        }
+    }
+
+
+# 基于 NotificationEvent 渲染的消息类型（markdown 由 main.MESSAGE_GENERATORS 负责）
+EVENT_RENDERERS = {
+    MSGTYPE_TEMPLATE_CARD: render_template_card,
+    MSGTYPE_NEWS: render_news,
+}
+
+
+def upload_url(webhook_url, media_type='file'):
+    """
+    由发送地址推导上传临时素材的地址（同一机器人Key）
+    """
+    parsed = urlparse(webhook_url)
+    key = parse_qs(parsed.query).get('key', [''])[0]
+    path = parsed.path.rsplit('/', 1)[0] + '/upload_media'
+    return urlunparse(parsed._replace(path=path, query=urlencode({'key': key, 'type': media_type})))
+
+
+class MediaCache:
+    """
+    media_id 本地缓存
+    以 (机器人, 文件内容哈希) 为键，保存在JSON文件中，过期条目在读取和保存时清理
+    """
+
+    def __init__(self, path=None, ttl_seconds=MEDIA_TTL_SECONDS, clock=time.time):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    @staticmethod
+    def cache_key(webhook_url, digest):
+        robot = hashlib.sha256(webhook_key(webhook_url).encode('utf-8')).hexdigest()[:16]
+        return f'{robot}:{digest}'
+
+    def get(self, webhook_url, digest):
+        """
+        获取未过期的 media_id
+        """
+        with self._lock:
+            entry = self._entries.get(self.cache_key(webhook_url, digest))
+        if entry and self._clock() - entry['created_at'] < self.ttl_seconds:
+            return entry['media_id']
+        return None
+
+    def put(self, webhook_url, digest, media_id, created_at=None):
+        with self._lock:
+            self._entries[self.cache_key(webhook_url, digest)] = {
+                'media_id': media_id,
+                'created_at': self._clock() if created_at is None else created_at,
+            }
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        now = self._clock()
+        with self._lock:
+            self._entries = {key: entry for key, entry in self._entries.items()
+                             if now - entry['created_at'] < self.ttl_seconds}
+            temp_path = f'{self.path}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(temp_path, self.path)
+
+
+def file_digest(path):
+    """
+    分块计算文件内容的SHA-256
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upload_media(webhook_url, path, cache=None, media_type='file', timeout=30):
+    """
+    上传临时素材，内容相同且未过期时直接复用缓存的 media_id
+    :param webhook_url: 企业微信机器人Webhook URL
+    :param path: 文件路径
+    :param cache: MediaCache，可选
+    :param media_type: file 或 voice
+    :return: media_id，上传失败时返回None
+    """
+    digest = file_digest(path)
+    if cache is not None:
+        media_id = cache.get(webhook_url, digest)
+        if media_id:
+            print(f'::debug::[{os.getenv("CURRENT_SESSION_ID", "main")}] 复用已上传的素材: {os.path.basename(path)}')
+            return media_id
+
+    try:
+        with open(path, 'rb') as f:
+            response = requests.post(upload_url(webhook_url, media_type),
+                                     files={'media': (os.path.basename(path), f)}, timeout=timeout)
+        response.raise_for_status()
+        result = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f'::error::[{os.getenv("CURRENT_SESSION_ID", "main")}] 上传素材失败: {e}')
+        return None
+    if result.get('errcode') != 0:
+        print(f'::error::[{os.getenv("CURRENT_SESSION_ID", "main")}] 上传素材失败: {result.get("errmsg")}')
+        return None
+
+    media_id = result['media_id']
+    if cache is not None:
+        # 以本地上传时间计算有效期，避免与服务端时钟偏差
+        cache.put(webhook_url, digest, media_id)
+    return media_id
+
+
+def build_attachment_message(webhook_url, path, cache=None):
+    """
+    构造附件消息：PNG/JPG 小图使用图片消息（base64，无需上传），其他文件上传后使用文件消息
+    :return: 企业微信消息，失败时返回None
+    """
+    if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.getsize(path) <= MAX_IMAGE_BYTES:
+        with open(path, 'rb') as f:
+            content = f.read()
+        return {
+            'msgtype': 'image',
+            'image': {
+                'base64': base64.b64encode(content).decode('ascii'),
+                'md5': hashlib.md5(content).hexdigest(),
+            }
+        }
+    media_id = upload_media(webhook_url, path, cache)
+    if not media_id:
+        return None
+    return {'msgtype': 'file', 'file': {'media_id': media_id}}
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地企业微信机器人接口替身
+模拟 /cgi-bin/webhook/send 与 /cgi-bin/webhook/upload_media，可注入基础延迟、长尾延迟、建立连接的延迟和错误码，
+用于基准测试和本地调试
+用法: python mock_wechat_server.py --port 8080 --latency 0.1 --tail-probability 0.05 --tail-latency 5 --connect-latency 0.1
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import ssl
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def self_signed_context(directory):
+    """
+    使用 openssl 为 127.0.0.1/localhost 生成自签名证书
+    :return: (服务端TLS上下文, 证书路径)，没有 openssl 命令时返回None
+    """
+    if shutil.which('openssl') is None:
+        return None
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key, '-out', cert,
+                    '-days', '1', '-subj', '/CN=localhost', '-addext', 'subjectAltName=IP:127.0.0.1,DNS:localhost'],
+                   check=True, capture_output=True)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context, cert
+
+
+class MockWeChatServer:
+    """
+    在后台线程运行的接口替身
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, tail_probability=0.0, tail_latency=5.0,
+                 errcode=0, seed=None, connect_latency=0.0, ssl_context=None):
+        """
+        :param connect_latency: 每个新连接的额外延迟（秒），模拟DNS解析、TCP与TLS握手的往返
+        :param ssl_context: 服务端TLS上下文，提供时以HTTPS提供服务
+        """
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.tail_probability = tail_probability
+        self.tail_latency = tail_latency
+        self.errcode = errcode
+        self.received = []
+        self.connections = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        if ssl_context is not None:
+            self._server.socket = ssl_context.wrap_socket(self._server.socket, server_side=True)
+        self._scheme = 'https' if ssl_context is not None else 'http'
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'{self._scheme}://{host}:{port}/cgi-bin/webhook/send?key=mock'
+
+    def _delay(self):
+        with self._lock:
+            tail = self._random.random() < self.tail_probability
+        return self.tail_latency if tail else self.latency
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 响应头与响应体分两次写出，复用的连接上 Nagle 与延迟确认会叠加约40ms
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                with server._lock:
+                    server.connections += 1
+                if server.connect_latency:
+                    time.sleep(server.connect_latency)
+                super().setup()
+
+            def do_HEAD(self):
+                # 连接预热使用 HEAD /，不计入 received
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                delay = server._delay()
+                if delay:
+                    time.sleep(delay)
+                with server._lock:
+                    server.received.append((self.path, body))
+                errmsg = 'ok' if server.errcode == 0 else 'mock error'
+                result = {'errcode': server.errcode, 'errmsg': errmsg}
+                if '/upload_media' in self.path and server.errcode == 0:
+                    result.update({'type': 'file', 'media_id': f'media-{len(server.received)}',
+                                   'created_at': str(int(time.time()))})
+                response = json.dumps(result).encode('utf-8')
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(response)))
+                    self.end_headers()
+                    self.wfile.write(response)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端已超时断开
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地企业微信机器人接口替身')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.1, help='基础延迟（秒）')
+    parser.add_argument('--tail-probability', type=float, default=0.0, help='长尾延迟概率')
+    parser.add_argument('--tail-latency', type=float, default=5.0, help='长尾延迟（秒）')
+    parser.add_argument('--errcode', type=int, default=0, help='返回的错误码')
+    parser.add_argument('--connect-latency', type=float, default=0.0, help='每个新连接的额外延迟（秒）')
+    args = parser.parse_args()
+
+    mock_server = MockWeChatServer(args.host, args.port, args.latency, args.tail_probability,
+                                   args.tail_latency, args.errcode, connect_latency=args.connect_latency)
+    print(f'企业微信接口替身已启动: {mock_server.url}')
+    try:
+        mock_server._server.serve_forever()
+    except KeyboardInterrupt:
+        mock_server._server.server_close()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+企业微信通知库接口
+不依赖 INPUT_* / GITHUB_EVENT_* 环境变量和子进程，可在其他Python服务中直接调用：
+
+    from notifier import Notifier
+
+    with Notifier(['https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=...']) as notifier:
+        result = notifier.send('push', payload, delivery_id=delivery_id)
+        if not result.success:
+            ...
+
+配置错误和不支持的事件通过异常报告，发送结果以 NotificationResult 返回
+"""
+
+import asyncio
+import time
+
+import aiohttp
+
+import main
+from circuit_breaker import configure_breakers
+from delivery_store import IdempotencyStore
+from event_record import NotificationEvent
+from identity import resolve_mentions
+from message_types import EVENT_RENDERERS, MSGTYPE_MARKDOWN
+from prewarm import create_connector, pooled_session
+
+
+class NotifierError(Exception):
+    """
+    通知库异常基类
+    """
+
+
+class ConfigurationError(NotifierError):
+    """
+    配置无效（缺少Webhook、未知消息类型等）
+    """
+
+
+class UnsupportedEventError(NotifierError):
+    """
+    事件类型没有对应的消息生成函数
+    """
+
+
+class DeliveryError(NotifierError):
+    """
+    raise_on_failure=True 时，任一目标发送失败抛出，result 属性为完整结果
+    """
+
+    def __init__(self, result):
+        failed = [target for target, delivery in result.deliveries.items() if not delivery.success]
+        super().__init__(f'{len(failed)} 个目标发送失败')
+        self.result = result
+
+
+class NotificationResult:
+    """
+    一次通知的结构化结果
+    """
+
+    __slots__ = ('event_name', 'delivery_id', 'deliveries', 'filtered', 'throttled', 'duration')
+
+    def __init__(self, event_name, delivery_id, deliveries=None, filtered=False, throttled=False, duration=0.0):
+        self.event_name = event_name
+        self.delivery_id = delivery_id
+        # {webhook_url: DeliveryResult}
+        self.deliveries = deliveries or {}
+        self.filtered = filtered
+        # 相似事件过于频繁，被节流静音
+        self.throttled = throttled
+        self.duration = duration
+
+    @property
+    def success(self):
+        """
+        所有目标均发送成功（或已发送过）；被事件类型过滤或节流时也视为成功
+        """
+        return all(delivery.success for delivery in self.deliveries.values())
+
+    def __repr__(self):
+        return f'NotificationResult(event_name={self.event_name!r}, delivery_id={self.delivery_id!r}, ' \
+               f'success={self.success}, filtered={self.filtered}, throttled={self.throttled}, ' \
+               f'targets={len(self.deliveries)})'
+
+
+class Notifier:
+    """
+    可复用的通知器：渲染缓存、熔断器和延迟估计在进程内共享，
+    同步发送复用 requests.Session 的连接池，异步发送复用 aiohttp.ClientSession，
+    两者重新连接时使用进程内共享的DNS缓存和TLS会话（见 prewarm）
+    """
+
+    def __init__(self, webhook_urls, event_types=None, msgtype=MSGTYPE_MARKDOWN, idempotency_db=None,
+                 send_timeout=None, max_attempts=1, raise_on_failure=False,
+                 circuit_failure_threshold=None, circuit_recovery_timeout=None, throttle=None, identity_map=None):
+        """
+        :param webhook_urls: Webhook URL列表，或逗号/换行分隔的字符串
+        :param event_types: 需要通知的事件类型，None表示所有支持的类型
+        :param msgtype: 消息类型：markdown、template_card 或 news
+        :param idempotency_db: 幂等存储SQLite路径，可选
+        :param send_timeout: 单个事件的发送时间预算（秒），可选
+        :param max_attempts: 建立连接失败时的最大尝试次数（配置幂等存储时读取超时也会重试）
+        :param raise_on_failure: 发送失败时是否抛出 DeliveryError
+        :param circuit_failure_threshold: 熔断阈值，可选
+        :param circuit_recovery_timeout: 熔断恢复时间（秒），可选
+        :param throttle: FrequencyThrottle，可选，相似事件过于频繁时静音并发送抑制摘要
+        :param identity_map: IdentityMap，可选，将评审人、指派人解析为企业微信成员并在markdown消息中提醒
+        """
+        if isinstance(webhook_urls, str):
+            webhook_urls = main.parse_webhook_urls(webhook_urls)
+        self.webhook_urls = list(webhook_urls or [])
+        if not self.webhook_urls:
+            raise ConfigurationError('至少需要一个企业微信Webhook URL')
+        if msgtype != MSGTYPE_MARKDOWN and msgtype not in EVENT_RENDERERS:
+            raise ConfigurationError(f'不支持的消息类型: {msgtype}')
+        unknown = set(event_types or ()) - set(main.MESSAGE_GENERATORS)
+        if unknown:
+            raise ConfigurationError(f'不支持的事件类型: {", ".join(sorted(unknown))}')
+
+        self.event_types = set(event_types) if event_types else None
+        self.msgtype = msgtype
+        self.send_timeout = send_timeout
+        self.max_attempts = max_attempts
+        self.raise_on_failure = raise_on_failure
+        self.throttle = throttle
+        self.identity_map = identity_map
+        self.store = IdempotencyStore(idempotency_db) if idempotency_db else None
+        self._session = pooled_session()
+        self._async_session = None
+        if circuit_failure_threshold is not None or circuit_recovery_timeout is not None:
+            configure_breakers(failure_threshold=circuit_failure_threshold,
+                               recovery_timeout=circuit_recovery_timeout)
+
+    def close(self):
+        """
+        释放连接池和幂等存储（异步会话需使用 aclose）
+        """
+        self._session.close()
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    async def aclose(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    def accepts(self, event_name):
+        """
+        判断事件类型是否需要通知
+        """
+        return self.event_types is None or event_name in self.event_types
+
+    def render(self, event_name, payload, delivery_id=None):
+        """
+        渲染通知消息（带缓存）
+        :return: RenderedMessage，包含 message 字典和预编码的 body；事件无需通知（如成功的CI运行）时返回None
+        :raises UnsupportedEventError: 事件类型不支持
+        """
+        return self._render_event(NotificationEvent.from_payload(event_name, payload, delivery_id=delivery_id))
+
+    def _render_event(self, event):
+        if event.event_name not in main.MESSAGE_GENERATORS:
+            raise UnsupportedEventError(f'不支持的事件类型: {event.event_name}')
+        return main.render_event(event, self.msgtype)
+
+    def _with_mentions(self, event_name, payload):
+        """
+        附加需要提醒的企业微信成员（不修改调用方的事件数据）
+        """
+        if self.identity_map is None:
+            return payload
+        mentions = resolve_mentions(event_name, payload, self.identity_map)
+        return dict(payload, wecom_mentions=mentions) if mentions else payload
+
+    def _finish(self, result):
+        if self.raise_on_failure and not result.success:
+            raise DeliveryError(result)
+        return result
+
+    def _deadline(self, start_time):
+        return start_time + self.send_timeout if self.send_timeout else None
+
+    def send(self, event_name, payload, delivery_id=None):
+        """
+        同步渲染并发送到所有目标
+        :param event_name: GitHub事件名称
+        :param payload: GitHub事件数据
+        :param delivery_id: GitHub投递ID，配置幂等存储时用于去重
+        :return: NotificationResult
+        :raises UnsupportedEventError: 事件类型不支持
+        :raises DeliveryError: raise_on_failure=True 且有目标发送失败
+        """
+        start_time = time.time()
+        if not self.accepts(event_name):
+            return NotificationResult(event_name, delivery_id, filtered=True)
+        payload = self._with_mentions(event_name, payload)
+        event = NotificationEvent.from_payload(event_name, payload, delivery_id=delivery_id)
+        rendered = self._render_event(event)
+        if rendered is None:
+            return NotificationResult(event_name, delivery_id, filtered=True)
+        if self.throttle is not None:
+            if not main.apply_throttle(self.throttle, event, self.webhook_urls, session=self._session):
+                return NotificationResult(event_name, delivery_id, throttled=True)
+        deadline = self._deadline(start_time)
+        deliveries = {}
+        for webhook_url in self.webhook_urls:
+            deliveries[webhook_url] = main.deliver_notification(
+                webhook_url, rendered, delivery_id=delivery_id, store=self.store, deadline=deadline,
+                max_attempts=self.max_attempts, session=self._session
+            )
+        return self._finish(NotificationResult(event_name, delivery_id, deliveries,
+                                               duration=time.time() - start_time))
+
+    async def send_async(self, event_name, payload, delivery_id=None):
+        """
+        异步渲染并并发发送到所有目标，参数与返回值同 send
+        """
+        start_time = time.time()
+        if not self.accepts(event_name):
+            return NotificationResult(event_name, delivery_id, filtered=True)
+        payload = self._with_mentions(event_name, payload)
+        event = NotificationEvent.from_payload(event_name, payload, delivery_id=delivery_id)
+        # 先同步渲染，以便不支持的事件在发送前抛出异常；发送时复用同一份渲染结果
+        rendered = self._render_event(event)
+        if rendered is None:
+            return NotificationResult(event_name, delivery_id, filtered=True)
+        if self._async_session is None:
+            self._async_session = aiohttp.ClientSession(connector=create_connector())
+        if self.throttle is not None:
+            allowed = await asyncio.to_thread(main.apply_throttle, self.throttle, event, self.webhook_urls,
+                                              self._session)
+            if not allowed:
+                return NotificationResult(event_name, delivery_id, throttled=True)
+        results = await main.notify_all(event, self.webhook_urls, self._async_session, msgtype=self.msgtype,
+                                        store=self.store, deadline=self._deadline(start_time),
+                                        max_attempts=self.max_attempts, rendered=rendered)
+        deliveries = dict(zip(self.webhook_urls, results))
+        return self._finish(NotificationResult(event_name, delivery_id, deliveries,
+                                               duration=time.time() - start_time))
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+连接预热与DNS/TLS会话缓存
+
+Action 的关键路径是串行的：读取输入、解析事件、渲染，之后才对 qyapi.weixin.qq.com 做DNS解析、
+TCP和TLS握手。ConnectionPrewarmer 在确定需要发送后立即在后台线程的事件循环中建立到各个Webhook主机的连接，
+与事件解析、补全和渲染并行；发送阶段在同一个事件循环和会话中复用这些连接。
+
+批处理和服务模式（Notifier、中继）的会话长期存在，但空闲连接会被服务端关闭，重新连接时:
+- DnsCache: 按TTL缓存主机地址，重新连接不再等待DNS解析
+- ResumingSSLContext: 记录每个主机的TLS会话（会话票据），新连接携带会话恢复握手，省去证书交换与校验
+requests（pooled_session）和 aiohttp（create_connector）共用同一个缓存
+"""
+
+import asyncio
+import os
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+import requests.adapters
+import requests.certs
+import urllib3.connection
+import urllib3.connectionpool
+
+DEFAULT_DNS_TTL = 300
+DEFAULT_PREWARM_TIMEOUT = 3.0
+
+
+class DnsCache:
+    """
+    线程安全的DNS缓存，条目在TTL后过期；连接失败时调用方应使该主机的条目失效
+    """
+
+    def __init__(self, ttl=DEFAULT_DNS_TTL, clock=None):
+        """
+        :param ttl: 缓存时间（秒）
+        :param clock: 单调时钟，测试时可替换
+        """
+        self.ttl = ttl
+        self._clock = clock or time.monotonic
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, host, port):
+        """
+        :return: 主机的第一个地址（IP字符串）；host 本身是IP时原样返回
+        :raises socket.gaierror: 解析失败
+        """
+        try:
+            socket.inet_pton(socket.AF_INET6 if ':' in host else socket.AF_INET, host)
+            return host
+        except (OSError, ValueError):
+            pass
+        key = (host, port)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][4][0]
+        with self._lock:
+            self._entries[key] = (address, now + self.ttl)
+        return address
+
+    def invalidate(self, host):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == host]:
+                del self._entries[key]
+
+
+class _ResumableMixin:
+    """
+    首次读取到数据后记录TLS会话：TLS 1.3 的会话票据在握手完成后才由服务端发送
+    """
+
+    _session_saved = False
+
+    def read(self, *args, **kwargs):
+        data = super().read(*args, **kwargs)
+        if not self._session_saved:
+            self._session_saved = True
+            self.context.remember(self.server_hostname, self.session, self.session_reused)
+        return data
+
+
+class _ResumableSocket(_ResumableMixin, ssl.SSLSocket):
+    pass
+
+
+class _ResumableObject(_ResumableMixin, ssl.SSLObject):
+    pass
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    在同一主机的新连接上恢复TLS会话的客户端上下文
+    wrap_socket（requests/urllib3）和 wrap_bio（asyncio/aiohttp）都会带上该主机最近的会话
+    """
+
+    sslsocket_class = _ResumableSocket
+    sslobject_class = _ResumableObject
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        # 完成首次读取的连接数，以及其中恢复了会话的连接数
+        self.handshakes = 0
+        self.resumed = 0
+
+    def remember(self, server_hostname, session, reused):
+        with self._sessions_lock:
+            self.handshakes += 1
+            self.resumed += bool(reused)
+            if server_hostname and session is not None and (session.has_ticket or session.id):
+                self._sessions[server_hostname] = session
+
+    def cached_session(self, server_hostname):
+        with self._sessions_lock:
+            return self._sessions.get(server_hostname)
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.cached_session(server_hostname)
+        return super().wrap_socket(sock, server_side, do_handshake_on_connect, suppress_ragged_eofs,
+                                   server_hostname, session)
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.cached_session(server_hostname)
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+
+def create_ssl_context(cafile=None):
+    """
+    创建校验证书的 ResumingSSLContext
+    :param cafile: CA证书文件，默认与 requests 一致：REQUESTS_CA_BUNDLE 环境变量，其次为 certifi 证书包
+    """
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_verify_locations(cafile or os.getenv('REQUESTS_CA_BUNDLE') or requests.certs.where())
+    return context
+
+
+_shared_lock = threading.Lock()
+_shared_dns_cache = None
+_shared_ssl_context = None
+
+
+def shared_dns_cache():
+    """
+    进程内共享的DNS缓存
+    """
+    global _shared_dns_cache
+    with _shared_lock:
+        if _shared_dns_cache is None:
+            _shared_dns_cache = DnsCache()
+        return _shared_dns_cache
+
+
+def shared_ssl_context():
+    """
+    进程内共享的TLS上下文（会话缓存随上下文共享）
+    """
+    global _shared_ssl_context
+    with _shared_lock:
+        if _shared_ssl_context is None:
+            _shared_ssl_context = create_ssl_context()
+        return _shared_ssl_context
+
+
+class _CachedDnsConnection(urllib3.connection.HTTPConnection):
+    dns_cache = None
+
+    def _new_conn(self):
+        # 只替换用于建立TCP连接的地址，SNI与证书校验仍使用原主机名
+        host = self._dns_host
+        try:
+            self._dns_host = self.dns_cache.lookup(host, self.port)
+        except OSError:
+            return super()._new_conn()
+        try:
+            return super()._new_conn()
+        except Exception:
+            self.dns_cache.invalidate(host)
+            raise
+        finally:
+            self._dns_host = host
+
+
+class _CachedDnsHTTPSConnection(_CachedDnsConnection, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class CachingAdapter(requests.adapters.HTTPAdapter):
+    """
+    requests 传输适配器：新连接使用DNS缓存和可恢复会话的TLS上下文
+    """
+
+    def __init__(self, dns_cache=None, ssl_context=None, **kwargs):
+        """
+        :param dns_cache: DnsCache，默认使用进程内共享的缓存
+        :param ssl_context: ResumingSSLContext，默认使用进程内共享的上下文
+        :param kwargs: 传给 HTTPAdapter 的连接池参数
+        """
+        self.dns_cache = dns_cache or shared_dns_cache()
+        self.ssl_context = ssl_context or shared_ssl_context()
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block, ssl_context=self.ssl_context, **pool_kwargs)
+        attributes = {'dns_cache': self.dns_cache}
+        http_pool = type('HTTPConnectionPool', (urllib3.connectionpool.HTTPConnectionPool,), {
+            'ConnectionCls': type('HTTPConnection', (_CachedDnsConnection,), attributes)})
+        https_pool = type('HTTPSConnectionPool', (urllib3.connectionpool.HTTPSConnectionPool,), {
+            'ConnectionCls': type('HTTPSConnection', (_CachedDnsHTTPSConnection,), attributes)})
+        self.poolmanager.pool_classes_by_scheme = {'http': http_pool, 'https': https_pool}
+
+
+def pooled_session(dns_cache=None, ssl_context=None):
+    """
+    创建使用DNS缓存和TLS会话恢复的 requests.Session（批处理、中继等长期运行的发送方）
+    """
+    session = requests.Session()
+    adapter = CachingAdapter(dns_cache, ssl_context)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def create_connector(ssl_context=None, dns_ttl=DEFAULT_DNS_TTL):
+    """
+    创建 aiohttp 连接器：DNS缓存TTL延长到 dns_ttl，TLS使用可恢复会话的上下文
+    必须在事件循环中调用
+    :param ssl_context: TLS上下文，默认使用进程内共享的上下文；True 表示使用 aiohttp 的默认校验
+    """
+    return aiohttp.TCPConnector(ttl_dns_cache=dns_ttl, ssl=ssl_context or shared_ssl_context())
+
+
+def webhook_origins(webhook_urls):
+    """
+    :return: 去重后的 scheme://host[:port] 列表，保持原顺序
+    """
+    origins = []
+    for url in webhook_urls:
+        parts = urlsplit(url)
+        origin = f'{parts.scheme}://{parts.netloc}'
+        if parts.scheme in ('http', 'https') and origin not in origins:
+            origins.append(origin)
+    return origins
+
+
+class ConnectionPrewarmer:
+    """
+    在后台线程运行事件循环，预先建立到Webhook主机的连接（DNS、TCP、TLS），
+    发送时通过 run 在同一事件循环中使用预热的 aiohttp 会话
+
+        prewarmer = ConnectionPrewarmer(webhook_urls).start()
+        ...  # 解析与渲染
+        results = prewarmer.run(notify_all, event, webhook_urls, msgtype=msgtype)
+        prewarmer.close()
+    """
+
+    def __init__(self, webhook_urls, timeout=DEFAULT_PREWARM_TIMEOUT, ssl_context=None):
+        """
+        :param webhook_urls: Webhook URL列表
+        :param timeout: 单个主机的预热超时（秒），超时后发送阶段照常建立连接
+        :param ssl_context: TLS上下文，默认使用进程内共享的上下文
+        """
+        self.origins = webhook_origins(webhook_urls)
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        # {origin: 预热耗时（秒）或异常}
+        self.warmed = {}
+        self.session = None
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='prewarm', daemon=True)
+        self._warming = None
+
+    def start(self):
+        self._thread.start()
+        self._warming = asyncio.run_coroutine_threadsafe(self._warm_all(), self.loop)
+        return self
+
+    async def _warm_all(self):
+        # 只有HTTPS目标需要加载CA证书（加载证书包会与主线程的解析争用GIL）
+        ssl_context = self.ssl_context
+        if ssl_context is None and not any(origin.startswith('https://') for origin in self.origins):
+            ssl_context = True
+        try:
+            self.session = aiohttp.ClientSession(connector=create_connector(ssl_context))
+        except Exception as e:
+            # 预热准备失败（如 REQUESTS_CA_BUNDLE 无效）不影响发送，run 改用临时会话
+            for origin in self.origins:
+                self.warmed[origin] = e
+            return
+        await asyncio.gather(*(self._warm(origin) for origin in self.origins))
+
+    async def _warm(self, origin):
+        """
+        以 HEAD / 建立连接：响应读完后连接回到连接池，供随后的发送复用
+        """
+        start = time.monotonic()
+        try:
+            async with self.session.head(origin + '/', allow_redirects=False,
+                                         timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                await response.read()
+            self.warmed[origin] = time.monotonic() - start
+        except Exception as e:
+            # 预热失败不影响发送，发送阶段会重新连接并报告错误
+            self.warmed[origin] = e
+
+    def run(self, coroutine_function, *args, **kwargs):
+        """
+        在预热的事件循环中执行 coroutine_function(*args, session=预热会话, **kwargs) 并等待结果
+        未完成的预热会先等待完成（最多 timeout 秒），避免为同一主机重复握手；预热未能创建会话时使用临时会话
+        """
+        async def call():
+            await asyncio.wrap_future(self._warming)
+            if self.session is None:
+                async with aiohttp.ClientSession() as session:
+                    return await coroutine_function(*args, session=session, **kwargs)
+            return await coroutine_function(*args, session=self.session, **kwargs)
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result()
+
+    def close(self):
+        """
+        关闭会话并停止后台线程
+        """
+        if not self._thread.is_alive():
+            return
+
+        async def close_session():
+            if self.session is not None:
+                await self.session.close()
+        try:
+            asyncio.run_coroutine_threadsafe(close_session(), self.loop).result(timeout=self.timeout)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=self.timeout)
+        if not self._thread.is_alive():
+            self.loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能剖析
+为单次运行（Action）以及批处理/常驻服务提供统一的剖析开关，输出文件可作为工作流制品上传：
+- cprofile.prof / cprofile.txt: cProfile 统计（可用 snakeviz、pstats 查看）
+- tracemalloc.txt: 内存分配最多的代码行
+- stages.folded: 按阶段汇总的耗时（微秒），折叠栈格式，可直接交给 flamegraph.pl / speedscope 生成火焰图
+
+阶段计时开销很低，始终记录；cProfile 开销较大，常驻服务中按 sample_rate 抽样，只剖析部分请求，
+因此可以在生产环境长期开启。未启用剖析时 stage() 为空上下文
+"""
+
+import collections
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+
+DEFAULT_OUTPUT_DIR = 'wechat-profile'
+# tracemalloc 保存的调用栈深度
+TRACEMALLOC_FRAMES = 25
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 40
+
+
+class Profiler:
+    """
+    剖析器：阶段计时 + 抽样 cProfile + 可选 tracemalloc
+    """
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, sample_rate=1.0, memory=True, seed=None):
+        """
+        :param output_dir: 输出目录
+        :param sample_rate: profile() 单元被 cProfile 剖析的概率，单次运行使用1.0，常驻服务建议0.01左右
+        :param memory: 是否启用 tracemalloc（约有一倍的分配开销，常驻服务建议只在排查时开启）
+        :param seed: 抽样随机种子，用于测试
+        """
+        self.output_dir = output_dir
+        self.sample_rate = float(sample_rate)
+        self.memory = memory
+        self.sampled = 0
+        self.total = 0
+        self._random = random.Random(seed)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # cProfile 同一时间只能有一个剖析器处于启用状态
+        self._profile_lock = threading.Lock()
+        self._folded = collections.Counter()
+        self._stats = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        return self
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        记录一个阶段的耗时，嵌套阶段以 ; 连接为折叠栈
+        """
+        stack = self._stack()
+        stack.append(name)
+        key = ';'.join(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = int((time.perf_counter() - start) * 1_000_000)
+            stack.pop()
+            with self._lock:
+                self._folded[key] += elapsed
+                # 折叠栈中父节点的值应为自身耗时，扣除子阶段
+                if stack:
+                    self._folded[';'.join(stack)] -= elapsed
+
+    @contextlib.contextmanager
+    def profile(self, name='run'):
+        """
+        剖析一个工作单元（一次运行、一个请求或一批事件），按 sample_rate 抽样启用 cProfile
+        """
+        with self._lock:
+            self.total += 1
+            sampled = self._random.random() < self.sample_rate
+        profiler = None
+        if sampled and self._profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        try:
+            with self.stage(name):
+                if profiler is None:
+                    yield False
+                    return
+                profiler.enable()
+                try:
+                    yield True
+                finally:
+                    profiler.disable()
+        finally:
+            if profiler is not None:
+                self._profile_lock.release()
+                with self._lock:
+                    self.sampled += 1
+                    if self._stats is None:
+                        self._stats = pstats.Stats(profiler)
+                    else:
+                        self._stats.add(profiler)
+
+    def folded_stacks(self):
+        """
+        :return: 折叠栈文本，每行 “阶段;子阶段 微秒”
+        """
+        with self._lock:
+            items = sorted(self._folded.items())
+        return ''.join(f'{key} {max(value, 0)}\n' for key, value in items)
+
+    def dump(self):
+        """
+        写出剖析结果
+        :return: 写出的文件路径列表
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = []
+
+        path = os.path.join(self.output_dir, 'stages.folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.folded_stacks())
+        paths.append(path)
+
+        with self._lock:
+            stats = self._stats
+            if stats is not None:
+                path = os.path.join(self.output_dir, 'cprofile.prof')
+                stats.dump_stats(path)
+                paths.append(path)
+                stream = io.StringIO()
+                stats.stream = stream
+                stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+                path = os.path.join(self.output_dir, 'cprofile.txt')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(f'# 抽样 {self.sampled}/{self.total} 个工作单元\n')
+                    f.write(stream.getvalue())
+                paths.append(path)
+
+        if self.memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            current, peak = tracemalloc.get_traced_memory()
+            path = os.path.join(self.output_dir, 'tracemalloc.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f'# 当前 {current / 1024:.1f} KiB, 峰值 {peak / 1024:.1f} KiB\n')
+                for index, stat in enumerate(snapshot.statistics('lineno')[:TOP_ALLOCATIONS], 1):
+                    frame = stat.traceback[0]
+                    f.write(f'{index:>3}. {frame.filename}:{frame.lineno} '
+                            f'{stat.size / 1024:.1f} KiB ({stat.count} 次分配)\n')
+            paths.append(path)
+        return paths
+
+    def stop(self):
+        """
+        写出结果并停止由本剖析器启动的 tracemalloc
+        """
+        paths = self.dump()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return paths
+
+
+# 进程内当前启用的剖析器
+_active = None
+
+
+def configure(output_dir=DEFAULT_OUTPUT_DIR, sample_rate=1.0, memory=True, seed=None):
+    """
+    启用进程级剖析
+    :return: Profiler
+    """
+    global _active
+    _active = Profiler(output_dir, sample_rate, memory, seed).start()
+    return _active
+
+
+def get_profiler():
+    """
+    :return: 当前启用的 Profiler，未启用时返回None
+    """
+    return _active
+
+
+def stage(name):
+    """
+    记录阶段耗时，未启用剖析时为空上下文
+    """
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name)
+
+
+def profile(name='run'):
+    """
+    剖析一个工作单元，未启用剖析时为空上下文
+    """
+    if _active is None:
+        return contextlib.nullcontext(False)
+    return _active.profile(name)
+
+
+def shutdown():
+    """
+    写出结果并关闭进程级剖析
+    :return: 写出的文件路径列表
+    """
+    global _active
+    profiler, _active = _active, None
+    return profiler.stop() if profiler is not None else []
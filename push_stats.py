@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推送统计补全
+push 事件的 commits 最多只包含20条提交，直接使用 len(commits) 会少报提交数。
+本模块根据 before/after 计算准确的提交数和文件变更统计：
+优先使用本地git对象库（只计算本次推送的范围，不重新拉取历史），其次使用GitHub compare API，
+最后退化为事件中的 size 字段。结果按 (仓库, before, after) 缓存，重叠或重放的推送不会重复计算
+"""
+
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+
+import requests
+
+ZERO_SHA = '0' * 40
+
+DEFAULT_CACHE_SIZE = 1000
+# 缓存条目保留时间
+DEFAULT_CACHE_TTL = 30 * 24 * 3600
+
+SOURCE_GIT = 'git'
+SOURCE_API = 'api'
+SOURCE_PAYLOAD = 'payload'
+
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+
+_SHORTSTAT_RE = re.compile(r'(\d+) files? changed(?:, (\d+) insertions?\(\+\))?(?:, (\d+) deletions?\(-\))?')
+
+
+class PushStats:
+    """
+    一次推送的统计
+    """
+
+    __slots__ = ('commits', 'files', 'additions', 'deletions', 'source')
+
+    def __init__(self, commits, files=None, additions=None, deletions=None, source=SOURCE_PAYLOAD):
+        self.commits = commits
+        self.files = files
+        self.additions = additions
+        self.deletions = deletions
+        self.source = source
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data.get(name) for name in cls.__slots__})
+
+    def __eq__(self, other):
+        if not isinstance(other, PushStats):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f'PushStats(commits={self.commits}, files={self.files}, additions={self.additions}, ' \
+               f'deletions={self.deletions}, source={self.source!r})'
+
+
+class PushStatsCache:
+    """
+    按 (仓库, before, after) 缓存推送统计，可选保存到JSON文件供后续运行复用
+    """
+
+    def __init__(self, path=None, maxsize=DEFAULT_CACHE_SIZE, ttl_seconds=DEFAULT_CACHE_TTL, clock=time.time):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    @staticmethod
+    def cache_key(repo, before, after):
+        return f'{repo}:{before}:{after}'
+
+    def get(self, repo, before, after):
+        with self._lock:
+            entry = self._entries.get(self.cache_key(repo, before, after))
+        if entry and self._clock() - entry['cached_at'] < self.ttl_seconds:
+            return PushStats.from_dict(entry['stats'])
+        return None
+
+    def put(self, repo, before, after, stats):
+        with self._lock:
+            self._entries[self.cache_key(repo, before, after)] = {'stats': stats.to_dict(), 'cached_at': self._clock()}
+            if len(self._entries) > self.maxsize:
+                # 淘汰最早缓存的条目
+                oldest = sorted(self._entries, key=lambda key: self._entries[key]['cached_at'])
+                for key in oldest[:len(self._entries) - self.maxsize]:
+                    del self._entries[key]
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        now = self._clock()
+        with self._lock:
+            self._entries = {key: entry for key, entry in self._entries.items()
+                             if now - entry['cached_at'] < self.ttl_seconds}
+            temp_path = f'{self.path}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(temp_path, self.path)
+
+
+def _git(git_dir, *args, timeout=10):
+    return subprocess.run(['git', '-C', git_dir, *args], capture_output=True, text=True, check=True,
+                          timeout=timeout).stdout
+
+
+def git_push_stats(git_dir, before, after, timeout=10):
+    """
+    使用本地git对象库计算 before..after 的提交数与变更统计（只遍历本次推送的范围）
+    :return: PushStats，对象不存在（如浅克隆）或git不可用时返回None
+    """
+    try:
+        commits = int(_git(git_dir, 'rev-list', '--count', f'{before}..{after}', timeout=timeout).strip())
+        shortstat = _git(git_dir, 'diff', '--shortstat', before, after, timeout=timeout)
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        print(f'::debug::[{os.getenv("CURRENT_SESSION_ID", "main")}] 本地git无法计算推送统计: {e}')
+        return None
+    match = _SHORTSTAT_RE.search(shortstat)
+    files, additions, deletions = (int(value or 0) for value in match.groups()) if match else (0, 0, 0)
+    return PushStats(commits, files, additions, deletions, SOURCE_GIT)
+
+
+def compare_push_stats(repo, before, after, token=None, session=None, timeout=10):
+    """
+    使用GitHub compare API计算推送统计
+    :return: PushStats，请求失败时返回None
+    """
+    headers = {'Accept': 'application/vnd.github+json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    http = session or requests
+    try:
+        response = http.get(f'{GITHUB_API_URL}/repos/{repo}/compare/{before}...{after}', headers=headers,
+                            timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f'::warning::[{os.getenv("CURRENT_SESSION_ID", "main")}] 调用compare API失败: {e}')
+        return None
+    # compare API 最多返回300个文件，文件数以返回为准
+    files = data.get('files') or []
+    return PushStats(data.get('total_commits', len(data.get('commits') or [])), len(files),
+                     sum(item.get('additions', 0) for item in files),
+                     sum(item.get('deletions', 0) for item in files), SOURCE_API)
+
+
+def enrich_push(event_data, cache=None, git_dir=None, token=None, session=None):
+    """
+    计算push事件的准确统计
+    :param event_data: push事件数据
+    :param cache: PushStatsCache，可选
+    :param git_dir: 本地仓库路径，可选
+    :param token: GitHub Token，可选，提供时在本地git无法计算时调用compare API
+    :param session: requests.Session，可选
+    :return: PushStats
+    """
+    repo = (event_data.get('repository') or {}).get('full_name')
+    before, after = event_data.get('before'), event_data.get('after')
+    payload_count = event_data.get('size', len(event_data.get('commits') or []))
+    payload_stats = PushStats(payload_count)
+    # 新建或删除分支没有可比较的范围
+    if not (repo and before and after) or ZERO_SHA in (before, after):
+        return payload_stats
+
+    if cache is not None:
+        stats = cache.get(repo, before, after)
+        if stats is not None:
+            return stats
+
+    stats = None
+    if git_dir:
+        stats = git_push_stats(git_dir, before, after)
+    if stats is None and token:
+        stats = compare_push_stats(repo, before, after, token, session)
+    if stats is None:
+        return payload_stats
+    if cache is not None:
+        cache.put(repo, before, after, stats)
+    return stats
@@ -0,0 +1,919 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Webhook中继服务
+直接接收GitHub Webhook，按机器人排队后以企业微信配额（每个机器人每分钟20条）匀速发送。
+组织级突发（批量rebase、机器人同时修改数百个仓库）时：
+- 每个机器人一个有界队列，内存占用有上限
+- 队列深度达到高水位后丢弃低优先级事件类型（如push），直到回落到低水位，重要事件的延迟保持可预期
+- 队列已满时返回 503 和 Retry-After，由GitHub稍后重新投递；所有目标队列都有空位才入队，
+  部分机器人已接收时记住这些机器人，重新投递只放入其余机器人的队列
+- 同时读取请求体的请求数有上限，超过时返回 503，内存占用不随并发请求增长
+- GET /metrics 以Prometheus文本格式输出队列占用、接收与发送计数
+- 配置归档目录时，事件数据与每次发送结果写入压缩归档，可按时间、仓库、事件类型和目标查询或重放
+- 收到 SIGTERM 或 SIGINT 后停止接收（返回503），在 drain_timeout 内发送完队列，剩余事件按机器人写入检查点目录，重启后恢复
+- 集群模式下机器人按一致性哈希分配到节点，任一节点接收的事件以紧凑记录（POST /events）转发给所属节点，见 cluster
+- 启用追踪时记录接收、过滤、转发、队列等待、限速与发送的 span，见 tracing
+- Action 交接模式提交的紧凑记录通过 POST /events 或缓冲目录（--spool-dir）接收，见 relay_client
+
+用法: python relay.py --webhook URL --port 8080 --max-queue 1000 --high-watermark 800 --low-watermark 200 \
+          --checkpoint-dir /var/lib/wechat-relay
+      python relay.py --webhook URL --port 8080 --node-url http://10.0.0.1:8080 \
+          --cluster-nodes http://10.0.0.1:8080,http://10.0.0.2:8080,http://10.0.0.3:8080
+"""
+
+import argparse
+import collections
+import hashlib
+import hmac
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import main
+import profiling
+import tracing
+from archive import EventArchive
+from cluster import DEFAULT_PROBE_INTERVAL, Membership
+from delivery_store import IdempotencyStore, target_id
+from event_filter import compile_filter
+from event_record import NotificationEvent, pack_event, unpack_event
+from message_types import MSGTYPE_MARKDOWN
+from prewarm import pooled_session
+from relay_client import ACCEPTED, EVENT_CONTENT_TYPE, IGNORED, REJECTED, SHED, drain_spool
+from shutdown import DEFAULT_DRAIN_TIMEOUT, GracefulShutdown, load_checkpoint, save_checkpoint
+
+# 企业微信群机器人限制：每分钟最多20条
+DEFAULT_RATE_PER_MINUTE = 20
+DEFAULT_MAX_QUEUE = 1000
+# 队列深度达到高水位开始丢弃低优先级事件，回落到低水位后恢复
+DEFAULT_HIGH_WATERMARK = 0.8
+DEFAULT_LOW_WATERMARK = 0.2
+DEFAULT_LOW_PRIORITY_EVENTS = ('push',)
+# 请求体上限，超过时返回413
+MAX_BODY_BYTES = 25 * 1024 * 1024
+# 同时读取请求体的请求数上限，最坏情况下接收占用的内存为 MAX_BODY_BYTES 的该倍数
+DEFAULT_MAX_INGEST = 8
+# 记住部分机器人已接收的投递数量上限（按投递ID，最久的先淘汰）
+MAX_PARTIAL_DELIVERIES = 1024
+MAX_RETRY_AFTER = 300
+# 排空期限过后仍在进行中的发送最多再等待的时间，之后连同队列一起写入检查点
+IN_FLIGHT_GRACE = 1.0
+# 转发请求中指定的目标机器人，接收节点只处理这些机器人
+ROBOTS_HEADER = 'X-Relay-Robots'
+# 事件已被转发的次数；接收节点按自己的视图不负责某个机器人时再转发一次，达到上限后直接入队
+HOPS_HEADER = 'X-Relay-Hops'
+MAX_FORWARD_HOPS = 2
+FORWARD_TIMEOUT = 5.0
+# 扫描缓冲目录的间隔（秒）
+SPOOL_INTERVAL = 0.2
+
+
+class RateLimiter:
+    """
+    滑动窗口限速：任意 period 秒内最多 limit 次，与企业微信的配额计算方式一致
+    """
+
+    def __init__(self, limit=DEFAULT_RATE_PER_MINUTE, period=60.0, clock=time.monotonic):
+        self.limit = limit
+        self.period = period
+        self._clock = clock
+        self._sent = collections.deque()
+        self._lock = threading.Lock()
+
+    def wait_time(self):
+        """
+        :return: 距离可以发送下一条的秒数，0表示可立即发送
+        """
+        with self._lock:
+            now = self._clock()
+            while self._sent and now - self._sent[0] >= self.period:
+                self._sent.popleft()
+            if len(self._sent) < self.limit:
+                return 0.0
+            return self._sent[0] + self.period - now
+
+    def acquire(self, stop_event=None):
+        """
+        等待直到可以发送并记录一次发送
+        :param stop_event: threading.Event，置位时放弃等待
+        :return: 是否获得发送配额
+        """
+        while True:
+            wait = self.wait_time()
+            if wait <= 0:
+                with self._lock:
+                    self._sent.append(self._clock())
+                return True
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class DeliveryQueue:
+    """
+    单个机器人的有界优先级队列
+    高优先级事件先出队；深度达到高水位后进入丢弃状态，低优先级事件被丢弃，回落到低水位后恢复
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_QUEUE, high_watermark=None, low_watermark=None):
+        """
+        :param max_size: 队列容量，达到后所有事件都被拒绝
+        :param high_watermark: 高水位（条），缺省为容量的80%
+        :param low_watermark: 低水位（条），缺省为容量的20%
+        """
+        if high_watermark is None:
+            high_watermark = int(max_size * DEFAULT_HIGH_WATERMARK)
+        if low_watermark is None:
+            low_watermark = int(max_size * DEFAULT_LOW_WATERMARK)
+        if not 0 <= low_watermark <= high_watermark <= max_size:
+            raise ValueError('水位需满足 0 <= low_watermark <= high_watermark <= max_size')
+        self.max_size = max_size
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.shedding = False
+        self._high = collections.deque()
+        self._low = collections.deque()
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._high) + len(self._low)
+
+    def depths(self):
+        """
+        :return: (高优先级深度, 低优先级深度)
+        """
+        with self._condition:
+            return len(self._high), len(self._low)
+
+    def full(self):
+        """
+        :return: 队列是否已满（offer 将返回 REJECTED）
+        """
+        with self._condition:
+            return len(self._high) + len(self._low) >= self.max_size
+
+    def offer(self, item, low_priority=False):
+        """
+        非阻塞入队
+        :return: ACCEPTED、SHED（低优先级被丢弃）或 REJECTED（队列已满）
+        """
+        with self._condition:
+            depth = len(self._high) + len(self._low)
+            if depth >= self.max_size:
+                self.shedding = True
+                return REJECTED
+            if depth >= self.high_watermark:
+                self.shedding = True
+            if low_priority and self.shedding:
+                return SHED
+            (self._low if low_priority else self._high).append(item)
+            self._condition.notify()
+            return ACCEPTED
+
+    def requeue(self, item, low_priority=False, front=False):
+        """
+        不受容量和水位限制地放回事件（发送中断或从检查点恢复时使用）
+        :param front: 是否放到队首
+        """
+        with self._condition:
+            target = self._low if low_priority else self._high
+            target.appendleft(item) if front else target.append(item)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """
+        出队，优先返回高优先级事件
+        :param timeout: 等待超时（秒）
+        :return: 事件，超时返回None
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._high or self._low, timeout):
+                return None
+            item = self._high.popleft() if self._high else self._low.popleft()
+            if self.shedding and len(self._high) + len(self._low) <= self.low_watermark:
+                self.shedding = False
+            return item
+
+    def drain(self):
+        """
+        取出全部未发送事件（高优先级在前）
+        """
+        with self._condition:
+            items = list(self._high) + list(self._low)
+            self._high.clear()
+            self._low.clear()
+            self.shedding = False
+            return items
+
+
+class _Robot:
+    """
+    一个目标机器人的队列、限速器、发送线程与计数
+    """
+
+    def __init__(self, webhook_url, queue, limiter):
+        self.webhook_url = webhook_url
+        self.label = target_id(webhook_url)[:12]
+        self.queue = queue
+        self.limiter = limiter
+        self.deliveries = collections.Counter()
+        self.thread = None
+        # 正在发送的事件
+        self.in_flight = None
+        # 队列中事件的等待 span: {id(事件): Span}，出队时结束
+        self.waiting = {}
+
+
+class Relay:
+    """
+    Webhook中继：HTTP接收 -> 每个机器人的有界队列 -> 限速发送线程
+    """
+
+    def __init__(self, webhook_urls, host='127.0.0.1', port=0, event_types=None, msgtype=MSGTYPE_MARKDOWN,
+                 max_queue=DEFAULT_MAX_QUEUE, high_watermark=None, low_watermark=None,
+                 low_priority_events=DEFAULT_LOW_PRIORITY_EVENTS, rate_per_minute=DEFAULT_RATE_PER_MINUTE,
+                 secret=None, idempotency_db=None, max_attempts=1, checkpoint_dir=None,
+                 drain_timeout=DEFAULT_DRAIN_TIMEOUT, archive_dir=None, event_filter=None, cluster_nodes=None,
+                 node_url=None, probe_interval=DEFAULT_PROBE_INTERVAL, spool_dir=None,
+                 max_ingest=DEFAULT_MAX_INGEST):
+        """
+        :param webhook_urls: Webhook URL列表，或逗号/换行分隔的字符串
+        :param host: 监听地址
+        :param port: 监听端口，0表示随机端口
+        :param event_types: 需要通知的事件类型，None表示所有支持的类型
+        :param msgtype: 消息类型：markdown、template_card 或 news
+        :param max_queue: 每个机器人的队列容量
+        :param high_watermark: 开始丢弃低优先级事件的队列深度，缺省为容量的80%
+        :param low_watermark: 恢复接收低优先级事件的队列深度，缺省为容量的20%
+        :param low_priority_events: 低优先级事件类型
+        :param rate_per_minute: 每个机器人每分钟最多发送的消息数
+        :param secret: GitHub Webhook密钥，配置后校验 X-Hub-Signature-256
+        :param idempotency_db: 幂等存储SQLite路径，可选；GitHub重新投递已部分接收的事件时避免重复发送
+        :param max_attempts: 建立连接失败时的最大尝试次数（配置幂等存储时读取超时也会重试）
+        :param checkpoint_dir: 检查点目录，可选；停止时未发送的事件按机器人写入，启动时恢复
+        :param drain_timeout: 停止时等待队列发送完成的最长时间（秒）
+        :param archive_dir: 归档目录，可选；被丢弃的低优先级事件也会归档，之后可以重放
+        :param event_filter: 过滤表达式（字符串或 EventFilter），可选
+        :param cluster_nodes: 集群所有节点的基础URL列表（或逗号分隔的字符串），可选；所有节点须配置相同的机器人
+        :param node_url: 本节点供其他节点访问的基础URL，缺省为监听地址
+        :param probe_interval: 集群节点健康探测间隔（秒）
+        :param spool_dir: 缓冲目录，可选；定期提交 Action 交接模式写入的事件，入队后删除文件
+        :param max_ingest: 同时读取请求体的请求数上限，超过时返回503
+        """
+        if isinstance(webhook_urls, str):
+            webhook_urls = main.parse_webhook_urls(webhook_urls)
+        if not webhook_urls:
+            raise ValueError('至少需要一个企业微信Webhook URL')
+        self.event_types = set(event_types) if event_types else None
+        self.event_filter = compile_filter(event_filter) if isinstance(event_filter, str) else event_filter
+        self.msgtype = msgtype
+        self.low_priority_events = frozenset(low_priority_events or ())
+        self.rate_per_minute = rate_per_minute
+        self.secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.max_attempts = max_attempts
+        self.checkpoint_dir = checkpoint_dir
+        self.drain_timeout = drain_timeout
+        self.store = IdempotencyStore(idempotency_db) if idempotency_db else None
+        self.archive = EventArchive(archive_dir) if archive_dir else None
+        self.robots = [
+            _Robot(url, DeliveryQueue(max_queue, high_watermark, low_watermark), RateLimiter(rate_per_minute))
+            for url in webhook_urls
+        ]
+        self._robots_by_label = {robot.label: robot for robot in self.robots}
+        self.events = collections.Counter()
+        # 集群转发计数: {(方向, 节点, 结果): 次数}
+        self.forwarded = collections.Counter()
+        self._counter_lock = threading.Lock()
+        # 检查所有队列的空位与入队在同一把锁内完成，避免部分入队
+        self._enqueue_lock = threading.Lock()
+        # 部分机器人已接收的投递: {投递ID: 已接收的机器人标识集合}
+        self._partial = collections.OrderedDict()
+        self._ingest_slots = threading.BoundedSemaphore(max_ingest)
+        # 排空中：不再接收新事件；停止：发送线程放弃等待并退出
+        self._draining = threading.Event()
+        self._stop = threading.Event()
+        # 发送线程共享连接池；空闲连接被关闭后，重新连接使用DNS缓存和TLS会话恢复
+        self._session = pooled_session()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._server_thread = None
+        self.membership = None
+        if cluster_nodes:
+            self.membership = Membership(node_url or self.url, cluster_nodes, probe_interval=probe_interval)
+        self.spool_dir = spool_dir
+        self._spool_thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _count(self, counter, key):
+        with self._counter_lock:
+            counter[key] += 1
+
+    def retry_after(self):
+        """
+        按最拥堵队列回落到低水位所需时间估计 Retry-After（秒）
+        """
+        backlog = max(len(robot.queue) - robot.queue.low_watermark for robot in self.robots)
+        seconds = math.ceil(max(backlog, 1) * 60 / self.rate_per_minute)
+        return min(max(seconds, 1), MAX_RETRY_AFTER)
+
+    def submit(self, event, labels=None, hops=0):
+        """
+        将事件放入所有机器人的队列；集群模式下只放入本节点负责的机器人，其余转发给所属节点
+        同一投递之前已被部分机器人接收时，只放入其余机器人的队列
+        :param event: NotificationEvent
+        :param labels: 其他节点转发时指定的机器人标识，只处理这些机器人
+        :param hops: 事件已被转发的次数。两个节点的存活视图不一致时，转发来的机器人按本节点视图不归自己负责，
+                     再转发给本节点视图中的所属节点，而不是在本节点另起一个限速器；达到 MAX_FORWARD_HOPS 后直接入队
+        :return: IGNORED、ACCEPTED、SHED 或 REJECTED；任一队列已满即为 REJECTED
+        """
+        counter, key = (self.events, None) if labels is None else (self.forwarded, ('in', ''))
+        if event.event_name not in main.MESSAGE_GENERATORS or \
+                (self.event_types is not None and event.event_name not in self.event_types):
+            self._count_outcome(counter, key, IGNORED)
+            return IGNORED
+        if self._draining.is_set():
+            self._count_outcome(counter, key, REJECTED)
+            return REJECTED
+        low_priority = event.event_name in self.low_priority_events
+        done = self.accepted_robots(event.delivery_id)
+        if labels is None:
+            robots = [robot for robot in self.robots if robot.label not in done]
+        else:
+            robots = [self._robots_by_label[label] for label in labels
+                      if label in self._robots_by_label and label not in done]
+        results = self._route(event, low_priority, robots, hops)
+        outcomes = set(results.values())
+        outcome = REJECTED if REJECTED in outcomes else SHED if SHED in outcomes else ACCEPTED
+        if event.delivery_id:
+            self._remember_partial(event.delivery_id, done, results, outcome)
+        self._count_outcome(counter, key, outcome)
+        return outcome
+
+    def _remember_partial(self, delivery_id, done, results, outcome):
+        """
+        记录被拒绝的投递中已接收的机器人，GitHub重新投递时不再放入这些机器人的队列
+        """
+        with self._counter_lock:
+            if outcome != REJECTED:
+                self._partial.pop(delivery_id, None)
+                return
+            accepted = done | {label for label, result in results.items() if result != REJECTED}
+            if not accepted:
+                return
+            self._partial[delivery_id] = frozenset(accepted)
+            self._partial.move_to_end(delivery_id)
+            while len(self._partial) > MAX_PARTIAL_DELIVERIES:
+                self._partial.popitem(last=False)
+
+    def accepted_robots(self, delivery_id):
+        """
+        :return: 被拒绝的投递中已接收该事件的机器人标识集合
+        """
+        with self._counter_lock:
+            return self._partial.get(delivery_id, frozenset()) if delivery_id else frozenset()
+
+    def _count_outcome(self, counter, key, outcome):
+        self._count(counter, outcome if key is None else key + (outcome,))
+
+    def _enqueue(self, robot, event, low_priority):
+        """
+        放入机器人队列；启用追踪时开始记录队列等待 span，由发送线程出队时结束
+        """
+        wait = tracing.start_span('queue.wait', delivery_id=event.delivery_id, kind=tracing.KIND_PRODUCER,
+                                  attributes={'wechat.robot': robot.label, 'relay.low_priority': low_priority})
+        if wait.recording:
+            # 先登记再入队，发送线程可能立即取出事件
+            robot.waiting[id(event)] = wait
+        outcome = robot.queue.offer(event, low_priority)
+        if outcome != ACCEPTED and wait.recording:
+            robot.waiting.pop(id(event), None)
+            wait.set_attribute('relay.outcome', outcome)
+            wait.end()
+        return outcome
+
+    def _enqueue_all(self, robots, event, low_priority):
+        """
+        确认所有机器人的队列都有空位后再入队，任一队列已满时都不入队
+        :return: {机器人标识: 入队结果}
+        """
+        with self._enqueue_lock:
+            if any(robot.queue.full() for robot in robots):
+                return {robot.label: REJECTED for robot in robots}
+            return {robot.label: self._enqueue(robot, event, low_priority) for robot in robots}
+
+    def _route(self, event, low_priority, robots, hops=0):
+        """
+        本节点负责的机器人直接入队，其他机器人按所属节点转发；无法连接或正在排空的节点标记为下线后重新分配
+        :param robots: 需要放入的机器人
+        :param hops: 事件已被转发的次数，达到 MAX_FORWARD_HOPS 时不再转发，全部在本节点入队
+        :return: {机器人标识: 入队结果}
+        """
+        results = {}
+        pending = robots
+        while pending:
+            local = []
+            remote = {}
+            for robot in pending:
+                node = self.membership.owner(robot.label) if self.membership is not None else None
+                if node is None or node == self.membership.self_url or hops >= MAX_FORWARD_HOPS:
+                    local.append(robot)
+                else:
+                    remote.setdefault(node, []).append(robot)
+            results.update(self._enqueue_all(local, event, low_priority))
+            pending = []
+            for node, node_robots in remote.items():
+                outcome = self._forward(node, event, node_robots, hops + 1)
+                if outcome is None:
+                    # 下线或排空的节点移出哈希环，其机器人在下一轮分配给其他节点（最终至少由本节点负责）
+                    self.membership.mark_down(node)
+                    pending.extend(node_robots)
+                else:
+                    results.update((robot.label, outcome) for robot in node_robots)
+        return results
+
+    def _forward(self, node, event, robots, hops=1):
+        """
+        以紧凑记录转发事件给所属节点
+        :param hops: 本次转发后事件已被转发的次数
+        :return: 所属节点的入队结果；无法连接或节点正在排空（确定未入队）时返回None，由其他节点接管；
+                 其他失败时节点可能已入队，返回 REJECTED 由GitHub重新投递，不改由其他节点发送
+        """
+        body = pack_event(event)
+        headers = {'Content-Type': EVENT_CONTENT_TYPE, ROBOTS_HEADER: ','.join(robot.label for robot in robots),
+                   HOPS_HEADER: str(hops)}
+        if self.secret:
+            headers['X-Hub-Signature-256'] = 'sha256=' + hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        with tracing.span('forward', kind=tracing.KIND_CLIENT,
+                          attributes={'relay.node': node, 'relay.robots': len(robots)}) as span:
+            tracing.inject(headers, span)
+            try:
+                response = self._session.post(node + '/events', data=body, headers=headers, timeout=FORWARD_TIMEOUT)
+            except requests.RequestException as e:
+                print(f'::warning::[relay] 转发事件 {event.delivery_id} 到 {node} 失败: {e}')
+                span.record_exception(e)
+                return None if main.is_connect_failure(e) else REJECTED
+            try:
+                result = response.json() if response.status_code in (202, 503) else {}
+            except ValueError:
+                result = {}
+            outcome = result.get('outcome')
+            if outcome == REJECTED and result.get('draining'):
+                print(f'::warning::[relay] 节点 {node} 正在排空，其负责的机器人改由其他节点发送')
+                span.set_attribute('relay.outcome', 'draining')
+                return None
+            if outcome not in (ACCEPTED, SHED, REJECTED, IGNORED):
+                print(f'::warning::[relay] 转发事件 {event.delivery_id} 到 {node} 失败: HTTP {response.status_code}')
+                span.set_status(tracing.STATUS_ERROR, f'HTTP {response.status_code}')
+                return REJECTED
+            span.set_attribute('relay.outcome', outcome)
+        self._count(self.forwarded, ('out', node, outcome))
+        return outcome
+
+    def owners(self):
+        """
+        :return: {机器人标识: 所属节点}，未启用集群时所属节点为None
+        """
+        return {robot.label: self.membership.owner(robot.label) if self.membership is not None else None
+                for robot in self.robots}
+
+    def accepts_event(self, event_name):
+        """
+        名称级过滤（事件类型与过滤表达式），在解析请求体之前调用
+        """
+        if event_name not in main.MESSAGE_GENERATORS or \
+                (self.event_types is not None and event_name not in self.event_types):
+            return False
+        return self.event_filter is None or self.event_filter.accepts_event(event_name)
+
+    def ingest(self, event_name, payload, delivery_id=None):
+        """
+        按过滤表达式过滤后，从GitHub事件数据构造紧凑记录并入队
+        """
+        if self.event_filter is not None:
+            with tracing.span('filter'):
+                matched = self.event_filter(event_name, payload)
+            if not matched:
+                self._count(self.events, IGNORED)
+                return IGNORED
+        outcome = self.submit(NotificationEvent.from_payload(event_name, payload, delivery_id=delivery_id))
+        # 被拒绝的事件会由GitHub重新投递，不归档
+        if self.archive is not None and outcome in (ACCEPTED, SHED):
+            self.archive.append_event(event_name, payload, delivery_id=delivery_id)
+        return outcome
+
+    def _deliver(self, robot, event):
+        with tracing.span('render'):
+            rendered = main.render_event(event, self.msgtype)
+        if rendered is None:
+            self._count(robot.deliveries, 'skipped')
+            return
+        with tracing.span('rate_limit'):
+            acquired = robot.limiter.acquire(self._stop)
+        if not acquired:
+            # 停止时放回队首，随队列一起写入检查点
+            robot.queue.requeue(event, event.event_name in self.low_priority_events, front=True)
+            return
+        result = main.deliver_notification(robot.webhook_url, rendered, delivery_id=event.delivery_id,
+                                           store=self.store, max_attempts=self.max_attempts,
+                                           session=self._session)
+        self._count(robot.deliveries, 'skipped' if result.skipped else 'success' if result.success else 'failure')
+        if self.archive is not None:
+            self.archive.append_delivery(event.event_name, event.repo_full_name, robot.webhook_url, rendered.message,
+                                         result, delivery_id=event.delivery_id)
+
+    def _worker(self, robot):
+        while not self._stop.is_set():
+            if self._draining.is_set() and not len(robot.queue):
+                return
+            event = robot.queue.get(timeout=0.1 if self._draining.is_set() else 0.5)
+            if event is None:
+                continue
+            robot.in_flight = event
+            # 队列等待 span 以入队时的 span 为父；从检查点恢复的事件没有等待 span，按投递ID归入同一链路
+            wait = robot.waiting.pop(id(event), None)
+            if wait is not None:
+                wait.end()
+            try:
+                with profiling.profile('relay_deliver'), tracing.span(
+                        'deliver', delivery_id=event.delivery_id, parent=wait.parent if wait is not None else None,
+                        kind=tracing.KIND_CONSUMER, attributes={'wechat.robot': robot.label}):
+                    self._deliver(robot, event)
+            except Exception as e:
+                print(f'::error::[relay] 发送事件 {event.delivery_id} 失败: {e}')
+                self._count(robot.deliveries, 'failure')
+            finally:
+                robot.in_flight = None
+
+    def _submit_spooled(self, event):
+        with tracing.span('ingest', delivery_id=event.delivery_id, kind=tracing.KIND_CONSUMER,
+                          attributes={'github.event': event.event_name, 'relay.source': 'spool'}) as span:
+            outcome = self.submit(event)
+            span.set_attribute('relay.outcome', outcome)
+        return outcome
+
+    def _spool_worker(self):
+        """
+        扫描缓冲目录；队列已满或排空中时文件保留，稍后（或重启后）再提交
+        """
+        while True:
+            try:
+                submitted = drain_spool(self.spool_dir, self._submit_spooled)
+                if submitted:
+                    print(f'::debug::[relay] 从缓冲目录接收 {submitted} 个事件')
+            except OSError as e:
+                print(f'::warning::[relay] 读取缓冲目录失败: {e}')
+            if self._draining.wait(SPOOL_INTERVAL):
+                return
+
+    def _checkpoint_path(self, robot):
+        return os.path.join(self.checkpoint_dir, f'{robot.label}.events')
+
+    def _resume(self):
+        """
+        将检查点中的事件放回各机器人队列（不受容量限制），随后删除检查点
+        """
+        for robot in self.robots:
+            path = self._checkpoint_path(robot)
+            events = load_checkpoint(path)
+            for event in events:
+                robot.queue.requeue(event, event.event_name in self.low_priority_events)
+            if events:
+                save_checkpoint(path, [])
+                print(f'::info::[relay] 从检查点恢复 {len(events)} 个事件，机器人: {robot.label}')
+
+    def metrics(self):
+        """
+        :return: Prometheus文本格式的指标
+        """
+        lines = [
+            '# HELP wechat_relay_queue_depth 待发送事件数',
+            '# TYPE wechat_relay_queue_depth gauge',
+        ]
+        for robot in self.robots:
+            high, low = robot.queue.depths()
+            lines.append(f'wechat_relay_queue_depth{{robot="{robot.label}",priority="high"}} {high}')
+            lines.append(f'wechat_relay_queue_depth{{robot="{robot.label}",priority="low"}} {low}')
+        for name, attribute, help_text in (
+                ('queue_capacity', 'max_size', '队列容量'),
+                ('queue_high_watermark', 'high_watermark', '开始丢弃低优先级事件的队列深度'),
+                ('queue_low_watermark', 'low_watermark', '恢复接收低优先级事件的队列深度'),
+                ('shedding', 'shedding', '是否正在丢弃低优先级事件')):
+            lines.append(f'# HELP wechat_relay_{name} {help_text}')
+            lines.append(f'# TYPE wechat_relay_{name} gauge')
+            for robot in self.robots:
+                lines.append(f'wechat_relay_{name}{{robot="{robot.label}"}} {int(getattr(robot.queue, attribute))}')
+        with self._counter_lock:
+            events = dict(self.events)
+            deliveries = [(robot.label, dict(robot.deliveries)) for robot in self.robots]
+        lines.append('# HELP wechat_relay_events_total 接收的事件数，按处理结果分类')
+        lines.append('# TYPE wechat_relay_events_total counter')
+        for outcome in (ACCEPTED, SHED, REJECTED, IGNORED):
+            lines.append(f'wechat_relay_events_total{{outcome="{outcome}"}} {events.get(outcome, 0)}')
+        lines.append('# HELP wechat_relay_deliveries_total 发送次数，按结果分类')
+        lines.append('# TYPE wechat_relay_deliveries_total counter')
+        for label, counts in deliveries:
+            for result in ('success', 'failure', 'skipped'):
+                lines.append(f'wechat_relay_deliveries_total{{robot="{label}",result="{result}"}} '
+                             f'{counts.get(result, 0)}')
+        if self.membership is not None:
+            lines.extend(self._cluster_metrics())
+        return '\n'.join(lines) + '\n'
+
+    def _cluster_metrics(self):
+        lines = ['# HELP wechat_relay_cluster_node_up 集群节点在本节点视图中是否存活',
+                 '# TYPE wechat_relay_cluster_node_up gauge']
+        for node, alive in self.membership.status()['nodes'].items():
+            lines.append(f'wechat_relay_cluster_node_up{{node="{node}"}} {int(alive)}')
+        lines.append('# HELP wechat_relay_robot_owned 机器人是否由本节点负责')
+        lines.append('# TYPE wechat_relay_robot_owned gauge')
+        for label, node in self.owners().items():
+            lines.append(f'wechat_relay_robot_owned{{robot="{label}"}} {int(node == self.membership.self_url)}')
+        with self._counter_lock:
+            forwarded = sorted(self.forwarded.items())
+        lines.append('# HELP wechat_relay_forwarded_total 集群转发的事件数，按方向、节点和结果分类')
+        lines.append('# TYPE wechat_relay_forwarded_total counter')
+        for (direction, node, outcome), count in forwarded:
+            lines.append(f'wechat_relay_forwarded_total{{direction="{direction}",node="{node}",outcome="{outcome}"}} '
+                         f'{count}')
+        return lines
+
+    def _verify_signature(self, body, signature):
+        if not self.secret:
+            return True
+        expected = 'sha256=' + hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature or '')
+
+    def _make_handler(self):
+        relay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 响应头与响应体分两次写出，开启Nagle时与客户端的延迟确认叠加会使每个请求多出约40ms
+            disable_nagle_algorithm = True
+
+            def _respond(self, status, body, content_type='application/json', headers=None):
+                if isinstance(body, dict):
+                    body = json.dumps(body, ensure_ascii=False)
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    self._respond(200, relay.metrics(), content_type='text/plain; version=0.0.4')
+                elif self.path == '/healthz':
+                    draining = relay._draining.is_set()
+                    self._respond(503 if draining else 200, {'draining': draining})
+                elif self.path == '/cluster' and relay.membership is not None:
+                    self._respond(200, dict(relay.membership.status(), owners=relay.owners()))
+                else:
+                    self._respond(404, {'error': 'not found'})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length > MAX_BODY_BYTES:
+                    self.close_connection = True
+                    self._respond(413, {'error': 'payload too large'})
+                    return
+                # 请求体未读取，关闭连接；客户端稍后重试
+                if not relay._ingest_slots.acquire(blocking=False):
+                    self.close_connection = True
+                    self._respond(503, {'outcome': REJECTED, 'retry_after': 1}, headers={'Retry-After': '1'})
+                    return
+                try:
+                    self._handle_post(length)
+                finally:
+                    relay._ingest_slots.release()
+
+            def _handle_post(self, length):
+                body = self.rfile.read(length)
+                if not relay._verify_signature(body, self.headers.get('X-Hub-Signature-256')):
+                    self._respond(401, {'error': 'invalid signature'})
+                    return
+                if self.path == '/events':
+                    self._submit_packed(body)
+                    return
+                event_name = self.headers.get('X-GitHub-Event')
+                if not event_name:
+                    self._respond(400, {'error': 'missing X-GitHub-Event'})
+                    return
+                if event_name == 'ping':
+                    self._respond(200, {'outcome': 'pong'})
+                    return
+                if not relay.accepts_event(event_name):
+                    relay._count(relay.events, IGNORED)
+                    self._respond(202, {'outcome': IGNORED})
+                    return
+                delivery_id = self.headers.get('X-GitHub-Delivery')
+                with tracing.span('ingest', delivery_id=delivery_id, kind=tracing.KIND_SERVER,
+                                  attributes={'github.event': event_name, 'github.event.size': len(body)}) as span:
+                    try:
+                        with tracing.span('parse'):
+                            payload = json.loads(body)
+                    except ValueError as e:
+                        span.record_exception(e)
+                        self._respond(400, {'error': 'invalid json'})
+                        return
+                    with profiling.profile('relay_ingest'):
+                        outcome = relay.ingest(event_name, payload, delivery_id)
+                    span.set_attribute('relay.outcome', outcome)
+                if outcome == REJECTED:
+                    retry_after = relay.retry_after()
+                    self._respond(503, {'outcome': outcome, 'retry_after': retry_after},
+                                  headers={'Retry-After': str(retry_after)})
+                else:
+                    self._respond(202, {'outcome': outcome})
+
+            def _submit_packed(self, body):
+                """
+                接收紧凑事件记录（集群转发）
+                """
+                if (self.headers.get('Content-Type') or '').split(';')[0].strip() != EVENT_CONTENT_TYPE:
+                    self._respond(415, {'error': f'expected {EVENT_CONTENT_TYPE}'})
+                    return
+                try:
+                    event = unpack_event(body)
+                except (ValueError, IndexError, UnicodeDecodeError):
+                    self._respond(400, {'error': 'invalid event record'})
+                    return
+                robots = self.headers.get(ROBOTS_HEADER)
+                labels = [label for label in robots.split(',') if label] if robots is not None else None
+                # 未携带转发次数的旧节点转发视为一次转发
+                try:
+                    hops = int(self.headers.get(HOPS_HEADER) or (0 if labels is None else 1))
+                except ValueError:
+                    hops = MAX_FORWARD_HOPS
+                with tracing.span('ingest', delivery_id=event.delivery_id, parent=tracing.extract(self.headers),
+                                  kind=tracing.KIND_SERVER, attributes={'github.event': event.event_name}) as span:
+                    outcome = relay.submit(event, labels, hops)
+                    span.set_attribute('relay.outcome', outcome)
+                if outcome == REJECTED:
+                    # partial: 部分机器人已接收，提交方不能改用其他方式发送，否则这些机器人会重复通知
+                    # draining: 本节点正在排空，转发方应把这些机器人改由其他节点发送
+                    partial = bool(relay.accepted_robots(event.delivery_id))
+                    self._respond(503, {'outcome': outcome, 'partial': partial,
+                                        'draining': relay._draining.is_set()})
+                else:
+                    self._respond(202, {'outcome': outcome})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        if self.checkpoint_dir:
+            self._resume()
+        if self.archive is not None:
+            self.archive.start()
+        for robot in self.robots:
+            robot.thread = threading.Thread(target=self._worker, args=(robot,), daemon=True)
+            robot.thread.start()
+        self._server_thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._server_thread.start()
+        if self.spool_dir:
+            self._spool_thread = threading.Thread(target=self._spool_worker, daemon=True)
+            self._spool_thread.start()
+        if self.membership is not None:
+            self.membership.start()
+            local = sum(node == self.membership.self_url for node in self.owners().values())
+            print(f'::debug::[relay] 集群节点 {self.membership.self_url}，成员数: {len(self.membership.nodes)}，'
+                  f'本节点负责机器人数: {local}')
+        print(f'::debug::[relay] 中继服务已启动: {self.url}，机器人数: {len(self.robots)}')
+        return self
+
+    def stop(self, drain_timeout=None):
+        """
+        优雅停止：停止接收新事件，在期限内发送完队列；剩余事件（包括超时仍在发送的事件）写入检查点
+        :param drain_timeout: 排空期限（秒），缺省使用构造时的配置
+        :return: 写入检查点（未配置检查点时为丢弃）的事件数量
+        """
+        timeout = self.drain_timeout if drain_timeout is None else drain_timeout
+        deadline = time.monotonic() + timeout
+        self._draining.set()
+        if self._spool_thread is not None:
+            self._spool_thread.join()
+        if self.membership is not None:
+            self.membership.stop()
+        for robot in self.robots:
+            if robot.thread is not None:
+                robot.thread.join(max(deadline - time.monotonic(), 0))
+        self._stop.set()
+        for robot in self.robots:
+            if robot.thread is not None:
+                robot.thread.join(IN_FLIGHT_GRACE)
+
+        remaining = 0
+        for robot in self.robots:
+            events = robot.queue.drain()
+            in_flight = robot.in_flight
+            if robot.thread is not None and robot.thread.is_alive() and in_flight is not None:
+                events.insert(0, in_flight)
+            remaining += len(events)
+            for event in events:
+                wait = robot.waiting.pop(id(event), None)
+                if wait is not None:
+                    wait.set_attribute('relay.checkpointed', bool(self.checkpoint_dir))
+                    wait.end()
+            if self.checkpoint_dir:
+                save_checkpoint(self._checkpoint_path(robot), events)
+            elif events:
+                print(f'::warning::[relay] 未配置检查点目录，丢弃 {len(events)} 个未发送事件，机器人: {robot.label}')
+        if remaining and self.checkpoint_dir:
+            print(f'::info::[relay] {remaining} 个未发送事件已写入检查点 {self.checkpoint_dir}')
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._session.close()
+        if self.store is not None:
+            self.store.close()
+        if self.archive is not None:
+            self.archive.close()
+        return remaining
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='GitHub Webhook到企业微信的中继服务')
+    parser.add_argument('--webhook', default=os.getenv('WECHAT_WEBHOOK_URL'),
+                        help='企业微信机器人Webhook URL，多个用逗号分隔')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--event-types', help='需要通知的事件类型，逗号分隔')
+    parser.add_argument('--msgtype', default=MSGTYPE_MARKDOWN)
+    parser.add_argument('--filter', help='过滤表达式，如 \'pull_request.base.ref == "main" && action in ["opened"]\'')
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE, help='每个机器人的队列容量')
+    parser.add_argument('--high-watermark', type=int, help='开始丢弃低优先级事件的队列深度')
+    parser.add_argument('--low-watermark', type=int, help='恢复接收低优先级事件的队列深度')
+    parser.add_argument('--low-priority-events', default=','.join(DEFAULT_LOW_PRIORITY_EVENTS),
+                        help='低优先级事件类型，逗号分隔')
+    parser.add_argument('--rate-per-minute', type=int, default=DEFAULT_RATE_PER_MINUTE)
+    parser.add_argument('--secret', default=os.getenv('GITHUB_WEBHOOK_SECRET'), help='GitHub Webhook密钥')
+    parser.add_argument('--idempotency-db', help='幂等存储SQLite文件路径')
+    parser.add_argument('--archive-dir', help='归档目录，保存事件数据与发送结果')
+    parser.add_argument('--checkpoint-dir', help='检查点目录，停止时保存未发送事件，启动时恢复')
+    parser.add_argument('--drain-timeout', type=float, default=DEFAULT_DRAIN_TIMEOUT,
+                        help='收到SIGTERM或SIGINT后等待队列发送完成的最长时间（秒）')
+    parser.add_argument('--cluster-nodes', help='集群所有节点的基础URL，逗号分隔；启用后机器人按一致性哈希分配到节点')
+    parser.add_argument('--node-url', help='本节点供其他节点访问的基础URL，监听 0.0.0.0 时必须指定')
+    parser.add_argument('--probe-interval', type=float, default=DEFAULT_PROBE_INTERVAL, help='集群节点健康探测间隔（秒）')
+    parser.add_argument('--spool-dir', help='缓冲目录，接收 Action 交接模式（mode: relay）写入的事件')
+    parser.add_argument('--max-ingest', type=int, default=DEFAULT_MAX_INGEST, help='同时读取请求体的请求数上限')
+    parser.add_argument('--trace-endpoint', default=os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT'),
+                        help='OTLP/HTTP 追踪接收端地址，如 http://otel-collector:4318')
+    parser.add_argument('--trace-file', help='追踪span写入的本地JSONL文件（OTLP/JSON格式）')
+    parser.add_argument('--trace-sample-rate', type=float, default=0.1, help='链路采样比例，按投递ID一致采样')
+    parser.add_argument('--profile', metavar='DIR', help='输出剖析结果到指定目录')
+    parser.add_argument('--profile-sample-rate', type=float, default=0.01, help='请求被cProfile剖析的概率')
+    args = parser.parse_args()
+    if not args.webhook:
+        parser.error('缺少 --webhook 或 WECHAT_WEBHOOK_URL')
+    if args.cluster_nodes and not args.node_url and args.host in ('0.0.0.0', '::'):
+        parser.error('集群模式监听所有地址时需要 --node-url')
+
+    if args.profile:
+        profiling.configure(args.profile, sample_rate=args.profile_sample_rate, memory=False)
+    tracing.configure(endpoint=args.trace_endpoint, path=args.trace_file, sample_rate=args.trace_sample_rate,
+                      service_name='wechat-relay')
+    relay = Relay(args.webhook, args.host, args.port,
+                  event_types=[name.strip() for name in args.event_types.split(',')] if args.event_types else None,
+                  msgtype=args.msgtype, max_queue=args.max_queue, high_watermark=args.high_watermark,
+                  low_watermark=args.low_watermark,
+                  low_priority_events=[name.strip() for name in args.low_priority_events.split(',') if name.strip()],
+                  rate_per_minute=args.rate_per_minute, secret=args.secret, idempotency_db=args.idempotency_db,
+                  checkpoint_dir=args.checkpoint_dir, drain_timeout=args.drain_timeout, archive_dir=args.archive_dir,
+                  event_filter=args.filter, cluster_nodes=args.cluster_nodes, node_url=args.node_url,
+                  probe_interval=args.probe_interval, spool_dir=args.spool_dir, max_ingest=args.max_ingest)
+    with GracefulShutdown(args.drain_timeout) as shutdown:
+        relay.start()
+        try:
+            shutdown.requested.wait()
+            print(f'::warning::[relay] 收到信号 {shutdown.signal_name}，停止接收新工作')
+        finally:
+            relay.stop()
+            tracing.shutdown()
+        for profile_path in profiling.shutdown():
+            print(f'剖析结果已写入: {profile_path}')
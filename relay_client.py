@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+中继客户端：把事件交给中继服务发送
+Action 同步发送时，作业要等待企业微信的往返以及重试退避，这些时间都计入Runner计费。
+交接模式下 Action 只校验事件并提交紧凑事件记录，由中继负责发送、重试和限速：
+- HTTP: 一次 POST /events（紧凑记录，按中继的 --secret 签名），中继入队后立即返回
+- 缓冲目录: 原子写入一个文件（先写临时文件再重命名），与中继共享目录的自托管Runner无需网络往返；
+  中继定期扫描目录，入队后删除文件，中继未运行时事件保留在目录中
+"""
+
+import hashlib
+import hmac
+import os
+import time
+
+import requests
+
+import tracing
+from event_record import pack_event, unpack_event
+
+# 紧凑事件记录（event_record.pack_event）的请求类型，中继的 POST /events 接收
+EVENT_CONTENT_TYPE = 'application/x-notification-event'
+DEFAULT_SUBMIT_TIMEOUT = (1.0, 2.0)
+SPOOL_SUFFIX = '.event'
+INVALID_SUFFIX = '.invalid'
+
+# 中继的入队结果
+ACCEPTED = 'accepted'
+SHED = 'shed'
+REJECTED = 'rejected'
+IGNORED = 'ignored'
+
+
+class HandoffError(RuntimeError):
+    """
+    中继不可用或拒绝接收事件
+    uncertain 为True时中继可能已接收事件（读取超时、部分机器人已入队），改用其他方式发送可能重复通知
+    """
+
+    def __init__(self, message, uncertain=False):
+        super().__init__(message)
+        self.uncertain = uncertain
+
+
+def sign(secret, body):
+    """
+    :return: X-Hub-Signature-256 请求头的值
+    """
+    if isinstance(secret, str):
+        secret = secret.encode('utf-8')
+    return 'sha256=' + hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def submit_event(relay_url, event, secret=None, timeout=DEFAULT_SUBMIT_TIMEOUT, session=None):
+    """
+    以紧凑记录提交事件到中继
+    :param relay_url: 中继的基础URL，如 http://relay:8080
+    :param event: NotificationEvent
+    :param secret: 中继配置的Webhook密钥，可选
+    :param timeout: (连接, 读取) 超时（秒）
+    :param session: requests.Session，可选
+    :return: 中继的入队结果：accepted、shed 或 ignored
+    :raises HandoffError: 中继不可用、队列已满或响应无效；只有连接失败和未入队的拒绝不带 uncertain 标记
+    """
+    # main 导入本模块，延迟导入避免循环依赖
+    import main
+
+    body = pack_event(event)
+    headers = {'Content-Type': EVENT_CONTENT_TYPE}
+    if secret:
+        headers['X-Hub-Signature-256'] = sign(secret, body)
+    tracing.inject(headers)
+    try:
+        response = (session or requests).post(relay_url.rstrip('/') + '/events', data=body, headers=headers,
+                                              timeout=timeout)
+    except requests.RequestException as e:
+        # 请求已发出后的失败（如读取超时）无法确定中继是否已入队
+        raise HandoffError(f'提交到中继失败: {e}', uncertain=not main.is_connect_failure(e)) from e
+    try:
+        result = response.json() if response.status_code in (202, 503) else {}
+    except ValueError as e:
+        raise HandoffError(f'提交到中继失败: {e}', uncertain=True) from e
+    outcome = result.get('outcome')
+    if outcome == REJECTED:
+        if result.get('partial'):
+            raise HandoffError('中继队列已满，部分机器人已接收事件', uncertain=True)
+        raise HandoffError('中继队列已满')
+    if outcome not in (ACCEPTED, SHED, IGNORED):
+        raise HandoffError(f'提交到中继失败: HTTP {response.status_code}', uncertain=response.status_code >= 500)
+    return outcome
+
+
+def spool_event(spool_dir, event):
+    """
+    将事件原子写入缓冲目录
+    :return: 写入的文件路径；文件名以纳秒时间戳开头，按名称排序即为写入顺序
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    digest = hashlib.sha256((event.delivery_id or '').encode('utf-8')).hexdigest()[:12]
+    name = f'{time.time_ns():020d}-{os.getpid()}-{digest}'
+    path = os.path.join(spool_dir, name + SPOOL_SUFFIX)
+    temp_path = os.path.join(spool_dir, '.' + name + '.tmp')
+    with open(temp_path, 'wb') as f:
+        f.write(pack_event(event))
+        f.flush()
+        os.fsync(f.fileno())
+    # 中继只读取 .event 文件，重命名之前不会看到写了一半的记录
+    os.replace(temp_path, path)
+    return path
+
+
+def drain_spool(spool_dir, submit, limit=None):
+    """
+    按写入顺序提交缓冲目录中的事件，提交后删除文件
+    :param spool_dir: 缓冲目录
+    :param submit: 接收 NotificationEvent 并返回入队结果的函数（如 Relay.submit）
+    :param limit: 本次最多处理的文件数，可选
+    :return: 提交的事件数量；遇到 REJECTED（队列已满）时停止，文件保留到下次
+    """
+    try:
+        names = sorted(name for name in os.listdir(spool_dir) if name.endswith(SPOOL_SUFFIX))
+    except FileNotFoundError:
+        return 0
+    submitted = 0
+    for name in names[:limit]:
+        path = os.path.join(spool_dir, name)
+        try:
+            with open(path, 'rb') as f:
+                event = unpack_event(f.read())
+        except FileNotFoundError:
+            continue
+        except (ValueError, IndexError, UnicodeDecodeError) as e:
+            print(f'::warning::[relay] 缓冲目录中的无效事件记录: {name}: {e}')
+            os.replace(path, path[:-len(SPOOL_SUFFIX)] + INVALID_SUFFIX)
+            continue
+        if submit(event) == REJECTED:
+            break
+        os.remove(path)
+        submitted += 1
+    return submitted
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+通知渲染缓存
+同一事件发送给多个机器人或被重放时，只渲染并编码一次消息体，
+缓存键为 (事件类型, 事件内容指纹, 模板版本, 消息类型)，按LRU淘汰
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时使用标准库json
+    orjson = None
+
+DEFAULT_MAXSIZE = 256
+
+
+def content_hash(event_data=None, raw=None):
+    """
+    计算事件内容哈希
+    :param event_data: 已解析的事件数据
+    :param raw: 事件文件原始字节（优先使用，避免重新序列化）
+    :return: 十六进制SHA-256摘要
+    """
+    if raw is None:
+        raw = json.dumps(event_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    elif isinstance(raw, str):
+        raw = raw.encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()
+
+
+def file_hash(path, chunk_size=64 * 1024):
+    """
+    分块计算文件的内容哈希，与 content_hash(raw=文件内容) 相同
+    :param path: 文件路径
+    :return: 十六进制SHA-256摘要
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode_message(message):
+    """
+    将通知消息编码为UTF-8 JSON请求体（安装了orjson时直接输出bytes）
+    """
+    if orjson is not None:
+        return orjson.dumps(message)
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def body_preview(body, limit=100):
+    """
+    截取请求体前若干字节用于日志，只对切片解码，不重新序列化整个消息
+    非ASCII字符转义输出，避免Windows环境下的编码问题
+    :param body: bytes 或 memoryview
+    :param limit: 截取的字节数
+    """
+    return bytes(body[:limit]).decode('utf-8', 'ignore').encode('ascii', 'backslashreplace').decode('ascii')
+
+
+class RenderedMessage:
+    """
+    渲染结果：消息字典及其预编码的请求体
+    """
+
+    __slots__ = ('message', 'body')
+
+    def __init__(self, message, body):
+        self.message = message
+        self.body = body
+
+
+class RenderCache:
+    """
+    线程安全的有界LRU渲染缓存
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = max(1, int(maxsize))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        获取缓存结果，命中时移动到最近使用位置
+        """
+        with self._lock:
+            rendered = self._entries.get(key)
+            if rendered is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return rendered
+
+    def put(self, key, rendered):
+        """
+        写入缓存，超出容量时淘汰最久未使用的条目
+        """
+        with self._lock:
+            self._entries[key] = rendered
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key, render):
+        """
+        获取缓存结果，未命中时调用 render() 生成消息并编码
+        :param key: 缓存键
+        :param render: 无参函数，返回消息字典（返回None表示无需通知，不缓存）
+        :return: RenderedMessage 或 None
+        """
+        rendered = self.get(key)
+        if rendered is not None:
+            return rendered
+        message = render()
+        if message is None:
+            return None
+        rendered = RenderedMessage(message, encode_message(message))
+        self.put(key, rendered)
+        return rendered
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+优雅退出与未发送事件检查点
+收到 SIGTERM 或 SIGINT（工作流取消、部署重启、Ctrl-C）后停止接收新工作，进行中的发送在 drain_timeout 内完成；
+超时或尚未发送的事件以 event_record 的长度前缀帧格式写入检查点文件，下次启动时优先恢复发送，
+重启不丢通知，也不需要整体重放。配合幂等存储可避免超时中断的发送在恢复时重复
+"""
+
+import asyncio
+import contextlib
+import os
+import signal
+import threading
+import time
+
+from event_record import read_events, write_events
+
+# Kubernetes 默认在 SIGTERM 后30秒发送 SIGKILL，GitHub取消工作流约为7.5秒
+DEFAULT_DRAIN_TIMEOUT = 10.0
+# 处理的退出信号：GitHub取消工作流先发送 SIGINT，再发送 SIGTERM
+DEFAULT_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+# 发送期间检查退出信号的间隔（秒）
+CHECK_INTERVAL = 0.05
+
+
+class ShutdownRequested(BaseException):
+    """
+    收到退出信号后在安全点中断当前工作
+    继承 BaseException，避免被发送路径中的 except Exception 吞掉
+    """
+
+
+class GracefulShutdown:
+    """
+    退出信号处理：信号处理函数只置位 requested，不在任意位置抛出异常，避免状态文件、SQLite提交写到一半
+    - 在两个工作单元之间调用 check()，已收到信号时抛出 ShutdownRequested
+    - 发送协程通过 bounded() 运行，收到信号后最多再等待 drain_timeout 秒，超时取消发送并抛出 ShutdownRequested
+    常驻服务直接等待 requested，由主循环自行停止
+    """
+
+    def __init__(self, drain_timeout=DEFAULT_DRAIN_TIMEOUT, signals=DEFAULT_SIGNALS):
+        """
+        :param drain_timeout: 收到信号后等待进行中发送完成的最长时间（秒）
+        :param signals: 处理的信号
+        """
+        self.drain_timeout = float(drain_timeout)
+        self.signals = tuple(signals)
+        self.requested = threading.Event()
+        self.signal_name = None
+        self._requested_at = None
+        self._previous = {}
+
+    def install(self):
+        """
+        安装信号处理函数，只能在主线程调用；非主线程（如嵌入其他服务）时忽略
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return self
+        for signum in self.signals:
+            self._previous[signum] = signal.signal(signum, self._handle)
+        return self
+
+    def restore(self):
+        """
+        恢复原有的信号处理函数
+        """
+        for signum, handler in self._previous.items():
+            signal.signal(signum, handler)
+        self._previous.clear()
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.restore()
+
+    def _handle(self, signum, frame):
+        if self._requested_at is None:
+            self._requested_at = time.monotonic()
+            self.signal_name = signal.Signals(signum).name
+        self.requested.set()
+
+    def expired(self):
+        """
+        :return: 是否已收到退出信号且超过 drain_timeout
+        """
+        return self.requested.is_set() and time.monotonic() - (self._requested_at or 0) >= self.drain_timeout
+
+    def check(self):
+        """
+        在两个工作单元之间调用：已收到退出信号时抛出 ShutdownRequested
+        """
+        if self.requested.is_set():
+            raise ShutdownRequested(f'已收到退出信号 {self.signal_name or ""}'.rstrip())
+
+    def bounded(self, coroutine_function):
+        """
+        包装发送协程函数：收到退出信号后等待其完成，超过 drain_timeout 时取消并抛出 ShutdownRequested
+        取消只发生在 await 处，不会中断进行中的状态写入
+        """
+        async def call(*args, **kwargs):
+            task = asyncio.ensure_future(coroutine_function(*args, **kwargs))
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=CHECK_INTERVAL)
+                if done:
+                    return task.result()
+                if self.expired():
+                    task.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await task
+                    raise ShutdownRequested(f'发送未在 {self.drain_timeout}s 内完成')
+        return call
+
+
+def load_checkpoint(path):
+    """
+    读取检查点中的未发送事件
+    :return: NotificationEvent 列表，文件不存在时为空
+    """
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        return list(read_events(f))
+
+
+def save_checkpoint(path, events):
+    """
+    原子地写入未发送事件，覆盖原检查点；没有事件时删除检查点文件
+    :return: 写入的事件数量
+    """
+    events = list(events)
+    if not events:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        return 0
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        count = write_events(f, events)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return count
+
+
+def append_checkpoint(path, events):
+    """
+    将事件追加到已有检查点（按投递ID去重）
+    :return: 检查点中的事件总数
+    """
+    pending = load_checkpoint(path)
+    known = {event.delivery_id for event in pending if event.delivery_id}
+    pending.extend(event for event in events if not event.delivery_id or event.delivery_id not in known)
+    return save_checkpoint(path, pending)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成GitHub事件语料
+按固定随机种子生成所有支持类型的事件数据，字段结构与真实Webhook一致（仓库、用户对象包含大量与通知无关的字段），
+大小从几KB到20MB（push事件包含大量变更文件）按重尾分布抽样，用于规模测试和负载测试。
+相同种子和参数生成的语料完全相同
+"""
+
+import json
+import math
+import os
+import random
+import uuid
+
+DEFAULT_EVENT_WEIGHTS = {
+    'push': 0.4,
+    'pull_request': 0.2,
+    'issues': 0.15,
+    'release': 0.05,
+    'workflow_run': 0.15,
+    'check_run': 0.05,
+}
+
+MAX_EVENT_BYTES = 20 * 1024 * 1024
+# (名称, 概率, 最小字节数, 最大字节数)，在区间内按对数均匀抽样
+SIZE_CLASSES = (
+    ('tiny', 0.60, 4 * 1024, 16 * 1024),
+    ('small', 0.28, 16 * 1024, 128 * 1024),
+    ('large', 0.10, 128 * 1024, 2 * 1024 * 1024),
+    ('huge', 0.02, 2 * 1024 * 1024, MAX_EVENT_BYTES),
+)
+# GitHub push事件的 commits 最多20条
+MAX_PAYLOAD_COMMITS = 20
+
+MANIFEST_FILE = 'manifest.jsonl'
+
+_WORDS = ('fix', 'add', 'update', 'remove', 'refactor', 'parser', 'cache', 'retry', 'timeout', 'webhook', 'docs',
+          'tests', 'build', 'deps', 'config', 'release', 'login', 'api', 'metrics', 'queue', '修复', '优化', '新增')
+_DIRECTORIES = ('src', 'lib', 'tests', 'docs', 'cmd', 'internal', 'pkg', 'web', 'scripts')
+
+
+class SyntheticEvent:
+    """
+    一个合成事件
+    """
+
+    __slots__ = ('event_name', 'delivery_id', 'payload', 'size_class')
+
+    def __init__(self, event_name, delivery_id, payload, size_class):
+        self.event_name = event_name
+        self.delivery_id = delivery_id
+        self.payload = payload
+        self.size_class = size_class
+
+    def encode(self):
+        return json.dumps(self.payload, ensure_ascii=False).encode('utf-8')
+
+
+class CorpusGenerator:
+    """
+    可复现的事件生成器
+    """
+
+    def __init__(self, seed=0, event_weights=None, size_classes=SIZE_CLASSES, max_bytes=MAX_EVENT_BYTES,
+                 repo_count=50, user_count=200):
+        """
+        :param seed: 随机种子
+        :param event_weights: {事件类型: 权重}，缺省为 DEFAULT_EVENT_WEIGHTS
+        :param size_classes: 大小分布，见 SIZE_CLASSES
+        :param max_bytes: 单个事件的大小上限
+        :param repo_count: 仓库数量
+        :param user_count: 用户数量
+        """
+        self._random = random.Random(seed)
+        weights = event_weights or DEFAULT_EVENT_WEIGHTS
+        self.event_names = list(weights)
+        self.event_weights = [weights[name] for name in self.event_names]
+        self.size_classes = size_classes
+        self.max_bytes = max_bytes
+        self.repos = [f'org-{index % 7}/service-{index}' for index in range(repo_count)]
+        self.users = [f'dev-{index}' for index in range(user_count)]
+
+    def _sha(self):
+        return f'{self._random.getrandbits(160):040x}'
+
+    def _words(self, low, high):
+        return ' '.join(self._random.choice(_WORDS) for _ in range(self._random.randint(low, high)))
+
+    def _user(self, login=None):
+        login = login or self._random.choice(self.users)
+        user = {'login': login, 'id': self._random.getrandbits(24), 'type': 'User', 'site_admin': False,
+                'html_url': f'https://github.com/{login}'}
+        for field in ('avatar_url', 'url', 'followers_url', 'following_url', 'gists_url', 'starred_url',
+                      'subscriptions_url', 'organizations_url', 'repos_url', 'events_url', 'received_events_url'):
+            user[field] = f'https://api.github.com/users/{login}/{field[:-4]}'
+        return user
+
+    def _repository(self, full_name):
+        owner, name = full_name.split('/')
+        repo = {'id': self._random.getrandbits(28), 'name': name, 'full_name': full_name, 'private': False,
+                'html_url': f'https://github.com/{full_name}', 'default_branch': 'main', 'owner': self._user(owner),
+                'description': self._words(3, 10), 'fork': False, 'stargazers_count': self._random.randint(0, 5000)}
+        for index in range(40):
+            repo[f'resource_{index}_url'] = f'https://api.github.com/repos/{full_name}/resource/{index}{{/id}}'
+        return repo
+
+    def _size_class(self):
+        roll = self._random.random()
+        for name, probability, low, high in self.size_classes:
+            roll -= probability
+            if roll < 0:
+                break
+        low, high = min(low, self.max_bytes), min(high, self.max_bytes)
+        target = math.exp(self._random.uniform(math.log(low), math.log(high)))
+        return name, int(target)
+
+    def _paths(self, total_bytes):
+        paths = []
+        size = 0
+        while size < total_bytes:
+            path = f'{self._random.choice(_DIRECTORIES)}/{self._random.choice(_WORDS)}/' \
+                   f'{self._random.choice(_WORDS)}_{self._random.randint(0, 99999)}.py'
+            paths.append(path)
+            size += len(path) + 4
+        return paths
+
+    def _text(self, total_bytes):
+        chunks = []
+        size = 0
+        while size < total_bytes:
+            line = self._words(6, 16) + '\n'
+            chunks.append(line)
+            size += len(line.encode('utf-8'))
+        return ''.join(chunks)
+
+    def _push(self, repo, sender, filler):
+        commit_count = max(1, int(self._random.paretovariate(1.2)))
+        before, after = self._sha(), self._sha()
+        commits = []
+        for _ in range(min(commit_count, MAX_PAYLOAD_COMMITS)):
+            author = self._random.choice(self.users)
+            commits.append({
+                'id': self._sha(), 'message': self._words(2, 8),
+                'timestamp': '2024-05-01T10:00:00Z', 'url': f'https://github.com/{repo["full_name"]}/commit/x',
+                'author': {'name': author, 'email': f'{author}@example.com', 'username': author},
+                'committer': {'name': author, 'email': f'{author}@example.com', 'username': author},
+                'added': [], 'removed': [], 'modified': [self._paths(1)[0]],
+            })
+        head_commit = dict(commits[-1], modified=list(commits[-1]['modified']))
+        # 大事件：变更文件列表分摊到各提交
+        for index, path in enumerate(self._paths(filler)):
+            commits[index % len(commits)]['modified'].append(path)
+        return {
+            'ref': f'refs/heads/{self._random.choice(("main", "develop", "feature/" + self._random.choice(_WORDS)))}',
+            'before': before, 'after': after, 'created': False, 'deleted': False, 'forced': False,
+            'compare': f'https://github.com/{repo["full_name"]}/compare/{before[:12]}...{after[:12]}',
+            'size': commit_count, 'commits': commits, 'head_commit': head_commit,
+            'pusher': {'name': sender['login'], 'email': f'{sender["login"]}@example.com'},
+            'repository': repo, 'sender': sender,
+        }
+
+    def _pull_request(self, repo, sender, filler):
+        number = self._random.randint(1, 5000)
+        action = self._random.choice(('opened', 'closed', 'synchronize', 'reopened', 'edited'))
+        merged = action == 'closed' and self._random.random() < 0.7
+        return {
+            'action': action, 'number': number, 'repository': repo, 'sender': sender,
+            'pull_request': {
+                'number': number, 'title': self._words(3, 9), 'state': 'closed' if action == 'closed' else 'open',
+                'html_url': f'https://github.com/{repo["full_name"]}/pull/{number}', 'user': self._user(),
+                'body': self._text(filler), 'merged': merged, 'draft': False,
+                'base': {'ref': 'main', 'sha': self._sha()},
+                'head': {'ref': f'feature/{self._random.choice(_WORDS)}', 'sha': self._sha()},
+                'requested_reviewers': [self._user() for _ in range(self._random.randint(0, 3))],
+                'assignees': [self._user() for _ in range(self._random.randint(0, 2))],
+                'labels': [{'name': self._random.choice(_WORDS)} for _ in range(self._random.randint(0, 3))],
+                'commits': self._random.randint(1, 30), 'changed_files': self._random.randint(1, 80),
+            },
+        }
+
+    def _issues(self, repo, sender, filler):
+        number = self._random.randint(1, 5000)
+        action = self._random.choice(('opened', 'closed', 'labeled', 'assigned', 'reopened'))
+        return {
+            'action': action, 'repository': repo, 'sender': sender,
+            'issue': {
+                'number': number, 'title': self._words(3, 9), 'state': 'closed' if action == 'closed' else 'open',
+                'html_url': f'https://github.com/{repo["full_name"]}/issues/{number}', 'user': self._user(),
+                'body': self._text(filler), 'comments': self._random.randint(0, 40),
+                'labels': [{'name': self._random.choice(_WORDS)} for _ in range(self._random.randint(0, 3))],
+                'assignees': [self._user() for _ in range(self._random.randint(0, 2))],
+            },
+        }
+
+    def _release(self, repo, sender, filler):
+        tag = f'v{self._random.randint(0, 5)}.{self._random.randint(0, 20)}.{self._random.randint(0, 50)}'
+        return {
+            'action': 'published', 'repository': repo, 'sender': sender,
+            'release': {
+                'name': self._random.choice((None, f'Release {tag}')), 'tag_name': tag,
+                'html_url': f'https://github.com/{repo["full_name"]}/releases/tag/{tag}',
+                'prerelease': self._random.random() < 0.2, 'body': self._text(filler), 'author': self._user(),
+                'assets': [{'name': f'build-{index}.tar.gz', 'size': self._random.randint(10 ** 4, 10 ** 8)}
+                           for index in range(self._random.randint(0, 5))],
+            },
+        }
+
+    def _conclusion(self):
+        return 'failure' if self._random.random() < 0.3 else 'success'
+
+    def _workflow_run(self, repo, sender, filler):
+        run_id = self._random.getrandbits(32)
+        return {
+            'action': 'completed', 'repository': repo, 'sender': sender,
+            'workflow_run': {
+                'id': run_id, 'name': self._random.choice(('CI', 'Release', 'Nightly', 'Lint')),
+                'html_url': f'https://github.com/{repo["full_name"]}/actions/runs/{run_id}',
+                'run_number': self._random.randint(1, 9000), 'head_branch': 'main', 'head_sha': self._sha(),
+                'status': 'completed', 'conclusion': self._conclusion(), 'actor': self._user(),
+                'head_commit': {'message': self._words(2, 8) + '\n\n' + self._text(filler)},
+                'logs_url': f'https://api.github.com/repos/{repo["full_name"]}/actions/runs/{run_id}/logs',
+            },
+        }
+
+    def _check_run(self, repo, sender, filler):
+        check_id = self._random.getrandbits(32)
+        return {
+            'action': 'completed', 'repository': repo, 'sender': sender,
+            'check_run': {
+                'id': check_id, 'name': self._random.choice(('build', 'test', 'lint')),
+                'html_url': f'https://github.com/{repo["full_name"]}/runs/{check_id}', 'head_sha': self._sha(),
+                'status': 'completed', 'conclusion': self._conclusion(),
+                'check_suite': {'head_branch': 'main'}, 'app': {'slug': 'github-actions'},
+                'output': {'title': self._words(2, 5), 'summary': self._text(filler)},
+            },
+        }
+
+    def event(self, event_name=None):
+        """
+        生成一个事件
+        :param event_name: 事件类型，缺省按权重抽样
+        :return: SyntheticEvent
+        """
+        if event_name is None:
+            event_name = self._random.choices(self.event_names, self.event_weights)[0]
+        build = getattr(self, f'_{event_name}')
+        size_class, target = self._size_class()
+        delivery_id = str(uuid.UUID(int=self._random.getrandbits(128), version=4))
+        repo = self._repository(self._random.choice(self.repos))
+        sender = self._user()
+        # 先生成不含填充内容的事件计算基础大小，再以相同的随机状态补足到目标大小
+        state = self._random.getstate()
+        base = len(json.dumps(build(repo, sender, 0), ensure_ascii=False).encode('utf-8'))
+        self._random.setstate(state)
+        payload = build(repo, sender, max(target - base, 0))
+        return SyntheticEvent(event_name, delivery_id, payload, size_class)
+
+    def events(self, count):
+        """
+        生成 count 个事件
+        """
+        for _ in range(count):
+            yield self.event()
+
+
+def write_corpus(directory, events):
+    """
+    将事件写为 <序号>-<事件类型>.json，并写入清单 manifest.jsonl
+    :return: 写入的事件数量
+    """
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    with open(os.path.join(directory, MANIFEST_FILE), 'w', encoding='utf-8') as manifest:
+        for event in events:
+            name = f'{count:06d}-{event.event_name}.json'
+            data = event.encode()
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(data)
+            manifest.write(json.dumps({'file': name, 'event_name': event.event_name,
+                                       'delivery_id': event.delivery_id, 'size_class': event.size_class,
+                                       'bytes': len(data)}) + '\n')
+            count += 1
+    return count
+
+
+def read_corpus(directory):
+    """
+    读取语料清单
+    :return: 清单项列表，path 为事件文件的绝对路径
+    """
+    entries = []
+    with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            entry['path'] = os.path.abspath(os.path.join(directory, entry['file']))
+            entries.append(entry)
+    return entries
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证自适应超时的估计、截止时间约束以及超时重试
+"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+import adaptive_timeout
+import circuit_breaker
+import main
+from adaptive_timeout import LatencyTracker
+from mock_wechat_server import MockWeChatServer
+from test_event_record import EVENTS
+
+MESSAGE = {'msgtype': 'markdown', 'markdown': {'content': '自适应超时测试'}}
+
+
+def test_defaults_until_enough_samples():
+    """
+    测试样本不足时保持原有的10秒超时
+    """
+    tracker = LatencyTracker(min_samples=5)
+    for _ in range(4):
+        tracker.record(0.1)
+    assert tracker.timeouts() == (adaptive_timeout.DEFAULT_CONNECT_TIMEOUT, adaptive_timeout.DEFAULT_READ_TIMEOUT)
+
+
+def test_timeouts_shrink_for_fast_endpoint():
+    """
+    测试健康接口的超时收敛到下限，超时样本使估计值上调但不进入分位数窗口
+    """
+    tracker = LatencyTracker(min_samples=5)
+    for _ in range(50):
+        tracker.record(0.1)
+    connect, read = tracker.timeouts()
+    assert connect == adaptive_timeout.MIN_CONNECT_TIMEOUT
+    assert read == adaptive_timeout.MIN_READ_TIMEOUT
+
+    tracker.record_timeout(10.0)
+    assert tracker.timeouts()[1] > adaptive_timeout.MIN_READ_TIMEOUT
+    assert tracker.percentile(0.99) == 0.1
+
+
+def test_deadline_caps_timeouts():
+    """
+    测试超时不超过截止时间的剩余时间，截止时间已过时返回0
+    """
+    tracker = LatencyTracker()
+    assert tracker.timeouts(deadline=102.5, clock=lambda: 100.0) == (2.5, 2.5)
+    assert tracker.timeouts(deadline=99.0, clock=lambda: 100.0) == (0.0, 0.0)
+
+
+def test_stalled_request_is_retried():
+    """
+    测试停滞请求在自适应超时后放弃，而不是等满10秒；读取超时时请求可能已被接收，
+    只有调用方声明可以重复（幂等存储已认领投递）时才重试
+    """
+    adaptive_timeout.reset_trackers()
+    circuit_breaker.reset_breakers()
+    with MockWeChatServer(latency=0.0) as server, contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(adaptive_timeout.MIN_SAMPLES):
+            assert main.send_wechat_message(server.url, MESSAGE)
+        server.tail_probability = 1.0
+        server.tail_latency = 3.0
+        before = len(server.received)
+        result = main.send_wechat_message_result(server.url, MESSAGE, max_attempts=2)
+        assert not result.success
+        assert result.duration < 3.0
+        time.sleep(3.2)
+        assert len(server.received) == before + 1
+        result = main.send_wechat_message_result(server.url, MESSAGE, max_attempts=2, retry_read_timeout=True)
+        assert not result.success
+        time.sleep(3.2)
+        assert len(server.received) == before + 3
+        circuit_breaker.reset_breakers()
+        server.tail_probability = 0.0
+        result = main.send_wechat_message_result(server.url, MESSAGE, max_attempts=2)
+        assert result.success
+    adaptive_timeout.reset_trackers()
+    circuit_breaker.reset_breakers()
+
+
+def test_estimate_persists_across_runs():
+    """
+    测试每次运行只发送一个请求时，延迟估计通过状态文件在多次运行之间累积，过期的状态不恢复
+    """
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS['release'], f)
+    state_path = os.path.join(directory, 'timeouts.json')
+    circuit_breaker.reset_breakers()
+    with MockWeChatServer() as server:
+        env = {
+            'INPUT_WECHAT_WEBHOOK_URL': server.url,
+            'INPUT_EVENT_TYPES': 'release',
+            'INPUT_TIMEOUT_STATE': state_path,
+            'GITHUB_EVENT_PATH': event_path,
+            'GITHUB_EVENT_NAME': 'release',
+        }
+        for run in range(adaptive_timeout.MIN_SAMPLES):
+            # 每次运行都是新进程，进程内没有估计
+            adaptive_timeout.reset_trackers()
+            main.render_cache.clear()
+            env['INPUT_DELIVERY_ID'] = f'run-{run}'
+            with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()):
+                main.main()
+        assert len(server.received) == adaptive_timeout.MIN_SAMPLES
+
+        adaptive_timeout.reset_trackers()
+        assert adaptive_timeout.load_trackers(state_path) == 1
+        connect, read = adaptive_timeout.get_tracker(server.url).timeouts()
+        assert read < adaptive_timeout.DEFAULT_READ_TIMEOUT and connect < adaptive_timeout.DEFAULT_CONNECT_TIMEOUT
+
+        adaptive_timeout.reset_trackers()
+        stale = time.time() + adaptive_timeout.STATE_MAX_AGE + 1
+        assert adaptive_timeout.load_trackers(state_path, clock=lambda: stale) == 0
+    adaptive_timeout.reset_trackers()
+    circuit_breaker.reset_breakers()
+
+
+if __name__ == "__main__":
+    print("自适应超时测试")
+    print("=" * 50)
+    test_defaults_until_enough_samples()
+    test_timeouts_shrink_for_fast_endpoint()
+    test_deadline_caps_timeouts()
+    test_stalled_request_is_retried()
+    test_estimate_persists_across_runs()
+    print("测试完成")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证压缩事件归档的时间轮转、稀疏索引查询与重放
+"""
+
+import contextlib
+import copy
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+import circuit_breaker
+import main
+from archive import EventArchive, replay, robot_label
+from mock_wechat_server import MockWeChatServer
+from notifier import Notifier
+from test_event_record import EVENTS
+
+DAY = 24 * 3600
+# 2024-05-13 00:00:00 UTC（周一）
+MONDAY = 1715558400.0
+
+
+def release_payload(repo):
+    payload = copy.deepcopy(EVENTS['release'])
+    payload['repository']['full_name'] = repo
+    return payload
+
+
+def fill_archive(directory):
+    """
+    一周内每天归档 owner/a 和 owner/b 的release事件，以及发送到两个机器人的结果
+    """
+    result = main.DeliveryResult(True, status_code=200, errcode=0)
+    with EventArchive(directory, block_records=4) as archive:
+        for day in range(7):
+            for hour, repo in ((9, 'owner/a'), (15, 'owner/b')):
+                ts = MONDAY + day * DAY + hour * 3600
+                delivery_id = f'{repo}-{day}'
+                archive.append_event('release', release_payload(repo), delivery_id=delivery_id, ts=ts)
+                for robot in ('alpha', 'beta'):
+                    target = f'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key={robot}'
+                    message = {'msgtype': 'markdown', 'markdown': {'content': f'{repo} day {day} -> {robot}'}}
+                    archive.append_delivery('release', repo, target, message, result, delivery_id=delivery_id,
+                                            ts=ts + 1)
+
+
+def test_rotation_and_format():
+    """
+    测试按天轮转分段，分段是标准gzip文件（多个member拼接），索引每块一行
+    """
+    directory = tempfile.mkdtemp()
+    fill_archive(directory)
+    segments = sorted(name for name in os.listdir(directory) if name.startswith('segment-'))
+    assert len(segments) == 7 and segments[1] == 'segment-20240514T000000.jsonl.gz'
+    with gzip.open(os.path.join(directory, segments[0]), 'rt', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert [record['kind'] for record in records] == ['event', 'delivery', 'delivery'] * 2
+    index = EventArchive(directory).index()
+    assert sum(entry.count for entry in index) == 42 and len(index) == 14
+
+
+def test_idle_buffer_is_flushed_by_timer():
+    """
+    测试启动后台写出后，空闲时缓冲记录在 flush_interval 后写出，无需等待下一次追加
+    """
+    directory = tempfile.mkdtemp()
+    archive = EventArchive(directory, flush_interval=0.1).start()
+    try:
+        archive.append_event('release', release_payload('owner/a'), delivery_id='idle-0')
+        assert archive.index() == []
+        deadline = time.monotonic() + 2
+        while not archive.index() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert [entry.count for entry in archive.index()] == [1]
+    finally:
+        archive.close()
+    assert [entry.count for entry in archive.index()] == [1]
+
+
+def test_indexed_search_reads_only_matching_blocks():
+    """
+    测试“周二发给某个群的消息”只解压索引命中的块
+    """
+    directory = tempfile.mkdtemp()
+    fill_archive(directory)
+    archive = EventArchive(directory)
+    target = 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=beta'
+    with mock.patch.object(archive, '_read_block', wraps=archive._read_block) as read_block:
+        sent = list(archive.search(MONDAY + DAY, MONDAY + 2 * DAY, target=target))
+    assert [record['message']['markdown']['content'] for record in sent] == \
+        ['owner/a day 1 -> beta', 'owner/b day 1 -> beta']
+    assert all(record['target'] == robot_label(target) for record in sent)
+    assert read_block.call_count == 2
+
+    events = list(archive.search(repo='owner/b', kind='event'))
+    assert [record['delivery_id'] for record in events] == [f'owner/b-{day}' for day in range(7)]
+    assert list(archive.search(event_name='push')) == []
+
+
+def test_main_archives_and_replays():
+    """
+    测试Action运行后归档事件与发送结果，并可以从归档重放到其他机器人
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS['release'], f)
+    archive_dir = os.path.join(directory, 'archive')
+    with MockWeChatServer() as server:
+        env = {
+            'INPUT_WECHAT_WEBHOOK_URL': server.url,
+            'INPUT_EVENT_TYPES': 'release',
+            'INPUT_ARCHIVE_DIR': archive_dir,
+            'INPUT_DELIVERY_ID': 'archived-1',
+            'GITHUB_EVENT_PATH': event_path,
+            'GITHUB_EVENT_NAME': 'release',
+        }
+        with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()):
+            main.main()
+        records = list(EventArchive(archive_dir).search(delivery_id='archived-1'))
+        assert [record['kind'] for record in records] == ['event', 'delivery']
+        assert records[0]['payload'] == EVENTS['release']
+        assert records[1]['success'] and records[1]['message'] == json.loads(server.received[0][1])
+
+        with Notifier(server.url) as notifier, contextlib.redirect_stdout(io.StringIO()):
+            results = replay(records, notifier)
+        assert len(results) == 1 and results[0].success
+        assert len(server.received) == 2 and server.received[1][1] == server.received[0][1]
+
+
+if __name__ == "__main__":
+    print("事件归档测试")
+    print("=" * 50)
+    test_rotation_and_format()
+    test_idle_buffer_is_flushed_by_timer()
+    test_indexed_search_reads_only_matching_blocks()
+    test_main_archives_and_replays()
+    print("测试完成")
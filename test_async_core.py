@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证异步发送核心 notify / notify_all 以及命令行包装
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+import aiohttp
+
+import adaptive_timeout
+import circuit_breaker
+import main
+from delivery_store import IdempotencyStore
+from event_record import NotificationEvent
+from mock_wechat_server import MockWeChatServer
+from test_event_record import EVENTS
+
+
+def run_quietly(coroutine):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(coroutine)
+
+
+def test_parse_wechat_response():
+    assert main.parse_wechat_response(200, '{"errcode":0,"errmsg":"ok"}') == (True, 0, None)
+    assert main.parse_wechat_response(200, '{"errcode":93000,"errmsg":"invalid webhook url"}')[:2] == (False, 93000)
+    assert main.parse_wechat_response(200, 'ok') == (True, None, None)
+    assert not main.parse_wechat_response(502, '')[0]
+
+
+def test_concurrent_deliveries_share_one_session():
+    """
+    测试大量并发投递在一个事件循环和一个会话中完成，不需要额外线程
+    """
+    adaptive_timeout.reset_trackers()
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    with MockWeChatServer(latency=0.05) as server:
+        urls = [server.url.replace('key=mock', f'key=robot-{index}') for index in range(50)]
+        event = NotificationEvent.from_payload('issues', EVENTS['issues'], delivery_id='async-1')
+        start = time.monotonic()
+        results = run_quietly(main.notify_all(event, urls))
+        elapsed = time.monotonic() - start
+        assert all(result.success for result in results)
+        assert len(server.received) == 50
+        # 50个目标并发发送，耗时远小于串行的 50 * 0.05s
+        assert elapsed < 1.5
+        bodies = {body for _, body in server.received}
+        assert len(bodies) == 1
+        assert json.loads(bodies.pop())['msgtype'] == 'markdown'
+
+
+def test_notify_skips_delivered_and_open_breaker():
+    """
+    测试幂等跳过与熔断快速失败
+    """
+    circuit_breaker.reset_breakers()
+    store = IdempotencyStore(os.path.join(tempfile.mkdtemp(), 'receipts.db'))
+    event = NotificationEvent.from_payload('push', EVENTS['push'], delivery_id='async-2')
+
+    async def scenario(url):
+        async with aiohttp.ClientSession() as session:
+            first = await main.notify(event, url, session, store=store)
+            second = await main.notify(event, url, session, store=store)
+            circuit_breaker.get_breaker(url).record_failure('invalid webhook url', 93000)
+            blocked = await main.send_wechat_message_async(session, url, {'msgtype': 'text'})
+            return first, second, blocked
+
+    with MockWeChatServer() as server:
+        first, second, blocked = run_quietly(scenario(server.url))
+        assert len(server.received) == 1
+    store.close()
+    circuit_breaker.reset_breakers()
+    assert first.success and not first.skipped
+    assert second.skipped
+    assert not blocked.success and blocked.error == '熔断器打开'
+
+
+def test_async_retries_only_connect_failures():
+    """
+    测试异步发送只重试连接失败；读取超时时服务端可能已接收，只有幂等存储认领投递后才重试
+    """
+    adaptive_timeout.reset_trackers()
+    circuit_breaker.reset_breakers()
+
+    async def send(url, **options):
+        async with aiohttp.ClientSession() as session:
+            return await main.send_wechat_message_async(session, url, {'msgtype': 'text'}, max_attempts=2,
+                                                        **options)
+
+    with MockWeChatServer(latency=1.5) as server:
+        # 快速样本使读取超时收敛到下限（1秒）
+        for _ in range(adaptive_timeout.MIN_SAMPLES):
+            adaptive_timeout.get_tracker(server.url).record(0.01)
+        assert not run_quietly(send(server.url)).success
+        time.sleep(1.7)
+        assert len(server.received) == 1
+        circuit_breaker.reset_breakers()
+        # 超时后读取超时上调，第二次尝试可能成功
+        run_quietly(send(server.url, retry_read_timeout=True))
+        time.sleep(1.7)
+        assert len(server.received) == 3
+    adaptive_timeout.reset_trackers()
+    circuit_breaker.reset_breakers()
+
+
+def test_load_event():
+    """
+    测试异步读取事件文件
+    """
+    with tempfile.NamedTemporaryFile(mode='wb', suffix='.json', delete=False) as f:
+        f.write(json.dumps(EVENTS['release']).encode('utf-8'))
+    try:
+        raw, data = asyncio.run(main.load_event(f.name))
+        assert data == EVENTS['release']
+        assert raw.startswith(b'{')
+    finally:
+        os.unlink(f.name)
+
+
+def test_cli_wrapper_end_to_end():
+    """
+    测试命令行入口通过异步核心发送到多个目标，缺少必填参数时抛出异常而不是直接退出
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+        json.dump(EVENTS['release'], f)
+    try:
+        with MockWeChatServer() as server:
+            env = {
+                'INPUT_WECHAT_WEBHOOK_URL': f'{server.url},{server.url}2',
+                'INPUT_EVENT_TYPES': 'release',
+                'GITHUB_EVENT_PATH': f.name,
+                'GITHUB_EVENT_NAME': 'release',
+            }
+            with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()):
+                main.main()
+            assert len(server.received) == 2
+    finally:
+        os.unlink(f.name)
+
+    with mock.patch.dict(os.environ, {}, clear=True), contextlib.redirect_stdout(io.StringIO()):
+        try:
+            main.get_input('wechat_webhook_url', required=True)
+            assert False, '缺少必填参数时应抛出异常'
+        except main.MissingInputError:
+            pass
+
+
+def test_invalid_numeric_inputs_exit_with_error():
+    """
+    测试数值参数格式错误或超出范围时输出错误并以退出码1结束，而不是抛出原始异常
+    """
+    with mock.patch.dict(os.environ, {'INPUT_TRACE_SAMPLE_RATE': '', 'INPUT_DRAIN_TIMEOUT': '2.5'}), \
+            contextlib.redirect_stdout(io.StringIO()):
+        assert main.get_float_input('trace_sample_rate', 1.0, maximum=1.0) == 1.0
+        assert main.get_float_input('drain_timeout', 10) == 2.5
+
+    for name, value in (('drain_timeout', 'ten'), ('trace_sample_rate', '1.5'), ('drain_timeout', 'nan')):
+        output = io.StringIO()
+        with mock.patch.dict(os.environ, {f'INPUT_{name.upper()}': value}), contextlib.redirect_stdout(output):
+            try:
+                main.main()
+                assert False, '参数无效时应退出'
+            except SystemExit as e:
+                assert e.code == 1
+        assert '::error::' in output.getvalue() and f'Invalid input {name}' in output.getvalue()
+
+
+if __name__ == "__main__":
+    print("异步发送核心测试")
+    print("=" * 50)
+    test_parse_wechat_response()
+    test_concurrent_deliveries_share_one_session()
+    test_notify_skips_delivered_and_open_breaker()
+    test_async_retries_only_connect_failures()
+    test_load_event()
+    test_cli_wrapper_end_to_end()
+    test_invalid_numeric_inputs_exit_with_error()
+    print("测试完成")
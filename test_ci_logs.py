@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证CI失败通知与日志摘录提取（使用本地生成的日志压缩包）
+"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+from unittest import mock
+
+import circuit_breaker
+import main
+from ci_logs import EXCERPT_MAX_BYTES, LogExcerpt, extract_log_excerpt, failure_excerpt
+from event_record import NotificationEvent, pack_event, unpack_event
+from message_types import render_template_card
+from mock_wechat_server import MockWeChatServer
+from test_event_record import EVENTS
+
+REPOSITORY = EVENTS['push']['repository']
+
+WORKFLOW_RUN_EVENT = {
+    'action': 'completed',
+    'repository': REPOSITORY,
+    'sender': {'login': 'test-sender'},
+    'workflow_run': {
+        'name': 'CI',
+        'html_url': 'https://github.com/test/test-repo/actions/runs/42',
+        'run_number': 7,
+        'head_branch': 'main',
+        'head_sha': 'abc1234def5678',
+        'status': 'completed',
+        'conclusion': 'failure',
+        'actor': {'login': 'test-actor'},
+        'head_commit': {'message': '修复解析器\n\n详细说明'},
+        'logs_url': 'https://api.github.com/repos/test/test-repo/actions/runs/42/logs',
+    },
+}
+
+CHECK_RUN_EVENT = {
+    'action': 'completed',
+    'repository': REPOSITORY,
+    'sender': {'login': 'test-sender'},
+    'check_run': {
+        'id': 99,
+        'name': 'build',
+        'html_url': 'https://github.com/test/test-repo/runs/99',
+        'head_sha': 'abc1234def5678',
+        'status': 'completed',
+        'conclusion': 'timed_out',
+        'check_suite': {'head_branch': 'feature'},
+        'output': {'title': '1 个测试失败'},
+        'app': {'slug': 'github-actions'},
+    },
+}
+
+TIMESTAMP = '2024-05-01T10:00:00.1234567Z '
+
+
+def step_log(lines):
+    return '\n'.join(TIMESTAMP + line for line in lines) + '\n'
+
+
+def make_archive(directory):
+    """
+    生成与GitHub运行日志结构一致的压缩包：<作业>/<序号>_<步骤>.txt 以及作业级汇总文件
+    """
+    path = os.path.join(directory, 'logs.zip')
+    noise = [f'collecting item {index}' for index in range(5000)]
+    failing = noise + [
+        'Traceback (most recent call last):',
+        '  File "test_parser.py", line 12, in test_parse',
+        '\x1b[31mAssertionError: expected 3, got 4\x1b[0m',
+        '##[error]Process completed with exit code 1.',
+    ]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('1_build.txt', step_log(noise + failing))
+        archive.writestr('build/1_Set up job.txt', step_log(['Preparing workflow directory']))
+        archive.writestr('build/2_Run actions checkout@v4.txt', step_log(['Syncing repository']))
+        archive.writestr('build/3_Run tests.txt', step_log(failing))
+        archive.writestr('build/4_Post Run actions checkout@v4.txt', step_log(['Cleaning up orphan processes']))
+        archive.writestr('lint/1_Run flake8.txt', step_log(['0 errors']))
+    return path
+
+
+def test_archive_excerpt_finds_failing_step():
+    """
+    测试从压缩包中定位失败步骤，摘录有界且去除时间戳与颜色码
+    """
+    directory = tempfile.mkdtemp()
+    excerpt = extract_log_excerpt(make_archive(directory), context_lines=10)
+    assert excerpt.source == 'build / Run tests'
+    assert not excerpt.truncated
+    assert len(excerpt.lines) <= 12
+    text = excerpt.text
+    assert 'AssertionError: expected 3, got 4' in text
+    assert TIMESTAMP.strip() not in text and '\x1b' not in text
+    assert text.splitlines()[-1] == '##[error]Process completed with exit code 1.'
+
+    # check_run 名称优先匹配对应作业
+    excerpt = extract_log_excerpt(os.path.join(directory, 'logs.zip'), failing_names=['lint'])
+    assert excerpt.source == 'build / Run tests'
+
+
+def test_text_log_tail_scan_is_bounded():
+    """
+    测试纯文本日志从末尾向前扫描，且扫描范围受字节上限约束
+    """
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'job.log')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(step_log(['Error: early failure']))
+        f.write(step_log([f'line {index} ' + 'x' * 80 for index in range(40000)]))
+        f.write(step_log(['FAILED tests/test_api.py::test_timeout', 'done', 'cleanup', 'exit']))
+    excerpt = extract_log_excerpt(path, context_lines=5)
+    assert excerpt.source == 'job.log'
+    assert 'FAILED tests/test_api.py::test_timeout' in excerpt.text
+    assert excerpt.lines[-1].endswith('cleanup')
+
+    # 只扫描末尾 1KB：找不到早期的错误，退化为日志末尾
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(step_log(['ok'] * 200))
+    excerpt = extract_log_excerpt(path, context_lines=5, max_scan_bytes=1024)
+    assert excerpt.truncated
+    assert excerpt.text.splitlines() == ['ok'] * 5
+
+
+def test_time_budget_interrupts_scan():
+    """
+    测试超出时间预算时返回已有结果
+    """
+    ticks = iter(range(1000))
+    excerpt = extract_log_excerpt(make_archive(tempfile.mkdtemp()), time_budget=1.5,
+                                  clock=lambda: next(ticks))
+    assert excerpt is not None and excerpt.truncated
+
+
+def test_failure_messages():
+    """
+    测试失败运行生成带摘录的通知，成功运行不通知，紧凑记录还原后渲染一致
+    """
+    payload = json.loads(json.dumps(WORKFLOW_RUN_EVENT))
+    excerpt = failure_excerpt('workflow_run', payload, log_path=make_archive(tempfile.mkdtemp()))
+    payload['log_excerpt'] = {'source': excerpt.source, 'text': excerpt.text}
+
+    content = main.generate_workflow_run_message(payload)['markdown']['content']
+    assert '**工作流**: [CI #7]' in content
+    assert '**失败步骤**: build / Run tests' in content
+    assert '> AssertionError: expected 3, got 4' in content
+    assert len(content.encode('utf-8')) < 4096
+
+    check_content = main.generate_check_run_message(CHECK_RUN_EVENT)['markdown']['content']
+    assert '**概要**: 1 个测试失败' in check_content
+
+    succeeded = dict(WORKFLOW_RUN_EVENT, workflow_run=dict(WORKFLOW_RUN_EVENT['workflow_run'], conclusion='success'))
+    assert main.generate_workflow_run_message(succeeded) is None
+    assert failure_excerpt('workflow_run', succeeded, log_path='unused') is None
+
+    for event_name, event_payload in (('workflow_run', payload), ('check_run', CHECK_RUN_EVENT)):
+        event = unpack_event(pack_event(NotificationEvent.from_payload(event_name, event_payload)))
+        generator = main.MESSAGE_GENERATORS[event_name]
+        assert generator(event.to_payload()) == generator(event_payload), event_name
+    card = render_template_card(NotificationEvent.from_payload('workflow_run', payload))
+    assert card['template_card']['main_title']['desc'] == 'build / Run tests 失败'
+
+
+def test_cjk_excerpt_fits_markdown_limit():
+    """
+    测试中文日志和大量提醒时摘录按剩余字节截断，消息不超过企业微信4096字节上限且保留最后的错误行
+    """
+    lines = [f'第{i}行：断言失败，期望值与实际值不一致' for i in range(300)] + ['错误：测试用例全部失败']
+    excerpt = LogExcerpt('构建 / 运行测试', lines)
+    assert len(excerpt.text.encode('utf-8')) <= EXCERPT_MAX_BYTES
+    assert excerpt.text.startswith('…')
+
+    payload = json.loads(json.dumps(WORKFLOW_RUN_EVENT))
+    payload['log_excerpt'] = {'source': excerpt.source, 'text': excerpt.text}
+    payload['wecom_mentions'] = [f'zhangsan{i:03d}' for i in range(150)]
+    content = main.generate_workflow_run_message(payload)['markdown']['content']
+    assert len(content.encode('utf-8')) <= main.MARKDOWN_MAX_BYTES
+    assert '> 错误：测试用例全部失败' in content
+    assert content.endswith('<@zhangsan149>\n')
+
+    check_payload = dict(CHECK_RUN_EVENT, log_excerpt={'source': excerpt.source, 'text': '错' * 5000})
+    check_content = main.generate_check_run_message(check_payload)['markdown']['content']
+    assert len(check_content.encode('utf-8')) <= main.MARKDOWN_MAX_BYTES
+    assert '> …错错' in check_content
+
+
+def test_cli_attaches_local_log_excerpt():
+    """
+    测试命令行入口读取本地日志文件并随通知发送摘录
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(WORKFLOW_RUN_EVENT, f)
+    with MockWeChatServer() as server:
+        env = {
+            'INPUT_WECHAT_WEBHOOK_URL': server.url,
+            'INPUT_EVENT_TYPES': 'workflow_run',
+            'INPUT_CI_LOG_PATH': make_archive(directory),
+            'GITHUB_EVENT_PATH': event_path,
+            'GITHUB_EVENT_NAME': 'workflow_run',
+        }
+        with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()):
+            main.main()
+        assert len(server.received) == 1
+    content = json.loads(server.received[0][1])['markdown']['content']
+    assert 'AssertionError: expected 3, got 4' in content
+
+
+if __name__ == "__main__":
+    print("CI失败通知测试")
+    print("=" * 50)
+    test_archive_excerpt_finds_failing_step()
+    test_text_log_tail_scan_is_bounded()
+    test_time_budget_interrupts_scan()
+    test_failure_messages()
+    test_cjk_excerpt_fits_markdown_limit()
+    test_cli_attaches_local_log_excerpt()
+    print("测试完成")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证Webhook熔断器的状态切换以及与 send_wechat_message 的集成
+"""
+
+import asyncio
+from unittest import mock
+
+import aiohttp
+import requests
+
+import circuit_breaker
+import main
+from mock_wechat_server import MockWeChatServer
+
+TEST_WEBHOOK_URL = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=breaker-test-key"
+
+TEST_MESSAGE = {
+    'msgtype': 'markdown',
+    'markdown': {
+        'content': '熔断器测试消息'
+    }
+}
+
+
+class FakeClock:
+    """
+    可手动推进的时钟
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_state_transitions():
+    """
+    测试 closed -> open -> half_open -> closed 的状态切换
+    """
+    clock = FakeClock()
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=2, recovery_timeout=30, clock=clock)
+
+    assert breaker.state == circuit_breaker.STATE_CLOSED
+    breaker.record_failure('timeout')
+    assert breaker.allow_request()
+    breaker.record_failure('timeout')
+    assert breaker.state == circuit_breaker.STATE_OPEN
+    assert not breaker.allow_request()
+
+    clock.now = 30
+    assert breaker.state == circuit_breaker.STATE_HALF_OPEN
+    assert breaker.allow_request()
+    # 半开状态只放行一个探测请求
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == circuit_breaker.STATE_CLOSED
+
+
+def test_half_open_failure_reopens():
+    """
+    测试探测失败后重新熔断
+    """
+    clock = FakeClock()
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=5, recovery_timeout=10, clock=clock)
+    breaker.record_failure('invalid webhook url', 93000)
+    assert breaker.state == circuit_breaker.STATE_OPEN
+
+    clock.now = 10
+    assert breaker.allow_request()
+    breaker.record_failure('timeout')
+    assert breaker.state == circuit_breaker.STATE_OPEN
+    assert breaker.retry_after() == 10
+
+
+def test_send_fails_fast_when_open():
+    """
+    测试熔断后 send_wechat_message 不再发起HTTP请求
+    """
+    circuit_breaker.reset_breakers()
+    circuit_breaker.configure_breakers(failure_threshold=2, recovery_timeout=60)
+
+    with mock.patch('main.requests.post', side_effect=requests.exceptions.Timeout('timeout')) as post:
+        assert not main.send_wechat_message(TEST_WEBHOOK_URL, TEST_MESSAGE)
+        assert not main.send_wechat_message(TEST_WEBHOOK_URL, TEST_MESSAGE)
+        assert not main.send_wechat_message(TEST_WEBHOOK_URL, TEST_MESSAGE)
+        assert post.call_count == 2
+
+    # 其他机器人不受影响
+    other_url = TEST_WEBHOOK_URL.replace('breaker-test-key', 'other-key')
+    assert circuit_breaker.get_breaker(other_url).allow_request()
+
+    circuit_breaker.reset_breakers()
+    circuit_breaker.configure_breakers(
+        failure_threshold=circuit_breaker.DEFAULT_FAILURE_THRESHOLD,
+        recovery_timeout=circuit_breaker.DEFAULT_RECOVERY_TIMEOUT
+    )
+
+
+def test_content_errors_do_not_open():
+    """
+    测试消息内容错误和限频错误码说明机器人可达，不会熔断；HTTP 5xx 和服务繁忙计为失败
+    """
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=2, clock=FakeClock())
+    breaker.record_failure('timeout')
+    # 40058: 消息内容不合法，45009: 接口调用超过限制
+    for errcode in (40058, 45009, 40058, 45009):
+        breaker.record_response('content error', errcode)
+        assert breaker.state == circuit_breaker.STATE_CLOSED
+    breaker.record_response('bad gateway', status_code=502)
+    breaker.record_response('system busy', -1)
+    assert breaker.state == circuit_breaker.STATE_OPEN
+
+    circuit_breaker.reset_breakers()
+    circuit_breaker.configure_breakers(failure_threshold=2, recovery_timeout=60)
+
+    async def send_async(url):
+        async with aiohttp.ClientSession() as session:
+            return await main.send_wechat_message_async(session, url, TEST_MESSAGE)
+
+    with MockWeChatServer(errcode=40058) as server:
+        for _ in range(3):
+            assert not main.send_wechat_message(server.url, TEST_MESSAGE)
+            assert asyncio.run(send_async(server.url)).errcode == 40058
+        # 每次都实际发出了请求，正常的消息不会被熔断器拒绝
+        assert len(server.received) == 6
+        assert circuit_breaker.get_breaker(server.url).state == circuit_breaker.STATE_CLOSED
+        server.errcode = 93000
+        assert not main.send_wechat_message(server.url, TEST_MESSAGE)
+        assert circuit_breaker.get_breaker(server.url).state == circuit_breaker.STATE_OPEN
+
+    circuit_breaker.reset_breakers()
+    circuit_breaker.configure_breakers(
+        failure_threshold=circuit_breaker.DEFAULT_FAILURE_THRESHOLD,
+        recovery_timeout=circuit_breaker.DEFAULT_RECOVERY_TIMEOUT
+    )
+
+
+if __name__ == "__main__":
+    print("Webhook熔断器测试")
+    print("=" * 50)
+    test_state_transitions()
+    test_half_open_failure_reopens()
+    test_send_fails_fast_when_open()
+    test_content_errors_do_not_open()
+    print("测试完成")
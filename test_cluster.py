@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证中继集群的一致性哈希分片、事件转发与节点故障时的迁移
+"""
+
+import collections
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from unittest import mock
+
+import requests
+
+import circuit_breaker
+import main
+from cluster import HashRing, Membership
+from event_record import NotificationEvent
+from mock_wechat_server import MockWeChatServer
+from relay import ACCEPTED, REJECTED, Relay
+from test_event_record import EVENTS
+from test_relay import post_event, wait_until
+
+ROBOTS = 6
+
+
+def free_ports(count):
+    sockets = [socket.socket() for _ in range(count)]
+    for sock in sockets:
+        sock.bind(('127.0.0.1', 0))
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+
+def robot_urls(server):
+    return [server.url.replace('key=mock', f'key=robot{index}') for index in range(ROBOTS)]
+
+
+def deliveries_by_key(server):
+    return collections.Counter(path.rsplit('key=', 1)[1] for path, _ in server.received)
+
+
+def test_hash_ring_balance_and_stability():
+    """
+    测试虚拟节点使分布大致均匀，移除一个节点只迁移它负责的键
+    """
+    nodes = [f'http://10.0.0.{index}:8080' for index in range(1, 4)]
+    keys = [f'robot-{index}' for index in range(3000)]
+    ring = HashRing(nodes)
+    owners = {key: ring.owner(key) for key in keys}
+    counts = collections.Counter(owners.values())
+    assert all(600 < counts[node] < 1400 for node in nodes), counts
+
+    smaller = HashRing(nodes[:2])
+    for key, owner in owners.items():
+        if owner != nodes[2]:
+            assert smaller.owner(key) == owner
+    assert HashRing([]).owner('x') is None
+
+    membership = Membership(nodes[0], ','.join(nodes[1:]) + ',' + nodes[0] + '/')
+    assert membership.nodes == nodes and membership.peers == nodes[1:]
+    assert not membership.mark_down(nodes[0]) and membership.mark_down(nodes[2])
+    assert all(membership.owner(key) != nodes[2] for key in keys[:200])
+    assert membership.mark_up(nodes[2]) and membership.owner(keys[0]) == owners[keys[0]]
+
+
+def test_cluster_in_process():
+    """
+    测试任一节点接收的事件只在机器人所属节点入队和发送，每个机器人恰好收到一次
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    ports = free_ports(3)
+    nodes = [f'http://127.0.0.1:{port}' for port in ports]
+    with MockWeChatServer() as server:
+        relays = [Relay(robot_urls(server), port=port, rate_per_minute=6000, secret='s3cret', cluster_nodes=nodes,
+                        probe_interval=0.2).start() for port in ports]
+        try:
+            # 先启动的节点可能在其他节点绑定端口之前探测失败，等待视图收敛
+            wait_until(lambda: all(set(relay.membership.live_nodes()) == set(nodes) for relay in relays))
+            for index in range(6):
+                response = post_event(relays[index % 3], 'release', f'cluster-{index}', secret=b's3cret')
+                assert response.json()['outcome'] == ACCEPTED
+            wait_until(lambda: len(server.received) == 6 * ROBOTS)
+            assert set(deliveries_by_key(server).values()) == {6}
+
+            owners = relays[0].owners()
+            assert owners == relays[1].owners() == relays[2].owners()
+            assert set(owners.values()) <= set(nodes)
+            for relay in relays:
+                for robot in relay.robots:
+                    owned = owners[robot.label] == relay.membership.self_url
+                    assert (robot.deliveries['success'] == 6) if owned else not robot.deliveries
+            metrics = requests.get(relays[0].url + '/metrics', timeout=5).text
+            forwarded = set(owners.values()) != {relays[0].membership.self_url}
+            assert ('wechat_relay_forwarded_total{direction="out"' in metrics) == forwarded
+            assert 'wechat_relay_events_total{outcome="accepted"} 2' in metrics
+
+            # 转发接口同样校验签名
+            response = requests.post(nodes[1] + '/events', data=b'NE\x04\x00',
+                                     headers={'Content-Type': 'application/x-notification-event'}, timeout=5)
+            assert response.status_code == 401
+        finally:
+            for relay in relays:
+                relay.stop(drain_timeout=1)
+
+
+def test_cluster_reroutes_only_when_peer_did_not_enqueue():
+    """
+    测试转发读取超时（节点可能已入队）时不改由其他节点发送；节点排空时其机器人改由转发节点发送
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    ports = free_ports(2)
+    nodes = [f'http://127.0.0.1:{port}' for port in ports]
+    with MockWeChatServer() as server:
+        relays = [Relay(robot_urls(server), port=port, rate_per_minute=6000, cluster_nodes=nodes,
+                        probe_interval=60).start() for port in ports]
+        try:
+            for relay in relays:
+                for node in nodes:
+                    relay.membership.mark_up(node)
+            owners = relays[0].owners()
+            first, second = relays if nodes[1] in owners.values() else relays[::-1]
+            remote = [label for label, node in owners.items() if node == second.membership.self_url]
+            local = len(owners) - len(remote)
+
+            # 发送线程共用同一个会话，只让转发请求超时
+            post = first._session.post
+
+            def forward_times_out(url, **kwargs):
+                if url.endswith('/events'):
+                    raise requests.exceptions.ReadTimeout('read timed out')
+                return post(url, **kwargs)
+
+            event = NotificationEvent.from_payload('release', EVENTS['release'], delivery_id='reroute-0')
+            with mock.patch.object(first._session, 'post', side_effect=forward_times_out):
+                assert first.submit(event) == REJECTED
+            assert first.membership.owner(remote[0]) == second.membership.self_url
+            assert set(first.accepted_robots('reroute-0')) == set(owners) - set(remote)
+
+            second._draining.set()
+            event = NotificationEvent.from_payload('release', EVENTS['release'], delivery_id='reroute-1')
+            assert first.submit(event) == ACCEPTED
+            assert first.membership.live_nodes() == [first.membership.self_url]
+            wait_until(lambda: len(server.received) == local + ROBOTS)
+            assert not any(robot.deliveries for robot in second.robots)
+            second._draining.clear()
+        finally:
+            for relay in relays:
+                relay.stop(drain_timeout=1)
+
+
+def test_divergent_views_forward_to_owner():
+    """
+    测试两个节点的存活视图不一致时，转发来的机器人不归接收节点负责则再转发一次给其视图中的所属节点，
+    不会在接收节点另起一个限速器
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    ports = free_ports(3)
+    nodes = [f'http://127.0.0.1:{port}' for port in ports]
+    with MockWeChatServer() as server:
+        relays = [Relay(robot_urls(server), port=port, rate_per_minute=6000, cluster_nodes=nodes,
+                        probe_interval=60).start() for port in ports]
+        try:
+            by_node = {relay.membership.self_url: relay for relay in relays}
+            label = relays[0].robots[0].label
+            # owner 为所有节点存活时的所属节点；entry 的视图中 owner 已下线，机器人改由 middle 负责
+            owner = HashRing(nodes).owner(label)
+            middle = HashRing([node for node in nodes if node != owner]).owner(label)
+            entry = next(node for node in nodes if node not in (owner, middle))
+            assert by_node[entry].membership.mark_down(owner)
+            assert by_node[entry].membership.owner(label) == middle
+            assert by_node[middle].membership.owner(label) == owner
+
+            event = NotificationEvent.from_payload('release', EVENTS['release'], delivery_id='divergent-0')
+            assert by_node[entry].submit(event) == ACCEPTED
+            wait_until(lambda: len(server.received) == ROBOTS)
+            time.sleep(0.2)
+            assert set(deliveries_by_key(server).values()) == {1}
+            assert by_node[owner]._robots_by_label[label].deliveries['success'] == 1
+            assert not by_node[middle]._robots_by_label[label].deliveries
+            assert by_node[middle].forwarded[('out', owner, ACCEPTED)] >= 1
+        finally:
+            for relay in relays:
+                relay.stop(drain_timeout=1)
+
+
+def test_cluster_processes_failover():
+    """
+    测试多个本地进程组成集群，节点收到 SIGTERM 后其机器人迁移到其他节点，事件不丢失也不重复
+    """
+    ports = free_ports(3)
+    nodes = [f'http://127.0.0.1:{port}' for port in ports]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'relay.py')
+    with MockWeChatServer() as server:
+        processes = [subprocess.Popen(
+            [sys.executable, script, '--webhook', ','.join(robot_urls(server)), '--host', '127.0.0.1',
+             '--port', str(port), '--cluster-nodes', ','.join(nodes), '--probe-interval', '0.2',
+             '--rate-per-minute', '6000', '--drain-timeout', '2'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for port in ports]
+        try:
+            for node in nodes:
+                wait_until(lambda: _healthy(node), timeout=15)
+            for node in nodes:
+                wait_until(lambda: all(requests.get(node + '/cluster', timeout=5).json()['nodes'].values()))
+            owners = requests.get(nodes[0] + '/cluster', timeout=5).json()['owners']
+            assert set(owners.values()) <= set(nodes)
+            # 停止一个拥有机器人的非入口节点
+            victim = next((node for node in owners.values() if node != nodes[0]), nodes[1])
+
+            class Target:
+                url = nodes[0]
+            for index in range(3):
+                assert post_event(Target, 'release', f'proc-{index}').json()['outcome'] == ACCEPTED
+            wait_until(lambda: len(server.received) == 3 * ROBOTS)
+
+            process = processes[nodes.index(victim)]
+            process.send_signal(signal.SIGTERM)
+            assert process.wait(timeout=10) == 0
+            wait_until(lambda: not requests.get(nodes[0] + '/cluster', timeout=5).json()['nodes'][victim])
+            owners = requests.get(nodes[0] + '/cluster', timeout=5).json()['owners']
+            assert victim not in owners.values()
+
+            for index in range(3, 6):
+                assert post_event(Target, 'release', f'proc-{index}').json()['outcome'] == ACCEPTED
+            wait_until(lambda: len(server.received) == 6 * ROBOTS)
+            time.sleep(0.3)
+            assert set(deliveries_by_key(server).values()) == {6}
+        finally:
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+                    process.wait(timeout=10)
+
+
+def _healthy(node):
+    try:
+        return requests.get(node + '/healthz', timeout=1).status_code == 200
+    except requests.RequestException:
+        return False
+
+
+if __name__ == "__main__":
+    print("中继集群测试")
+    print("=" * 50)
+    test_hash_ring_balance_and_stability()
+    test_cluster_in_process()
+    test_cluster_reroutes_only_when_peer_did_not_enqueue()
+    test_divergent_views_forward_to_owner()
+    test_cluster_processes_failover()
+    print("测试完成")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证投递回执幂等存储，以及重试时不会重复推送
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+from unittest import mock
+
+import main
+from delivery_store import STATUS_FAILED, STATUS_SENT, IdempotencyStore
+from event_record import NotificationEvent
+from test_main import test_events
+
+TEST_WEBHOOK_URL = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=store-test-key"
+
+
+class FakeClock:
+    """
+    可手动推进的时钟
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_store(clock=None):
+    directory = tempfile.mkdtemp()
+    return IdempotencyStore(os.path.join(directory, 'receipts.db'), lease_seconds=30, clock=clock or FakeClock())
+
+
+def test_claim_and_record():
+    """
+    测试成功发送后不可再次占用，失败后允许重试
+    """
+    clock = FakeClock()
+    with make_store(clock) as store:
+        assert store.claim('d-1', TEST_WEBHOOK_URL)
+        # 租约未过期，其他worker不可占用
+        assert not store.claim('d-1', TEST_WEBHOOK_URL)
+        store.record('d-1', TEST_WEBHOOK_URL, False, 'timeout')
+        assert store.get('d-1', TEST_WEBHOOK_URL)['status'] == STATUS_FAILED
+
+        assert store.claim('d-1', TEST_WEBHOOK_URL)
+        store.record('d-1', TEST_WEBHOOK_URL, True)
+        assert store.is_delivered('d-1', TEST_WEBHOOK_URL)
+        assert not store.claim('d-1', TEST_WEBHOOK_URL)
+        receipt = store.get('d-1', TEST_WEBHOOK_URL)
+        assert receipt['status'] == STATUS_SENT
+        assert receipt['attempts'] == 2
+
+        # 不同目标互不影响
+        assert store.claim('d-1', TEST_WEBHOOK_URL.replace('store-test-key', 'other'))
+
+
+def test_expired_lease_can_be_reclaimed():
+    """
+    测试发送中断（租约过期）后允许重新占用
+    """
+    clock = FakeClock()
+    with make_store(clock) as store:
+        assert store.claim('d-2', TEST_WEBHOOK_URL)
+        clock.now += 31
+        assert store.claim('d-2', TEST_WEBHOOK_URL)
+
+
+def test_expire_old_receipts():
+    """
+    测试清理过期回执
+    """
+    clock = FakeClock()
+    with make_store(clock) as store:
+        store.record('old', TEST_WEBHOOK_URL, True)
+        clock.now += 100
+        store.record('new', TEST_WEBHOOK_URL, True)
+        assert store.expire(ttl_seconds=50, vacuum=True) == 1
+        assert store.get('old', TEST_WEBHOOK_URL) is None
+        assert store.is_delivered('new', TEST_WEBHOOK_URL)
+
+
+def test_concurrent_claims():
+    """
+    测试多个worker（各自独立连接）并发占用同一投递时只有一个成功
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'receipts.db')
+    stores = [IdempotencyStore(path) for _ in range(8)]
+    results = []
+    barrier = threading.Barrier(len(stores))
+
+    def worker(store):
+        barrier.wait()
+        results.append(store.claim('d-3', TEST_WEBHOOK_URL))
+
+    threads = [threading.Thread(target=worker, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for store in stores:
+        store.close()
+    assert results.count(True) == 1
+
+
+def test_retry_does_not_double_post():
+    """
+    测试同一投递ID重试时不再调用发送
+    """
+    main.render_cache.clear()
+    rendered = main.render_message('push', test_events["push"])
+    with make_store() as store, \
+            mock.patch('main.send_wechat_message_result', return_value=main.DeliveryResult(True)) as send:
+        first = main.deliver_notification(TEST_WEBHOOK_URL, rendered, delivery_id='run-1', store=store)
+        second = main.deliver_notification(TEST_WEBHOOK_URL, rendered, delivery_id='run-1', store=store)
+    assert first.success and not first.skipped
+    assert second.success and second.skipped
+    assert send.call_count == 1
+
+
+def test_async_notify_uses_worker_thread():
+    """
+    测试异步投递在线程池中访问幂等存储，不阻塞事件循环
+    """
+    main.render_cache.clear()
+    event = NotificationEvent.from_payload('push', test_events["push"], delivery_id='run-async')
+    threads = []
+
+    def track(method):
+        def wrapper(*args):
+            threads.append(threading.current_thread())
+            return method(*args)
+        return wrapper
+
+    with make_store() as store, \
+            mock.patch.object(store, 'claim', track(store.claim)), \
+            mock.patch.object(store, 'record', track(store.record)), \
+            mock.patch('main.send_wechat_message_async', mock.AsyncMock(return_value=main.DeliveryResult(True))):
+        first = asyncio.run(main.notify(event, TEST_WEBHOOK_URL, None, store=store))
+        second = asyncio.run(main.notify(event, TEST_WEBHOOK_URL, None, store=store))
+        status = store.get('run-async', TEST_WEBHOOK_URL)
+    assert first.success and not first.skipped
+    assert second.skipped
+    assert status['status'] == STATUS_SENT
+    assert len(threads) == 3
+    assert all(thread is not threading.main_thread() for thread in threads)
+
+
+if __name__ == "__main__":
+    print("投递回执幂等存储测试")
+    print("=" * 50)
+    test_claim_and_record()
+    test_expired_lease_can_be_reclaimed()
+    test_expire_old_receipts()
+    test_concurrent_claims()
+    test_retry_does_not_double_post()
+    test_async_notify_uses_worker_thread()
+    print("测试完成")
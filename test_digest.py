@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证动态摘要的记录、汇总与卡片生成
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import time
+from unittest import mock
+
+import main
+from digest import (KIND_PR_MERGED, DigestStore, generate_digest_messages, record_payload)
+from event_record import NotificationEvent
+from test_event_record import EVENTS
+
+NOW = 1_700_000_000.0
+
+
+def make_store():
+    return DigestStore(os.path.join(tempfile.mkdtemp(), 'digest.db'))
+
+
+def merged_pr(repo, number, ts):
+    return NotificationEvent(event_name='pull_request', action='closed', merged=True, received_at=ts,
+                             repo_full_name=repo, repo_html_url=f'https://github.com/{repo}',
+                             title=f'PR {number}', html_url=f'https://github.com/{repo}/pull/{number}',
+                             number=number, sender='reviewer')
+
+
+def test_summarize_by_repo_and_kind():
+    """
+    测试按仓库和分类汇总，且只统计周期内的事件
+    """
+    with make_store() as store:
+        for event_name, payload in EVENTS.items():
+            store.record(NotificationEvent.from_payload(event_name, payload, received_at=NOW - 60))
+        store.record_many([merged_pr('test/other-repo', number, NOW - 120) for number in range(3)])
+        # 周期之外的事件
+        store.record(merged_pr('test/other-repo', 99, NOW - 3 * 24 * 3600))
+
+        summary = store.summarize(NOW - 24 * 3600, NOW)
+        assert summary['test/other-repo']['counts'] == {KIND_PR_MERGED: 3}
+        assert summary['test/test-repo']['commits'] == 1
+        assert summary['test/test-repo']['counts']['pr_opened'] == 1
+
+
+def test_generate_digest_messages():
+    """
+    测试每个仓库生成一张Markdown摘要卡片
+    """
+    with make_store() as store:
+        record_payload(store, 'push', EVENTS['push'])
+        store.record_many([merged_pr('test/other-repo', number, NOW - 120) for number in range(8)])
+        messages = generate_digest_messages(store, 'daily', now=NOW)
+        weekly = generate_digest_messages(store, 'weekly', now=NOW)
+
+    assert len(messages) == 1
+    content = messages[0]['markdown']['content']
+    assert '今日动态摘要' in content
+    assert '**合并PR**: 8 次' in content
+    # 最近动态最多列出5条
+    assert content.count('- 合并PR #') == 5
+    assert len(weekly) == 1
+
+
+def test_summary_uses_time_index():
+    """
+    测试汇总查询使用时间索引，而不是全表扫描
+    """
+    with make_store() as store:
+        plan = store._conn.execute(
+            'EXPLAIN QUERY PLAN SELECT repo, kind, COUNT(*), SUM(commit_count) FROM events '
+            'WHERE ts >= ? AND ts < ? GROUP BY repo, kind', (0, 1)
+        ).fetchall()
+    assert any('COVERING INDEX idx_events_ts_repo_kind' in row[-1] for row in plan)
+
+
+def test_digest_send_purges_events_before_window():
+    """
+    测试发送摘要后清理早于本次窗口的事件，窗口内的事件保留
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'digest.db')
+    now = time.time()
+    with DigestStore(path) as store:
+        store.record(merged_pr('test/test-repo', 1, now - 60))
+        store.record(merged_pr('test/test-repo', 2, now - 3 * 24 * 3600))
+
+    env = {
+        'INPUT_WECHAT_WEBHOOK_URL': 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=digest-test-key',
+        'INPUT_MODE': 'digest-send',
+        'INPUT_DIGEST_DB': path,
+    }
+    with mock.patch.dict(os.environ, env), mock.patch('main.send_wechat_message', return_value=True) as send, \
+            contextlib.redirect_stdout(io.StringIO()):
+        main.main()
+    assert send.call_count == 1
+
+    with DigestStore(path) as store:
+        remaining = store._conn.execute('SELECT number FROM events').fetchall()
+    assert remaining == [(1,)]
+
+
+if __name__ == "__main__":
+    print("动态摘要测试")
+    print("=" * 50)
+    test_summarize_by_repo_and_kind()
+    test_generate_digest_messages()
+    test_summary_uses_time_index()
+    test_digest_send_purges_events_before_window()
+    print("测试完成")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证过滤表达式的编译、名称级短路与流式字段读取
+"""
+
+import contextlib
+import copy
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+import circuit_breaker
+import main
+from event_filter import EventFilter, FilterSyntaxError, compile_filter, stream_fields
+from mock_wechat_server import MockWeChatServer
+from test_event_record import EVENTS
+
+
+class CountingReader(io.BytesIO):
+    """
+    记录读取字节数的文件对象
+    """
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def pr_payload(action='opened', base='main'):
+    payload = copy.deepcopy(EVENTS['pull_request'])
+    payload['action'] = action
+    payload['pull_request']['base'] = {'ref': base}
+    payload['pull_request']['labels'] = [{'name': 'bug'}]
+    return payload
+
+
+def test_expression_semantics():
+    """
+    测试比较、in/not in、正则、逻辑运算与缺失字段
+    """
+    expression = EventFilter('pull_request.base.ref == "main" && action in ["opened", "closed"]')
+    assert expression('pull_request', pr_payload())
+    assert not expression('pull_request', pr_payload(action='edited'))
+    assert not expression('pull_request', pr_payload(base='dev'))
+    assert not expression('push', EVENTS['push'])
+
+    cases = [
+        ('!(action == "opened") || pull_request.number > 100', False),
+        ("pull_request.labels[0].name == 'bug'", True),
+        ('pull_request.labels[5].name == null', True),
+        ('action not in ["closed"] && pull_request.title =~ "^[A-Z]"', True),
+        ('pull_request.missing.deep > 3', False),
+        ('pull_request.number >= 1 && pull_request.number != 2.5', True),
+        ('pull_request.merged', False),
+        ('true && !false', True),
+    ]
+    payload = pr_payload()
+    payload['pull_request'].update({'number': 42, 'title': 'Fix bug', 'merged': False})
+    for source, expected in cases:
+        assert EventFilter(source)('pull_request', payload) is expected, source
+    assert compile_filter('  ') is None
+
+
+def test_event_name_constraints():
+    """
+    测试编译时推导事件名称集合：&& 取交集，|| 取并集，无法判断时不限制
+    """
+    assert EventFilter('event == "push" && ref == "refs/heads/main"').event_names == {'push'}
+    assert EventFilter('event in ["push", "release"] && event != "push"').event_names == {'push', 'release'}
+    assert EventFilter('event in ["push", "release"] && "release" == event').event_names == {'release'}
+    assert EventFilter('event == "push" || event == "issues"').event_names == {'push', 'issues'}
+    assert EventFilter('event == "push" || action == "opened"').event_names is None
+    assert EventFilter('!(event == "push")').event_names is None
+    assert EventFilter('(event == "push") && ref == "refs/heads/main"').event_names == {'push'}
+    assert EventFilter('(event == "push" || event == "release") && (event != "push")').event_names == \
+        {'push', 'release'}
+    assert EventFilter('((event in ["push", "issues"]))').event_names == {'push', 'issues'}
+    assert not EventFilter('event == "push" && action == "x"').accepts_event('release')
+    assert EventFilter('action == "opened"').paths == {('action',)}
+
+    for source in ('action ==', 'action = "x"', 'a.b[x] == 1', '(action == "x"', 'action in', 'a not b'):
+        try:
+            EventFilter(source)
+            raise AssertionError(source)
+        except FilterSyntaxError as e:
+            assert e.position >= 0
+
+
+def test_streaming_stops_early():
+    """
+    测试流式读取在所需字段全部出现后停止，不解析后面的大数组；未安装 ijson 时完整解析
+    """
+    payload = {'action': 'opened', 'pull_request': {'base': {'ref': 'dev'}, 'labels': [{'name': 'bug'}]}}
+    payload['commits'] = [{'message': 'x' * 200, 'id': str(index)} for index in range(20000)]
+    data = json.dumps(payload).encode('utf-8')
+    expression = EventFilter('pull_request.base.ref == "main" && pull_request.labels == [] || action == "closed"')
+    assert expression.can_stream()
+    reader = CountingReader(data)
+    assert stream_fields(reader, expression.paths) == {
+        'action': 'opened', 'pull_request': {'base': {'ref': 'dev'}, 'labels': [{'name': 'bug'}]}}
+    assert reader.bytes_read < len(data) // 10
+    assert not expression.matches_file('pull_request', CountingReader(data))
+
+    with mock.patch('event_filter.ijson', None):
+        assert not expression.can_stream()
+        assert not expression.matches_file('pull_request', CountingReader(data))
+        assert EventFilter('action == "opened"').matches_file('pull_request', CountingReader(data))
+
+
+def run_main(event_name, event_path, expression, server):
+    env = {
+        'INPUT_WECHAT_WEBHOOK_URL': server.url,
+        'INPUT_EVENT_TYPES': 'push,pull_request,release',
+        'INPUT_FILTER': expression,
+        'GITHUB_EVENT_PATH': event_path,
+        'GITHUB_EVENT_NAME': event_name,
+    }
+    with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()) as output:
+        main.main()
+    return output.getvalue()
+
+
+def test_main_filter_stage():
+    """
+    测试名称级过滤不打开事件文件，字段级过滤跳过不满足条件的事件
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    expression = 'event == "pull_request" && pull_request.base.ref == "main" && action in ["opened", "closed"]'
+    with MockWeChatServer() as server:
+        output = run_main('push', os.path.join(directory, 'missing.json'), expression, server)
+        assert '不满足过滤表达式' in output and '事件数据加载成功' not in output
+
+        for base, sent in (('dev', 0), ('main', 1)):
+            with open(event_path, 'w', encoding='utf-8') as f:
+                json.dump(pr_payload(base=base), f)
+            run_main('pull_request', event_path, expression, server)
+            assert len(server.received) == sent
+
+
+if __name__ == "__main__":
+    print("过滤表达式测试")
+    print("=" * 50)
+    test_expression_semantics()
+    test_event_name_constraints()
+    test_streaming_stops_early()
+    test_main_filter_stage()
+    print("测试完成")
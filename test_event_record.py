@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证紧凑事件记录的提取、还原、二进制序列化以及内存占用
+"""
+
+import copy
+import io
+import tracemalloc
+
+import main
+from event_record import NotificationEvent, pack_event, read_events, unpack_event, write_events
+from test_main import test_events
+
+# 补充 issues / release 事件数据
+EVENTS = dict(test_events)
+EVENTS["issues"] = {
+    "repository": test_events["push"]["repository"],
+    "issue": {
+        "title": "测试Issue标题",
+        "html_url": "https://github.com/test/test-repo/issues/2",
+        "number": 2,
+        "state": "open",
+        "user": {"login": "test-author"}
+    },
+    "action": "labeled",
+    "sender": {"login": "test-sender"}
+}
+EVENTS["release"] = {
+    "repository": test_events["push"]["repository"],
+    "release": {
+        "name": None,
+        "tag_name": "v1.0.0",
+        "html_url": "https://github.com/test/test-repo/releases/tag/v1.0.0",
+        "prerelease": True
+    },
+    "action": "published",
+    "sender": {"login": "test-sender"}
+}
+
+
+def realistic_payload(event_name):
+    """
+    模拟真实GitHub事件数据：仓库和用户对象包含大量与通知无关的字段
+    """
+    payload = copy.deepcopy(EVENTS[event_name])
+    repo = payload["repository"]
+    for index in range(90):
+        repo[f"extra_url_{index}"] = f"https://api.github.com/repos/test/test-repo/resource/{index}{{/id}}"
+    payload["sender"] = dict(payload.get("sender", {"login": "test-sender"}),
+                             **{f"field_{index}": "x" * 40 for index in range(20)})
+    return payload
+
+
+def test_rendering_matches_full_payload():
+    """
+    测试由紧凑记录还原的数据渲染出的消息与原始数据一致
+    """
+    for event_name, payload in EVENTS.items():
+        event = NotificationEvent.from_payload(event_name, payload, delivery_id='d-1', received_at=1.5)
+        generator = main.MESSAGE_GENERATORS[event_name]
+        assert generator(event.to_payload()) == generator(payload), event_name
+
+
+def test_binary_roundtrip():
+    """
+    测试二进制序列化往返一致，且文件末尾不完整的记录被忽略
+    """
+    events = [NotificationEvent.from_payload(name, payload, delivery_id=f'd-{name}')
+              for name, payload in EVENTS.items()]
+    for event in events:
+        assert unpack_event(pack_event(event)) == event
+
+    buffer = io.BytesIO()
+    assert write_events(buffer, events) == len(events)
+    # 模拟写入中断
+    buffer.write(b'\x40\x00\x00\x00NE')
+    buffer.seek(0)
+    assert list(read_events(buffer)) == events
+
+
+def test_compact_memory_usage():
+    """
+    测试紧凑记录的内存占用比完整事件数据减少90%以上
+    """
+    payloads = [realistic_payload('pull_request') for _ in range(200)]
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    full = [copy.deepcopy(payload) for payload in payloads]
+    full_size = tracemalloc.get_traced_memory()[0] - before
+    del full
+
+    before, _ = tracemalloc.get_traced_memory()
+    compact = [NotificationEvent.from_payload('pull_request', payload) for payload in payloads]
+    compact_size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    assert len(compact) == 200
+    assert compact_size < full_size * 0.1, (compact_size, full_size)
+
+
+if __name__ == "__main__":
+    print("紧凑事件记录测试")
+    print("=" * 50)
+    test_rendering_matches_full_payload()
+    test_binary_roundtrip()
+    test_compact_memory_usage()
+    print("测试完成")
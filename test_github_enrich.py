@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证GitHub API补全的条件请求缓存、GraphQL批量查询、REST退化和时间预算
+"""
+
+import contextlib
+import copy
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import circuit_breaker
+import github_enrich
+import main
+from event_record import NotificationEvent, pack_event, unpack_event
+from github_enrich import ConditionalCache, enrich_event, github_api
+from message_types import render_template_card
+from mock_wechat_server import MockWeChatServer
+from test_event_record import EVENTS
+
+REPO = 'test/test-repo'
+HEAD_SHA = 'c' * 40
+
+
+class MockGitHubServer:
+    """
+    GitHub REST / GraphQL 接口替身：REST响应带 ETag，If-None-Match 匹配时返回304且不消耗速率限制
+    """
+
+    def __init__(self, routes=None, graphql=None, latency=0.0):
+        """
+        :param routes: {路径: JSON响应}
+        :param graphql: GraphQL data，为None时返回错误
+        """
+        self.routes = routes or {}
+        self.graphql = graphql
+        self.latency = latency
+        self.received = []
+        self.remaining = 5000
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def statuses(self, method=None):
+        return [status for request_method, _, status in self.received if method in (None, request_method)]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self, status, data=None, headers=()):
+                body = b'' if data is None else json.dumps(data).encode('utf-8')
+                with server._lock:
+                    server.received.append((self.command, self.path, status))
+                    if status != 304:
+                        server.remaining -= 1
+                    remaining = server.remaining
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('X-RateLimit-Limit', '5000')
+                self.send_header('X-RateLimit-Remaining', str(remaining))
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                time.sleep(server.latency)
+                if self.path not in server.routes:
+                    return self._respond(404, {'message': 'Not Found'})
+                data = server.routes[self.path]
+                etag = '"' + hashlib.sha256(json.dumps(data).encode('utf-8')).hexdigest()[:16] + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    return self._respond(304, headers=[('ETag', etag)])
+                self._respond(200, data, [('ETag', etag)])
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                time.sleep(server.latency)
+                if server.graphql is None:
+                    return self._respond(200, {'errors': [{'message': 'GraphQL unavailable'}]})
+                self._respond(200, {'data': server.graphql})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def pull_request_payload():
+    payload = copy.deepcopy(EVENTS['pull_request'])
+    payload['pull_request'].update({
+        'head': dict(payload['pull_request']['head'], sha=HEAD_SHA),
+        'updated_at': '2026-10-19T08:00:00Z',
+        'requested_reviewers': [{'login': 'carol'}],
+    })
+    return payload
+
+
+def release_payload():
+    payload = copy.deepcopy(EVENTS['release'])
+    payload['release']['id'] = 7
+    return payload
+
+
+def graphql_data(rollup_state='SUCCESS'):
+    return {'repository': {'pullRequest': {
+        'changedFiles': 5, 'additions': 40, 'deletions': 8,
+        'reviews': {'nodes': [{'author': {'login': 'alice'}, 'state': 'APPROVED'},
+                              {'author': {'login': 'alice'}, 'state': 'COMMENTED'},
+                              {'author': {'login': 'bob'}, 'state': 'CHANGES_REQUESTED'}]},
+        'reviewRequests': {'nodes': [{'requestedReviewer': {'login': 'carol'}}]},
+        'commits': {'nodes': [{'commit': {'oid': HEAD_SHA, 'statusCheckRollup': {'state': rollup_state}}}]},
+    }}}
+
+
+ASSETS = [{'name': 'app.tar.gz', 'size': 1536 * 1024}, {'name': 'app.zip', 'size': 512 * 1024}]
+REST_ROUTES = {
+    f'/repos/{REPO}/pulls/1': {'changed_files': 2, 'additions': 3, 'deletions': 1,
+                               'requested_reviewers': [{'login': 'carol'}], 'requested_teams': []},
+    f'/repos/{REPO}/pulls/1/reviews?per_page=100': [{'user': {'login': 'alice'}, 'state': 'APPROVED'}],
+    f'/repos/{REPO}/commits/{HEAD_SHA}/check-runs?per_page=100': {
+        'check_runs': [{'status': 'completed', 'conclusion': 'success'},
+                       {'status': 'completed', 'conclusion': 'failure'}]},
+    f'/repos/{REPO}/commits/{HEAD_SHA}/status': {'state': 'success', 'statuses': []},
+    f'/repos/{REPO}/releases/7/assets?per_page=100': ASSETS,
+}
+
+
+def test_conditional_requests_survive_runs():
+    """
+    测试REST响应按URL缓存到磁盘，后续运行带 If-None-Match，304不消耗速率限制且返回缓存的数据
+    """
+    cache_path = os.path.join(tempfile.mkdtemp(), 'cache', 'github.json')
+    with MockGitHubServer(REST_ROUTES) as server:
+        for run in range(3):
+            api = github_api('token', ConditionalCache(cache_path), api_url=server.url)
+            details = enrich_event('release', release_payload(), api)
+            assert details == {'assets': 2, 'asset_size': 2048 * 1024}
+            assert (api.requests, api.not_modified) == (1, 0 if run == 0 else 1)
+        assert server.statuses() == [200, 304, 304]
+        assert server.remaining == 4999 and api.rate_limit_remaining == 4999
+
+        # 资源变化后重新下载
+        server.routes[f'/repos/{REPO}/releases/7/assets?per_page=100'] = ASSETS[:1]
+        api = github_api('token', ConditionalCache(cache_path), api_url=server.url)
+        assert enrich_event('release', release_payload(), api) == {'assets': 1, 'asset_size': 1536 * 1024}
+        assert server.statuses()[-1] == 200
+
+        # 事件数据中已有附件列表时不发起请求
+        payload = release_payload()
+        payload['release']['assets'] = ASSETS
+        assert enrich_event('release', payload, api)['assets'] == 2 and len(server.received) == 4
+
+
+def test_pull_request_batched_through_graphql():
+    """
+    测试PR的评审、评审请求和CI状态通过一次GraphQL查询获取，CI结束后按头提交缓存；GraphQL不可用时退化为REST
+    """
+    cache = ConditionalCache()
+    with MockGitHubServer(REST_ROUTES, graphql=graphql_data('PENDING')) as server:
+        api = github_api('token', cache, api_url=server.url)
+        details = enrich_event('pull_request', pull_request_payload(), api)
+        assert details == {'files': 5, 'additions': 40, 'deletions': 8, 'ci_state': 'pending',
+                           'reviewers': [{'login': 'alice', 'state': 'approved'},
+                                         {'login': 'bob', 'state': 'changes_requested'},
+                                         {'login': 'carol', 'state': 'requested'}]}
+        assert [method for method, _, _ in server.received] == ['POST'] and server.received[0][1] == '/graphql'
+
+        # CI未结束时不缓存，结束后同一头提交不再查询
+        server.graphql = graphql_data('FAILURE')
+        for _ in range(2):
+            details = enrich_event('pull_request', pull_request_payload(), api)
+            assert details['ci_state'] == 'failure'
+        assert len(server.received) == 2
+
+        # 事件数据中的变更统计优先
+        payload = pull_request_payload()
+        payload['pull_request'].update({'changed_files': 6, 'additions': 41, 'deletions': 9})
+        assert enrich_event('pull_request', payload, api)['files'] == 6
+
+        server.graphql = None
+        server.received.clear()
+        details = enrich_event('pull_request', pull_request_payload(), github_api(
+            'token', ConditionalCache(), api_url=server.url))
+        assert details == {'files': 2, 'additions': 3, 'deletions': 1, 'ci_state': 'failure',
+                           'reviewers': [{'login': 'alice', 'state': 'approved'},
+                                         {'login': 'carol', 'state': 'requested'}]}
+        assert [method for method, _, _ in server.received] == ['POST', 'GET', 'GET', 'GET', 'GET']
+
+        # 没有Token时不使用GraphQL
+        server.received.clear()
+        enrich_event('pull_request', pull_request_payload(), github_api('', ConditionalCache(), api_url=server.url))
+        assert 'POST' not in [method for method, _, _ in server.received]
+
+
+def test_unsupported_pygithub_degrades():
+    """
+    测试PyGitHub版本不受支持（缺少参数或接口）时放弃补全，不影响通知发送
+    """
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        with mock.patch('github.Github', side_effect=TypeError("unexpected keyword 'seconds_between_requests'")):
+            assert github_api('token') is None
+        assert '版本不受支持' in output.getvalue()
+
+        class OldRequester:
+            auth = object()
+            rate_limiting = (-1, -1)
+
+        api = github_enrich.GitHubApi(OldRequester())
+        assert enrich_event('pull_request', pull_request_payload(), api) is None
+        assert 'GitHub API补全失败' in output.getvalue()
+
+
+def test_budget_fallback_and_rendering():
+    """
+    测试超出时间预算时发送未补全的通知，补全结果随紧凑记录传递并显示在markdown和卡片中
+    """
+    with MockGitHubServer(REST_ROUTES, latency=1.0) as server:
+        start = time.monotonic()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            assert enrich_event('release', release_payload(), github_api('token', api_url=server.url),
+                                budget=0.2) is None
+        assert time.monotonic() - start < 0.6
+        assert '超出时间预算' in output.getvalue()
+
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(pull_request_payload(), f)
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    with MockGitHubServer(REST_ROUTES, graphql=graphql_data()) as github, MockWeChatServer() as wechat:
+        env = {
+            'INPUT_WECHAT_WEBHOOK_URL': wechat.url,
+            'INPUT_EVENT_TYPES': 'pull_request',
+            'INPUT_GITHUB_ENRICH': 'true',
+            'INPUT_GITHUB_TOKEN': 'token',
+            'INPUT_GITHUB_CACHE': os.path.join(directory, 'github.json'),
+            'INPUT_PREWARM': 'false',
+            'GITHUB_EVENT_PATH': event_path,
+            'GITHUB_EVENT_NAME': 'pull_request',
+        }
+        with mock.patch.dict(os.environ, env), mock.patch('github_enrich.GITHUB_API_URL', github.url), \
+                contextlib.redirect_stdout(io.StringIO()):
+            main.main()
+        content = json.loads(wechat.received[0][1])['markdown']['content']
+    assert '**变更**: 5 个文件（+40 / -8）' in content
+    assert '**评审**: alice(已批准)、bob(要求修改)、carol(待评审)' in content
+    assert '**CI**: <font color="info">通过</font>' in content
+
+    payload = pull_request_payload()
+    payload['github_details'] = {'files': 5, 'additions': 40, 'deletions': 8, 'ci_state': 'success',
+                                 'reviewers': [{'login': 'alice', 'state': 'approved'}]}
+    event = unpack_event(pack_event(NotificationEvent.from_payload('pull_request', payload)))
+    assert main.generate_pull_request_message(event.to_payload()) == main.generate_pull_request_message(payload)
+    fields = {item['keyname']: item['value']
+              for item in render_template_card(event)['template_card']['horizontal_content_list']}
+    assert fields['评审'] == 'alice(已批准)' and fields['CI'] == '通过'
+
+    payload = release_payload()
+    payload['github_details'] = {'assets': 2, 'asset_size': 2048 * 1024}
+    event = unpack_event(pack_event(NotificationEvent.from_payload('release', payload)))
+    assert '**附件**: 2 个，共 2.0 MB' in main.generate_release_message(event.to_payload())['markdown']['content']
+
+
+if __name__ == "__main__":
+    print("GitHub API补全测试")
+    print("=" * 50)
+    test_conditional_requests_survive_runs()
+    test_pull_request_batched_through_graphql()
+    test_unsupported_pygithub_degrades()
+    test_budget_fallback_and_rendering()
+    print("测试完成")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证GitHub到企业微信的身份映射与 <@userid> 提醒
+"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+import main
+from event_record import NotificationEvent, pack_event, unpack_event
+from identity import IdentityMap, TTLCache, resolve_mentions
+from test_event_record import EVENTS
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeGitHub:
+    """
+    模拟 PyGitHub 客户端，只提供 get_user(login).email
+    """
+
+    class User:
+        def __init__(self, email):
+            self.email = email
+
+    def __init__(self, emails):
+        self.emails = emails
+        self.calls = []
+
+    def get_user(self, login):
+        self.calls.append(login)
+        if login not in self.emails:
+            raise LookupError(f'404 {login}')
+        return self.User(self.emails[login])
+
+
+def write_mapping(name, content):
+    path = os.path.join(tempfile.mkdtemp(), name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return path
+
+
+def pr_payload():
+    payload = json.loads(json.dumps(EVENTS['pull_request']))
+    payload['pull_request']['requested_reviewers'] = [{'login': 'Reviewer-A'}, {'login': 'unknown'}]
+    payload['pull_request']['assignees'] = [{'login': 'reviewer-a'}, {'login': 'ops-bot'}]
+    return payload
+
+
+def test_mapping_file_formats():
+    """
+    测试JSON和CSV映射文件加载为大小写不敏感的索引
+    """
+    json_path = write_mapping('ids.json', json.dumps({
+        'reviewer-a': 'zhangsan',
+        'ops-bot': {'userid': 'lisi', 'email': 'lisi@example.com'},
+    }))
+    csv_path = write_mapping('ids.csv', '# github,wecom,email\nreviewer-a,zhangsan\nops-bot, lisi ,lisi@example.com\n')
+    for path in (json_path, csv_path):
+        identities = IdentityMap(path)
+        assert len(identities) == 2
+        assert identities.resolve('Reviewer-A').userid == 'zhangsan'
+        assert identities.resolve('nobody') is None
+        assert resolve_mentions('pull_request', pr_payload(), identities) == ['zhangsan', 'lisi']
+
+
+def test_lazy_lookup_is_cached():
+    """
+    测试映射文件之外的登录名通过GitHub公开邮箱匹配，结果（包括未找到）在TTL内只查询一次
+    """
+    clock = FakeClock()
+    client = FakeGitHub({'new-dev': 'Wang@Example.com', 'no-email': None})
+    identities = IdentityMap(client=client, clock=clock)
+    identities.add('someone', 'wangwu', 'wang@example.com')
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(3):
+            assert identities.resolve('new-dev').userid == 'wangwu'
+            assert identities.resolve('no-email') is None
+            assert identities.resolve('ghost') is None
+        assert client.calls == ['new-dev', 'no-email', 'ghost']
+        # 映射文件中的登录名不调用API
+        identities.resolve('someone')
+        assert len(client.calls) == 3
+        clock.now += 7 * 3600
+        identities.resolve('new-dev')
+        assert client.calls[-1] == 'new-dev'
+
+
+def test_ttl_cache_eviction():
+    """
+    测试缓存按最近使用淘汰并按TTL过期
+    """
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, ttl_seconds=10, clock=clock)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert 'b' not in cache and cache.get('a') == 1
+    clock.now += 10
+    assert cache.get('a') is None and len(cache) <= 2
+
+
+def test_mentions_rendered_and_preserved():
+    """
+    测试提醒行出现在markdown消息中，且经过紧凑记录往返后保持一致；无提醒时输出不变
+    """
+    identities = IdentityMap()
+    identities.add('reviewer-a', 'zhangsan')
+    payload = pr_payload()
+    before = main.generate_pull_request_message(payload)
+    payload['wecom_mentions'] = resolve_mentions('pull_request', payload, identities)
+    content = main.generate_pull_request_message(payload)['markdown']['content']
+    assert '**提醒**: <@zhangsan>' in content
+    assert main.generate_pull_request_message(EVENTS['pull_request']) == before
+
+    event = unpack_event(pack_event(NotificationEvent.from_payload('pull_request', payload)))
+    assert event.mentions == 'zhangsan'
+    assert main.generate_pull_request_message(event.to_payload())['markdown']['content'] == content
+
+
+if __name__ == "__main__":
+    print("身份映射测试")
+    print("=" * 50)
+    test_mapping_file_formats()
+    test_lazy_lookup_is_cached()
+    test_ttl_cache_eviction()
+    test_mentions_rendered_and_preserved()
+    print("测试完成")
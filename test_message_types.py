@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证模版卡片/图文消息渲染以及附件上传的 media_id 缓存
+"""
+
+import os
+import tempfile
+
+import main
+from event_record import NotificationEvent
+from message_types import (MEDIA_TTL_SECONDS, MediaCache, build_attachment_message, render_news,
+                           render_template_card, upload_media, upload_url)
+from mock_wechat_server import MockWeChatServer
+from test_event_record import EVENTS
+
+
+def test_template_card_packs_fields():
+    """
+    测试模版卡片包含标题、字段和跳转链接，且字段数不超过6个
+    """
+    for event_name, payload in EVENTS.items():
+        message = render_template_card(NotificationEvent.from_payload(event_name, payload))
+        card = message['template_card']
+        assert message['msgtype'] == 'template_card'
+        assert card['card_type'] == 'text_notice'
+        assert card['main_title']['title']
+        assert 0 < len(card['horizontal_content_list']) <= 6
+        assert card['card_action']['url'].startswith('https://github.com/')
+
+    pr_card = render_template_card(NotificationEvent.from_payload('pull_request', EVENTS['pull_request']))
+    assert pr_card['template_card']['main_title']['title'] == 'PR #1 测试PR标题'
+
+
+def test_news_article():
+    """
+    测试图文消息
+    """
+    message = render_news(NotificationEvent.from_payload('release', EVENTS['release']))
+    article = message['news']['articles'][0]
+    assert article['title'] == 'Release v1.0.0'
+    assert article['url'] == EVENTS['release']['release']['html_url']
+
+
+def test_render_message_by_type():
+    """
+    测试不同消息类型分别缓存
+    """
+    main.render_cache.clear()
+    markdown = main.render_message('issues', EVENTS['issues'])
+    card = main.render_message('issues', EVENTS['issues'], msgtype='template_card')
+    assert markdown.message['msgtype'] == 'markdown'
+    assert card.message['msgtype'] == 'template_card'
+    assert main.render_message('issues', EVENTS['issues'], msgtype='template_card') is card
+    try:
+        main.render_message('issues', EVENTS['issues'], msgtype='voice')
+        assert False, '应拒绝不支持的消息类型'
+    except ValueError:
+        pass
+
+
+def test_upload_url():
+    url = upload_url('https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=abc')
+    assert url == 'https://qyapi.weixin.qq.com/cgi-bin/webhook/upload_media?key=abc&type=file'
+
+
+def test_upload_is_cached_by_content():
+    """
+    测试相同内容只上传一次，缓存持久化到文件，过期后重新上传
+    """
+    directory = tempfile.mkdtemp()
+    attachment = os.path.join(directory, 'report.log')
+    with open(attachment, 'wb') as f:
+        f.write(b'build log' * 100)
+    cache_path = os.path.join(directory, 'media.json')
+    now = [1_000_000.0]
+
+    with MockWeChatServer() as server:
+        cache = MediaCache(cache_path, clock=lambda: now[0])
+        first = upload_media(server.url, attachment, cache)
+        # 重新加载缓存文件，模拟下一次运行
+        cache = MediaCache(cache_path, clock=lambda: now[0])
+        message = build_attachment_message(server.url, attachment, cache)
+        assert message == {'msgtype': 'file', 'file': {'media_id': first}}
+        assert len(server.received) == 1
+        assert '/upload_media' in server.received[0][0]
+
+        now[0] += MEDIA_TTL_SECONDS + 1
+        assert upload_media(server.url, attachment, cache) != first
+        assert len(server.received) == 2
+
+
+def test_image_attachment_uses_base64():
+    """
+    测试小图片直接使用图片消息，无需上传
+    """
+    attachment = os.path.join(tempfile.mkdtemp(), 'chart.png')
+    with open(attachment, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + b'0' * 64)
+    message = build_attachment_message('https://example.invalid/send?key=img', attachment)
+    assert message['msgtype'] == 'image'
+    assert len(message['image']['md5']) == 32
+
+
+if __name__ == "__main__":
+    print("消息类型测试")
+    print("=" * 50)
+    test_template_card_packs_fields()
+    test_news_article()
+    test_render_message_by_type()
+    test_upload_url()
+    test_upload_is_cached_by_content()
+    test_image_attachment_uses_base64()
+    print("测试完成")
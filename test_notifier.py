@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证 Notifier 库接口（不依赖环境变量和子进程）
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+
+import circuit_breaker
+import main
+from mock_wechat_server import MockWeChatServer
+from notifier import (ConfigurationError, DeliveryError, Notifier, UnsupportedEventError)
+from test_event_record import EVENTS
+
+
+def test_configuration_errors():
+    """
+    测试配置错误通过异常报告，而不是退出进程
+    """
+    for kwargs in ({'webhook_urls': []}, {'webhook_urls': 'http://x', 'msgtype': 'voice'},
+                   {'webhook_urls': 'http://x', 'event_types': ['push', 'deployment']}):
+        try:
+            Notifier(**kwargs)
+            assert False, f'应抛出 ConfigurationError: {kwargs}'
+        except ConfigurationError:
+            pass
+
+
+def test_send_reuses_session_and_filters():
+    """
+    测试同步发送返回结构化结果，过滤事件不发送，不支持的事件抛出异常
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    with MockWeChatServer() as server, Notifier(server.url, event_types=['push', 'release']) as notifier, \
+            contextlib.redirect_stdout(io.StringIO()):
+        result = notifier.send('push', EVENTS['push'], delivery_id='lib-1')
+        filtered = notifier.send('issues', EVENTS['issues'])
+        for _ in range(3):
+            notifier.send('release', EVENTS['release'])
+        try:
+            Notifier(server.url).render('deployment', {})
+            assert False, '不支持的事件应抛出 UnsupportedEventError'
+        except UnsupportedEventError:
+            pass
+        assert len(server.received) == 4
+
+    assert result.success and not result.filtered
+    assert result.deliveries[server.url].status_code == 200
+    assert filtered.filtered and filtered.success and not filtered.deliveries
+    assert json.loads(server.received[0][1])['msgtype'] == 'markdown'
+
+
+def test_idempotency_and_raise_on_failure():
+    """
+    测试同一投递ID不会重复发送，以及 raise_on_failure 抛出带完整结果的 DeliveryError
+    """
+    circuit_breaker.reset_breakers()
+    db_path = os.path.join(tempfile.mkdtemp(), 'receipts.db')
+    with MockWeChatServer() as server, contextlib.redirect_stdout(io.StringIO()):
+        with Notifier([server.url], idempotency_db=db_path) as notifier:
+            notifier.send('issues', EVENTS['issues'], delivery_id='lib-2')
+            second = notifier.send('issues', EVENTS['issues'], delivery_id='lib-2')
+        assert len(server.received) == 1
+        assert second.deliveries[server.url].skipped
+
+    with MockWeChatServer(errcode=40008) as server, contextlib.redirect_stdout(io.StringIO()):
+        with Notifier(server.url, raise_on_failure=True) as notifier:
+            try:
+                notifier.send('release', EVENTS['release'])
+                assert False, '发送失败应抛出 DeliveryError'
+            except DeliveryError as e:
+                assert e.result.deliveries[server.url].errcode == 40008
+
+
+def test_send_async():
+    """
+    测试异步发送并发投递到多个目标
+    """
+    circuit_breaker.reset_breakers()
+
+    async def scenario(urls):
+        async with Notifier(urls, msgtype='template_card') as notifier:
+            return await notifier.send_async('pull_request', EVENTS['pull_request'], delivery_id='lib-3')
+
+    with MockWeChatServer() as server, contextlib.redirect_stdout(io.StringIO()):
+        urls = [server.url, server.url.replace('key=mock', 'key=other')]
+        result = asyncio.run(scenario(urls))
+        assert len(server.received) == 2
+    assert result.success
+    assert set(result.deliveries) == set(urls)
+    assert json.loads(server.received[0][1])['msgtype'] == 'template_card'
+
+
+if __name__ == "__main__":
+    print("通知库接口测试")
+    print("=" * 50)
+    test_configuration_errors()
+    test_send_reuses_session_and_filters()
+    test_idempotency_and_raise_on_failure()
+    test_send_async()
+    print("测试完成")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证连接预热与解析并行、DNS缓存以及TLS会话恢复
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+import aiohttp
+
+import circuit_breaker
+import main
+from event_record import NotificationEvent
+from mock_wechat_server import MockWeChatServer, self_signed_context
+from prewarm import (ConnectionPrewarmer, DnsCache, create_connector, create_ssl_context, pooled_session,
+                     webhook_origins)
+from test_event_record import EVENTS
+
+
+def test_prewarm_reuses_connection():
+    """
+    测试预热连接在发送时复用：建立连接的延迟与解析重叠，发送阶段不再新建连接
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    with MockWeChatServer(connect_latency=0.2) as server:
+        assert webhook_origins([server.url, server.url + '2']) == [server.url.split('/cgi-bin')[0]]
+        event = NotificationEvent.from_payload('release', EVENTS['release'], delivery_id='prewarm-1')
+        with ConnectionPrewarmer([server.url]) as prewarmer, contextlib.redirect_stdout(io.StringIO()):
+            # 模拟解析与渲染耗时，期间后台完成握手
+            time.sleep(0.3)
+            start = time.monotonic()
+            results = prewarmer.run(main.notify_all, event, [server.url])
+            elapsed = time.monotonic() - start
+        assert results[0].success and elapsed < 0.15
+        assert server.connections == 1 and len(server.received) == 1
+        assert not isinstance(prewarmer.warmed[webhook_origins([server.url])[0]], Exception)
+
+
+def test_prewarm_failure_does_not_block_send():
+    """
+    测试预热失败（主机不可达）时发送照常进行并报告错误
+    """
+    circuit_breaker.reset_breakers()
+    url = 'http://127.0.0.1:9/cgi-bin/webhook/send?key=closed'
+    event = NotificationEvent.from_payload('release', EVENTS['release'], delivery_id='prewarm-2')
+    with ConnectionPrewarmer([url], timeout=1) as prewarmer, contextlib.redirect_stdout(io.StringIO()):
+        results = prewarmer.run(main.notify_all, event, [url])
+    assert not results[0].success
+    assert isinstance(prewarmer.warmed['http://127.0.0.1:9'], Exception)
+
+    # 预热准备失败（如CA证书包无效）时改用临时会话发送
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    with MockWeChatServer() as server:
+        with mock.patch('prewarm.create_connector', side_effect=OSError('bad CA bundle')), \
+                ConnectionPrewarmer([server.url], timeout=1) as prewarmer, contextlib.redirect_stdout(io.StringIO()):
+            results = prewarmer.run(main.notify_all, event, [server.url])
+        assert results[0].success and len(server.received) == 1
+        assert prewarmer.session is None and isinstance(prewarmer.warmed[server.url.split('/cgi-bin')[0]], OSError)
+
+
+def test_dns_cache():
+    """
+    测试DNS缓存命中、过期与连接失败后失效，requests 会话通过缓存建立连接
+    """
+    now = [0.0]
+    cache = DnsCache(ttl=10, clock=lambda: now[0])
+    assert cache.lookup('127.0.0.1', 80) == '127.0.0.1' and cache.misses == 0
+    assert cache.lookup('localhost', 80) in ('127.0.0.1', '::1')
+    cache.lookup('localhost', 80)
+    assert (cache.hits, cache.misses) == (1, 1)
+    now[0] = 11
+    cache.lookup('localhost', 80)
+    assert cache.misses == 2
+    cache.invalidate('localhost')
+    cache.lookup('localhost', 80)
+    assert cache.misses == 3
+
+    with MockWeChatServer() as server:
+        url = server.url.replace('127.0.0.1', 'localhost')
+        cache = DnsCache()
+        for _ in range(3):
+            with pooled_session(dns_cache=cache) as session:
+                assert session.post(url, json={'msgtype': 'text'}).status_code == 200
+        assert (cache.hits, cache.misses) == (2, 1) and server.connections == 3
+
+
+def test_tls_session_resumption():
+    """
+    测试 requests 与 aiohttp 的新连接恢复同一主机的TLS会话
+    """
+    tls = self_signed_context(tempfile.mkdtemp())
+    if tls is None:
+        print('未安装 openssl，跳过TLS会话恢复测试')
+        return
+    server_context, cert = tls
+    context = create_ssl_context(cert)
+    with MockWeChatServer(ssl_context=server_context) as server:
+        assert server.url.startswith('https://')
+        for _ in range(3):
+            with pooled_session(ssl_context=context) as session:
+                assert session.post(server.url, json={'msgtype': 'text'}).json()['errcode'] == 0
+        assert (context.handshakes, context.resumed) == (3, 2)
+
+        async def scenario():
+            for _ in range(2):
+                async with aiohttp.ClientSession(connector=create_connector(context)) as session:
+                    async with session.post(server.url, json={'msgtype': 'text'}) as response:
+                        assert response.status == 200
+        asyncio.run(scenario())
+        assert (context.handshakes, context.resumed) == (5, 4) and server.connections == 5
+
+
+def test_main_prewarm_input():
+    """
+    测试Action默认预热连接，prewarm=false 时在发送阶段建立连接
+    """
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS['release'], f)
+    for prewarm, expected in (('true', '连接预热完成'), ('false', None)):
+        circuit_breaker.reset_breakers()
+        main.render_cache.clear()
+        with MockWeChatServer() as server:
+            env = {
+                'INPUT_WECHAT_WEBHOOK_URL': server.url,
+                'INPUT_EVENT_TYPES': 'release',
+                'INPUT_PREWARM': prewarm,
+                'GITHUB_EVENT_PATH': event_path,
+                'GITHUB_EVENT_NAME': 'release',
+            }
+            with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()) as output:
+                main.main()
+            assert len(server.received) == 1 and server.connections == 1
+            assert (expected in output.getvalue()) if expected else '连接预热' not in output.getvalue()
+
+
+if __name__ == "__main__":
+    print("连接预热测试")
+    print("=" * 50)
+    test_prewarm_reuses_connection()
+    test_prewarm_failure_does_not_block_send()
+    test_dns_cache()
+    test_tls_session_resumption()
+    test_main_prewarm_input()
+    print("测试完成")
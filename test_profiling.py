@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证剖析开关输出 cProfile、tracemalloc 与折叠栈文件
+"""
+
+import contextlib
+import io
+import json
+import os
+import pstats
+import tempfile
+import time
+from unittest import mock
+
+import circuit_breaker
+import main
+import profiling
+from mock_wechat_server import MockWeChatServer
+from test_event_record import EVENTS
+
+
+def test_stages_are_folded_self_time():
+    """
+    测试嵌套阶段输出为折叠栈，父阶段只计自身耗时
+    """
+    profiler = profiling.Profiler(tempfile.mkdtemp(), memory=False)
+    with profiler.stage('run'):
+        time.sleep(0.01)
+        with profiler.stage('render'):
+            time.sleep(0.02)
+    lines = dict(line.rsplit(' ', 1) for line in profiler.folded_stacks().splitlines())
+    assert set(lines) == {'run', 'run;render'}
+    assert int(lines['run;render']) >= 20000
+    assert 10000 <= int(lines['run']) < 20000
+
+
+def test_sampling():
+    """
+    测试常驻服务模式下只有抽样的工作单元启用 cProfile
+    """
+    profiler = profiling.Profiler(tempfile.mkdtemp(), sample_rate=0.1, memory=False, seed=7)
+    sampled = 0
+    for _ in range(200):
+        with profiler.profile('request') as active:
+            sampled += active
+            sum(range(100))
+    assert profiler.total == 200 and profiler.sampled == sampled
+    assert 5 <= sampled <= 40
+    paths = profiler.dump()
+    assert {os.path.basename(path) for path in paths} == {'stages.folded', 'cprofile.prof', 'cprofile.txt'}
+    assert pstats.Stats(os.path.join(profiler.output_dir, 'cprofile.prof')).total_calls > 0
+    # 未启用进程级剖析时为空上下文
+    with profiling.stage('noop'), profiling.profile() as active:
+        assert active is False
+
+
+def test_main_profile_switch():
+    """
+    测试命令行入口开启剖析后写出全部结果文件
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS['release'], f)
+    profile_dir = os.path.join(directory, 'profile')
+    with MockWeChatServer() as server:
+        env = {
+            'INPUT_WECHAT_WEBHOOK_URL': server.url,
+            'INPUT_EVENT_TYPES': 'release',
+            'INPUT_PROFILE': 'true',
+            'INPUT_PROFILE_DIR': profile_dir,
+            'GITHUB_EVENT_PATH': event_path,
+            'GITHUB_EVENT_NAME': 'release',
+        }
+        with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()):
+            main.main()
+        assert len(server.received) == 1
+    assert profiling.get_profiler() is None
+    assert sorted(os.listdir(profile_dir)) == ['cprofile.prof', 'cprofile.txt', 'stages.folded', 'tracemalloc.txt']
+    with open(os.path.join(profile_dir, 'stages.folded'), encoding='utf-8') as f:
+        stages = {line.rsplit(' ', 1)[0] for line in f}
+    assert {'main', 'main;load_event', 'main;render', 'main;deliver'} <= stages
+
+
+if __name__ == "__main__":
+    print("剖析开关测试")
+    print("=" * 50)
+    test_stages_are_folded_self_time()
+    test_sampling()
+    test_main_profile_switch()
+    print("测试完成")
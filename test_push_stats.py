@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证push事件提交数与变更统计的补全和缓存
+"""
+
+import contextlib
+import copy
+import io
+import os
+import subprocess
+import tempfile
+from unittest import mock
+
+import main
+import push_stats
+from event_record import NotificationEvent, pack_event, unpack_event
+from push_stats import PushStats, PushStatsCache, enrich_push
+from test_event_record import EVENTS
+
+
+def git(directory, *args):
+    return subprocess.run(['git', '-C', directory, *args], capture_output=True, text=True, check=True).stdout.strip()
+
+
+def make_repo(commit_count):
+    """
+    创建本地仓库，返回 (路径, before, after)
+    """
+    directory = tempfile.mkdtemp()
+    git(directory, 'init', '-q')
+    git(directory, 'config', 'user.email', 'test@example.com')
+    git(directory, 'config', 'user.name', 'test')
+    with open(os.path.join(directory, 'README.md'), 'w') as f:
+        f.write('init\n')
+    git(directory, 'add', '.')
+    git(directory, 'commit', '-q', '-m', 'init')
+    before = git(directory, 'rev-parse', 'HEAD')
+    for index in range(commit_count):
+        with open(os.path.join(directory, f'file_{index % 3}.txt'), 'a') as f:
+            f.write(f'line {index}\n')
+        git(directory, 'add', '.')
+        git(directory, 'commit', '-q', '-m', f'commit {index}')
+    return directory, before, git(directory, 'rev-parse', 'HEAD')
+
+
+def truncated_push(before, after, size=25):
+    """
+    模拟提交列表被截断为20条的push事件
+    """
+    payload = copy.deepcopy(EVENTS['push'])
+    payload['commits'] = payload['commits'] * 20
+    payload.update({'before': before, 'after': after, 'size': size})
+    return payload
+
+
+def test_git_stats_and_memoization():
+    """
+    测试使用本地git计算准确统计，且相同 (仓库, before, after) 只计算一次
+    """
+    directory, before, after = make_repo(25)
+    payload = truncated_push(before, after)
+    cache_path = os.path.join(tempfile.mkdtemp(), 'push_stats.json')
+    cache = PushStatsCache(cache_path)
+    with mock.patch('push_stats.git_push_stats', wraps=push_stats.git_push_stats) as git_stats:
+        stats = enrich_push(payload, cache=cache, git_dir=directory)
+        assert enrich_push(payload, cache=cache, git_dir=directory) == stats
+        # 后续运行从缓存文件读取
+        assert enrich_push(payload, cache=PushStatsCache(cache_path), git_dir=directory) == stats
+        assert git_stats.call_count == 1
+    assert (stats.commits, stats.files, stats.additions, stats.deletions, stats.source) == (25, 3, 25, 0, 'git')
+
+
+def test_fallbacks():
+    """
+    测试git不可用时使用compare API，新建分支或无法计算时退化为事件中的 size
+    """
+    payload = truncated_push('a' * 40, 'b' * 40, size=42)
+    response = mock.Mock(status_code=200)
+    response.json.return_value = {'total_commits': 42, 'files': [{'additions': 3, 'deletions': 1}] * 7}
+    session = mock.Mock()
+    session.get.return_value = response
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = enrich_push(payload, git_dir=tempfile.mkdtemp(), token='t', session=session)
+        assert (stats.commits, stats.files, stats.additions, stats.deletions, stats.source) == (42, 7, 21, 7, 'api')
+        assert session.get.call_args.args[0].endswith(f'/repos/test/test-repo/compare/{"a" * 40}...{"b" * 40}')
+
+        assert enrich_push(payload, git_dir=tempfile.mkdtemp()) == PushStats(42)
+    assert enrich_push(truncated_push(push_stats.ZERO_SHA, 'b' * 40, size=30)) == PushStats(30)
+    assert enrich_push(EVENTS['push']) == PushStats(1)
+
+
+def test_message_uses_accurate_count():
+    """
+    测试推送通知使用准确的提交数，并在紧凑记录往返后保持一致（不再以占位提交补齐数量）
+    """
+    payload = truncated_push('a' * 40, 'b' * 40)
+    content = main.generate_push_message(payload)['markdown']['content']
+    assert '**提交数**: 25 个' in content
+
+    payload['push_stats'] = PushStats(25, 3, 40, 2, 'git').to_dict()
+    content = main.generate_push_message(payload)['markdown']['content']
+    assert '**变更**: 3 个文件（+40 / -2）' in content
+
+    event = unpack_event(pack_event(NotificationEvent.from_payload('push', payload)))
+    assert event.commit_count == 25
+    restored = event.to_payload()
+    assert len(restored['commits']) == 1
+    assert main.generate_push_message(restored)['markdown']['content'] == content
+
+
+if __name__ == "__main__":
+    print("推送统计测试")
+    print("=" * 50)
+    test_git_stats_and_memoization()
+    test_fallbacks()
+    test_message_uses_accurate_count()
+    print("测试完成")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证中继服务的有界队列、低优先级丢弃、503/Retry-After与队列指标
+"""
+
+import hashlib
+import hmac
+import json
+import time
+from unittest import mock
+
+import requests
+
+import circuit_breaker
+import main
+from mock_wechat_server import MockWeChatServer
+from event_record import NotificationEvent
+from relay import ACCEPTED, REJECTED, SHED, DeliveryQueue, RateLimiter, Relay
+from test_event_record import EVENTS
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def post_event(relay, event_name, delivery_id, secret=None):
+    body = json.dumps(EVENTS[event_name]).encode('utf-8')
+    headers = {'X-GitHub-Event': event_name, 'X-GitHub-Delivery': delivery_id, 'Content-Type': 'application/json'}
+    if secret:
+        headers['X-Hub-Signature-256'] = 'sha256=' + hmac.new(secret, body, hashlib.sha256).hexdigest()
+    return requests.post(relay.url + '/webhook', data=body, headers=headers, timeout=5)
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError('等待超时')
+        time.sleep(0.01)
+
+
+def test_queue_watermarks():
+    """
+    测试达到高水位后丢弃低优先级事件，回落到低水位后恢复，队列满时拒绝所有事件
+    """
+    queue = DeliveryQueue(max_size=4, high_watermark=2, low_watermark=1)
+    assert [queue.offer(n, low_priority=True) for n in range(3)] == [ACCEPTED, ACCEPTED, SHED]
+    assert queue.shedding
+    assert queue.offer('a') == ACCEPTED and queue.offer('b') == ACCEPTED
+    assert queue.offer('c') == REJECTED
+    # 高优先级先出队
+    assert [queue.get(0), queue.get(0)] == ['a', 'b']
+    assert queue.shedding and queue.offer(9, low_priority=True) == SHED
+    assert queue.get(0) == 0
+    assert not queue.shedding and queue.offer(9, low_priority=True) == ACCEPTED
+    assert queue.get(0) == 1 and queue.get(0) == 9 and queue.get(0) is None
+
+
+def test_rate_limiter_window():
+    """
+    测试任意60秒内最多发送 limit 条
+    """
+    clock = FakeClock()
+    limiter = RateLimiter(limit=3, period=60, clock=clock)
+    for _ in range(3):
+        assert limiter.acquire()
+    assert limiter.wait_time() == 60
+    clock.now = 59.5
+    assert limiter.wait_time() == 0.5
+    clock.now = 60
+    assert limiter.wait_time() == 0 and limiter.acquire()
+
+
+def test_relay_backpressure():
+    """
+    测试发送缓慢时中继丢弃低优先级事件、返回503与Retry-After，并通过 /metrics 暴露队列占用
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    with MockWeChatServer(latency=0.5) as server:
+        with Relay(server.url, max_queue=3, high_watermark=2, low_watermark=1, rate_per_minute=600) as relay:
+            assert post_event(relay, 'release', 'd-0').json()['outcome'] == ACCEPTED
+            # 第一个事件已被发送线程取走，正在发送
+            wait_until(lambda: len(relay.robots[0].queue) == 0)
+            assert [post_event(relay, 'push', f'd-{n}').json()['outcome'] for n in (1, 2, 3)] == \
+                [ACCEPTED, ACCEPTED, SHED]
+            assert post_event(relay, 'release', 'd-4').json()['outcome'] == ACCEPTED
+            response = post_event(relay, 'release', 'd-5')
+            assert response.status_code == 503
+            assert 1 <= int(response.headers['Retry-After']) <= 300
+
+            metrics = requests.get(relay.url + '/metrics', timeout=5).text
+            label = relay.robots[0].label
+            assert 'key=mock' not in metrics
+            assert f'wechat_relay_queue_depth{{robot="{label}",priority="high"}} 1' in metrics
+            assert f'wechat_relay_queue_depth{{robot="{label}",priority="low"}} 2' in metrics
+            assert f'wechat_relay_shedding{{robot="{label}"}} 1' in metrics
+            assert 'wechat_relay_events_total{outcome="shed"} 1' in metrics
+            assert 'wechat_relay_events_total{outcome="rejected"} 1' in metrics
+
+            wait_until(lambda: len(server.received) == 4)
+            wait_until(lambda: relay.robots[0].deliveries['success'] == 4)
+            assert not relay.robots[0].queue.shedding
+    # 高优先级事件先于更早入队的低优先级事件发送
+    contents = [json.loads(body)['markdown']['content'] for _, body in server.received]
+    assert ['Release' in content for content in contents] == [True, True, False, False]
+
+
+def test_relay_signature_and_filters():
+    """
+    测试配置密钥后校验签名，不支持或未配置的事件类型直接忽略
+    """
+    with MockWeChatServer() as server:
+        with Relay(server.url, event_types=['release'], secret='s3cret') as relay:
+            assert post_event(relay, 'release', 'sig-0').status_code == 401
+            assert post_event(relay, 'push', 'sig-1', secret=b's3cret').json()['outcome'] == 'ignored'
+            assert post_event(relay, 'release', 'sig-2', secret=b's3cret').status_code == 202
+            wait_until(lambda: len(server.received) == 1)
+
+
+def test_relay_rejects_without_partial_enqueue():
+    """
+    测试任一机器人队列已满时整个事件都不入队，部分机器人已接收的投递重新投递时只放入其余机器人
+    """
+    relay = Relay(['https://example.invalid/send?key=a', 'https://example.invalid/send?key=b'], max_queue=1)
+    try:
+        first, second = relay.robots
+        second.queue.offer('busy')
+        event = NotificationEvent.from_payload('release', EVENTS['release'], delivery_id='p-1')
+        assert relay.submit(event) == REJECTED
+        assert len(first.queue) == 0 and len(second.queue) == 1
+
+        # 集群中所属节点拒绝了第二个机器人，重新投递时第一个机器人不再入队
+        second.queue.drain()
+        with mock.patch.object(relay, '_route', return_value={first.label: ACCEPTED, second.label: REJECTED}):
+            assert relay.submit(event) == REJECTED
+        with mock.patch.object(relay, '_route', wraps=relay._route) as route:
+            assert relay.submit(event) == ACCEPTED
+        assert route.call_args.args[2] == [second]
+        assert len(second.queue) == 1 and 'p-1' not in relay._partial
+    finally:
+        relay._server.server_close()
+        relay._session.close()
+
+
+def test_relay_limits_concurrent_ingest():
+    """
+    测试同时读取请求体的请求数达到上限时返回503，而不是继续缓冲请求体
+    """
+    with MockWeChatServer() as server:
+        with Relay(server.url, max_ingest=1) as relay:
+            assert relay._ingest_slots.acquire(blocking=False)
+            try:
+                response = post_event(relay, 'release', 'slot-0')
+                assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+            finally:
+                relay._ingest_slots.release()
+            assert post_event(relay, 'release', 'slot-1').status_code == 202
+            wait_until(lambda: len(server.received) == 1)
+
+
+if __name__ == "__main__":
+    print("中继服务测试")
+    print("=" * 50)
+    test_queue_watermarks()
+    test_rate_limiter_window()
+    test_relay_backpressure()
+    test_relay_signature_and_filters()
+    test_relay_rejects_without_partial_enqueue()
+    test_relay_limits_concurrent_ingest()
+    print("测试完成")
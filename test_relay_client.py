@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证Action交接模式通过HTTP或缓冲目录把事件交给中继，以及中继不可用时的直接发送
+"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+import requests
+
+import circuit_breaker
+import main
+from event_record import NotificationEvent
+from mock_wechat_server import MockWeChatServer
+from relay import ACCEPTED, REJECTED, Relay
+from relay_client import HandoffError, drain_spool, spool_event, submit_event
+from test_event_record import EVENTS
+from test_relay import wait_until
+
+
+def run_action(inputs, event_name='release'):
+    """
+    以给定输入运行一次 main()
+    :return: (main 耗时, 输出)
+    """
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS[event_name], f)
+    env = {f'INPUT_{name.upper()}': value for name, value in inputs.items()}
+    env.update({'INPUT_EVENT_TYPES': event_name, 'INPUT_PREWARM': 'false', 'GITHUB_EVENT_PATH': event_path,
+                'GITHUB_EVENT_NAME': event_name})
+    start = time.monotonic()
+    with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()) as output:
+        main.main()
+    return time.monotonic() - start, output.getvalue()
+
+
+def test_handoff_over_http_returns_before_delivery():
+    """
+    测试交接模式只提交一次紧凑记录，不等待企业微信往返，由中继完成发送
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    with MockWeChatServer(latency=0.5) as server:
+        relay = Relay([server.url], rate_per_minute=600, secret='s3cret').start()
+        try:
+            elapsed, output = run_action({'mode': 'relay', 'relay_url': relay.url, 'relay_secret': 's3cret',
+                                          'delivery_id': 'handoff-1'})
+            assert '已提交到中继，结果: accepted' in output
+            assert elapsed < 0.4 and not server.received
+            wait_until(lambda: len(server.received) == 1)
+            assert relay.events[ACCEPTED] == 1
+
+            # 密钥不一致时中继拒绝，未配置Webhook时运行失败
+            with mock.patch.dict(os.environ, {'INPUT_RELAY_SECRET': 'wrong'}), \
+                    contextlib.suppress(SystemExit):
+                run_action({'mode': 'relay', 'relay_url': relay.url, 'delivery_id': 'handoff-2'})
+            assert relay.events[ACCEPTED] == 1
+        finally:
+            relay.stop(drain_timeout=1)
+
+
+def test_handoff_spool_directory():
+    """
+    测试交接模式写入缓冲目录，中继扫描后入队发送并删除文件；队列已满时文件保留
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    spool_dir = os.path.join(tempfile.mkdtemp(), 'spool')
+    with MockWeChatServer() as server:
+        _, output = run_action({'mode': 'relay', 'relay_spool_dir': spool_dir, 'delivery_id': 'spool-1'})
+        assert '已写入中继缓冲目录' in output
+        assert [name.endswith('.event') for name in os.listdir(spool_dir)] == [True]
+
+        relay = Relay([server.url], rate_per_minute=600, spool_dir=spool_dir).start()
+        try:
+            wait_until(lambda: len(server.received) == 1)
+            wait_until(lambda: not os.listdir(spool_dir))
+        finally:
+            relay.stop(drain_timeout=1)
+
+    event = NotificationEvent.from_payload('release', EVENTS['release'], delivery_id='spool-2')
+    for index in range(3):
+        spool_event(spool_dir, event)
+    with open(os.path.join(spool_dir, '0-broken.event'), 'wb') as f:
+        f.write(b'not a record')
+    outcomes = iter([ACCEPTED, REJECTED])
+    received = []
+    assert drain_spool(spool_dir, lambda event: received.append(event) or next(outcomes)) == 1
+    assert received == [event, event]
+    assert sorted(name.rsplit('.', 1)[1] for name in os.listdir(spool_dir)) == ['event', 'event', 'invalid']
+
+
+def test_handoff_falls_back_to_direct_send():
+    """
+    测试中继不可用时改为直接发送；中继与Webhook都不可用时运行失败
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    closed = 'http://127.0.0.1:9'
+    event = NotificationEvent.from_payload('release', EVENTS['release'], delivery_id='fallback-0')
+    try:
+        submit_event(closed, event, timeout=1)
+        raise AssertionError('应抛出 HandoffError')
+    except HandoffError as e:
+        assert '提交到中继失败' in str(e) and not e.uncertain
+
+    with MockWeChatServer() as server:
+        _, output = run_action({'mode': 'relay', 'relay_url': closed, 'wechat_webhook_url': server.url,
+                                'delivery_id': 'fallback-1'})
+        assert '中继不可用，改为直接发送' in output and len(server.received) == 1
+
+    with mock.patch.dict(os.environ, {'INPUT_WECHAT_WEBHOOK_URL': ''}):
+        for inputs in ({'mode': 'relay', 'relay_url': closed}, {'mode': 'relay'}):
+            try:
+                run_action(dict(inputs, delivery_id='fallback-2'))
+                raise AssertionError('应以退出码1结束')
+            except SystemExit as e:
+                assert e.code == 1
+
+
+def test_handoff_does_not_fall_back_when_relay_may_have_accepted():
+    """
+    测试读取超时或部分机器人已入队时不改为直接发送，配置幂等存储后才回退；队列已满且未入队时可以回退
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    event = NotificationEvent.from_payload('release', EVENTS['release'], delivery_id='uncertain-0')
+    session = mock.Mock()
+    partial = mock.Mock(status_code=503)
+    partial.json.return_value = {'outcome': REJECTED, 'partial': True}
+    for side_effect, uncertain in ((requests.exceptions.ReadTimeout('read timed out'), True), (None, True)):
+        session.post.side_effect = side_effect
+        session.post.return_value = partial
+        try:
+            submit_event('http://relay.invalid', event, session=session)
+            raise AssertionError('应抛出 HandoffError')
+        except HandoffError as e:
+            assert e.uncertain is uncertain
+
+    # 整个事件都未入队的拒绝可以安全回退
+    with MockWeChatServer() as server:
+        with Relay(server.url, max_queue=1, rate_per_minute=1) as relay:
+            relay._draining.set()
+            try:
+                submit_event(relay.url, event)
+                raise AssertionError('应抛出 HandoffError')
+            except HandoffError as e:
+                assert not e.uncertain
+            relay._draining.clear()
+
+    directory = tempfile.mkdtemp()
+    with MockWeChatServer() as server, \
+            mock.patch('main.submit_event', side_effect=HandoffError('读取超时', uncertain=True)):
+        _, output = run_action({'mode': 'relay', 'relay_url': 'http://relay.invalid',
+                                'wechat_webhook_url': server.url, 'delivery_id': 'uncertain-1'})
+        assert '不再改为其他方式发送' in output and not server.received
+        run_action({'mode': 'relay', 'relay_url': 'http://relay.invalid', 'wechat_webhook_url': server.url,
+                    'delivery_id': 'uncertain-2', 'idempotency_db': os.path.join(directory, 'deliveries.db')})
+        assert len(server.received) == 1
+
+
+if __name__ == "__main__":
+    print("中继交接模式测试")
+    print("=" * 50)
+    test_handoff_over_http_returns_before_delivery()
+    test_handoff_spool_directory()
+    test_handoff_falls_back_to_direct_send()
+    test_handoff_does_not_fall_back_when_relay_may_have_accepted()
+    print("测试完成")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证渲染缓存的命中、淘汰以及多目标发送时消息体复用
+"""
+
+import json
+import os
+import tempfile
+from unittest import mock
+
+import main
+from render_cache import RenderCache, RenderedMessage, body_preview, content_hash, encode_message
+from test_main import test_events
+
+
+def test_lru_eviction():
+    """
+    测试超出容量后淘汰最久未使用的条目
+    """
+    cache = RenderCache(maxsize=2)
+    cache.put('a', RenderedMessage({}, b'a'))
+    cache.put('b', RenderedMessage({}, b'b'))
+    assert cache.get('a').body == b'a'
+    cache.put('c', RenderedMessage({}, b'c'))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert len(cache) == 2
+
+
+def test_render_message_is_memoized():
+    """
+    测试同一事件只渲染一次，且消息体为UTF-8 JSON
+    """
+    main.render_cache.clear()
+    push_event = test_events["push"]
+    with mock.patch.dict(main.MESSAGE_GENERATORS, {'push': mock.Mock(wraps=main.generate_push_message)}) as generators:
+        first = main.render_message('push', push_event)
+        second = main.render_message('push', push_event)
+        assert generators['push'].call_count == 1
+    assert first is second
+    assert json.loads(first.body.decode('utf-8')) == first.message
+    assert '测试提交信息'.encode('utf-8') in first.body
+
+    # 投递ID不影响通知内容，重放时命中同一缓存
+    assert main.render_message('push', push_event, delivery_id='delivery-2') is first
+    assert main.render_message('unknown', push_event) is None
+
+
+def test_reenriched_event_is_rendered_again():
+    """
+    测试同一投递补全推送统计后重新渲染，而不是返回缓存中的旧消息
+    """
+    main.render_cache.clear()
+    push_event = test_events["push"]
+    plain = main.render_message('push', push_event, delivery_id='delivery-1')
+    enriched = dict(push_event, push_stats={'commits': 1, 'files': 3, 'additions': 10, 'deletions': 2})
+    with_stats = main.render_message('push', enriched, delivery_id='delivery-1')
+    assert with_stats is not plain
+    assert '3 个文件' in with_stats.message['markdown']['content']
+    assert '3 个文件' not in plain.message['markdown']['content']
+
+
+def test_content_hash_matches_raw_and_parsed():
+    """
+    测试内容哈希对相同原始字节稳定
+    """
+    raw = json.dumps(test_events["push"]).encode('utf-8')
+    assert content_hash(raw=raw) == content_hash(raw=raw.decode('utf-8'))
+    assert content_hash(test_events["push"]) == content_hash(json.loads(raw))
+
+
+def test_send_uses_preencoded_body():
+    """
+    测试发送时直接以memoryview传递预编码的消息体，不再重新序列化
+    """
+    message = main.generate_push_message(test_events["push"])
+    body = encode_message(message)
+    response = mock.Mock(status_code=200, text='{"errcode":0}', headers={})
+    response.json.return_value = {'errcode': 0}
+    with mock.patch('main.requests.post', return_value=response) as post:
+        assert main.send_wechat_message('https://example.invalid/send?key=body', message, body=body)
+    data = post.call_args.kwargs['data']
+    assert isinstance(data, memoryview)
+    assert data.obj is body
+    assert 'json' not in post.call_args.kwargs
+    assert body_preview(body, 20).isascii()
+
+
+def test_main_fans_out_same_body():
+    """
+    测试多个Webhook目标复用同一份已编码的消息体
+    """
+    main.render_cache.clear()
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+        json.dump(test_events["pull_request"], f)
+        event_file_path = f.name
+
+    env = {
+        'INPUT_WECHAT_WEBHOOK_URL': 'https://example.invalid/send?key=a, https://example.invalid/send?key=b',
+        'INPUT_EVENT_TYPES': 'pull_request',
+        'GITHUB_EVENT_PATH': event_file_path,
+        'GITHUB_EVENT_NAME': 'pull_request',
+    }
+    try:
+        with mock.patch.dict(os.environ, env), \
+                mock.patch('main.send_wechat_message_async', return_value=main.DeliveryResult(True)) as send:
+            main.main()
+        assert send.call_count == 2
+        bodies = [call.kwargs['body'] for call in send.call_args_list]
+        assert bodies[0] is bodies[1]
+        assert [call.args[1] for call in send.call_args_list] == [
+            'https://example.invalid/send?key=a', 'https://example.invalid/send?key=b'
+        ]
+    finally:
+        os.unlink(event_file_path)
+
+
+if __name__ == "__main__":
+    print("渲染缓存测试")
+    print("=" * 50)
+    test_lru_eviction()
+    test_render_message_is_memoized()
+    test_reenriched_event_is_rendered_again()
+    test_content_hash_matches_raw_and_parsed()
+    test_send_uses_preencoded_body()
+    test_main_fans_out_same_body()
+    print("测试完成")
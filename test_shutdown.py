@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证SIGTERM优雅退出、未发送事件写入检查点并在重启后恢复
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import circuit_breaker
+import main
+from event_record import NotificationEvent
+from mock_wechat_server import MockWeChatServer
+from relay import Relay
+from shutdown import GracefulShutdown, ShutdownRequested, append_checkpoint, load_checkpoint, save_checkpoint
+from test_event_record import EVENTS
+
+
+def make_event(delivery_id, event_name='release'):
+    return NotificationEvent.from_payload(event_name, EVENTS[event_name], delivery_id=delivery_id)
+
+
+def test_checkpoint_roundtrip():
+    """
+    测试检查点原子写入、按投递ID去重追加，没有事件时删除文件
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'pending', 'queue.events')
+    assert load_checkpoint(path) == []
+    events = [make_event('a'), make_event('b', 'push')]
+    assert save_checkpoint(path, events) == 2
+    assert append_checkpoint(path, [make_event('b', 'push'), make_event('c')]) == 3
+    assert [event.delivery_id for event in load_checkpoint(path)] == ['a', 'b', 'c']
+    assert load_checkpoint(path)[:2] == events
+    save_checkpoint(path, [])
+    assert not os.path.exists(path)
+
+
+def test_signal_only_sets_flag():
+    """
+    测试收到SIGTERM时只置位标志，在安全点 check() 才中断；发送协程超过期限后被取消
+    """
+    with GracefulShutdown(drain_timeout=1.0) as shutdown:
+        os.kill(os.getpid(), signal.SIGTERM)
+        # 信号处理函数不抛出异常，正在进行的状态写入不会被打断
+        time.sleep(0.1)
+        assert shutdown.requested.is_set() and shutdown.signal_name == 'SIGTERM'
+        try:
+            shutdown.check()
+            raise AssertionError('应当中断')
+        except ShutdownRequested as e:
+            assert 'SIGTERM' in str(e)
+
+    async def send(seconds):
+        await asyncio.sleep(seconds)
+        return seconds
+
+    with GracefulShutdown(drain_timeout=0.1) as shutdown:
+        # 期限内完成的发送正常返回
+        os.kill(os.getpid(), signal.SIGTERM)
+        assert asyncio.run(shutdown.bounded(send)(0.05)) == 0.05
+        started = time.monotonic()
+        try:
+            asyncio.run(shutdown.bounded(send)(2))
+            raise AssertionError('应当中断')
+        except ShutdownRequested:
+            assert time.monotonic() - started < 1
+    assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+
+
+def test_relay_drain_and_resume():
+    """
+    测试中继停止时在期限内发送部分队列，其余写入检查点，重启后恢复发送且不重复
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    checkpoint_dir = tempfile.mkdtemp()
+    with MockWeChatServer(latency=0.2) as server:
+        relay = Relay(server.url, rate_per_minute=6000, checkpoint_dir=checkpoint_dir).start()
+        for index in range(6):
+            assert relay.submit(make_event(f'drain-{index}')) == 'accepted'
+        time.sleep(0.3)
+        remaining = relay.stop(drain_timeout=0.2)
+        sent = len(server.received)
+        assert 1 <= sent < 6 and remaining == 6 - sent
+        assert relay.submit(make_event('late')) == 'rejected'
+        assert len(load_checkpoint(os.path.join(checkpoint_dir, f'{relay.robots[0].label}.events'))) == remaining
+
+        server.latency = 0
+        with Relay(server.url, rate_per_minute=6000, checkpoint_dir=checkpoint_dir):
+            deadline = time.monotonic() + 5
+            while len(server.received) < 6 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        assert os.listdir(checkpoint_dir) == []
+    assert len(server.received) == 6
+
+
+def test_main_checkpoints_interrupted_send():
+    """
+    测试Action运行中收到SIGTERM且发送未在期限内完成时写入检查点，下次运行先恢复发送
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS['release'], f)
+    checkpoint_path = os.path.join(directory, 'pending.events')
+    with MockWeChatServer(latency=3) as server:
+        env = {
+            'INPUT_WECHAT_WEBHOOK_URL': server.url,
+            'INPUT_EVENT_TYPES': 'release,push',
+            'INPUT_CHECKPOINT_PATH': checkpoint_path,
+            'INPUT_DRAIN_TIMEOUT': '0.2',
+            'INPUT_DELIVERY_ID': 'interrupted',
+            'GITHUB_EVENT_PATH': event_path,
+            'GITHUB_EVENT_NAME': 'release',
+        }
+        timer = threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGTERM))
+        timer.start()
+        with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()):
+            try:
+                main.main()
+                raise AssertionError('应当退出')
+            except SystemExit as e:
+                assert e.code == 1
+        timer.join()
+        assert [event.delivery_id for event in load_checkpoint(checkpoint_path)] == ['interrupted']
+        assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+
+        server.latency = 0
+        with open(event_path, 'w', encoding='utf-8') as f:
+            json.dump(EVENTS['push'], f)
+        env.update({'GITHUB_EVENT_NAME': 'push', 'INPUT_DELIVERY_ID': 'next'})
+        with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()) as output:
+            main.main()
+        assert '已恢复发送检查点中的 1 个事件' in output.getvalue()
+        assert not os.path.exists(checkpoint_path)
+        contents = [json.loads(body)['markdown']['content'] for _, body in server.received[-2:]]
+        assert 'Release' in contents[0] and 'Release' not in contents[1]
+
+
+def test_main_checkpoints_event_before_enrichment():
+    """
+    测试补全完成之前收到SIGTERM时，未补全的事件同样写入检查点，不会丢失
+    """
+    main.render_cache.clear()
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS['release'], f)
+    checkpoint_path = os.path.join(directory, 'pending.events')
+    env = {
+        'INPUT_WECHAT_WEBHOOK_URL': 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=enrich-test-key',
+        'INPUT_EVENT_TYPES': 'release',
+        'INPUT_CHECKPOINT_PATH': checkpoint_path,
+        'INPUT_PREWARM': 'false',
+        'GITHUB_EVENT_PATH': event_path,
+        'GITHUB_EVENT_NAME': 'release',
+    }
+    original_loads = json.loads
+    signalled = []
+
+    def loads_then_signal(*args, **kwargs):
+        # 解析事件时（补全之前）收到退出信号
+        if not signalled:
+            signalled.append(True)
+            os.kill(os.getpid(), signal.SIGTERM)
+            time.sleep(0.05)
+        return original_loads(*args, **kwargs)
+
+    with mock.patch.dict(os.environ, env), mock.patch('main.json.loads', loads_then_signal), \
+            mock.patch('main.send_wechat_message_async') as send, contextlib.redirect_stdout(io.StringIO()):
+        try:
+            main.main()
+            raise AssertionError('应当退出')
+        except SystemExit as e:
+            assert e.code == 1
+    assert not send.called
+    events = load_checkpoint(checkpoint_path)
+    assert len(events) == 1 and events[0].event_name == 'release' and events[0].delivery_id
+
+
+def test_main_checkpoints_on_sigint():
+    """
+    测试取消工作流或Ctrl-C发送的SIGINT与SIGTERM一样等待发送并写入检查点；未经信号处理函数的 KeyboardInterrupt 同样保存
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS['release'], f)
+    checkpoint_path = os.path.join(directory, 'pending.events')
+    with MockWeChatServer(latency=3) as server:
+        env = {
+            'INPUT_WECHAT_WEBHOOK_URL': server.url,
+            'INPUT_EVENT_TYPES': 'release',
+            'INPUT_CHECKPOINT_PATH': checkpoint_path,
+            'INPUT_DRAIN_TIMEOUT': '0.2',
+            'INPUT_DELIVERY_ID': 'sigint',
+            'GITHUB_EVENT_PATH': event_path,
+            'GITHUB_EVENT_NAME': 'release',
+        }
+        timer = threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGINT))
+        timer.start()
+        with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()):
+            try:
+                main.main()
+                raise AssertionError('应当退出')
+            except SystemExit as e:
+                assert e.code == 1
+        timer.join()
+    assert signal.getsignal(signal.SIGINT) is signal.default_int_handler
+    assert [event.delivery_id for event in load_checkpoint(checkpoint_path)] == ['sigint']
+
+    keyboard_path = os.path.join(directory, 'keyboard.events')
+    env.update({'INPUT_DELIVERY_ID': 'keyboard', 'INPUT_CHECKPOINT_PATH': keyboard_path})
+    with mock.patch.dict(os.environ, env), mock.patch('main.render_event', side_effect=KeyboardInterrupt), \
+            contextlib.redirect_stdout(io.StringIO()):
+        try:
+            main.main()
+            raise AssertionError('应当退出')
+        except SystemExit as e:
+            assert e.code == 1
+    assert [event.delivery_id for event in load_checkpoint(keyboard_path)] == ['keyboard']
+
+
+if __name__ == "__main__":
+    print("优雅退出测试")
+    print("=" * 50)
+    test_checkpoint_roundtrip()
+    test_signal_only_sets_flag()
+    test_relay_drain_and_resume()
+    test_main_checkpoints_interrupted_send()
+    test_main_checkpoints_event_before_enrichment()
+    test_main_checkpoints_on_sigint()
+    print("测试完成")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证合成事件语料的可复现性、结构与大小分布，以及开环负载驱动
+"""
+
+import contextlib
+import io
+import tempfile
+import time
+
+import circuit_breaker
+import main
+from bench_load import percentile, relay_sender, run_open_loop
+from event_record import NotificationEvent
+from mock_wechat_server import MockWeChatServer
+from relay import Relay
+from synthetic_events import DEFAULT_EVENT_WEIGHTS, CorpusGenerator, read_corpus, write_corpus
+
+
+def test_seeded_and_renderable():
+    """
+    测试相同种子生成相同语料，所有事件类型都能被提取和渲染
+    """
+    first = [event.encode() for event in CorpusGenerator(seed=3).events(30)]
+    assert first == [event.encode() for event in CorpusGenerator(seed=3).events(30)]
+    assert first != [event.encode() for event in CorpusGenerator(seed=4).events(30)]
+
+    generator = CorpusGenerator(seed=1)
+    for event_name in DEFAULT_EVENT_WEIGHTS:
+        for _ in range(5):
+            event = generator.event(event_name)
+            NotificationEvent.from_payload(event_name, event.payload, delivery_id=event.delivery_id)
+            main.MESSAGE_GENERATORS[event_name](event.payload)
+            if event_name == 'push':
+                assert len(event.payload['commits']) <= 20 <= event.payload['size'] or \
+                    len(event.payload['commits']) == event.payload['size']
+
+
+def test_size_distribution():
+    """
+    测试事件大小接近抽样的目标大小，且不超过上限
+    """
+    generator = CorpusGenerator(seed=2, size_classes=(('fixed', 1.0, 200 * 1024, 200 * 1024),))
+    for event_name in DEFAULT_EVENT_WEIGHTS:
+        size = len(generator.event(event_name).encode())
+        assert 0.9 * 200 * 1024 <= size <= 1.15 * 200 * 1024, (event_name, size)
+
+    generator = CorpusGenerator(seed=5, max_bytes=64 * 1024)
+    events = list(generator.events(200))
+    assert max(len(event.encode()) for event in events) < 80 * 1024
+    assert {event.size_class for event in events} >= {'tiny', 'small', 'large'}
+
+    directory = tempfile.mkdtemp()
+    assert write_corpus(directory, events[:10]) == 10
+    entries = read_corpus(directory)
+    with open(entries[3]['path'], 'rb') as f:
+        assert f.read() == events[3].encode()
+    assert entries[3]['delivery_id'] == events[3].delivery_id
+
+
+def test_open_loop_counts_queueing():
+    """
+    测试开环驱动按目标速率发送，目标处理不过来时排队时间计入延迟
+    """
+    report = run_open_loop(lambda item: time.sleep(0.01) or True, range(100), rate=200, arrival='constant')
+    assert report.completed == 100 and report.errors == 0
+    assert 150 <= report.throughput <= 210
+    assert 0.01 <= percentile(report.latencies, 0.5) < 0.05
+
+    # 单并发、每个请求20ms、目标速率100/s：请求不断积压
+    report = run_open_loop(lambda item: time.sleep(0.02) or True, range(50), rate=100, arrival='constant',
+                           concurrency=1)
+    assert report.to_dict()['p99'] > 0.3
+    report = run_open_loop(lambda item: item % 2 == 0, range(10), rate=1000)
+    assert (report.completed, report.errors) == (5, 5)
+
+
+def test_relay_target():
+    """
+    测试以合成语料压测进程内中继
+    """
+    circuit_breaker.reset_breakers()
+    directory = tempfile.mkdtemp()
+    write_corpus(directory, CorpusGenerator(seed=7, max_bytes=32 * 1024).events(20))
+    entries = read_corpus(directory)
+    with MockWeChatServer() as server, contextlib.redirect_stdout(io.StringIO()):
+        with Relay(server.url, rate_per_minute=10 ** 6) as relay:
+            report = run_open_loop(relay_sender(relay.url + '/webhook'), entries, rate=100)
+    assert report.completed == 20, report.to_dict()
+    # 成功的CI运行不发送通知
+    assert 0 < len(server.received) <= 20
+
+
+if __name__ == "__main__":
+    print("合成语料与负载测试")
+    print("=" * 50)
+    test_seeded_and_renderable()
+    test_size_distribution()
+    test_open_loop_counts_queueing()
+    test_relay_target()
+    print("测试完成")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证滑动窗口 Count-Min 节流、静音摘要与状态持久化
+"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
+
+import circuit_breaker
+import main
+from event_record import NotificationEvent
+from mock_wechat_server import MockWeChatServer
+from test_event_record import EVENTS
+from throttle import FrequencyThrottle, throttle_key
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_mute_and_summary():
+    """
+    测试超过阈值后静音，安静一个窗口后输出抑制数量
+    """
+    clock = FakeClock()
+    throttle = FrequencyThrottle(threshold=3, window_seconds=60, buckets=6, clock=clock)
+    decisions = []
+    for _ in range(8):
+        decisions.append(throttle.hit('repo:issues:2'))
+        clock.now += 1
+    assert decisions == [True] * 3 + [False] * 5
+    # 其他键不受影响
+    assert throttle.hit('repo:issues:3')
+    assert throttle.pop_expired() == []
+
+    clock.now += 61
+    expired = throttle.pop_expired()
+    assert [(entry.key, entry.suppressed) for entry in expired] == [('repo:issues:2', 5)]
+    # 窗口滑过后计数清零，重新允许
+    assert throttle.estimate('repo:issues:2') == 0
+    assert throttle.hit('repo:issues:2')
+
+
+def test_sliding_window_and_bounded_memory():
+    """
+    测试计数按时间桶滑出窗口，且大量键时内存固定、估计值不低于真实值
+    """
+    clock = FakeClock()
+    throttle = FrequencyThrottle(threshold=1000, window_seconds=100, buckets=10, width=512, depth=4, clock=clock)
+    for _ in range(5):
+        throttle.hit('hot')
+    clock.now += 50
+    for _ in range(5):
+        throttle.hit('hot')
+    assert throttle.estimate('hot') == 10
+    clock.now += 55
+    assert throttle.estimate('hot') == 5
+
+    size = len(throttle._counters)
+    for index in range(20000):
+        throttle.hit(f'org/repo-{index}:push:main')
+    assert len(throttle._counters) == size
+    assert throttle.estimate('hot') >= 5
+
+
+def test_state_persistence():
+    """
+    测试状态保存后在下一次运行中继续累计，配置变化时重新开始
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'throttle.bin')
+    clock = FakeClock()
+    first = FrequencyThrottle(threshold=2, window_seconds=60, clock=clock)
+    for _ in range(3):
+        first.hit('repo:workflow_run:CI@main')
+    first.save(path)
+
+    second = FrequencyThrottle.load(path, threshold=2, window_seconds=60, clock=clock)
+    assert second.is_muted('repo:workflow_run:CI@main')
+    assert not second.hit('repo:workflow_run:CI@main')
+    assert second.estimate('repo:workflow_run:CI@main') == 4
+
+    assert FrequencyThrottle.load(path, threshold=2, window_seconds=120, clock=clock).estimate(
+        'repo:workflow_run:CI@main') == 0
+    with open(path, 'wb') as f:
+        f.write(b'broken')
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert FrequencyThrottle.load(path).estimate('x') == 0
+
+
+def test_same_delivery_counts_once():
+    """
+    测试同一投递（重跑工作流）只计数一次并返回首次的判断，已计数的投递随状态保存
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'throttle.bin')
+    clock = FakeClock()
+    throttle = FrequencyThrottle(threshold=1, window_seconds=60, clock=clock)
+    assert throttle.hit('repo:issues:2', 'd-1') and throttle.hit('repo:issues:2', 'd-1')
+    assert throttle.estimate('repo:issues:2') == 1
+    assert not throttle.hit('repo:issues:2', 'd-2')
+    throttle.save(path)
+
+    restored = FrequencyThrottle.load(path, threshold=1, window_seconds=60, clock=clock)
+    assert restored.hit('repo:issues:2', 'd-1') and not restored.hit('repo:issues:2', 'd-2')
+    assert restored.estimate('repo:issues:2') == 2
+    # 超过窗口后不再记住
+    clock.now += 61
+    assert restored.hit('repo:issues:2', 'd-1') and restored.estimate('repo:issues:2') == 1
+
+
+def test_locked_state_keeps_concurrent_counts():
+    """
+    测试多个作业并发更新同一状态文件时计数不丢失
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'throttle.bin')
+
+    def job(index):
+        for hit in range(10):
+            with FrequencyThrottle.locked(path, threshold=1000) as throttle:
+                throttle.hit('repo:push:main', f'{index}-{hit}')
+
+    threads = [threading.Thread(target=job, args=(index,)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert FrequencyThrottle.load(path, threshold=1000).estimate('repo:push:main') == 60
+
+
+def test_throttle_key_ignores_action():
+    """
+    测试反复开关同一个Issue计入同一个键
+    """
+    opened = NotificationEvent.from_payload('issues', dict(EVENTS['issues'], action='opened'))
+    closed = NotificationEvent.from_payload('issues', dict(EVENTS['issues'], action='closed'))
+    assert throttle_key(opened) == throttle_key(closed) == 'test/test-repo:issues:2'
+
+
+def test_cli_throttles_and_sends_summary():
+    """
+    测试命令行入口在发送前节流，静音结束后发送一条摘要
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS['issues'], f)
+    state_path = os.path.join(directory, 'throttle.bin')
+    clock = FakeClock()
+
+    class ClockedThrottle(FrequencyThrottle):
+        def __init__(self, **options):
+            super().__init__(clock=clock, **options)
+
+    with MockWeChatServer() as server:
+        env = {
+            'INPUT_WECHAT_WEBHOOK_URL': server.url,
+            'INPUT_EVENT_TYPES': 'issues',
+            'INPUT_THROTTLE_STATE': state_path,
+            'INPUT_THROTTLE_THRESHOLD': '2',
+            'INPUT_THROTTLE_WINDOW': '60',
+            'GITHUB_EVENT_PATH': event_path,
+            'GITHUB_EVENT_NAME': 'issues',
+        }
+        with mock.patch.dict(os.environ, env), mock.patch('main.FrequencyThrottle', ClockedThrottle), \
+                contextlib.redirect_stdout(io.StringIO()):
+            for index in range(5):
+                os.environ['INPUT_DELIVERY_ID'] = f'flap-{index}'
+                main.main()
+            assert len(server.received) == 2
+            # 安静一个窗口后，下一次运行先发送摘要
+            clock.now += 120
+            os.environ['INPUT_DELIVERY_ID'] = 'flap-after'
+            main.main()
+        assert len(server.received) == 4
+
+    summary = json.loads(server.received[2][1])['markdown']['content']
+    assert '已抑制**: <font color="warning">3</font> 条相似事件' in summary
+    assert 'test/test-repo:issues:2' in summary
+
+
+if __name__ == "__main__":
+    print("频繁事件节流测试")
+    print("=" * 50)
+    test_mute_and_summary()
+    test_sliding_window_and_bounded_memory()
+    test_state_persistence()
+    test_same_delivery_counts_once()
+    test_locked_state_keeps_concurrent_counts()
+    test_throttle_key_ignores_action()
+    test_cli_throttles_and_sends_summary()
+    print("测试完成")
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试脚本：验证追踪 span 的父子关系、按投递ID一致采样、OTLP导出以及Action与中继各阶段的链路
+"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+import circuit_breaker
+import main
+import tracing
+from event_record import unpack_event
+from mock_wechat_server import MockWeChatServer
+from relay import Relay
+from render_cache import content_hash
+from test_event_record import EVENTS
+from test_relay import post_event, wait_until
+
+
+class ListExporter:
+    def __init__(self):
+        self.requests = []
+
+    def export(self, request):
+        self.requests.append(request)
+
+    def close(self):
+        pass
+
+
+def exported_spans(requests):
+    return [span for request in requests for resource in request['resourceSpans']
+            for scope in resource['scopeSpans'] for span in scope['spans']]
+
+
+def attributes(span):
+    return {item['key']: next(iter(item['value'].values())) for item in span['attributes']}
+
+
+def read_trace_file(path):
+    with open(path, encoding='utf-8') as f:
+        return exported_spans(json.loads(line) for line in f)
+
+
+def test_span_tree_and_file_export():
+    """
+    测试嵌套 span 的父子关系、异常状态、属性编码，以及以 OTLP/JSON 写入本地文件
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'traces', 'spans.jsonl')
+    tracer = tracing.configure(path=path, export_interval=None)
+    try:
+        with tracing.span('notification', delivery_id='d-1', kind=tracing.KIND_CONSUMER) as root:
+            with tracing.span('render') as render:
+                render.set_attributes({'bytes': 12, 'ratio': 0.5, 'cached': True})
+            with contextlib.suppress(ValueError), tracing.span('parse'):
+                raise ValueError('bad json')
+            assert tracing.current_span() is root
+        assert tracing.current_span() is tracing.NOOP_SPAN
+    finally:
+        tracing.shutdown()
+    assert tracer.exported == 3
+
+    spans = {span['name']: span for span in read_trace_file(path)}
+    root = spans['notification']
+    assert root['traceId'] == tracing.trace_id_for('d-1') and 'parentSpanId' not in root
+    assert attributes(root)['github.delivery_id'] == 'd-1' and root['kind'] == tracing.KIND_CONSUMER
+    assert all(spans[name]['parentSpanId'] == root['spanId'] for name in ('render', 'parse'))
+    assert spans['render']['attributes'] == [{'key': 'bytes', 'value': {'intValue': '12'}},
+                                             {'key': 'ratio', 'value': {'doubleValue': 0.5}},
+                                             {'key': 'cached', 'value': {'boolValue': True}}]
+    assert spans['parse']['status'] == {'code': tracing.STATUS_ERROR, 'message': 'bad json'}
+    assert spans['parse']['events'][0]['name'] == 'exception'
+    assert int(root['startTimeUnixNano']) <= int(spans['render']['startTimeUnixNano']) <= int(root['endTimeUnixNano'])
+    # 未启用时为空操作
+    with tracing.span('noop') as span:
+        assert span is tracing.NOOP_SPAN
+
+
+def test_consistent_sampling_and_propagation():
+    """
+    测试按投递ID的一致采样、未采样链路的子 span 为空操作，以及 traceparent 传递
+    """
+    first = tracing.Tracer(ListExporter(), sample_rate=0.5)
+    second = tracing.Tracer(ListExporter(), sample_rate=0.5)
+    decisions = [first.sampled(tracing.trace_id_for(f'delivery-{index}')) for index in range(2000)]
+    assert 900 < sum(decisions) < 1100
+    assert decisions == [second.sampled(tracing.trace_id_for(f'delivery-{index}')) for index in range(2000)]
+    assert not any(tracing.Tracer(ListExporter(), 0).sampled(tracing.trace_id_for(str(n))) for n in range(100))
+
+    exporter = ListExporter()
+    tracing.configure(exporter=exporter, sample_rate=0.5, export_interval=None)
+    try:
+        unsampled = next(f'delivery-{index}' for index, sampled in enumerate(decisions) if not sampled)
+        with tracing.span('ingest', delivery_id=unsampled) as root:
+            assert root is tracing.NOOP_SPAN
+            with tracing.span('child') as child:
+                assert child is tracing.NOOP_SPAN and tracing.inject({}) == {}
+
+        sampled = next(f'delivery-{index}' for index, sampled in enumerate(decisions) if sampled)
+        with tracing.span('forward', delivery_id=sampled, kind=tracing.KIND_CLIENT) as span:
+            headers = tracing.inject({})
+        parent = tracing.extract(headers)
+        assert (parent.trace_id, parent.span_id, parent.sampled) == (span.trace_id, span.context.span_id, True)
+        with tracing.span('ingest', parent=parent) as remote:
+            assert remote.parent is parent
+        assert not tracing.extract({'traceparent': f'00-{span.trace_id}-{span.context.span_id}-00'}).sampled
+        assert tracing.extract({'traceparent': 'garbage'}) is None and tracing.extract({}) is None
+    finally:
+        tracing.shutdown()
+    assert [span['name'] for span in exported_spans(exporter.requests)] == ['forward', 'ingest']
+
+
+def test_main_traces_stages_and_retries():
+    """
+    测试Action的各阶段 span：解析、渲染、发送，每次重试一个HTTP span，预热事件循环中的发送仍在同一链路
+    """
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    trace_path = os.path.join(directory, 'spans.jsonl')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS['release'], f)
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    closed = 'http://127.0.0.1:9/cgi-bin/webhook/send?key=closed'
+    with MockWeChatServer() as server:
+        env = {
+            'INPUT_WECHAT_WEBHOOK_URL': f'{server.url},{closed}',
+            'INPUT_EVENT_TYPES': 'release',
+            'INPUT_DELIVERY_ID': 'trace-main-1',
+            'INPUT_MAX_ATTEMPTS': '2',
+            'INPUT_TRACE_FILE': trace_path,
+            'GITHUB_EVENT_PATH': event_path,
+            'GITHUB_EVENT_NAME': 'release',
+        }
+        with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()):
+            main.main()
+        assert len(server.received) == 1
+    assert tracing.get_tracer() is None
+
+    spans = read_trace_file(trace_path)
+    assert {span['traceId'] for span in spans} == {tracing.trace_id_for('trace-main-1')}
+    by_id = {span['spanId']: span for span in spans}
+    parent_name = lambda span: by_id[span['parentSpanId']]['name'] if 'parentSpanId' in span else None
+    names = sorted((span['name'], parent_name(span)) for span in spans)
+    assert names == sorted([('notification', None), ('parse', 'notification'), ('enrich', 'notification'),
+                            ('render', 'notification'), ('deliver', 'notification'),
+                            ('wechat.send', 'deliver'), ('wechat.send', 'deliver'),
+                            ('POST', 'wechat.send'), ('POST', 'wechat.send'), ('POST', 'wechat.send')])
+    sends = {attributes(span)['wechat.success']: span for span in spans if span['name'] == 'wechat.send'}
+    assert attributes(sends[False])['wechat.attempts'] == '2' and sends[False]['status']['code'] == tracing.STATUS_ERROR
+    assert [event['name'] for event in sends[False]['events']] == ['retry']
+    assert attributes(sends[True])['http.response.status_code'] == '200'
+    root = next(span for span in spans if span['name'] == 'notification')
+    assert attributes(root)['github.delivery_id'] == 'trace-main-1'
+
+
+def test_main_trace_id_follows_derived_delivery_id():
+    """
+    测试未输入投递ID时根 span 的 trace id 由 运行ID + 事件内容哈希 派生，与中继处理缓冲文件时的链路一致
+    """
+    directory = tempfile.mkdtemp()
+    event_path = os.path.join(directory, 'event.json')
+    trace_path = os.path.join(directory, 'spans.jsonl')
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(EVENTS['release'], f)
+    with open(event_path, 'rb') as f:
+        delivery_id = f'42:{content_hash(raw=f.read())[:16]}'
+    env = {
+        'INPUT_MODE': 'relay',
+        'INPUT_RELAY_SPOOL_DIR': os.path.join(directory, 'spool'),
+        'INPUT_EVENT_TYPES': 'release',
+        'INPUT_TRACE_FILE': trace_path,
+        'INPUT_TRACE_SAMPLE_RATE': '1',
+        'INPUT_PREWARM': 'false',
+        'GITHUB_RUN_ID': '42',
+        'GITHUB_EVENT_PATH': event_path,
+        'GITHUB_EVENT_NAME': 'release',
+    }
+    with mock.patch.dict(os.environ, env), contextlib.redirect_stdout(io.StringIO()):
+        os.environ.pop('INPUT_DELIVERY_ID', None)
+        main.main()
+    spans = read_trace_file(trace_path)
+    assert {span['traceId'] for span in spans} == {tracing.trace_id_for(delivery_id)}
+    assert {span['name'] for span in spans} >= {'notification', 'handoff'}
+    with open(os.path.join(directory, 'spool', os.listdir(os.path.join(directory, 'spool'))[0]), 'rb') as f:
+        assert unpack_event(f.read()).delivery_id == delivery_id
+
+
+def test_relay_traces_queue_wait_over_otlp():
+    """
+    测试中继链路：接收、队列等待、限速与发送，span 以 OTLP/HTTP 导出
+    """
+    circuit_breaker.reset_breakers()
+    main.render_cache.clear()
+    with MockWeChatServer() as server, MockWeChatServer() as collector:
+        tracer = tracing.configure(endpoint=collector.url.split('/cgi-bin')[0], headers={'Authorization': 'token'},
+                                   export_interval=None)
+        relay = Relay([server.url], rate_per_minute=600).start()
+        try:
+            assert post_event(relay, 'release', 'trace-relay-1').json()['outcome'] == 'accepted'
+            wait_until(lambda: relay.robots[0].deliveries['success'] == 1)
+        finally:
+            relay.stop(drain_timeout=1)
+            tracing.shutdown()
+        assert tracer.exported > 0 and tracer.dropped == 0
+        assert {path for path, _ in collector.received} == {'/v1/traces'}
+        spans = exported_spans(json.loads(body) for _, body in collector.received)
+
+    assert {span['traceId'] for span in spans} == {tracing.trace_id_for('trace-relay-1')}
+    by_name = {span['name']: span for span in spans}
+    ingest = by_name['ingest']
+    assert ingest['kind'] == tracing.KIND_SERVER and attributes(ingest)['relay.outcome'] == 'accepted'
+    for name in ('parse', 'queue.wait', 'deliver'):
+        assert by_name[name]['parentSpanId'] == ingest['spanId']
+    for name in ('render', 'rate_limit', 'wechat.send'):
+        assert by_name[name]['parentSpanId'] == by_name['deliver']['spanId']
+    assert by_name['POST']['parentSpanId'] == by_name['wechat.send']['spanId']
+    assert int(by_name['queue.wait']['endTimeUnixNano']) <= int(by_name['deliver']['startTimeUnixNano'])
+
+
+if __name__ == "__main__":
+    print("分布式追踪测试")
+    print("=" * 50)
+    test_span_tree_and_file_export()
+    test_consistent_sampling_and_propagation()
+    test_main_traces_stages_and_retries()
+    test_main_trace_id_follows_derived_delivery_id()
+    test_relay_traces_queue_wait_over_otlp()
+    print("测试完成")
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+频繁事件节流
+反复失败的流水线、反复开关同一Issue的机器人会产生通知风暴并耗尽机器人配额。
+按“相似事件键”统计滑动窗口内的次数，超过阈值后自动静音该键，
+静音期间（该键连续一个窗口没有新事件前）的事件只计数，静音结束时发送一条“已抑制 N 条相似事件”摘要。
+
+计数使用分桶的 Count-Min Sketch：窗口被切分为若干时间桶，每个桶是 depth x width 的计数矩阵，
+内存与状态文件大小只取决于 (桶数, depth, width)，与仓库和事件键的数量无关；
+估计值只会偏大（哈希冲突），不会漏判超阈值的键。
+同一投递（如重跑工作流）在窗口内只计数一次；多个作业共享状态文件时以文件锁串行读取、更新和保存
+"""
+
+import array
+import contextlib
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_THRESHOLD = 10
+DEFAULT_WINDOW_SECONDS = 600
+DEFAULT_BUCKETS = 10
+DEFAULT_WIDTH = 2048
+DEFAULT_DEPTH = 4
+# 同时静音的键数量上限，超出时淘汰最早静音的键（其摘要立即输出）
+DEFAULT_MAX_MUTED = 256
+# 记住的已计数投递ID数量上限，超出时淘汰最早的
+DEFAULT_MAX_SEEN = 1024
+
+_STATE_MAGIC = b'CMST'
+# 版本2: 尾部JSON增加已计数的投递ID
+_STATE_VERSION = 2
+# magic, version, width, depth, buckets, window_seconds, 尾部JSON长度
+_HEADER_STRUCT = struct.Struct('<4sBIIIdI')
+
+
+def throttle_key(event):
+    """
+    计算相似事件键：同一仓库中针对同一对象（Issue/PR编号、工作流、分支、版本）的同类事件视为相似，
+    不区分 action，因此反复开关同一个Issue会累计到同一个键
+    :param event: NotificationEvent
+    """
+    subject = event.number or event.title or event.ref or event.tag_name or ''
+    if event.event_name in ('workflow_run', 'check_run'):
+        subject = f'{event.title}@{event.ref}'
+    return f'{event.repo_full_name}:{event.event_name}:{subject}'
+
+
+class MutedKey:
+    """
+    被静音的键
+    """
+
+    __slots__ = ('key', 'muted_at', 'last_seen', 'suppressed')
+
+    def __init__(self, key, muted_at, last_seen=None, suppressed=0):
+        self.key = key
+        self.muted_at = muted_at
+        self.last_seen = muted_at if last_seen is None else last_seen
+        self.suppressed = suppressed
+
+    def __repr__(self):
+        return f'MutedKey(key={self.key!r}, suppressed={self.suppressed})'
+
+
+class FrequencyThrottle:
+    """
+    基于滑动窗口 Count-Min Sketch 的节流器
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, window_seconds=DEFAULT_WINDOW_SECONDS, buckets=DEFAULT_BUCKETS,
+                 width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, max_muted=DEFAULT_MAX_MUTED, max_seen=DEFAULT_MAX_SEEN,
+                 clock=time.time):
+        """
+        :param threshold: 窗口内允许的最多事件数，超过后静音
+        :param window_seconds: 滑动窗口长度（秒）
+        :param buckets: 窗口切分的时间桶数，越多滑动越平滑
+        :param width: 每行计数器数量
+        :param depth: 哈希函数（行）数量
+        :param max_muted: 同时静音的键数量上限
+        :param max_seen: 记住的已计数投递ID数量上限
+        """
+        self.threshold = int(threshold)
+        self.window_seconds = float(window_seconds)
+        self.buckets = int(buckets)
+        self.width = int(width)
+        self.depth = int(depth)
+        self.max_muted = max_muted
+        self.max_seen = max_seen
+        self._clock = clock
+        self._bucket_seconds = self.window_seconds / self.buckets
+        # 每个槽位当前保存的时间桶序号，过期槽位在访问时清零
+        self._slot_epochs = array.array('q', [-1] * self.buckets)
+        self._counters = array.array('I', bytes(4 * self.buckets * self.depth * self.width))
+        self._muted = {}
+        self._expired = []
+        # 窗口内已计数的投递: {投递ID: [计数时间, 是否允许发送]}，按计数顺序
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def _columns(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * self.depth).digest()
+        return [value % self.width for value in struct.unpack(f'<{self.depth}I', digest)]
+
+    def _rotate(self, now):
+        """
+        清零已滑出窗口的时间桶，返回当前桶序号
+        """
+        epoch = int(now // self._bucket_seconds)
+        row_size = self.depth * self.width
+        for slot in range(self.buckets):
+            slot_epoch = self._slot_epochs[slot]
+            if slot_epoch != -1 and slot_epoch <= epoch - self.buckets:
+                start = slot * row_size
+                self._counters[start:start + row_size] = array.array('I', bytes(4 * row_size))
+                self._slot_epochs[slot] = -1
+        return epoch
+
+    def _estimate(self, columns):
+        estimates = []
+        for row, column in enumerate(columns):
+            total = 0
+            for slot in range(self.buckets):
+                if self._slot_epochs[slot] != -1:
+                    total += self._counters[(slot * self.depth + row) * self.width + column]
+            estimates.append(total)
+        return min(estimates)
+
+    def estimate(self, key):
+        """
+        估计窗口内该键的事件数（只会偏大）
+        """
+        with self._lock:
+            self._rotate(self._clock())
+            return self._estimate(self._columns(key))
+
+    def _expire_mutes(self, now):
+        for key, muted in list(self._muted.items()):
+            if now - muted.last_seen >= self.window_seconds:
+                self._expired.append(self._muted.pop(key))
+
+    def hit(self, key, delivery_id=None):
+        """
+        记录一次事件并判断是否允许通知
+        :param key: 相似事件键，见 throttle_key
+        :param delivery_id: 投递ID，可选；同一投递在窗口内重复出现时不再计数，返回首次的判断
+        :return: True 表示允许发送，False 表示已被静音
+        """
+        with self._lock:
+            if delivery_id:
+                now = self._clock()
+                self._expire_seen(now)
+                seen = self._seen.get(delivery_id)
+                if seen is not None:
+                    return seen[1]
+            allowed = self._hit(key)
+            if delivery_id:
+                self._seen[delivery_id] = [now, allowed]
+                while len(self._seen) > self.max_seen:
+                    del self._seen[next(iter(self._seen))]
+            return allowed
+
+    def _expire_seen(self, now):
+        while self._seen:
+            delivery_id, (seen_at, _) = next(iter(self._seen.items()))
+            if now - seen_at < self.window_seconds:
+                return
+            del self._seen[delivery_id]
+
+    def _hit(self, key):
+        now = self._clock()
+        epoch = self._rotate(now)
+        self._expire_mutes(now)
+        slot = epoch % self.buckets
+        self._slot_epochs[slot] = epoch
+        columns = self._columns(key)
+        for row, column in enumerate(columns):
+            index = (slot * self.depth + row) * self.width + column
+            self._counters[index] = min(self._counters[index] + 1, 0xffffffff)
+
+        muted = self._muted.get(key)
+        if muted is not None:
+            muted.last_seen = now
+            muted.suppressed += 1
+            return False
+        if self._estimate(columns) <= self.threshold:
+            return True
+
+        if len(self._muted) >= self.max_muted:
+            oldest = min(self._muted.values(), key=lambda entry: entry.muted_at)
+            self._expired.append(self._muted.pop(oldest.key))
+        self._muted[key] = MutedKey(key, now, suppressed=1)
+        return False
+
+    def is_muted(self, key):
+        return key in self._muted
+
+    def pop_expired(self):
+        """
+        取出已结束静音（连续一个窗口没有新事件）的键，用于发送抑制摘要
+        :return: MutedKey 列表
+        """
+        with self._lock:
+            self._expire_mutes(self._clock())
+            expired, self._expired = self._expired, []
+        return expired
+
+    def save(self, path):
+        """
+        保存状态到文件（先写临时文件再原子替换），保存前应先通过 pop_expired 取出并发送已结束的静音摘要
+        """
+        muted = json.dumps({
+            'muted': [[entry.key, entry.muted_at, entry.last_seen, entry.suppressed]
+                      for entry in self._muted.values()],
+            'seen': [[delivery_id, seen_at, allowed] for delivery_id, (seen_at, allowed) in self._seen.items()],
+        }).encode('utf-8')
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(_HEADER_STRUCT.pack(_STATE_MAGIC, _STATE_VERSION, self.width, self.depth, self.buckets,
+                                        self.window_seconds, len(muted)))
+            self._slot_epochs.tofile(f)
+            self._counters.tofile(f)
+            f.write(muted)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, **options):
+        """
+        从文件恢复状态；文件不存在、损坏或与当前配置（窗口、矩阵尺寸）不一致时从空状态开始
+        :param path: 状态文件路径
+        :param options: 构造参数
+        """
+        throttle = cls(**options)
+        if not os.path.exists(path):
+            return throttle
+        try:
+            with open(path, 'rb') as f:
+                magic, version, width, depth, buckets, window_seconds, muted_length = \
+                    _HEADER_STRUCT.unpack(f.read(_HEADER_STRUCT.size))
+                if magic != _STATE_MAGIC or version > _STATE_VERSION or \
+                        (width, depth, buckets, window_seconds) != \
+                        (throttle.width, throttle.depth, throttle.buckets, throttle.window_seconds):
+                    return throttle
+                slot_epochs = array.array('q')
+                slot_epochs.fromfile(f, buckets)
+                counters = array.array('I')
+                counters.fromfile(f, buckets * depth * width)
+                muted = json.loads(f.read(muted_length))
+        except (OSError, EOFError, struct.error, ValueError) as e:
+            print(f'::warning::[{os.getenv("CURRENT_SESSION_ID", "main")}] 节流状态文件无效，重新开始计数: {e}')
+            return throttle
+        throttle._slot_epochs = slot_epochs
+        throttle._counters = counters
+        # 版本1的尾部只有静音表
+        seen = muted.get('seen', []) if isinstance(muted, dict) else []
+        muted = muted.get('muted', []) if isinstance(muted, dict) else muted
+        for key, muted_at, last_seen, suppressed in muted:
+            throttle._muted[key] = MutedKey(key, muted_at, last_seen, suppressed)
+        for delivery_id, seen_at, allowed in seen:
+            throttle._seen[delivery_id] = [seen_at, allowed]
+        return throttle
+
+    @classmethod
+    @contextlib.contextmanager
+    def locked(cls, path, **options):
+        """
+        持有文件锁读取状态，退出时保存后释放：多个并发作业共享同一状态文件时不会互相覆盖计数
+        锁加在旁边的 .lock 文件上（状态文件以原子替换写入，inode会变化）
+
+            with FrequencyThrottle.locked(path, threshold=10) as throttle:
+                allowed = throttle.hit(key, delivery_id)
+
+        :param path: 状态文件路径
+        :param options: 构造参数
+        """
+        with open(f'{path}.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            throttle = cls.load(path, **options)
+            yield throttle
+            throttle.save(path)
+
+
+def suppressed_summary_message(muted):
+    """
+    生成“已抑制 N 条相似事件”摘要消息
+    :param muted: MutedKey
+    """
+    started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(muted.muted_at))
+    ended = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(muted.last_seen))
+    return {
+        'msgtype': 'markdown',
+        'markdown': {
+            'content': f"""## 🔕 GitHub 通知已节流
+
+**相似事件**: {muted.key}
+**已抑制**: <font color="warning">{muted.suppressed}</font> 条相似事件
+**时间范围**: {started} ~ {ended}
+"""
+        }
+    }
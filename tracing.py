@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分布式追踪
+以与 OpenTelemetry 兼容的 span 记录一次投递经过的各个阶段（解析、过滤、补全、渲染、队列等待、限速、重试与HTTP发送），
+按 OTLP/JSON 编码导出到 OTLP/HTTP 接收端（Collector、Jaeger、Tempo 等的 /v1/traces）或本地JSONL文件：
+- trace id 由GitHub投递ID派生，同一投递在Action、中继各节点上的 span 天然属于同一条链路，无需共享状态
+- 采样按 trace id 决定（与 TraceIdRatioBased 相同），各进程对同一投递做出相同的采样决定
+- 跨进程转发时以 W3C traceparent 请求头传递父 span
+
+未启用追踪时 span() 返回空操作对象，开销只有一次全局变量判断；未采样的链路同样只返回空操作对象。
+span 结束后放入缓冲区，按批次或定时导出，导出失败只输出警告，不影响通知发送
+"""
+
+import contextlib
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+
+import requests
+
+DEFAULT_SAMPLE_RATE = 1.0
+DEFAULT_SERVICE_NAME = 'wechat-notification'
+DEFAULT_BATCH_SIZE = 512
+DEFAULT_EXPORT_INTERVAL = 5.0
+EXPORT_TIMEOUT = 5.0
+OTLP_TRACES_PATH = '/v1/traces'
+
+# OTLP SpanKind
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+KIND_PRODUCER = 4
+KIND_CONSUMER = 5
+
+# OTLP StatusCode
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def trace_id_for(delivery_id=None):
+    """
+    :param delivery_id: GitHub投递ID，缺省时生成随机 trace id
+    :return: 32位十六进制 trace id
+    """
+    if not delivery_id:
+        return os.urandom(16).hex()
+    return hashlib.sha256(f'delivery:{delivery_id}'.encode('utf-8')).hexdigest()[:32]
+
+
+def _span_id():
+    return os.urandom(8).hex()
+
+
+class SpanContext:
+    """
+    跨线程、跨进程传递的 span 标识
+    """
+
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id, span_id, sampled=True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def __repr__(self):
+        return f'SpanContext(trace_id={self.trace_id}, span_id={self.span_id}, sampled={self.sampled})'
+
+
+def _attribute_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _attributes(attributes):
+    return [{'key': key, 'value': _attribute_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    """
+    一个已采样的 span，结束时交给 Tracer 导出
+    """
+
+    recording = True
+
+    def __init__(self, tracer, name, trace_id, parent=None, kind=KIND_INTERNAL, attributes=None, start_ns=None):
+        """
+        :param parent: 父 SpanContext，可选
+        :param start_ns: 开始时间（纳秒时间戳），缺省为当前时间；队列等待等事后记录的 span 使用入队时间
+        """
+        self._tracer = tracer
+        self.name = name
+        self.context = SpanContext(trace_id, _span_id())
+        self.parent = parent
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = STATUS_UNSET
+        self.status_message = None
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+
+    @property
+    def trace_id(self):
+        return self.context.trace_id
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        self.attributes.update(attributes)
+
+    def add_event(self, name, attributes=None):
+        self.events.append((time.time_ns(), name, dict(attributes or {})))
+
+    def set_status(self, status, message=None):
+        self.status = status
+        self.status_message = message
+
+    def record_exception(self, exc):
+        self.add_event('exception', {'exception.type': type(exc).__name__, 'exception.message': str(exc)})
+        self.set_status(STATUS_ERROR, str(exc) or type(exc).__name__)
+
+    def end(self, end_ns=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        self._tracer._finish(self)
+
+    def to_otlp(self):
+        """
+        :return: OTLP/JSON 编码的 span
+        """
+        span = {
+            'traceId': self.context.trace_id,
+            'spanId': self.context.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': _attributes(self.attributes),
+            'status': {'code': self.status},
+        }
+        if self.parent is not None:
+            span['parentSpanId'] = self.parent.span_id
+        if self.status_message:
+            span['status']['message'] = self.status_message
+        if self.events:
+            span['events'] = [{'timeUnixNano': str(timestamp), 'name': name, 'attributes': _attributes(attributes)}
+                              for timestamp, name, attributes in self.events]
+        return span
+
+
+class _NoopSpan:
+    """
+    未启用追踪或未采样时使用的空操作 span
+    """
+
+    recording = False
+    context = None
+    parent = None
+    trace_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def set_status(self, status, message=None):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+    def end(self, end_ns=None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+# 当前 span：contextvars 在线程和 asyncio 任务之间各自独立，asyncio.gather 创建的任务继承调用方的当前 span
+_current = contextvars.ContextVar('wechat_current_span', default=None)
+
+
+class FileExporter:
+    """
+    追加写入JSONL文件，每行一个 OTLP ExportTraceServiceRequest（与 Collector 的 file 导出器格式一致）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, request):
+        line = json.dumps(request, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+    def close(self):
+        pass
+
+
+class OtlpHttpExporter:
+    """
+    以 OTLP/HTTP JSON 编码发送到接收端
+    """
+
+    def __init__(self, endpoint, headers=None, timeout=EXPORT_TIMEOUT):
+        """
+        :param endpoint: 接收端地址；没有以 /v1/traces 结尾时视为基础地址并追加该路径
+        :param headers: 额外请求头（如认证），也可以是 “k1=v1,k2=v2” 格式的字符串（OTEL_EXPORTER_OTLP_HEADERS）
+        """
+        endpoint = endpoint.rstrip('/')
+        self.endpoint = endpoint if endpoint.endswith(OTLP_TRACES_PATH) else endpoint + OTLP_TRACES_PATH
+        if isinstance(headers, str):
+            headers = dict(item.split('=', 1) for item in headers.split(',') if '=' in item)
+        self.headers = {'Content-Type': 'application/json', **{k.strip(): v.strip() for k, v in (headers or {}).items()}}
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def export(self, request):
+        body = json.dumps(request, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        response = self._session.post(self.endpoint, data=body, headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self):
+        self._session.close()
+
+
+class Tracer:
+    """
+    创建 span、按 trace id 采样，并批量导出已结束的 span
+    """
+
+    def __init__(self, exporter, sample_rate=DEFAULT_SAMPLE_RATE, service_name=DEFAULT_SERVICE_NAME,
+                 batch_size=DEFAULT_BATCH_SIZE, export_interval=DEFAULT_EXPORT_INTERVAL):
+        """
+        :param exporter: FileExporter 或 OtlpHttpExporter（任何提供 export(request) 的对象）
+        :param sample_rate: 链路被采样的比例，0~1
+        :param service_name: 资源属性 service.name
+        :param batch_size: 缓冲区达到该数量时立即导出
+        :param export_interval: 后台定时导出的间隔（秒），常驻服务使用；None 表示只在缓冲区满和关闭时导出
+        """
+        self.exporter = exporter
+        self.sample_rate = float(sample_rate)
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.export_interval = export_interval
+        self.exported = 0
+        self.dropped = 0
+        self._threshold = int(min(max(self.sample_rate, 0.0), 1.0) * (1 << 64))
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.export_interval:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.export_interval):
+            self.flush()
+
+    def sampled(self, trace_id):
+        """
+        :return: trace id 的低64位是否落在采样比例内（同一 trace id 在任何进程中结果相同）
+        """
+        return int(trace_id[16:], 16) < self._threshold
+
+    def start_span(self, name, delivery_id=None, parent=None, kind=KIND_INTERNAL, attributes=None, start_ns=None):
+        """
+        创建 span（不设为当前 span），调用方负责 end()
+        :param delivery_id: GitHub投递ID；没有父 span 时用于派生 trace id 并记录为属性
+        :param parent: 父 span 或 SpanContext，缺省为当前 span
+        :return: Span，未采样时返回 NOOP_SPAN
+        """
+        if parent is None:
+            parent = _current.get()
+        if isinstance(parent, (Span, _NoopSpan)):
+            parent = parent.context if parent.recording else False
+        if parent is False or (parent is not None and not parent.sampled):
+            return NOOP_SPAN
+        if parent is None:
+            trace_id = trace_id_for(delivery_id)
+            if not self.sampled(trace_id):
+                return NOOP_SPAN
+        else:
+            trace_id = parent.trace_id
+        span = Span(self, name, trace_id, parent=parent, kind=kind, attributes=attributes, start_ns=start_ns)
+        if delivery_id:
+            span.set_attribute('github.delivery_id', delivery_id)
+        return span
+
+    def _finish(self, span):
+        with self._lock:
+            self._buffer.append(span)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        导出缓冲区中的 span
+        :return: 导出的 span 数量
+        """
+        with self._export_lock:
+            with self._lock:
+                spans, self._buffer = self._buffer, []
+            if not spans:
+                return 0
+            request = {'resourceSpans': [{
+                'resource': {'attributes': _attributes({'service.name': self.service_name})},
+                'scopeSpans': [{'scope': {'name': 'wechat-notification'}, 'spans': [span.to_otlp() for span in spans]}],
+            }]}
+            try:
+                self.exporter.export(request)
+            except Exception as e:
+                self.dropped += len(spans)
+                print(f'::warning::[tracing] 导出 {len(spans)} 个span失败: {e}')
+                return 0
+            self.exported += len(spans)
+            return len(spans)
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(EXPORT_TIMEOUT)
+        self.flush()
+        self.exporter.close()
+
+
+# 进程内当前启用的追踪器
+_active = None
+
+
+def configure(endpoint=None, path=None, sample_rate=DEFAULT_SAMPLE_RATE, service_name=DEFAULT_SERVICE_NAME,
+              headers=None, export_interval=DEFAULT_EXPORT_INTERVAL, exporter=None):
+    """
+    启用进程级追踪，endpoint 与 path 都未提供时不启用
+    :param endpoint: OTLP/HTTP 接收端地址
+    :param path: 本地JSONL文件路径（同时提供时优先使用 endpoint）
+    :param headers: OTLP 请求头，缺省读取 OTEL_EXPORTER_OTLP_HEADERS
+    :param exporter: 自定义导出器，提供时忽略 endpoint 与 path
+    :return: Tracer，未启用时返回None
+    """
+    global _active
+    if exporter is None:
+        if endpoint:
+            exporter = OtlpHttpExporter(endpoint, headers if headers is not None
+                                        else os.getenv('OTEL_EXPORTER_OTLP_HEADERS'))
+        elif path:
+            exporter = FileExporter(path)
+        else:
+            return None
+    _active = Tracer(exporter, sample_rate, service_name, export_interval=export_interval).start()
+    return _active
+
+
+def get_tracer():
+    """
+    :return: 当前启用的 Tracer，未启用时返回None
+    """
+    return _active
+
+
+def current_span():
+    """
+    :return: 当前 span，没有时返回 NOOP_SPAN
+    """
+    return _current.get() or NOOP_SPAN
+
+
+def start_span(name, delivery_id=None, parent=None, kind=KIND_INTERNAL, attributes=None, start_ns=None):
+    """
+    创建 span 但不设为当前 span（队列等待等跨线程的阶段），未启用追踪时返回 NOOP_SPAN
+    """
+    if _active is None:
+        return NOOP_SPAN
+    return _active.start_span(name, delivery_id, parent, kind, attributes, start_ns)
+
+
+@contextlib.contextmanager
+def use_span(span, end=False):
+    """
+    将 span 设为当前 span（例如在另一个线程的事件循环中继续链路）
+    :param end: 退出时是否结束 span；异常会记录到 span
+    """
+    # 未采样的 span 同样设为当前 span，子阶段据此沿用“不采样”的决定
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        if span is not None:
+            span.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        if end and span is not None:
+            span.end()
+
+
+def span(name, delivery_id=None, parent=None, kind=KIND_INTERNAL, attributes=None):
+    """
+    记录一个阶段的 span 并设为当前 span，未启用追踪时为空上下文
+    """
+    if _active is None:
+        return contextlib.nullcontext(NOOP_SPAN)
+    return use_span(_active.start_span(name, delivery_id, parent, kind, attributes), end=True)
+
+
+def traced(name, kind=KIND_INTERNAL):
+    """
+    装饰器：以 span 包裹函数（支持协程函数），函数内可通过 current_span() 设置属性
+    """
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if _active is None:
+                    return await function(*args, **kwargs)
+                with span(name, kind=kind):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with span(name, kind=kind):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def inject(headers, span=None):
+    """
+    写入 W3C traceparent 请求头
+    :param span: 缺省为当前 span；未采样或未启用时不写入
+    :return: headers
+    """
+    span = span or current_span()
+    if span.recording:
+        headers['traceparent'] = f'00-{span.context.trace_id}-{span.context.span_id}-01'
+    return headers
+
+
+def extract(headers):
+    """
+    解析 W3C traceparent 请求头
+    :return: SpanContext，没有或格式错误时返回None
+    """
+    value = headers.get('traceparent') if headers is not None else None
+    if not value:
+        return None
+    parts = value.strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3][:2], 16) & 1)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return SpanContext(parts[1], parts[2], sampled)
+
+
+def shutdown():
+    """
+    导出剩余 span 并关闭进程级追踪
+    """
+    global _active
+    tracer, _active = _active, None
+    if tracer is not None:
+        tracer.shutdown()